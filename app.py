@@ -1,16 +1,311 @@
-from flask import Flask, request, jsonify, render_template_string
-from grocery import GroceryList, GroceryItem
+"""Stateless JSON API and a small HTML page over db.py.
 
-grocery_list = GroceryList()
+All state lives in the database, so any number of worker processes can serve
+requests (e.g. ``gunicorn -w 4 app:app``). Collections are paged with opaque
+cursors (``?limit=&cursor=``, ``next_cursor`` in the response) and GET
+responses carry an ETag, so clients can revalidate with If-None-Match.
+Items carry a ``version``: an edit or delete that sends it back fails with 409
+if someone changed the item in the meantime, and ``/changes`` (or its event
+stream) tells clients what changed after the version they last saw.
+``/metrics`` serves request, helper and SQL latencies for Prometheus when
+``GROCERY_METRICS=1``; see smart_grocery/metrics.py, also for profiling requests.
+Each process also runs a background job worker (jobs.py) for the recomputation
+that requests only read the results of, such as suggestion rankings.
+"""
+import base64
+import binascii
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime
+
+from flask import Flask, Response, g, request, jsonify, render_template_string, abort, redirect, stream_with_context, url_for
+from werkzeug.exceptions import HTTPException
+
+import db
+import jobs
+from smart_grocery import metrics, transfer
+from smart_grocery.canonical import canonical_name
+from smart_grocery.images import ImageStore
+from smart_grocery.optimizer import Optimizer, load_layouts
+from smart_grocery.recipes import Ingredient
+
+DEFAULT_USER = 'guest'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+MAX_BULK_ITEMS = 10_000
+MAX_WAIT_SECONDS = 30  # Longest ?wait= on /changes
+CHANGE_POLL_SECONDS = 0.5  # How often waiting requests and event streams look for new changes
+STREAM_SECONDS = 300  # Event streams end after this; EventSource reconnects with Last-Event-ID
+KEEPALIVE_SECONDS = 15
+MAX_PLAN_STORES = 10
 
 app = Flask(__name__)
+images = ImageStore()
+# One optimizer (and route cache) per store layout, shared by all requests
+optimizers = {name: Optimizer(layout) for name, layout in load_layouts().items()}
+
+
+@app.before_request
+def start_request():
+    jobs.start_worker()
+    if metrics.enabled():
+        g.request_start = time.perf_counter()
+    if metrics.should_profile(request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'):
+        g.profile = metrics.Profile(f'{request.method}-{request.path}').start()
+
+
+@app.after_request
+def finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers['X-Profile-File'] = profile.stop()
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Label by route pattern, not path, so /api/users/<username>/items is one series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe(metrics.HTTP_REQUEST, time.perf_counter() - start,
+                        method=request.method, route=route, status=str(response.status_code))
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.errorhandler(HTTPException)
+def json_error(e):
+    if request.path.startswith('/api/'):
+        return jsonify(error=e.name, message=e.description), e.code
+    return e
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        abort(400, 'invalid cursor')
+
+
+def page_limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        abort(400, 'limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def conditional(payload):
+    """JSON response with an ETag over its body; answers 304 when If-None-Match matches."""
+    resp = jsonify(payload)
+    resp.add_etag()
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp.make_conditional(request)
+
+
+def json_body():
+    payload = request.get_json(silent=True)
+    if payload is None:
+        abort(400, 'expected a JSON body')
+    return payload
+
+
+def validate_item(row):
+    if not isinstance(row, dict):
+        raise ValueError('expected an object')
+    item = transfer.normalize_row(row)
+    if row.get('image_path'):
+        item['image_path'] = str(row['image_path'])
+    return item
+
+
+ITEM_PATCH_FIELDS = ('name', 'quantity', 'category', 'image_path')
+
+
+def validate_patch(payload):
+    """The fields a PATCH sets, each checked as validate_item would; fields not sent are left alone."""
+    fields = [f for f in ITEM_PATCH_FIELDS if f in payload]
+    if not fields:
+        raise ValueError(f'expected at least one of {", ".join(ITEM_PATCH_FIELDS)}')
+    # normalize_row checks a whole row, so it is given a stand-in for a name that is not changing
+    row = transfer.normalize_row({'name': 'unchanged', **{f: payload[f] for f in fields}})
+    patch = {f: row[f] for f in fields if f in row}
+    if 'image_path' in fields:
+        patch['image_path'] = str(payload['image_path']) if payload['image_path'] else None
+    return patch
+
+
+def item_json(item):
+    return {'id': item.id, 'name': item.name, 'quantity': item.quantity, 'category': item.category,
+            'image_path': item.image_path, 'version': item.version}
+
+
+def expected_version(value):
+    """The ``version`` a client based its edit on, or None to skip the check."""
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('version must be an integer')
+
+
+def conflict_json(e):
+    return {'error': 'Conflict', 'message': str(e), 'item': item_json(e.item) if e.item is not None else None}
+
+
+def change_json(change):
+    if change.op != 'upsert':
+        return {'version': change.version, 'op': change.op, 'id': change.item_id}
+    return {'version': change.version, 'op': change.op, 'id': change.item_id, 'name': change.name,
+            'quantity': change.quantity, 'category': change.category, 'image_path': change.image_path}
+
+
+def changes_json(version, changes, items):
+    """A /changes payload; ``reset`` means replace the whole list with ``items`` instead of applying changes."""
+    payload = {'version': version, 'reset': items is not None, 'changes': [change_json(c) for c in changes]}
+    if items is not None:
+        payload['items'] = [item_json(i) for i in items]
+    return payload
+
+
+def change_args(args):
+    """``(since, limit, wait)`` from /changes query arguments."""
+    try:
+        since = int(args['since']) if args.get('since') else None
+        limit = max(1, min(int(args.get('limit', db.CHANGE_PAGE_LIMIT)), db.CHANGE_PAGE_LIMIT))
+        wait = max(0.0, min(float(args.get('wait', 0)), MAX_WAIT_SECONDS))
+    except ValueError:
+        raise ValueError('since and limit must be integers and wait a number of seconds')
+    return since, limit, wait
+
+
+def timestamp_json(timestamp):
+    return timestamp.isoformat() if timestamp else None
+
+
+def route_json(route):
+    return {
+        'store': route.store,
+        'distance': round(route.distance, 1),
+        'path': route.path,
+        'stops': [{'location': stop.location, 'items': [item_json(i) for i in stop.items]} for stop in route.stops],
+    }
+
+
+def validate_recipe(payload):
+    """``{"name", "servings", "ingredients": [{"name", "amount", "unit", "category"}]}`` as save_recipe_db arguments."""
+    if not isinstance(payload, dict) or not isinstance(payload.get('name'), str) or not payload['name'].strip():
+        raise ValueError('expected a recipe with a "name"')
+    rows = payload.get('ingredients')
+    if not isinstance(rows, list) or not rows or not all(isinstance(r, dict) for r in rows):
+        raise ValueError('expected a non-empty "ingredients" array of objects')
+    ingredients = []
+    for row in rows:
+        if not isinstance(row.get('name'), str) or not row['name'].strip():
+            raise ValueError('every ingredient needs a "name"')
+        ingredients.append(Ingredient(row['name'], float(row.get('amount', 1)), str(row.get('unit') or ''),
+                                      str(row.get('category') or 'Other')))
+    return payload['name'].strip(), ingredients, int(payload.get('servings', 1))
+
+
+def recipe_json(recipe):
+    return {'name': recipe.name, 'servings': recipe.servings,
+            'ingredients': [i._asdict() for i in recipe.ingredients]}
+
+
+def expansion_json(expansion):
+    return {
+        'meals': expansion.meals,
+        'items': [{'name': r.name, 'category': r.category, 'quantity': r.quantity, 'amount': round(r.amount, 3),
+                   'unit': r.unit, 'label': r.label()} for r in expansion.requirements()],
+        'covered': expansion.covered,
+        'unknown': expansion.unknown,
+    }
+
+
+def aliases_json(rows):
+    return [{'alias': alias, 'name': canonical, 'source': source} for alias, canonical, source in rows]
+
+
+def pantry_json(entry):
+    return {'name': entry.name, 'category': entry.category, 'quantity': entry.quantity,
+            'remaining': round(entry.remaining, 2), 'purchased_at': timestamp_json(entry.purchased_at),
+            'rate_per_day': round(entry.rate, 4) if entry.rate else None, 'runout_at': timestamp_json(entry.runout_at)}
+
+
+def proposal_json(proposal):
+    return {'name': proposal.name, 'category': proposal.category, 'quantity': proposal.quantity,
+            'runout_at': timestamp_json(proposal.runout_at), 'in_pantry': proposal.in_pantry}
+
+
+def horizon_days(value):
+    """Days ahead to look for items running out (``?days=``), 1 to 365."""
+    if value is None or value == '':
+        return db.PANTRY_HORIZON_DAYS
+    try:
+        return max(1, min(int(value), 365))
+    except (TypeError, ValueError):
+        raise ValueError('days must be an integer')
+
+
+def budget_args(args):
+    """``(budget, max_stores, store_cost, stores)`` from /budget query arguments."""
+    try:
+        budget = float(args['budget']) if args.get('budget') else None
+        max_stores = max(1, min(int(args.get('max_stores') or 1), MAX_PLAN_STORES))
+        store_cost = float(args.get('store_cost') or 0)
+    except (TypeError, ValueError):
+        raise ValueError('budget and store_cost must be numbers and max_stores an integer')
+    if budget is not None and budget < 0:
+        raise ValueError('budget must not be negative')
+    stores = [s.strip() for s in args['stores'].split(',') if s.strip()] if args.get('stores') else None
+    return budget, max_stores, store_cost, stores
+
+
+def plan_json(plan):
+    return {'stores': plan.stores, 'total': plan.total, 'lines': [line._asdict() for line in plan.lines],
+            'dropped': [line._asdict() for line in plan.dropped], 'unavailable': plan.unavailable,
+            'by_store': [total._asdict() for total in plan.by_store]}
+
+
+def spend_args(args):
+    """``(grain, since, store)`` from /spend query arguments."""
+    grain = args.get('grain') or 'month'
+    if grain not in db.ROLLUP_GRAINS:
+        raise ValueError(f'grain must be one of {", ".join(db.ROLLUP_GRAINS)}')
+    try:
+        since = date.fromisoformat(args['since']) if args.get('since') else None
+    except ValueError:
+        raise ValueError('since must be a YYYY-MM-DD date')
+    return grain, since, args.get('store') or None
+
+
+def plan_range(args):
+    """Inclusive (start, end) ISO dates and servings for a meal-plan expansion."""
+    try:
+        start, end = (date.fromisoformat(args[k]).isoformat() if args.get(k) else None for k in ('start', 'end'))
+        servings = int(args['servings']) if args.get('servings') else None
+    except (TypeError, ValueError):
+        raise ValueError('start and end must be YYYY-MM-DD dates and servings an integer')
+    return start, end, servings
+
 
 @app.route('/')
 def index():
-    items = grocery_list.list_items()
+    username = request.args.get('user', DEFAULT_USER)
+    items, _ = db.get_items_page_db(username, MAX_LIMIT)
     return render_template_string('''
         <h1>Smart Grocery List Generator</h1>
         <form method="post" action="/add">
+            <input type="hidden" name="user" value="{{username}}">
             <input name="name" placeholder="Item name" required>
             <input name="quantity" type="number" min="1" value="1" required>
             <input name="category" placeholder="Category" required>
@@ -19,22 +314,542 @@ def index():
         <h2>Grocery List</h2>
         <ul>
         {% for item in items %}
-            <li>{{item['name']}} (x{{item['quantity']}}) - {{item['category']}}</li>
+            <li>{{item.name}} (x{{item.quantity}}) - {{item.category}}</li>
         {% endfor %}
         </ul>
-    ''', items=items)
+    ''', items=items, username=username)
+
 
 @app.route('/add', methods=['POST'])
 def add_item():
-    name = request.form['name']
-    quantity = int(request.form['quantity'])
-    category = request.form['category']
-    grocery_list.add_item(GroceryItem(name, quantity, category))
-    return ('', 204), 204, {'HX-Redirect': '/'}
+    username = request.form.get('user', DEFAULT_USER)
+    try:
+        item = validate_item(request.form.to_dict())
+    except ValueError as e:
+        abort(400, str(e))
+    db.add_item_db(item['name'], item['quantity'], item['category'], username)
+    return redirect(url_for('index', user=username), 303)
+
 
 @app.route('/api/items', methods=['GET'])
 def api_list_items():
-    return jsonify(grocery_list.list_items())
+    username = request.args.get('user', DEFAULT_USER)
+    return conditional([item_json(i) for i in db.get_items_db(username)])
+
+
+@app.route('/api/users/<username>/items', methods=['GET'])
+def api_get_items(username):
+    """Items in insertion order, or with ``?q=`` those whose name starts with q, in name order."""
+    after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    prefix = request.args.get('q', '').strip()
+    if prefix:
+        if after is not None and not (isinstance(after, list) and len(after) == 2 and isinstance(after[1], int)):
+            abort(400, 'invalid cursor')
+        items, last = db.search_items_db(username, prefix, page_limit(), tuple(after) if after else None)
+    else:
+        if after is not None and not isinstance(after, int):
+            abort(400, 'invalid cursor')
+        items, last = db.get_items_page_db(username, page_limit(), after)
+    return conditional({
+        'items': [item_json(i) for i in items],
+        'next_cursor': encode_cursor(last) if last is not None else None,
+    })
+
+
+@app.route('/api/users/<username>/items', methods=['POST'])
+def api_add_items(username):
+    """Add one item (an object) or many (an array); a bulk add is all-or-nothing."""
+    payload = json_body()
+    rows = payload if isinstance(payload, list) else [payload]
+    if len(rows) > MAX_BULK_ITEMS:
+        abort(413, f'at most {MAX_BULK_ITEMS} items per request')
+    items, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            items.append(validate_item(row))
+        except ValueError as e:
+            errors.append({'index': index, 'message': str(e)})
+    if errors:
+        return jsonify(error='Bad Request', message='invalid items', errors=errors), 400
+    if isinstance(payload, list):
+        return jsonify(created=db.add_items_db(items, username)), 201
+    item = items[0]
+    item_id = db.add_item_db(item['name'], item['quantity'], item['category'], username, item.get('image_path'))
+    return jsonify(item_json(db.get_item_db(item_id, username))), 201
+
+
+@app.route('/api/users/<username>/items', methods=['DELETE'])
+def api_clear_items(username):
+    db.clear_items_db(username)
+    return '', 204
+
+
+@app.route('/api/users/<username>/items/<int:item_id>', methods=['GET'])
+def api_get_item(username, item_id):
+    item = db.get_item_db(item_id, username)
+    if item is None:
+        abort(404, 'no such item')
+    return conditional(item_json(item))
+
+
+@app.route('/api/users/<username>/items/<int:item_id>', methods=['PATCH'])
+def api_update_item(username, item_id):
+    """Change the fields sent (name, quantity, category, image_path); the others stay as they are.
+
+    Send the item's ``version`` to get a 409 instead of overwriting someone else's change.
+    """
+    payload = json_body()
+    if not isinstance(payload, dict):
+        abort(400, 'expected an object')
+    try:
+        fields = validate_patch(payload)
+        version = expected_version(payload.get('version'))
+    except ValueError as e:
+        abort(400, str(e))
+    try:
+        item = db.update_item_db(item_id, username, version, **fields)
+    except db.VersionConflict as e:
+        return jsonify(conflict_json(e)), 409
+    if item is None:
+        abort(404, 'no such item')
+    return jsonify(item_json(item))
+
+
+@app.route('/api/users/<username>/items/<int:item_id>', methods=['DELETE'])
+def api_delete_item(username, item_id):
+    """Delete an item; with ``?version=`` only if nobody has changed it since."""
+    try:
+        deleted = db.delete_item_db(item_id, username, expected_version(request.args.get('version')))
+    except ValueError as e:
+        abort(400, str(e))
+    except db.VersionConflict as e:
+        return jsonify(conflict_json(e)), 409
+    if not deleted:
+        abort(404, 'no such item')
+    return '', 204
+
+
+@app.route('/api/users/<username>/changes', methods=['GET'])
+def api_get_changes(username):
+    """Changes to the list after version ``?since=``; ``?wait=`` (seconds) holds the request until there are some.
+
+    Without ``since``, or when it is older than the change log, the response
+    has ``"reset": true`` and the whole list in ``items``.
+    """
+    try:
+        since, limit, wait = change_args(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    deadline = time.monotonic() + wait
+    while True:
+        version, changes, items = db.get_changes_db(username, since, limit)
+        if changes or items is not None or time.monotonic() >= deadline:
+            break
+        time.sleep(CHANGE_POLL_SECONDS)
+    resp = jsonify(changes_json(version, changes, items))
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
+
+
+@app.route('/api/users/<username>/changes/stream', methods=['GET'])
+def api_stream_changes(username):
+    """Server-sent events: a ``changes`` event, with the /changes payload, whenever the list changes.
+
+    Starts after ``?since=`` or the Last-Event-ID header; without either the
+    first event is a reset with the whole list. Each event id is its version.
+    """
+    try:
+        since, limit, _ = change_args({**request.args, 'since': request.headers.get('Last-Event-ID') or request.args.get('since')})
+    except ValueError as e:
+        abort(400, str(e))
+
+    def events(since):
+        yield f'retry: {int(CHANGE_POLL_SECONDS * 4000)}\n\n'
+        started = quiet = time.monotonic()
+        while time.monotonic() - started < STREAM_SECONDS:
+            version, changes, items = db.get_changes_db(username, since, limit)
+            if changes or items is not None:
+                since = version
+                data = json.dumps(changes_json(version, changes, items), separators=(',', ':'))
+                yield f'id: {version}\nevent: changes\ndata: {data}\n\n'
+                quiet = time.monotonic()
+                continue
+            if time.monotonic() - quiet >= KEEPALIVE_SECONDS:
+                yield ': keepalive\n\n'
+                quiet = time.monotonic()
+            time.sleep(CHANGE_POLL_SECONDS)
+
+    return Response(stream_with_context(events(since)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/stores', methods=['GET'])
+def api_get_stores():
+    return conditional({'stores': sorted(optimizers)})
+
+
+@app.route('/api/users/<username>/route', methods=['GET'])
+def api_get_route(username):
+    """The list in walking order for ``?store=`` (default: the built-in layout)."""
+    optimizer = optimizers.get(request.args.get('store') or next(iter(optimizers)))
+    if optimizer is None:
+        abort(404, 'no such store')
+    return conditional(route_json(optimizer.plan(db.get_items_db(username))))
+
+
+@app.route('/api/users/<username>/history', methods=['GET'])
+def api_get_history(username):
+    before = None
+    if request.args.get('cursor'):
+        cursor = decode_cursor(request.args['cursor'])
+        try:
+            before = (datetime.fromisoformat(cursor[0]), int(cursor[1]))
+        except (TypeError, ValueError, IndexError):
+            abort(400, 'invalid cursor')
+    page, last = db.get_history_page_db(username, page_limit(), before)
+    return conditional({
+        'history': [{'id': history_id, 'timestamp': timestamp_json(timestamp), 'items': items}
+                    for history_id, timestamp, items in page],
+        'next_cursor': encode_cursor([last[0].isoformat(), last[1]]) if last else None,
+    })
+
+
+@app.route('/api/users/<username>/history', methods=['POST'])
+def api_add_history(username):
+    """Record a purchase: ``{"items": [...], "timestamp": optional ISO string}``."""
+    payload = json_body()
+    rows = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(rows, list) or not rows:
+        abort(400, 'expected a non-empty "items" array')
+    try:
+        items = [validate_item(row) for row in rows]
+        timestamp = datetime.fromisoformat(payload['timestamp']) if payload.get('timestamp') else None
+    except (TypeError, ValueError) as e:
+        abort(400, str(e))
+    history_id = db.add_history_db(items, username, timestamp)
+    return jsonify(id=history_id, items=items), 201
+
+
+@app.route('/api/users/<username>/meals', methods=['GET'])
+def api_get_meals(username):
+    return conditional({'meals': [{'date': date, 'items': items} for date, items in db.get_meals_db(username)]})
+
+
+@app.route('/api/users/<username>/meals', methods=['POST'])
+def api_add_meal(username):
+    """Plan a meal: ``{"date": "YYYY-MM-DD", "items": ["name", ...]}``."""
+    payload = json_body()
+    date = payload.get('date') if isinstance(payload, dict) else None
+    items = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(date, str) or not date.strip():
+        abort(400, 'expected a "date" string')
+    if not isinstance(items, list) or not all(isinstance(i, str) and i.strip() for i in items):
+        abort(400, 'expected an "items" array of names')
+    items = [i.strip().title() for i in items]
+    return jsonify(id=db.add_meal_db(date.strip(), items, username), date=date.strip(), items=items), 201
+
+
+@app.route('/api/users/<username>/recipes', methods=['GET'])
+def api_get_recipes(username):
+    return conditional({'recipes': [recipe_json(r) for r in db.get_recipes_db(username)]})
+
+
+@app.route('/api/users/<username>/recipes', methods=['POST'])
+def api_save_recipe(username):
+    """Create or replace a recipe; meal-plan entries with its name expand into its ingredients."""
+    try:
+        name, ingredients, servings = validate_recipe(json_body())
+        db.save_recipe_db(username, name, ingredients, servings)
+    except (TypeError, ValueError) as e:
+        abort(400, str(e))
+    return jsonify(recipe_json(db.get_recipe_db(username, name))), 201
+
+
+@app.route('/api/users/<username>/recipes/<name>', methods=['DELETE'])
+def api_delete_recipe(username, name):
+    if not db.delete_recipe_db(username, name):
+        abort(404, 'no such recipe')
+    return '', 204
+
+
+@app.route('/api/users/<username>/meals/shopping-list', methods=['GET'])
+def api_meal_shopping_list(username):
+    """What the meals from ``?start=`` to ``?end=`` need beyond the current list."""
+    try:
+        start, end, servings = plan_range(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    return conditional(expansion_json(db.expand_meal_plan_db(username, start, end, servings=servings)))
+
+
+@app.route('/api/users/<username>/meals/shopping-list', methods=['POST'])
+def api_add_meal_shopping_list(username):
+    """Add what the planned meals need to the list: ``{"start", "end", "servings"}``, all optional."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        start, end, servings = plan_range(payload if isinstance(payload, dict) else {})
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify(expansion_json(db.add_meal_plan_to_list_db(username, start, end, servings)))
+
+
+@app.route('/api/users/<username>/suggestions', methods=['GET'])
+def api_get_suggestions(username):
+    """Ranked suggestions; ``?current=a,b`` names items already on the list."""
+    try:
+        top_n = max(1, min(int(request.args.get('top_n', 5)), 100))
+    except ValueError:
+        abort(400, 'top_n must be an integer')
+    current = [name for name in request.args.get('current', '').split(',') if name.strip()]
+    suggestions = db.get_ranked_suggestions_db(username, top_n, current=current)
+    return conditional({'suggestions': [
+        {'name': s.name, 'score': round(s.score, 4), 'reason': s.reason,
+         'due_in_days': round(s.due_in_days, 1) if s.due_in_days is not None else None}
+        for s in suggestions
+    ]})
+
+
+@app.route('/api/users/<username>/autocomplete', methods=['GET'])
+def api_autocomplete(username):
+    """Known names for ``?q=`` (prefix or near-miss spelling) and the key adding it would be stored under.
+
+    A near miss of one known name comes back as ``did_you_mean``; adding ``q``
+    as typed does not apply it. Accepting it is POST .../aliases with
+    ``"source": "typo"``.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        abort(400, 'q is required')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+    except ValueError:
+        abort(400, 'limit must be an integer')
+    resolution, completions = db.autocomplete_db(username, text, limit)
+    typo = resolution.how == 'typo'
+    return conditional({
+        'query': text,
+        'key': canonical_name(text) if typo else resolution.key,
+        'match': 'new' if typo else resolution.how,
+        'did_you_mean': resolution.key if typo else None,
+        'suggestions': [c._asdict() for c in completions],
+    })
+
+
+@app.route('/api/users/<username>/aliases', methods=['GET'])
+def api_get_aliases(username):
+    return conditional({'aliases': aliases_json(db.get_aliases_db(username))})
+
+
+@app.route('/api/users/<username>/aliases', methods=['POST'])
+def api_set_alias(username):
+    """``{"alias", "name"[, "source"]}``: treat alias as the same item as name, merging rows already stored under it.
+
+    ``source`` is "user" (default) or "typo" for an accepted autocomplete correction.
+    """
+    payload = json_body()
+    if not isinstance(payload, dict) or not isinstance(payload.get('alias'), str) or \
+            not isinstance(payload.get('name'), str) or payload.get('source', 'user') not in ('user', 'typo'):
+        abort(400, 'expected {"alias", "name"[, "source": "user" or "typo"]}')
+    try:
+        db.set_alias_db(username, payload['alias'], payload['name'], payload.get('source', 'user'))
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify(aliases=aliases_json(db.get_aliases_db(username))), 201
+
+
+@app.route('/api/users/<username>/aliases/<alias>', methods=['DELETE'])
+def api_delete_alias(username, alias):
+    if not db.delete_alias_db(username, alias):
+        abort(404, 'no such alias')
+    return '', 204
+
+
+@app.route('/api/users/<username>/items/checkout', methods=['POST'])
+def api_check_out_items(username):
+    """``{"ids": [...]}``: record those items as bought (history and pantry) and take them off the list."""
+    payload = json_body()
+    ids = payload.get('ids') if isinstance(payload, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        abort(400, 'expected an "ids" array of item ids')
+    return jsonify(checked_out=db.check_out_items_db(ids, username))
+
+
+@app.route('/api/users/<username>/pantry', methods=['GET'])
+def api_get_pantry(username):
+    """What is at home, with the estimated amount left and run-out date, soonest first."""
+    return conditional({'items': [pantry_json(e) for e in db.get_pantry_db(username)]})
+
+
+@app.route('/api/users/<username>/pantry', methods=['POST'])
+def api_add_to_pantry(username):
+    """Record items bought outside the list: one object or an array."""
+    payload = json_body()
+    rows = payload if isinstance(payload, list) else [payload]
+    if len(rows) > MAX_BULK_ITEMS:
+        abort(413, f'at most {MAX_BULK_ITEMS} items per request')
+    try:
+        items = [validate_item(row) for row in rows]
+    except ValueError as e:
+        abort(400, str(e))
+    db.add_to_pantry_db(items, username)
+    return jsonify(added=len(items)), 201
+
+
+@app.route('/api/users/<username>/pantry/<name>', methods=['PUT'])
+def api_set_pantry_item(username, name):
+    """``{"quantity": n, "category": optional}``: how much is at home now; 0 removes the item."""
+    payload = json_body()
+    quantity = payload.get('quantity') if isinstance(payload, dict) else None
+    if isinstance(quantity, bool) or not isinstance(quantity, (int, float)):
+        abort(400, 'expected a numeric "quantity"')
+    if not db.set_pantry_item_db(username, name, quantity, str(payload.get('category') or 'Other')):
+        abort(404, 'no such pantry item')
+    return '', 204
+
+
+@app.route('/api/users/<username>/pantry/<name>', methods=['DELETE'])
+def api_delete_pantry_item(username, name):
+    if not db.set_pantry_item_db(username, name, 0):
+        abort(404, 'no such pantry item')
+    return '', 204
+
+
+@app.route('/api/users/<username>/pantry/proposals', methods=['GET'])
+def api_pantry_proposals(username):
+    """Items forecast to run out within ``?days=`` (default 7) that are not on the list yet."""
+    try:
+        days = horizon_days(request.args.get('days'))
+    except ValueError as e:
+        abort(400, str(e))
+    return conditional({'proposals': [proposal_json(p) for p in db.get_pantry_proposals_db(username, days)]})
+
+
+@app.route('/api/users/<username>/pantry/proposals', methods=['POST'])
+def api_add_pantry_proposals(username):
+    """Put the proposals on the list: ``{"days": optional}``."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        days = horizon_days(payload.get('days') if isinstance(payload, dict) else None)
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify(added=[proposal_json(p) for p in db.add_pantry_proposals_to_list_db(username, days)])
+
+
+def job_json(job):
+    return {'id': job.id, 'job': job.job, 'username': job.username, 'payload': json.loads(job.payload),
+            'status': job.status, 'attempts': job.attempts, 'max_attempts': job.max_attempts,
+            'run_at': timestamp_json(job.run_at), 'enqueued_at': timestamp_json(job.enqueued_at),
+            'started_at': timestamp_json(job.started_at), 'finished_at': timestamp_json(job.finished_at),
+            'result': json.loads(job.result) if job.result else None, 'error': job.last_error}
+
+
+@app.route('/api/jobs', methods=['GET'])
+def api_job_stats():
+    """Queue depth per job and status, and the latest failures."""
+    return jsonify({
+        'queue': [{'job': job, 'status': status, 'count': count, 'oldest_pending_seconds': age}
+                  for job, status, count, age in db.get_job_stats_db()],
+        'failed': [job_json(job) for job in db.get_jobs_db('failed', limit=20)],
+    })
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def api_get_job(job_id):
+    job = db.get_job_db(job_id)
+    if job is None:
+        abort(404, 'no such job')
+    return jsonify(job_json(job))
+
+
+@app.route('/api/users/<username>/jobs', methods=['POST'])
+def api_enqueue_job(username):
+    """``{"job": "rank-suggestions"}``: recompute now for this user; an identical pending job is returned instead."""
+    payload = request.get_json(silent=True)
+    name = payload.get('job') if isinstance(payload, dict) else None
+    if name not in jobs.USER_TASKS:
+        abort(400, f'job must be one of {", ".join(jobs.USER_TASKS)}')
+    return jsonify(job_json(jobs.enqueue(name, username))), 202
+
+
+@app.route('/api/prices', methods=['GET'])
+def api_get_price_stores():
+    """Stores in the price catalog and how many items each has a price for."""
+    return conditional({'stores': [{'store': store, 'items': n} for store, n in db.get_price_stores_db()]})
+
+
+@app.route('/api/prices', methods=['POST'])
+def api_import_prices():
+    """A price catalog file as the request body (rows of store, name, price[, date]), imported by a background job.
+
+    ``?format=`` is csv, jsonl or parquet; without it the format is detected.
+    The response is the queued job, whose result reports rejected rows.
+    """
+    fmt = request.args.get('format') or None
+    if fmt is not None and fmt not in transfer.FORMATS:
+        abort(400, f'format must be one of {", ".join(transfer.FORMATS)}')
+    os.makedirs(jobs.UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.upload', dir=jobs.UPLOAD_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        shutil.copyfileobj(request.stream, f)
+        empty = f.tell() == 0
+    if empty:
+        os.remove(path)
+        abort(400, 'expected a price catalog file as the request body')
+    # One attempt: a retry would add the rows imported before a failure again
+    return jsonify(job_json(jobs.enqueue('import-prices', payload={'path': path, 'fmt': fmt}, max_attempts=1))), 202
+
+
+@app.route('/api/prices/<name>', methods=['GET'])
+def api_get_price_history(name):
+    """Observed prices of an item by store and date; ``?store=`` and ``?since=`` (YYYY-MM-DD) narrow it down."""
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        abort(400, 'since must be a YYYY-MM-DD date')
+    rows = db.get_price_history_db(name, request.args.get('store') or None, since)
+    return conditional({'name': name, 'prices': [
+        {'store': store, 'price': price, 'observed_at': timestamp_json(observed_at)}
+        for store, price, observed_at in rows
+    ]})
+
+
+@app.route('/api/users/<username>/budget', methods=['GET'])
+def api_plan_budget(username):
+    """Where to buy the list at current prices: ``?budget=`` caps the spend, ``?max_stores=`` allows a split
+    (each extra store has to save ``?store_cost=``), ``?stores=a,b`` limits the choice."""
+    try:
+        budget, max_stores, store_cost, stores = budget_args(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    return conditional(plan_json(db.plan_budget_db(username, budget, max_stores, store_cost, stores)))
+
+
+@app.route('/api/users/<username>/spend', methods=['GET'])
+def api_get_spend(username):
+    """Estimated spend per ``?grain=`` (day, week or month) from purchase history, priced from the catalog."""
+    try:
+        grain, since, store = spend_args(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    return conditional({'grain': grain, 'periods': [
+        {'period': period, 'spend': spend, 'unpriced_quantity': unpriced}
+        for period, spend, unpriced in db.get_spend_db(username, grain, since, store)
+    ]})
+
+
+@app.route('/images/<digest>/<int:size>.webp', methods=['GET'])
+def image_thumbnail(digest, size):
+    """Item thumbnail by content hash; the URL never changes meaning, so it is cached for a year."""
+    if size not in images.sizes:
+        abort(404)
+    data = images.thumbnail(digest, size)
+    if data is None:
+        abort(404)
+    resp = Response(data, mimetype='image/webp')
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
+
 
 if __name__ == '__main__':
+    db.init_db()
     app.run(debug=True)
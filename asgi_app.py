@@ -0,0 +1,885 @@
+"""ASGI version of the JSON API in app.py, on Starlette and db_async.py.
+
+Same routes, payloads, cursors and ETags as app.py, but every handler is a
+coroutine and database calls go through the async engine's bounded pool, so
+one process can keep many requests in flight while others wait on SQLite.
+``/metrics`` and request timing work as in app.py; per-request cProfile does
+not, since a coroutine's profile would include whatever else the event loop ran.
+The schema is migrated and the background job worker (jobs.py) started at
+startup; the pool is closed and the worker stopped at shutdown::
+
+    uvicorn asgi_app:app --workers 4
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from http import HTTPStatus
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import db
+import db_async
+import jobs
+from smart_grocery import metrics, transfer
+from smart_grocery.canonical import canonical_name
+from smart_grocery.images import ImageStore
+from smart_grocery.optimizer import Optimizer, load_layouts
+from smart_grocery.recipes import Ingredient
+
+DEFAULT_USER = 'guest'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+MAX_BULK_ITEMS = 10_000
+MAX_WAIT_SECONDS = 30
+CHANGE_POLL_SECONDS = 0.5
+STREAM_SECONDS = 300
+KEEPALIVE_SECONDS = 15
+MAX_PLAN_STORES = 10
+
+images = ImageStore()
+optimizers = {name: Optimizer(layout) for name, layout in load_layouts().items()}
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(400, 'invalid cursor')
+
+
+def page_limit(request):
+    try:
+        limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise HTTPException(400, 'limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def conditional(request, payload):
+    """JSON response with an ETag over its body; answers 304 when If-None-Match matches."""
+    resp = JSONResponse(payload)
+    etag = f'"{hashlib.sha1(resp.body).hexdigest()}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if etag in [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers=headers)
+    resp.headers.update(headers)
+    return resp
+
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(400, 'expected a JSON body')
+
+
+def validate_item(row):
+    if not isinstance(row, dict):
+        raise ValueError('expected an object')
+    item = transfer.normalize_row(row)
+    if row.get('image_path'):
+        item['image_path'] = str(row['image_path'])
+    return item
+
+
+ITEM_PATCH_FIELDS = ('name', 'quantity', 'category', 'image_path')
+
+
+def validate_patch(payload):
+    """The fields a PATCH sets, each checked as validate_item would; fields not sent are left alone."""
+    fields = [f for f in ITEM_PATCH_FIELDS if f in payload]
+    if not fields:
+        raise ValueError(f'expected at least one of {", ".join(ITEM_PATCH_FIELDS)}')
+    # normalize_row checks a whole row, so it is given a stand-in for a name that is not changing
+    row = transfer.normalize_row({'name': 'unchanged', **{f: payload[f] for f in fields}})
+    patch = {f: row[f] for f in fields if f in row}
+    if 'image_path' in fields:
+        patch['image_path'] = str(payload['image_path']) if payload['image_path'] else None
+    return patch
+
+
+def item_json(item):
+    return {'id': item.id, 'name': item.name, 'quantity': item.quantity, 'category': item.category,
+            'image_path': item.image_path, 'version': item.version}
+
+
+def expected_version(value):
+    """The ``version`` a client based its edit on, or None to skip the check."""
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('version must be an integer')
+
+
+def conflict_json(e):
+    return {'error': 'Conflict', 'message': str(e), 'item': item_json(e.item) if e.item is not None else None}
+
+
+def change_json(change):
+    if change.op != 'upsert':
+        return {'version': change.version, 'op': change.op, 'id': change.item_id}
+    return {'version': change.version, 'op': change.op, 'id': change.item_id, 'name': change.name,
+            'quantity': change.quantity, 'category': change.category, 'image_path': change.image_path}
+
+
+def changes_json(version, changes, items):
+    """A /changes payload; ``reset`` means replace the whole list with ``items`` instead of applying changes."""
+    payload = {'version': version, 'reset': items is not None, 'changes': [change_json(c) for c in changes]}
+    if items is not None:
+        payload['items'] = [item_json(i) for i in items]
+    return payload
+
+
+def change_args(args):
+    """``(since, limit, wait)`` from /changes query arguments."""
+    try:
+        since = int(args['since']) if args.get('since') else None
+        limit = max(1, min(int(args.get('limit', db.CHANGE_PAGE_LIMIT)), db.CHANGE_PAGE_LIMIT))
+        wait = max(0.0, min(float(args.get('wait', 0)), MAX_WAIT_SECONDS))
+    except ValueError:
+        raise ValueError('since and limit must be integers and wait a number of seconds')
+    return since, limit, wait
+
+
+def timestamp_json(timestamp):
+    return timestamp.isoformat() if timestamp else None
+
+
+def route_json(route):
+    return {
+        'store': route.store,
+        'distance': round(route.distance, 1),
+        'path': route.path,
+        'stops': [{'location': stop.location, 'items': [item_json(i) for i in stop.items]} for stop in route.stops],
+    }
+
+
+def validate_recipe(payload):
+    """``{"name", "servings", "ingredients": [{"name", "amount", "unit", "category"}]}`` as save_recipe_db arguments."""
+    if not isinstance(payload, dict) or not isinstance(payload.get('name'), str) or not payload['name'].strip():
+        raise ValueError('expected a recipe with a "name"')
+    rows = payload.get('ingredients')
+    if not isinstance(rows, list) or not rows or not all(isinstance(r, dict) for r in rows):
+        raise ValueError('expected a non-empty "ingredients" array of objects')
+    ingredients = []
+    for row in rows:
+        if not isinstance(row.get('name'), str) or not row['name'].strip():
+            raise ValueError('every ingredient needs a "name"')
+        ingredients.append(Ingredient(row['name'], float(row.get('amount', 1)), str(row.get('unit') or ''),
+                                      str(row.get('category') or 'Other')))
+    return payload['name'].strip(), ingredients, int(payload.get('servings', 1))
+
+
+def recipe_json(recipe):
+    return {'name': recipe.name, 'servings': recipe.servings,
+            'ingredients': [i._asdict() for i in recipe.ingredients]}
+
+
+def expansion_json(expansion):
+    return {
+        'meals': expansion.meals,
+        'items': [{'name': r.name, 'category': r.category, 'quantity': r.quantity, 'amount': round(r.amount, 3),
+                   'unit': r.unit, 'label': r.label()} for r in expansion.requirements()],
+        'covered': expansion.covered,
+        'unknown': expansion.unknown,
+    }
+
+
+def aliases_json(rows):
+    return [{'alias': alias, 'name': canonical, 'source': source} for alias, canonical, source in rows]
+
+
+def pantry_json(entry):
+    return {'name': entry.name, 'category': entry.category, 'quantity': entry.quantity,
+            'remaining': round(entry.remaining, 2), 'purchased_at': timestamp_json(entry.purchased_at),
+            'rate_per_day': round(entry.rate, 4) if entry.rate else None, 'runout_at': timestamp_json(entry.runout_at)}
+
+
+def proposal_json(proposal):
+    return {'name': proposal.name, 'category': proposal.category, 'quantity': proposal.quantity,
+            'runout_at': timestamp_json(proposal.runout_at), 'in_pantry': proposal.in_pantry}
+
+
+def horizon_days(value):
+    """Days ahead to look for items running out (``?days=``), 1 to 365."""
+    if value is None or value == '':
+        return db.PANTRY_HORIZON_DAYS
+    try:
+        return max(1, min(int(value), 365))
+    except (TypeError, ValueError):
+        raise ValueError('days must be an integer')
+
+
+def budget_args(args):
+    """``(budget, max_stores, store_cost, stores)`` from /budget query arguments."""
+    try:
+        budget = float(args['budget']) if args.get('budget') else None
+        max_stores = max(1, min(int(args.get('max_stores') or 1), MAX_PLAN_STORES))
+        store_cost = float(args.get('store_cost') or 0)
+    except (TypeError, ValueError):
+        raise ValueError('budget and store_cost must be numbers and max_stores an integer')
+    if budget is not None and budget < 0:
+        raise ValueError('budget must not be negative')
+    stores = [s.strip() for s in args['stores'].split(',') if s.strip()] if args.get('stores') else None
+    return budget, max_stores, store_cost, stores
+
+
+def plan_json(plan):
+    return {'stores': plan.stores, 'total': plan.total, 'lines': [line._asdict() for line in plan.lines],
+            'dropped': [line._asdict() for line in plan.dropped], 'unavailable': plan.unavailable,
+            'by_store': [total._asdict() for total in plan.by_store]}
+
+
+def spend_args(args):
+    """``(grain, since, store)`` from /spend query arguments."""
+    grain = args.get('grain') or 'month'
+    if grain not in db.ROLLUP_GRAINS:
+        raise ValueError(f'grain must be one of {", ".join(db.ROLLUP_GRAINS)}')
+    try:
+        since = date.fromisoformat(args['since']) if args.get('since') else None
+    except ValueError:
+        raise ValueError('since must be a YYYY-MM-DD date')
+    return grain, since, args.get('store') or None
+
+
+def plan_range(args):
+    """Inclusive (start, end) ISO dates and servings for a meal-plan expansion."""
+    try:
+        start, end = (date.fromisoformat(args[k]).isoformat() if args.get(k) else None for k in ('start', 'end'))
+        servings = int(args['servings']) if args.get('servings') else None
+    except (TypeError, ValueError):
+        raise ValueError('start and end must be YYYY-MM-DD dates and servings an integer')
+    return start, end, servings
+
+
+async def json_error(request, e):
+    if request.url.path.startswith('/api/'):
+        return JSONResponse({'error': HTTPStatus(e.status_code).phrase, 'message': e.detail}, e.status_code)
+    return Response(e.detail, e.status_code)
+
+
+async def api_list_items(request):
+    username = request.query_params.get('user', DEFAULT_USER)
+    return conditional(request, [item_json(i) for i in await db_async.get_items_db(username)])
+
+
+async def api_get_items(request):
+    """Items in insertion order, or with ``?q=`` those whose name starts with q, in name order."""
+    username = request.path_params['username']
+    cursor = request.query_params.get('cursor')
+    after = decode_cursor(cursor) if cursor else None
+    prefix = request.query_params.get('q', '').strip()
+    if prefix:
+        if after is not None and not (isinstance(after, list) and len(after) == 2 and isinstance(after[1], int)):
+            raise HTTPException(400, 'invalid cursor')
+        items, last = await db_async.search_items_db(username, prefix, page_limit(request),
+                                                     tuple(after) if after else None)
+    else:
+        if after is not None and not isinstance(after, int):
+            raise HTTPException(400, 'invalid cursor')
+        items, last = await db_async.get_items_page_db(username, page_limit(request), after)
+    return conditional(request, {
+        'items': [item_json(i) for i in items],
+        'next_cursor': encode_cursor(last) if last is not None else None,
+    })
+
+
+async def api_add_items(request):
+    """Add one item (an object) or many (an array); a bulk add is all-or-nothing."""
+    username = request.path_params['username']
+    payload = await json_body(request)
+    rows = payload if isinstance(payload, list) else [payload]
+    if len(rows) > MAX_BULK_ITEMS:
+        raise HTTPException(413, f'at most {MAX_BULK_ITEMS} items per request')
+    items, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            items.append(validate_item(row))
+        except ValueError as e:
+            errors.append({'index': index, 'message': str(e)})
+    if errors:
+        return JSONResponse({'error': 'Bad Request', 'message': 'invalid items', 'errors': errors}, 400)
+    if isinstance(payload, list):
+        return JSONResponse({'created': await db_async.add_items_db(items, username)}, 201)
+    item = items[0]
+    item_id = await db_async.add_item_db(item['name'], item['quantity'], item['category'], username,
+                                         item.get('image_path'))
+    return JSONResponse(item_json(await db_async.get_item_db(item_id, username)), 201)
+
+
+async def api_clear_items(request):
+    await db_async.clear_items_db(request.path_params['username'])
+    return Response(status_code=204)
+
+
+async def api_get_item(request):
+    item = await db_async.get_item_db(request.path_params['item_id'], request.path_params['username'])
+    if item is None:
+        raise HTTPException(404, 'no such item')
+    return conditional(request, item_json(item))
+
+
+async def api_update_item(request):
+    """Change the fields sent (name, quantity, category, image_path); the others stay as they are.
+
+    Send the item's ``version`` to get a 409 instead of overwriting someone else's change.
+    """
+    username, item_id = request.path_params['username'], request.path_params['item_id']
+    payload = await json_body(request)
+    if not isinstance(payload, dict):
+        raise HTTPException(400, 'expected an object')
+    try:
+        fields = validate_patch(payload)
+        version = expected_version(payload.get('version'))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    try:
+        item = await db_async.update_item_db(item_id, username, version, **fields)
+    except db.VersionConflict as e:
+        return JSONResponse(conflict_json(e), 409)
+    if item is None:
+        raise HTTPException(404, 'no such item')
+    return JSONResponse(item_json(item))
+
+
+async def api_delete_item(request):
+    """Delete an item; with ``?version=`` only if nobody has changed it since."""
+    try:
+        deleted = await db_async.delete_item_db(request.path_params['item_id'], request.path_params['username'],
+                                                expected_version(request.query_params.get('version')))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except db.VersionConflict as e:
+        return JSONResponse(conflict_json(e), 409)
+    if not deleted:
+        raise HTTPException(404, 'no such item')
+    return Response(status_code=204)
+
+
+async def api_get_changes(request):
+    """Changes to the list after version ``?since=``; ``?wait=`` (seconds) holds the request until there are some.
+
+    Without ``since``, or when it is older than the change log, the response
+    has ``"reset": true`` and the whole list in ``items``.
+    """
+    try:
+        since, limit, wait = change_args(request.query_params)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    username = request.path_params['username']
+    deadline = time.monotonic() + wait
+    while True:
+        version, changes, items = await db_async.get_changes_db(username, since, limit)
+        if changes or items is not None or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(CHANGE_POLL_SECONDS)
+    return JSONResponse(changes_json(version, changes, items), headers={'Cache-Control': 'no-store'})
+
+
+async def api_stream_changes(request):
+    """Server-sent events: a ``changes`` event, with the /changes payload, whenever the list changes.
+
+    Starts after ``?since=`` or the Last-Event-ID header; without either the
+    first event is a reset with the whole list. Each event id is its version.
+    """
+    args = {**request.query_params,
+            'since': request.headers.get('last-event-id') or request.query_params.get('since')}
+    try:
+        since, limit, _ = change_args(args)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    username = request.path_params['username']
+
+    async def events(since):
+        yield f'retry: {int(CHANGE_POLL_SECONDS * 4000)}\n\n'
+        started = quiet = time.monotonic()
+        while time.monotonic() - started < STREAM_SECONDS:
+            version, changes, items = await db_async.get_changes_db(username, since, limit)
+            if changes or items is not None:
+                since = version
+                data = json.dumps(changes_json(version, changes, items), separators=(',', ':'))
+                yield f'id: {version}\nevent: changes\ndata: {data}\n\n'
+                quiet = time.monotonic()
+                continue
+            if time.monotonic() - quiet >= KEEPALIVE_SECONDS:
+                yield ': keepalive\n\n'
+                quiet = time.monotonic()
+            await asyncio.sleep(CHANGE_POLL_SECONDS)
+
+    return StreamingResponse(events(since), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+
+async def api_get_stores(request):
+    return conditional(request, {'stores': sorted(optimizers)})
+
+
+async def api_get_route(request):
+    """The list in walking order for ``?store=`` (default: the built-in layout)."""
+    optimizer = optimizers.get(request.query_params.get('store') or next(iter(optimizers)))
+    if optimizer is None:
+        raise HTTPException(404, 'no such store')
+    items = await db_async.get_items_db(request.path_params['username'])
+    return conditional(request, route_json(await run_in_threadpool(optimizer.plan, items)))
+
+
+async def api_get_history(request):
+    before = None
+    if request.query_params.get('cursor'):
+        cursor = decode_cursor(request.query_params['cursor'])
+        try:
+            before = (datetime.fromisoformat(cursor[0]), int(cursor[1]))
+        except (TypeError, ValueError, IndexError):
+            raise HTTPException(400, 'invalid cursor')
+    page, last = await db_async.get_history_page_db(request.path_params['username'], page_limit(request), before)
+    return conditional(request, {
+        'history': [{'id': history_id, 'timestamp': timestamp_json(timestamp), 'items': items}
+                    for history_id, timestamp, items in page],
+        'next_cursor': encode_cursor([last[0].isoformat(), last[1]]) if last else None,
+    })
+
+
+async def api_add_history(request):
+    """Record a purchase: ``{"items": [...], "timestamp": optional ISO string}``."""
+    payload = await json_body(request)
+    rows = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(rows, list) or not rows:
+        raise HTTPException(400, 'expected a non-empty "items" array')
+    try:
+        items = [validate_item(row) for row in rows]
+        timestamp = datetime.fromisoformat(payload['timestamp']) if payload.get('timestamp') else None
+    except (TypeError, ValueError) as e:
+        raise HTTPException(400, str(e))
+    history_id = await db_async.add_history_db(items, request.path_params['username'], timestamp)
+    return JSONResponse({'id': history_id, 'items': items}, 201)
+
+
+async def api_get_meals(request):
+    meals = await db_async.get_meals_db(request.path_params['username'])
+    return conditional(request, {'meals': [{'date': date, 'items': items} for date, items in meals]})
+
+
+async def api_add_meal(request):
+    """Plan a meal: ``{"date": "YYYY-MM-DD", "items": ["name", ...]}``."""
+    payload = await json_body(request)
+    date = payload.get('date') if isinstance(payload, dict) else None
+    items = payload.get('items') if isinstance(payload, dict) else None
+    if not isinstance(date, str) or not date.strip():
+        raise HTTPException(400, 'expected a "date" string')
+    if not isinstance(items, list) or not all(isinstance(i, str) and i.strip() for i in items):
+        raise HTTPException(400, 'expected an "items" array of names')
+    items = [i.strip().title() for i in items]
+    meal_id = await db_async.add_meal_db(date.strip(), items, request.path_params['username'])
+    return JSONResponse({'id': meal_id, 'date': date.strip(), 'items': items}, 201)
+
+
+async def api_get_recipes(request):
+    recipes = await db_async.get_recipes_db(request.path_params['username'])
+    return conditional(request, {'recipes': [recipe_json(r) for r in recipes]})
+
+
+async def api_save_recipe(request):
+    """Create or replace a recipe; meal-plan entries with its name expand into its ingredients."""
+    username = request.path_params['username']
+    payload = await json_body(request)
+    try:
+        name, ingredients, servings = validate_recipe(payload)
+        await db_async.save_recipe_db(username, name, ingredients, servings)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(400, str(e))
+    return JSONResponse(recipe_json(await db_async.get_recipe_db(username, name)), 201)
+
+
+async def api_delete_recipe(request):
+    if not await db_async.delete_recipe_db(request.path_params['username'], request.path_params['name']):
+        raise HTTPException(404, 'no such recipe')
+    return Response(status_code=204)
+
+
+async def api_meal_shopping_list(request):
+    """What the meals from ``?start=`` to ``?end=`` need beyond the current list."""
+    try:
+        start, end, servings = plan_range(request.query_params)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    expansion = await db_async.expand_meal_plan_db(request.path_params['username'], start, end, servings=servings)
+    return conditional(request, expansion_json(expansion))
+
+
+async def api_add_meal_shopping_list(request):
+    """Add what the planned meals need to the list: ``{"start", "end", "servings"}``, all optional."""
+    try:
+        payload = await request.json() if await request.body() else {}
+    except ValueError:
+        payload = {}
+    try:
+        start, end, servings = plan_range(payload if isinstance(payload, dict) else {})
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    expansion = await db_async.add_meal_plan_to_list_db(request.path_params['username'], start, end, servings)
+    return JSONResponse(expansion_json(expansion))
+
+
+async def api_get_suggestions(request):
+    """Ranked suggestions; ``?current=a,b`` names items already on the list."""
+    try:
+        top_n = max(1, min(int(request.query_params.get('top_n', 5)), 100))
+    except ValueError:
+        raise HTTPException(400, 'top_n must be an integer')
+    current = [name for name in request.query_params.get('current', '').split(',') if name.strip()]
+    suggestions = await db_async.get_ranked_suggestions_db(request.path_params['username'], top_n, current=current)
+    return conditional(request, {'suggestions': [
+        {'name': s.name, 'score': round(s.score, 4), 'reason': s.reason,
+         'due_in_days': round(s.due_in_days, 1) if s.due_in_days is not None else None}
+        for s in suggestions
+    ]})
+
+
+async def api_autocomplete(request):
+    """Known names for ``?q=`` (prefix or near-miss spelling) and the key adding it would be stored under.
+
+    A near miss of one known name comes back as ``did_you_mean``; adding ``q``
+    as typed does not apply it. Accepting it is POST .../aliases with
+    ``"source": "typo"``.
+    """
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        raise HTTPException(400, 'q is required')
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 10)), 100))
+    except ValueError:
+        raise HTTPException(400, 'limit must be an integer')
+    resolution, completions = await db_async.autocomplete_db(request.path_params['username'], text, limit)
+    typo = resolution.how == 'typo'
+    return conditional(request, {
+        'query': text,
+        'key': canonical_name(text) if typo else resolution.key,
+        'match': 'new' if typo else resolution.how,
+        'did_you_mean': resolution.key if typo else None,
+        'suggestions': [c._asdict() for c in completions],
+    })
+
+
+async def api_get_aliases(request):
+    aliases = await db_async.get_aliases_db(request.path_params['username'])
+    return conditional(request, {'aliases': aliases_json(aliases)})
+
+
+async def api_set_alias(request):
+    """``{"alias", "name"[, "source"]}``: treat alias as the same item as name, merging rows already stored under it.
+
+    ``source`` is "user" (default) or "typo" for an accepted autocomplete correction.
+    """
+    username = request.path_params['username']
+    payload = await json_body(request)
+    if not isinstance(payload, dict) or not isinstance(payload.get('alias'), str) or \
+            not isinstance(payload.get('name'), str) or payload.get('source', 'user') not in ('user', 'typo'):
+        raise HTTPException(400, 'expected {"alias", "name"[, "source": "user" or "typo"]}')
+    try:
+        await db_async.set_alias_db(username, payload['alias'], payload['name'], payload.get('source', 'user'))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return JSONResponse({'aliases': aliases_json(await db_async.get_aliases_db(username))}, 201)
+
+
+async def api_delete_alias(request):
+    if not await db_async.delete_alias_db(request.path_params['username'], request.path_params['alias']):
+        raise HTTPException(404, 'no such alias')
+    return Response(status_code=204)
+
+
+async def api_check_out_items(request):
+    """``{"ids": [...]}``: record those items as bought (history and pantry) and take them off the list."""
+    payload = await json_body(request)
+    ids = payload.get('ids') if isinstance(payload, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+        raise HTTPException(400, 'expected an "ids" array of item ids')
+    return JSONResponse({'checked_out': await db_async.check_out_items_db(ids, request.path_params['username'])})
+
+
+async def api_get_pantry(request):
+    """What is at home, with the estimated amount left and run-out date, soonest first."""
+    entries = await db_async.get_pantry_db(request.path_params['username'])
+    return conditional(request, {'items': [pantry_json(e) for e in entries]})
+
+
+async def api_add_to_pantry(request):
+    """Record items bought outside the list: one object or an array."""
+    payload = await json_body(request)
+    rows = payload if isinstance(payload, list) else [payload]
+    if len(rows) > MAX_BULK_ITEMS:
+        raise HTTPException(413, f'at most {MAX_BULK_ITEMS} items per request')
+    try:
+        items = [validate_item(row) for row in rows]
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    await db_async.add_to_pantry_db(items, request.path_params['username'])
+    return JSONResponse({'added': len(items)}, 201)
+
+
+async def api_set_pantry_item(request):
+    """``{"quantity": n, "category": optional}``: how much is at home now; 0 removes the item."""
+    payload = await json_body(request)
+    quantity = payload.get('quantity') if isinstance(payload, dict) else None
+    if isinstance(quantity, bool) or not isinstance(quantity, (int, float)):
+        raise HTTPException(400, 'expected a numeric "quantity"')
+    if not await db_async.set_pantry_item_db(request.path_params['username'], request.path_params['name'], quantity,
+                                             str(payload.get('category') or 'Other')):
+        raise HTTPException(404, 'no such pantry item')
+    return Response(status_code=204)
+
+
+async def api_delete_pantry_item(request):
+    if not await db_async.set_pantry_item_db(request.path_params['username'], request.path_params['name'], 0):
+        raise HTTPException(404, 'no such pantry item')
+    return Response(status_code=204)
+
+
+async def api_pantry_proposals(request):
+    """Items forecast to run out within ``?days=`` (default 7) that are not on the list yet."""
+    try:
+        days = horizon_days(request.query_params.get('days'))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    proposals = await db_async.get_pantry_proposals_db(request.path_params['username'], days)
+    return conditional(request, {'proposals': [proposal_json(p) for p in proposals]})
+
+
+async def api_add_pantry_proposals(request):
+    """Put the proposals on the list: ``{"days": optional}``."""
+    try:
+        payload = await request.json() if await request.body() else {}
+    except ValueError:
+        payload = {}
+    try:
+        days = horizon_days(payload.get('days') if isinstance(payload, dict) else None)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    added = await db_async.add_pantry_proposals_to_list_db(request.path_params['username'], days)
+    return JSONResponse({'added': [proposal_json(p) for p in added]})
+
+
+def job_json(job):
+    return {'id': job.id, 'job': job.job, 'username': job.username, 'payload': json.loads(job.payload),
+            'status': job.status, 'attempts': job.attempts, 'max_attempts': job.max_attempts,
+            'run_at': timestamp_json(job.run_at), 'enqueued_at': timestamp_json(job.enqueued_at),
+            'started_at': timestamp_json(job.started_at), 'finished_at': timestamp_json(job.finished_at),
+            'result': json.loads(job.result) if job.result else None, 'error': job.last_error}
+
+
+async def api_job_stats(request):
+    """Queue depth per job and status, and the latest failures."""
+    return JSONResponse({
+        'queue': [{'job': job, 'status': status, 'count': count, 'oldest_pending_seconds': age}
+                  for job, status, count, age in await db_async.get_job_stats_db()],
+        'failed': [job_json(job) for job in await db_async.get_jobs_db('failed', limit=20)],
+    })
+
+
+async def api_get_job(request):
+    job = await db_async.get_job_db(request.path_params['job_id'])
+    if job is None:
+        raise HTTPException(404, 'no such job')
+    return JSONResponse(job_json(job))
+
+
+async def api_enqueue_job(request):
+    """``{"job": "rank-suggestions"}``: recompute now for this user; an identical pending job is returned instead."""
+    payload = await json_body(request)
+    name = payload.get('job') if isinstance(payload, dict) else None
+    if name not in jobs.USER_TASKS:
+        raise HTTPException(400, f'job must be one of {", ".join(jobs.USER_TASKS)}')
+    job = await db_async.enqueue_job_db(name, request.path_params['username'])
+    jobs.wake()
+    return JSONResponse(job_json(job), 202)
+
+
+async def api_get_price_stores(request):
+    """Stores in the price catalog and how many items each has a price for."""
+    rows = await db_async.get_price_stores_db()
+    return conditional(request, {'stores': [{'store': store, 'items': n} for store, n in rows]})
+
+
+async def api_import_prices(request):
+    """A price catalog file as the request body (rows of store, name, price[, date]), imported by a background job.
+
+    ``?format=`` is csv, jsonl or parquet; without it the format is detected.
+    The response is the queued job, whose result reports rejected rows.
+    """
+    fmt = request.query_params.get('format') or None
+    if fmt is not None and fmt not in transfer.FORMATS:
+        raise HTTPException(400, f'format must be one of {", ".join(transfer.FORMATS)}')
+    os.makedirs(jobs.UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.upload', dir=jobs.UPLOAD_DIR)
+    with os.fdopen(fd, 'wb') as f:
+        async for chunk in request.stream():
+            await run_in_threadpool(f.write, chunk)
+        empty = f.tell() == 0
+    if empty:
+        os.remove(path)
+        raise HTTPException(400, 'expected a price catalog file as the request body')
+    # One attempt: a retry would add the rows imported before a failure again
+    job = await db_async.enqueue_job_db('import-prices', payload={'path': path, 'fmt': fmt}, max_attempts=1)
+    jobs.wake()
+    return JSONResponse(job_json(job), 202)
+
+
+async def api_get_price_history(request):
+    """Observed prices of an item by store and date; ``?store=`` and ``?since=`` (YYYY-MM-DD) narrow it down."""
+    name, args = request.path_params['name'], request.query_params
+    try:
+        since = datetime.fromisoformat(args['since']) if args.get('since') else None
+    except ValueError:
+        raise HTTPException(400, 'since must be a YYYY-MM-DD date')
+    rows = await db_async.get_price_history_db(name, args.get('store') or None, since)
+    return conditional(request, {'name': name, 'prices': [
+        {'store': store, 'price': price, 'observed_at': timestamp_json(observed_at)}
+        for store, price, observed_at in rows
+    ]})
+
+
+async def api_plan_budget(request):
+    """Where to buy the list at current prices: ``?budget=`` caps the spend, ``?max_stores=`` allows a split
+    (each extra store has to save ``?store_cost=``), ``?stores=a,b`` limits the choice."""
+    try:
+        budget, max_stores, store_cost, stores = budget_args(request.query_params)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    plan = await db_async.plan_budget_db(request.path_params['username'], budget, max_stores, store_cost, stores)
+    return conditional(request, plan_json(plan))
+
+
+async def api_get_spend(request):
+    """Estimated spend per ``?grain=`` (day, week or month) from purchase history, priced from the catalog."""
+    try:
+        grain, since, store = spend_args(request.query_params)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    periods = await db_async.get_spend_db(request.path_params['username'], grain, since, store)
+    return conditional(request, {'grain': grain, 'periods': [
+        {'period': period, 'spend': spend, 'unpriced_quantity': unpriced} for period, spend, unpriced in periods
+    ]})
+
+
+async def image_thumbnail(request):
+    """Item thumbnail by content hash; the URL never changes meaning, so it is cached for a year."""
+    size = request.path_params['size']
+    if size not in images.sizes:
+        raise HTTPException(404, 'Not Found')
+    data = await run_in_threadpool(images.thumbnail, request.path_params['digest'], size)
+    if data is None:
+        raise HTTPException(404, 'Not Found')
+    return Response(data, media_type='image/webp', headers={'Cache-Control': 'public, max-age=31536000, immutable'})
+
+
+async def metrics_endpoint(request):
+    # The job queue gauges read the database with db.py
+    return Response(await run_in_threadpool(metrics.render), media_type=metrics.CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """Times each request under its route pattern, like app.py's after_request hook."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not metrics.enabled():
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            metrics.observe(metrics.HTTP_REQUEST, time.perf_counter() - start, method=scope['method'],
+                            route=getattr(route, 'path', 'unmatched'), status=str(status))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await db_async.init_db()
+    jobs.start_worker()
+    try:
+        yield
+    finally:
+        await run_in_threadpool(jobs.stop_worker)
+        await db_async.dispose()
+        images.close()
+
+
+ITEMS = '/api/users/{username}/items'
+app = Starlette(
+    routes=[
+        Route('/api/items', api_list_items, methods=['GET']),
+        Route(ITEMS, api_get_items, methods=['GET']),
+        Route(ITEMS, api_add_items, methods=['POST']),
+        Route(ITEMS, api_clear_items, methods=['DELETE']),
+        Route(ITEMS + '/{item_id:int}', api_get_item, methods=['GET']),
+        Route(ITEMS + '/{item_id:int}', api_update_item, methods=['PATCH']),
+        Route(ITEMS + '/{item_id:int}', api_delete_item, methods=['DELETE']),
+        Route(ITEMS + '/checkout', api_check_out_items, methods=['POST']),
+        Route('/api/users/{username}/changes', api_get_changes, methods=['GET']),
+        Route('/api/users/{username}/changes/stream', api_stream_changes, methods=['GET']),
+        Route('/api/stores', api_get_stores, methods=['GET']),
+        Route('/api/users/{username}/route', api_get_route, methods=['GET']),
+        Route('/api/users/{username}/history', api_get_history, methods=['GET']),
+        Route('/api/users/{username}/history', api_add_history, methods=['POST']),
+        Route('/api/users/{username}/meals', api_get_meals, methods=['GET']),
+        Route('/api/users/{username}/meals', api_add_meal, methods=['POST']),
+        Route('/api/users/{username}/meals/shopping-list', api_meal_shopping_list, methods=['GET']),
+        Route('/api/users/{username}/meals/shopping-list', api_add_meal_shopping_list, methods=['POST']),
+        Route('/api/users/{username}/recipes', api_get_recipes, methods=['GET']),
+        Route('/api/users/{username}/recipes', api_save_recipe, methods=['POST']),
+        Route('/api/users/{username}/recipes/{name}', api_delete_recipe, methods=['DELETE']),
+        Route('/api/users/{username}/suggestions', api_get_suggestions, methods=['GET']),
+        Route('/api/users/{username}/autocomplete', api_autocomplete, methods=['GET']),
+        Route('/api/users/{username}/aliases', api_get_aliases, methods=['GET']),
+        Route('/api/users/{username}/aliases', api_set_alias, methods=['POST']),
+        Route('/api/users/{username}/aliases/{alias}', api_delete_alias, methods=['DELETE']),
+        Route('/api/users/{username}/pantry', api_get_pantry, methods=['GET']),
+        Route('/api/users/{username}/pantry', api_add_to_pantry, methods=['POST']),
+        Route('/api/users/{username}/pantry/proposals', api_pantry_proposals, methods=['GET']),
+        Route('/api/users/{username}/pantry/proposals', api_add_pantry_proposals, methods=['POST']),
+        Route('/api/users/{username}/pantry/{name}', api_set_pantry_item, methods=['PUT']),
+        Route('/api/users/{username}/pantry/{name}', api_delete_pantry_item, methods=['DELETE']),
+        Route('/api/jobs', api_job_stats, methods=['GET']),
+        Route('/api/jobs/{job_id:int}', api_get_job, methods=['GET']),
+        Route('/api/users/{username}/jobs', api_enqueue_job, methods=['POST']),
+        Route('/api/prices', api_get_price_stores, methods=['GET']),
+        Route('/api/prices', api_import_prices, methods=['POST']),
+        Route('/api/prices/{name}', api_get_price_history, methods=['GET']),
+        Route('/api/users/{username}/budget', api_plan_budget, methods=['GET']),
+        Route('/api/users/{username}/spend', api_get_spend, methods=['GET']),
+        Route('/images/{digest}/{size:int}.webp', image_thumbnail, methods=['GET']),
+        Route('/metrics', metrics_endpoint, methods=['GET']),
+    ],
+    middleware=[Middleware(MetricsMiddleware)],
+    exception_handlers={HTTPException: json_error},
+    lifespan=lifespan,
+)
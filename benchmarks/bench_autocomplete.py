@@ -0,0 +1,107 @@
+"""Autocomplete and typo lookups over a large item vocabulary.
+
+Builds an AutocompleteIndex of generated item names ("crunchy marlo rice")
+weighted like purchase counts, then times prefix completions for prefixes of
+1 to 6 characters, typo lookups for names with one edit (what Canonicalizer
+corrects) and two, and Canonicalizer.resolve, against a linear scan of the
+same vocabulary. Short prefixes match thousands of names; their ranking is
+computed once and cached, so both the first and the repeated lookups are
+reported.
+
+    python benchmarks/bench_autocomplete.py [--names 100000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smart_grocery.canonical import AutocompleteIndex, Canonicalizer, canonical_name, edit_distance
+
+SYLLABLES = ["ba", "ko", "ri", "mel", "sa", "to", "nu", "pi", "lo", "fa", "ven", "dor", "chi", "qua", "zem",
+             "ti", "mar", "lo", "ne", "gru", "sho", "pa", "el", "an", "o", "bri", "ca", "de"]
+ADJECTIVES = ["", "", "", "organic ", "frozen ", "smoked ", "crunchy ", "low fat ", "whole ", "spicy ", "baby "]
+NOUNS = ["rice", "beans", "sauce", "chips", "tomatoes", "cheese", "bread", "noodles", "tea", "apples", "soup",
+         "crackers", "yogurt", "juice", "cookies", "peppers"]
+
+
+def vocabulary(n, rng):
+    names = set()
+    while len(names) < n:
+        brand = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+        names.add(f"{rng.choice(ADJECTIVES)}{brand} {rng.choice(NOUNS)}")
+    # Zipf-like purchase counts
+    return [(name, int(1000 / (rank + 1)) + 1) for rank, name in enumerate(sorted(names, key=lambda _: rng.random()))]
+
+
+def typo(name, edits, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    for _ in range(edits):
+        i = rng.randrange(len(name))
+        kind = rng.randrange(3)
+        if kind == 0:
+            name = name[:i] + rng.choice(letters) + name[i + 1:]
+        elif kind == 1:
+            name = name[:i] + name[i + 1:]
+        else:
+            name = name[:i] + rng.choice(letters) + name[i:]
+    return name
+
+
+def timed(fn, queries):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        times.append((time.perf_counter() - start) * 1e6)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.99) - 1]
+
+
+def report(label, fn, queries):
+    p50, p99 = timed(fn, queries)
+    print(f"{label:<34} {p50:>9.1f} us {p99:>9.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    names = vocabulary(args.names, rng)
+    start = time.perf_counter()
+    index = AutocompleteIndex(names)
+    print(f"{len(index)} canonical names from {len(names)} generated, index built in "
+          f"{time.perf_counter() - start:.2f} s\n")
+    keys = [canonical_name(name) for name, _ in names]
+    weights = dict((canonical_name(n), w) for n, w in names)
+    sample = [rng.choice(keys) for _ in range(args.queries)]
+
+    print(f"{'lookup':<34} {'p50':>12} {'p99':>12}")
+    for length in (1, 2, 3, 4, 6):
+        prefixes = [key[:length] for key in sample]
+        index._top.clear()
+        report(f"prefix, {length} chars (first)", lambda p: index.complete(p, 10), prefixes)
+        report(f"prefix, {length} chars (repeat)", lambda p: index.complete(p, 10), prefixes)
+    for edits in (1, 2):
+        typos = [typo(key, edits, rng) for key in sample]
+        report(f"typo, {edits} edit{'s' if edits > 1 else ''}", lambda q: index.fuzzy(q, 5, edits), typos)
+    canonicalizer = Canonicalizer(index)
+    report("resolve (known or typo)", canonicalizer.resolve, [typo(key, 1, rng) for key in sample])
+    report("suggest, 4 chars", lambda p: index.suggest(p, 10), [key[:4] for key in sample])
+
+    print("\nlinear scan over the vocabulary:")
+    few = sample[:20]
+    report("prefix, 3 chars", lambda p: sorted((k for k in keys if k.startswith(p)), key=weights.get)[-10:],
+           [key[:3] for key in few])
+    report("typo, 1 edit", lambda q: [k for k in keys if edit_distance(q, k, 1) <= 1],
+           [typo(key, 1, rng) for key in few])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Budget plans over large generated price catalogs.
+
+Builds a catalog of N SKUs priced at S stores (each store carries about 80%
+of them, at its own price level plus noise), then times planning lists of
+several sizes against it: the cheapest single store, splits over up to 2 and
+3 stores (with a per-store cost), and each of those under a spending cap of
+70% of the unconstrained total, so the knapsack step runs too. With --db the
+catalog is also imported into a temporary database and db.plan_budget_db is
+timed for the largest list.
+
+    python benchmarks/bench_budget.py [--skus 100000] [--stores 50] [--items 50 500] [--db]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smart_grocery.models import GroceryItem, GroceryList
+from smart_grocery.prices import PriceCatalog
+
+COVERAGE = 0.8
+STORE_COST = 2.0
+USER = "bench"
+
+
+def catalog_rows(skus, stores, seed=1):
+    """``(key, store, price)`` for every SKU a store carries."""
+    rng = np.random.default_rng(seed)
+    base = rng.lognormal(1.0, 0.8, skus)
+    level = rng.uniform(0.85, 1.15, stores)
+    carried = rng.random((skus, stores)) < COVERAGE
+    sku, store = np.nonzero(carried)
+    price = np.round(base[sku] * level[store] * rng.uniform(0.9, 1.1, len(sku)), 2).clip(0.05)
+    names = [f"item {i}" for i in range(skus)]
+    store_names = [f"store {j}" for j in range(stores)]
+    return [(names[i], store_names[j], p) for i, j, p in zip(sku.tolist(), store.tolist(), price.tolist())]
+
+
+def shopping_list(n, skus, seed=2):
+    rng = np.random.default_rng(seed)
+    grocery_list = GroceryList()
+    for i in rng.choice(skus, n, replace=False):
+        grocery_list.add_item(GroceryItem(f"Item {i}", int(rng.integers(1, 4))))
+    return grocery_list
+
+
+def median_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+
+def import_catalog(db, rows, chunk_size=10_000):
+    for start in range(0, len(rows), chunk_size):
+        db.add_prices_db([{"store": store, "name": key.title(), "price": price, "observed_at": None}
+                          for key, store, price in rows[start:start + chunk_size]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--stores", type=int, default=50)
+    parser.add_argument("--items", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--db", action="store_true", help="also import the catalog and time db.plan_budget_db")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = catalog_rows(args.skus, args.stores)
+    generated = time.perf_counter() - start
+    start = time.perf_counter()
+    catalog = PriceCatalog(rows)
+    print(f"{args.skus:,} SKUs x {args.stores} stores, {len(rows):,} prices "
+          f"(generated in {generated:.1f}s, matrix built in {time.perf_counter() - start:.1f}s)")
+    print(f"{'items':>6}  {'stores':>6}  {'no cap':>10}  {'70% cap':>10}  {'total':>10}  {'capped':>10}  {'kept':>9}")
+    for n in args.items:
+        grocery_list = shopping_list(n, args.skus)
+        for max_stores in (1, 2, 3):
+            plan = catalog.plan(grocery_list, None, max_stores, STORE_COST)
+            cap = round(plan.total * 0.7, 2)
+            capped = catalog.plan(grocery_list, cap, max_stores, STORE_COST)
+            free_ms = median_ms(lambda: catalog.plan(grocery_list, None, max_stores, STORE_COST), args.repeats)
+            cap_ms = median_ms(lambda: catalog.plan(grocery_list, cap, max_stores, STORE_COST), args.repeats)
+            print(f"{n:>6}  {len(plan.stores):>6}  {free_ms:>7.1f} ms  {cap_ms:>7.1f} ms  {plan.total:>10.2f}  "
+                  f"{capped.total:>10.2f}  {len(capped.lines):>4}/{len(plan.lines):<4}")
+
+    if args.db:
+        tmp = tempfile.mkdtemp(prefix="grocery_bench_")
+        os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ.setdefault("GROCERY_JOB_THREADS", "0")
+        import db
+
+        db.init_db()
+        start = time.perf_counter()
+        import_catalog(db, rows)
+        print(f"\nImported into {tmp} in {time.perf_counter() - start:.1f}s")
+        grocery_list = shopping_list(max(args.items), args.skus)
+        db.add_items_db([{"name": item.name, "quantity": item.quantity, "category": item.category}
+                         for item in grocery_list], USER)
+        for max_stores in (1, 2, 3):
+            ms = median_ms(lambda: db.plan_budget_db(USER, None, max_stores, STORE_COST), args.repeats)
+            print(f"db.plan_budget_db, {max(args.items)} items, up to {max_stores} stores: {ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Throughput of the batched list-mutation API against the per-item helpers.
+
+Each row adds, edits and deletes N items for one user, first one call (and one
+transaction) per item, then with add_items_db/update_items_db/delete_items_db.
+The last row saves an N-item list to history and clears it, either as three
+separate calls or with save_list_to_history_db.
+
+    python benchmarks/bench_bulk_writes.py [--items 10000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='grocery_bench_'), 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Meat", "Beverages", "Snacks", "Other"]
+
+
+def rows(n):
+    return [{"name": f"Item {i}", "quantity": 1 + i % 3, "category": CATEGORIES[i % len(CATEGORIES)]} for i in range(n)]
+
+
+def item_ids(user):
+    return [item.id for item in db.get_items_db(user)]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def per_item(n, user="per_item"):
+    items = rows(n)
+    add = timed(lambda: [db.add_item_db(i["name"], i["quantity"], i["category"], user) for i in items])
+    ids = item_ids(user)
+    edit = timed(lambda: [db.update_item_db(item_id, user, quantity=5) for item_id in ids])
+    delete = timed(lambda: [db.delete_item_db(item_id, user) for item_id in ids])
+    return add, edit, delete
+
+
+def batched(n, user="batched"):
+    items = rows(n)
+    add = timed(lambda: db.add_items_db(items, user))
+    ids = item_ids(user)
+    edit = timed(lambda: db.update_items_db([{"id": item_id, "quantity": 5} for item_id in ids], user))
+    delete = timed(lambda: db.delete_items_db(ids, user))
+    return add, edit, delete
+
+
+def save_separately(n, user="save_old"):
+    db.add_items_db(rows(n), user)
+
+    def save():
+        items = db.get_items_db(user)
+        db.add_history_db([{"name": i.name, "quantity": i.quantity, "category": i.category} for i in items], user)
+        db.clear_items_db(user)
+    return timed(save)
+
+
+def save_atomically(n, user="save_new"):
+    db.add_items_db(rows(n), user)
+    return timed(lambda: db.save_list_to_history_db(user))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10_000)
+    args = parser.parse_args()
+    n = args.items
+
+    db.init_db()
+    print(f"{n:,} items          {'per item':>16}  {'batched':>16}  speed-up")
+    for label, old, new in zip(("add", "edit", "delete"), per_item(n), batched(n)):
+        print(f"  {label:<16} {n / old:>10,.0f} items/s  {n / new:>10,.0f} items/s  {old / new:>6.0f}x")
+    old, new = save_separately(n), save_atomically(n)
+    print(f"  save + clear     {old * 1000:>13.0f} ms  {new * 1000:>13.0f} ms  {old / new:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
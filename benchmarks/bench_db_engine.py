@@ -0,0 +1,71 @@
+"""Compare db.py helpers on the pooled engine against the old engine-per-call path.
+
+    python benchmarks/bench_db_engine.py [--ops 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+TMP_DIR = tempfile.mkdtemp(prefix="grocery_bench_")
+os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(TMP_DIR, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import db
+
+
+def per_call_session():
+    # What every helper used to do: new engine, new sessionmaker, new connection
+    engine = create_engine(os.environ["GROCERY_DB_URL"], echo=False)
+    return sessionmaker(bind=engine)()
+
+
+def per_call_add(i):
+    session = per_call_session()
+    session.add(db.GroceryItemDB(name=f"Item {i}", quantity=1, category="Other", username="bench_old"))
+    session.commit()
+    session.close()
+
+
+def per_call_get(i):
+    session = per_call_session()
+    session.query(db.GroceryItemDB).filter_by(username="bench_old").limit(20).all()
+    session.close()
+
+
+def pooled_add(i):
+    db.add_item_db(f"Item {i}", 1, "Other", "bench_new")
+
+
+def pooled_get(i):
+    with db.session_scope() as session:
+        session.query(db.GroceryItemDB).filter_by(username="bench_new").limit(20).all()
+
+
+def ops_per_sec(fn, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return ops / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+
+    db.init_db()
+    print(f"database: {os.environ['GROCERY_DB_URL']}")
+    print(f"{'operation':<12}{'per-call':>14}{'pooled':>14}{'speedup':>10}")
+    for label, old, new in (("add_item", per_call_add, pooled_add), ("get_items", per_call_get, pooled_get)):
+        old_rate = ops_per_sec(old, args.ops)
+        new_rate = ops_per_sec(new, args.ops)
+        print(f"{label:<12}{old_rate:>10.0f} op/s{new_rate:>10.0f} op/s{new_rate / old_rate:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
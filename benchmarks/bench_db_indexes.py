@@ -0,0 +1,95 @@
+"""Seed a throwaway database and time username-scoped queries before and after the index migration.
+
+    python benchmarks/bench_db_indexes.py [--history-rows 1000000] [--users 1000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TMP_DIR = tempfile.mkdtemp(prefix="grocery_bench_")
+os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(TMP_DIR, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+
+import db
+from migrations import run_migrations
+
+ITEMS = ["Milk", "Bread", "Eggs", "Apples", "Rice", "Chicken", "Tomato", "Cheese", "Coffee", "Pasta"]
+
+QUERIES = {
+    "history by user": "SELECT id, timestamp, items FROM grocery_history WHERE username = :u ORDER BY timestamp DESC",
+    "items by user": "SELECT id, name, quantity FROM grocery_items WHERE username = :u",
+    "meals by user": "SELECT date, items FROM meal_plans WHERE username = :u",
+}
+
+
+def seed(engine, history_rows, users):
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1)
+    batch = 50_000
+    with engine.begin() as conn:
+        for offset in range(0, history_rows, batch):
+            rows = []
+            for _ in range(min(batch, history_rows - offset)):
+                basket = [{"name": n, "quantity": rng.randint(1, 4), "category": "Other"} for n in rng.sample(ITEMS, 3)]
+                rows.append({
+                    "u": f"user{rng.randrange(users)}",
+                    "t": start + timedelta(minutes=rng.randrange(3_000_000)),
+                    "i": json.dumps(basket),
+                })
+            conn.execute(text("INSERT INTO grocery_history (username, timestamp, items) VALUES (:u, :t, :i)"), rows)
+        items = [{"u": f"user{rng.randrange(users)}", "n": rng.choice(ITEMS)} for _ in range(history_rows // 10)]
+        conn.execute(text("INSERT INTO grocery_items (username, name, quantity, category) VALUES (:u, :n, 1, 'Other')"), items)
+        meals = [{"u": f"user{rng.randrange(users)}", "d": f"2024-01-{rng.randint(1, 28):02d}"} for _ in range(history_rows // 10)]
+        conn.execute(text("INSERT INTO meal_plans (username, date, items) VALUES (:u, :d, '[]')"), meals)
+        conn.execute(text("ANALYZE"))
+
+
+def time_queries(engine, users, repeats):
+    rng = random.Random(7)
+    results = {}
+    with engine.connect() as conn:
+        for label, sql in QUERIES.items():
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                conn.execute(text(sql), {"u": f"user{rng.randrange(users)}"}).fetchall()
+                samples.append(time.perf_counter() - start)
+            samples.sort()
+            results[label] = samples[len(samples) // 2] * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--history-rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=25)
+    args = parser.parse_args()
+
+    engine = db.configure_engine(migrate=False)
+    run_migrations(engine, target=1)
+    print(f"seeding {args.history_rows:,} history rows into {engine.url} ...")
+    seed(engine, args.history_rows, args.users)
+    before = time_queries(engine, args.users, args.repeats)
+
+    start = time.perf_counter()
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"index migration took {time.perf_counter() - start:.1f}s")
+    after = time_queries(engine, args.users, args.repeats)
+
+    print(f"{'query (median)':<20}{'before':>12}{'after':>12}{'speedup':>10}")
+    for label in QUERIES:
+        print(f"{label:<20}{before[label]:>9.2f} ms{after[label]:>9.2f} ms{before[label] / after[label]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Microbenchmark for grocery.GroceryList: bulk add, lookups, edits and removals.
+
+The previous list-backed implementation is quadratic, so it is timed on a
+smaller list for comparison.
+
+    python benchmarks/bench_grocery_list.py [--items 1000000] [--legacy-items 10000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smart_grocery.models import GroceryItem, GroceryList
+
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Meat", "Beverages", "Snacks", "Other"]
+
+
+class LegacyItem:
+    def __init__(self, name, quantity=1, category="Other"):
+        self.name = name.strip().title()
+        self.quantity = quantity
+        self.category = category.strip().title()
+
+
+class LegacyList:
+    # The pre-index implementation: linear scans and a rebuild on remove
+    def __init__(self):
+        self.items = []
+
+    def add_item(self, item):
+        for existing in self.items:
+            if existing.name == item.name:
+                existing.quantity += item.quantity
+                return
+        self.items.append(item)
+
+    def remove_item(self, name):
+        self.items = [item for item in self.items if item.name.lower() != name.lower()]
+
+
+def names(n):
+    return [f"item {i}" for i in range(n)]
+
+
+def time_adds(grocery_list, item_cls, item_names):
+    start = time.perf_counter()
+    for i, name in enumerate(item_names):
+        grocery_list.add_item(item_cls(name, 1, CATEGORIES[i % len(CATEGORIES)]))
+    return time.perf_counter() - start
+
+
+def bytes_per_item(item_cls, n=100_000):
+    tracemalloc.start()
+    items = [item_cls(f"item {i}", 1, "Other") for i in range(n)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return size / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--legacy-items", type=int, default=10_000)
+    args = parser.parse_args()
+
+    grocery_list = GroceryList()
+    item_names = names(args.items)
+    elapsed = time_adds(grocery_list, GroceryItem, item_names)
+    print(f"GroceryList.add_item      {args.items:>10,} items  {elapsed:7.2f}s  {args.items / elapsed:>12,.0f} items/s")
+
+    start = time.perf_counter()
+    time_adds(grocery_list, GroceryItem, item_names[: args.items // 10])
+    elapsed = time.perf_counter() - start
+    print(f"  merge duplicates        {args.items // 10:>10,} items  {elapsed:7.2f}s")
+
+    start = time.perf_counter()
+    produce = grocery_list.by_category("produce")
+    print(f"  by_category             {len(produce):>10,} items  {time.perf_counter() - start:7.2f}s")
+
+    start = time.perf_counter()
+    for name in item_names[::100]:
+        grocery_list.edit_item(name.upper(), quantity=3, category="Dairy")
+        grocery_list.remove_item(name)
+    print(f"  edit + remove           {len(item_names[::100]):>10,} items  {time.perf_counter() - start:7.2f}s")
+
+    legacy = LegacyList()
+    elapsed = time_adds(legacy, LegacyItem, names(args.legacy_items))
+    print(f"legacy list add_item      {args.legacy_items:>10,} items  {elapsed:7.2f}s  "
+          f"{args.legacy_items / elapsed:>12,.0f} items/s")
+
+    print(f"memory per item: __slots__ {bytes_per_item(GroceryItem):.0f} B, "
+          f"dict-backed {bytes_per_item(LegacyItem):.0f} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Measure cold import time of the CLI and the shared package in fresh interpreters.
+
+Also checks that importing the CLI and touching every public name of
+smart_grocery does not pull in SQLAlchemy, pandas or matplotlib.
+
+    python benchmarks/bench_import_time.py [--runs 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("sqlalchemy", "pandas", "matplotlib")
+
+TARGETS = {
+    "python (baseline)": "pass",
+    "import main": "import main",
+    "import smart_grocery": "import smart_grocery",
+    "all smart_grocery names": "import smart_grocery as sg\nfor n in sg.__all__: getattr(sg, n)",
+    "import db": "import db",
+}
+
+
+def cold_time(code, runs):
+    # Best wall time over several fresh interpreters, measured inside the child
+    probe = "import time\n_t = time.perf_counter()\n" + code + "\nprint(time.perf_counter() - _t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return min(samples) * 1000
+
+
+def heavy_modules(code):
+    probe = code + f"\nimport sys\nprint(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1] if out.stdout.strip() else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'target':<26}{'best of ' + str(args.runs):>12}  heavy deps loaded")
+    failed = False
+    for label, code in TARGETS.items():
+        loaded = heavy_modules(code)
+        print(f"{label:<26}{cold_time(code, args.runs):>9.1f} ms  {loaded or '-'}")
+        if loaded and label != "import db":
+            failed = True
+    if failed:
+        raise SystemExit("heavy dependencies leaked into the CLI import path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Meal-plan expansion for many users: per-user reads against the batched expansion.
+
+Seeds U users with R recipes each and a month of three meals a day, then times
+turning every user's month into a shopping list two ways: one user at a time
+(get_meals_db, get_recipes_db, compile a RecipeIndex, expand) and with
+expand_meal_plans_db, which reads the stored compiled ingredients for all
+users in a few queries.
+
+    python benchmarks/bench_meal_expansion.py [--users 1000] [--recipes 30] [--days 30]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='grocery_bench_'), 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from smart_grocery.recipes import Ingredient, RecipeIndex, expand_meals, list_quantities
+
+UNITS = ["g", "kg", "ml", "cup", "tbsp", "", "can"]
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Meat", "Pantry", "Other"]
+
+
+def seed(users, recipes, days, start, rng):
+    for user in users:
+        for r in range(recipes):
+            ingredients = [Ingredient(f"ingredient {rng.randrange(200)}", rng.randint(1, 500), rng.choice(UNITS),
+                                      rng.choice(CATEGORIES)) for _ in range(rng.randint(4, 12))]
+            db.save_recipe_db(user, f"recipe {r}", ingredients, rng.randint(1, 6))
+        for d in range(days):
+            day = (start + timedelta(days=d)).isoformat()
+            db.add_meal_db(day, [f"recipe {rng.randrange(recipes)}" for _ in range(3)], user)
+        db.add_items_db([{"name": f"ingredient {rng.randrange(200)}", "quantity": 1, "category": "Other"}
+                         for _ in range(20)], user)
+
+
+def per_user(users, start, end):
+    for user in users:
+        index = RecipeIndex(db.get_recipes_db(user))
+        expand_meals(dict(db.get_meals_db(user)), index, start, end, list_quantities(db.get_items_db(user)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--recipes", type=int, default=30)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    db.init_db()
+    rng = random.Random(1)
+    users = [f"user{i}" for i in range(args.users)]
+    first = date(2026, 1, 1)
+    start, end = first.isoformat(), (first + timedelta(days=args.days - 1)).isoformat()
+    t = time.perf_counter()
+    seed(users, args.recipes, args.days, first, rng)
+    print(f"seeded {args.users:,} users x {args.recipes} recipes x {args.days * 3} meals "
+          f"in {time.perf_counter() - t:.1f}s")
+
+    t = time.perf_counter()
+    per_user(users, start, end)
+    old = time.perf_counter() - t
+    t = time.perf_counter()
+    expansions = db.expand_meal_plans_db(users, start, end)
+    new = time.perf_counter() - t
+    lines = sum(len(e.totals) for e in expansions.values())
+    print(f"  per user   {old * 1000:>9.0f} ms  {old / args.users * 1000:>7.2f} ms/user")
+    print(f"  batched    {new * 1000:>9.0f} ms  {new / args.users * 1000:>7.2f} ms/user  "
+          f"{old / new:.1f}x  ({lines:,} list lines)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Dashboard render-data build time: full-history pandas groupby vs. the purchase rollups.
+
+Loads a synthetic history of N line items for one user into a temporary
+database, then times building the data behind the Analytics Dashboard charts
+three ways: the old approach (load every history entry, build a DataFrame row
+by row, group by name and by date), the rollups for a 90-day window and the
+rollups for all time. The incremental cost of add_history_db is also reported.
+
+    python benchmarks/bench_rollups.py [--lines 10000 1000000] [--repeats 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Meat", "Beverages", "Snacks", "Other"]
+LINES_PER_BASKET = 10
+USER = "bench"
+
+
+def load_history(db, lines, seed=1):
+    """Bulk-insert ``lines`` history lines spread over five years, then build the rollups."""
+    from sqlalchemy import insert
+
+    rng = random.Random(seed)
+    baskets = max(1, lines // LINES_PER_BASKET)
+    start = datetime.now() - timedelta(days=5 * 365)
+    step = timedelta(days=5 * 365) / baskets
+    with db.session_scope() as session:
+        for first in range(0, baskets, 10_000):
+            ids = range(first + 1, min(first + 10_000, baskets) + 1)
+            session.execute(insert(db.GroceryHistoryDB), [
+                {"id": i, "username": USER, "timestamp": start + step * i} for i in ids
+            ])
+            rows = []
+            for i in ids:
+                for _ in range(LINES_PER_BASKET):
+                    n = min(int(rng.paretovariate(1.2)), 2000)
+                    rows.append({"history_id": i, "username": USER, "name": f"Item {n}", "name_normalized": f"item {n}",
+                                 "quantity": rng.randint(1, 4), "category": CATEGORIES[n % len(CATEGORIES)]})
+            session.execute(insert(db.GroceryHistoryLineDB), rows)
+    db.rebuild_rollups_db(USER)
+
+
+def legacy_render_data(db):
+    all_items = []
+    for ts, items in db.get_history_db(USER):
+        for item in items:
+            all_items.append({"name": item["name"], "quantity": item["quantity"], "date": ts})
+    df = pd.DataFrame(all_items)
+    top_items = df.groupby("name")["quantity"].sum().sort_values(ascending=False).head(5)
+    df["date"] = pd.to_datetime(df["date"])
+    trend = df.groupby(df["date"].dt.date)["quantity"].sum()
+    return top_items, trend
+
+
+def rollup_render_data(db, days, grain):
+    since = datetime.now() - timedelta(days=days) if days else None
+    return (db.get_item_totals_db(USER, 10, since), db.get_period_totals_db(USER, grain, since),
+            db.get_category_totals_db(USER, grain, since), db.get_restock_cadence_db(USER, since))
+
+
+def median_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--skip-legacy-above", type=int, default=2_000_000,
+                        help="skip the full-history build for larger histories")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="grocery_bench_")
+    os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    import db
+
+    db.init_db()
+    print(f"{'lines':>10}  {'full history':>13}  {'rollup 90d':>11}  {'rollup all':>11}  {'add_history_db':>15}")
+    for lines in args.lines:
+        with db.session_scope() as session:
+            for table in (db.PurchaseRollupDB, db.GroceryHistoryLineDB, db.GroceryHistoryDB):
+                session.query(table).delete()
+        start = time.perf_counter()
+        load_history(db, lines)
+        load = time.perf_counter() - start
+
+        legacy = "skipped"
+        if lines <= args.skip_legacy_above:
+            legacy = f"{median_ms(lambda: legacy_render_data(db), max(1, args.repeats // 2)):>10.1f} ms"
+        window = median_ms(lambda: rollup_render_data(db, 90, "week"), args.repeats)
+        lifetime = median_ms(lambda: rollup_render_data(db, None, "month"), args.repeats)
+        basket = [{"name": f"Item {i}", "quantity": 1, "category": "Other"} for i in range(LINES_PER_BASKET)]
+        add = median_ms(lambda: db.add_history_db(basket, USER), args.repeats)
+        print(f"{lines:>10,}  {legacy:>13}  {window:>8.1f} ms  {lifetime:>8.1f} ms  {add:>12.2f} ms"
+              f"   (loaded in {load:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
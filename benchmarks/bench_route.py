@@ -0,0 +1,84 @@
+"""Route planning for 500-item lists across large generated store layouts.
+
+Each store is a grid of aisles (rows x bays, with cross aisles at both ends)
+whose every bay is a shelf location. Items are shelved at random bays, so a
+500-item list can have hundreds of stops. For each store size the script
+reports the cold plan (Dijkstra from every stop plus the tour), a plan for a
+new list over already-searched locations, a route-cache hit, and the walking
+distance of the 2-opt route against visiting the stops in category order.
+
+    python benchmarks/bench_route.py [--items 500] [--sizes 10x20 30x40 60x80]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smart_grocery.models import GroceryItem
+from smart_grocery.optimizer import Optimizer, StoreLayout
+
+
+def grid_store(aisles, bays, rng):
+    edges = []
+    for a in range(aisles):
+        for b in range(bays - 1):
+            edges.append((f"a{a}b{b}", f"a{a}b{b + 1}", 1))
+        if a + 1 < aisles:
+            # Cross aisles at the front and back of the store
+            edges.append((f"a{a}b0", f"a{a + 1}b0", 3))
+            edges.append((f"a{a}b{bays - 1}", f"a{a + 1}b{bays - 1}", 3))
+    edges += [("entrance", "a0b0", 2), ("checkout", f"a{aisles - 1}b0", 2)]
+    items = {f"item {i}": f"a{rng.randrange(aisles)}b{rng.randrange(bays)}" for i in range(5000)}
+    return StoreLayout(f"grid {aisles}x{bays}", edges, {}, items=items, default="a0b0")
+
+
+def shopping_list(n, rng):
+    return [GroceryItem(f"item {i}", 1, f"Category {i % 12}") for i in rng.sample(range(5000), n)]
+
+
+def category_order_distance(layout, items):
+    """Walk the stops as a category-sorted list would: by category, then name."""
+    stops = []
+    for item in sorted(items, key=lambda i: (i.category, i.name)):
+        location = layout.location(item.name, item.category)
+        if not stops or stops[-1] != location:
+            stops.append(location)
+    walk = [layout.entrance] + stops + [layout.checkout]
+    return sum(layout.shortest_paths(a)[0][b] for a, b in zip(walk, walk[1:]))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--sizes", nargs="+", default=["10x20", "30x40", "60x80"])
+    args = parser.parse_args()
+
+    print(f"{'store':>12} {'nodes':>6} {'stops':>6}  {'cold':>9}  {'warm':>9}  {'cached':>8}  "
+          f"{'route':>7}  {'by category':>11}")
+    for size in args.sizes:
+        rng = random.Random(1)
+        aisles, bays = map(int, size.split("x"))
+        layout = grid_store(aisles, bays, rng)
+        optimizer = Optimizer(layout)
+        items = shopping_list(args.items, rng)
+        route, cold = timed(lambda: optimizer.plan(items))
+        # Same locations in a different order: the shortest paths are cached, the tour is not
+        optimizer._routes.clear()
+        _, warm = timed(lambda: optimizer.plan(list(reversed(items))))
+        _, cached = timed(lambda: optimizer.plan(items))
+        naive = category_order_distance(layout, items)
+        print(f"{layout.name:>12} {len(layout.graph):>6} {len(route.stops):>6}  {cold:>6.0f} ms  {warm:>6.0f} ms  "
+              f"{cached:>5.1f} ms  {route.distance:>7.0f}  {naive:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Synthetic purchase histories for the benchmarks.
+
+Every shopper has a handful of staples bought on a personal cadence (milk
+every 5-7 days, coffee every few weeks), now and then a recipe bundle bought
+together, and a long tail of other items drawn Zipf-like from a shared
+catalogue of a few thousand products. So item popularity, basket sizes, repeat
+intervals and co-purchases look like real lists rather than uniform noise.
+Output is seeded and streamed: 10M history lines never sit in memory at once.
+
+    from datagen import baskets, load_database, write_journal
+"""
+import heapq
+import json
+import random
+from datetime import datetime, timedelta
+
+PRODUCTS = {
+    "Produce": ["Bananas", "Apples", "Tomatoes", "Onions", "Potatoes", "Carrots", "Lettuce", "Avocados", "Lemons",
+                "Spinach", "Peppers", "Garlic", "Cucumbers", "Grapes", "Berries", "Broccoli"],
+    "Dairy": ["Milk", "Eggs", "Butter", "Cheese", "Yogurt", "Cream", "Cottage Cheese", "Sour Cream"],
+    "Bakery": ["Bread", "Bagels", "Tortillas", "Croissants", "Muffins", "Pita", "Burger Buns"],
+    "Meat": ["Chicken Breast", "Ground Beef", "Bacon", "Sausages", "Salmon", "Pork Chops", "Turkey", "Ham"],
+    "Beverages": ["Coffee", "Tea", "Orange Juice", "Sparkling Water", "Cola", "Beer", "Wine", "Oat Milk"],
+    "Snacks": ["Chips", "Crackers", "Cookies", "Nuts", "Popcorn", "Chocolate", "Pretzels", "Granola Bars"],
+    "Other": ["Rice", "Pasta", "Tomato Sauce", "Flour", "Sugar", "Olive Oil", "Beans", "Cereal", "Soup",
+              "Salsa", "Parmesan", "Toilet Paper", "Dish Soap", "Paper Towels"],
+}
+VARIANTS = ["", "Organic ", "Large ", "Low Fat ", "Family Size ", "Store Brand ", "Frozen ", "Smoked ", "Whole ",
+            "Spicy ", "Mini ", "Premium "]
+BRANDS = ["", "", "", " (Acme)", " (Northfield)", " (Sunny Farm)", " (Blue Hill)", " (Harvest)"]
+# Head items that make good staples, with typical days between purchases
+STAPLES = {"Milk": 6, "Bread": 4, "Eggs": 9, "Bananas": 7, "Coffee": 21, "Rice": 30, "Yogurt": 8, "Cheese": 14,
+           "Apples": 10, "Chicken Breast": 9, "Pasta": 18, "Orange Juice": 12, "Butter": 20, "Tomatoes": 6,
+           "Toilet Paper": 28, "Cereal": 15}
+BUNDLES = [("Pasta", "Tomato Sauce", "Parmesan"), ("Tortillas", "Salsa", "Beans", "Ground Beef"),
+           ("Burger Buns", "Ground Beef", "Lettuce", "Tomatoes"), ("Salmon", "Lemons", "Spinach"),
+           ("Chips", "Salsa", "Beer"), ("Flour", "Sugar", "Butter", "Eggs")]
+CATEGORY_OF = {name: category for category, names in PRODUCTS.items() for name in names}
+
+
+def catalogue(size=3000, seed=0):
+    """``size`` distinct (name, category) products, most common first."""
+    most = len(CATEGORY_OF) * len(VARIANTS) * len(set(BRANDS))
+    if size > most:
+        raise ValueError(f"at most {most} products")
+    rng = random.Random(seed)
+    products = [(name, category) for name, category in CATEGORY_OF.items()]
+    seen = set(name for name, _ in products)
+    while len(products) < size:
+        base = rng.choice(list(CATEGORY_OF))
+        name = f"{rng.choice(VARIANTS)}{base}{rng.choice(BRANDS)}"
+        if name not in seen:
+            seen.add(name)
+            products.append((name, CATEGORY_OF[base]))
+    return products[:size]
+
+
+class Shopper:
+    def __init__(self, username, rng, start):
+        self.username = username
+        self.rng = rng
+        self.staples = {name: every * rng.uniform(0.7, 1.3) for name, every in
+                        rng.sample(sorted(STAPLES.items()), rng.randint(5, 10))}
+        self.bundles = rng.sample(BUNDLES, 2)
+        self.tail = rng.uniform(1.5, 4.0)  # Mean number of long-tail items per trip
+        self.trip_days = rng.uniform(2.0, 6.0)
+        self.due = {name: rng.uniform(0, every) for name, every in self.staples.items()}
+        self.start = start
+        self.next_trip = rng.uniform(0, self.trip_days)
+
+    def shop(self, products, categories):
+        """One trip at ``self.next_trip`` days: ``(timestamp, items)``; schedules the next trip."""
+        rng = self.rng
+        day = self.next_trip
+        names = [name for name, due in self.due.items() if due <= day]
+        for name in names:
+            every = self.staples[name]
+            self.due[name] = day + max(1.0, rng.gauss(every, every * 0.15))
+        if rng.random() < 0.25:
+            names.extend(rng.choice(self.bundles))
+        for _ in range(int(rng.expovariate(1 / self.tail))):
+            names.append(products[min(int(rng.paretovariate(1.1)) - 1, len(products) - 1)][0])
+        if not names:
+            names.append(rng.choice(list(self.staples)))
+        basket = {}
+        for name in names:
+            if name not in basket:
+                basket[name] = {"name": name, "quantity": 1 if rng.random() < 0.7 else rng.randint(2, 4),
+                                "category": categories[name]}
+        self.next_trip = day + max(0.5, rng.expovariate(1 / self.trip_days))
+        return self.start + timedelta(days=day), list(basket.values())
+
+
+def baskets(lines, users=1, seed=1, start=datetime(2020, 1, 1), products=None):
+    """Yield ``(username, timestamp, items)`` in time order until about ``lines`` history lines.
+
+    Usernames are ``shopper0`` .. ``shopper{users-1}``; items are
+    ``{"name", "quantity", "category"}`` dicts as the apps store them.
+    """
+    rng = random.Random(seed)
+    products = products or catalogue(seed=seed)
+    categories = dict(products)
+    shoppers = [Shopper(f"shopper{i}", random.Random(rng.random()), start) for i in range(users)]
+    queue = [(s.next_trip, i) for i, s in enumerate(shoppers)]
+    heapq.heapify(queue)
+    written = 0
+    while written < lines:
+        _, i = heapq.heappop(queue)
+        shopper = shoppers[i]
+        timestamp, items = shopper.shop(products, categories)
+        items = items[:lines - written]
+        written += len(items)
+        yield shopper.username, timestamp, items
+        heapq.heappush(queue, (shopper.next_trip, i))
+
+
+def write_journal(path, lines, seed=1):
+    """Write one shopper's history of about ``lines`` lines in the journal format HistoryManager reads."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for _, timestamp, items in baskets(lines, 1, seed):
+            f.write(json.dumps({"ts": timestamp.isoformat(), "items": items}, separators=(",", ":")) + "\n")
+            count += 1
+    return count
+
+
+def load_database(db, lines, users, seed=1, batch=20_000):
+    """Bulk-load ``lines`` history lines for ``users`` shoppers, then build the derived tables.
+
+    Rows go straight in with executemany, as a migration would, and the
+    frequencies and rollups are rebuilt from them once at the end; feeding
+    10M lines through add_history_db one basket at a time would take hours.
+    Returns the number of baskets.
+    """
+    from sqlalchemy import func, insert, select
+
+    from smart_grocery.canonical import canonical_name
+
+    keys = {}
+    with db.session_scope() as session:
+        history_id = session.scalar(select(func.max(db.GroceryHistoryDB.id))) or 0
+    first = history_id
+    histories, history_lines = [], []
+
+    def flush():
+        with db.session_scope() as session:
+            session.execute(insert(db.GroceryHistoryDB), histories)
+            session.execute(insert(db.GroceryHistoryLineDB), history_lines)
+        histories.clear()
+        history_lines.clear()
+
+    for username, timestamp, items in baskets(lines, users, seed):
+        history_id += 1
+        histories.append({"id": history_id, "username": username, "timestamp": timestamp, "items": "[]"})
+        for item in items:
+            key = keys.get(item["name"])
+            if key is None:
+                key = keys[item["name"]] = canonical_name(item["name"])
+            history_lines.append({"history_id": history_id, "username": username, "name": item["name"],
+                                  "name_normalized": key, "quantity": item["quantity"],
+                                  "category": item["category"]})
+        if len(history_lines) >= batch:
+            flush()
+    if histories:
+        flush()
+    db.rebuild_item_frequencies_db()
+    db.rebuild_rollups_db()
+    return history_id - first
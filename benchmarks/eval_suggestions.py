@@ -0,0 +1,134 @@
+"""Offline evaluation and latency benchmark for smart_grocery.suggestions.SuggestionModel.
+
+Replays a synthetic purchase history in time order. Before each basket is
+added, the model is asked for its top-N suggestions given the first item of the
+basket as the "current list"; a hit is a suggested item that the basket really
+contains. The lifetime-count ranking that the apps used before is scored the
+same way as a baseline.
+
+    python benchmarks/eval_suggestions.py [--baskets 5000] [--latency-baskets 100000]
+    python benchmarks/eval_suggestions.py --db   # also replay through db.add_history_db
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smart_grocery.canonical import canonical_name
+from smart_grocery.suggestions import SuggestionModel
+
+# name -> typical days between purchases
+STAPLES = {"Milk": 6, "Bread": 4, "Eggs": 9, "Coffee": 21, "Rice": 30, "Bananas": 7, "Yogurt": 8, "Cheese": 14}
+# Items bought together on an occasional cadence
+BUNDLES = [("Pasta", "Tomato Sauce", "Parmesan"), ("Tortillas", "Salsa", "Beans"), ("Burger Buns", "Ground Beef")]
+EXTRAS = [f"Extra {i}" for i in range(200)]
+
+
+def generate_history(baskets, seed=1):
+    """Yield (timestamp, [names]) for one shopper, oldest first."""
+    rng = random.Random(seed)
+    day = datetime(2020, 1, 1)
+    due = {name: rng.uniform(0, every) for name, every in STAPLES.items()}
+    elapsed = 0.0
+    for _ in range(baskets):
+        step = rng.uniform(1, 4)
+        elapsed += step
+        day += timedelta(days=step)
+        basket = []
+        for name, every in STAPLES.items():
+            if elapsed >= due[name]:
+                basket.append(name)
+                due[name] = elapsed + rng.gauss(every, every * 0.15)
+        if rng.random() < 0.3:
+            basket.extend(rng.choice(BUNDLES))
+        basket.extend(rng.sample(EXTRAS, rng.randint(0, 2)))
+        if basket:
+            yield day, basket
+
+
+def evaluate(history, top_n, warmup):
+    model = SuggestionModel()
+    lifetime = Counter()
+    hits = {"model": 0, "lifetime counts": 0}
+    possible = 0
+    for index, (timestamp, basket) in enumerate(history):
+        if index >= warmup and len(basket) > 1:
+            anchor = canonical_name(basket[0])
+            wanted = {canonical_name(n) for n in basket[1:]}
+            possible += min(len(wanted), top_n)
+            suggested = {s.name for s in model.suggest(top_n, now=timestamp, current=[anchor])}
+            hits["model"] += len(suggested & wanted)
+            baseline = [name for name, _ in lifetime.most_common(top_n + 1) if name != anchor][:top_n]
+            hits["lifetime counts"] += len(set(baseline) & wanted)
+        model.add_basket(basket, timestamp)
+        lifetime.update(canonical_name(n) for n in set(basket))
+    return {label: count / possible for label, count in hits.items()} if possible else {}
+
+
+def median_ms(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1000
+
+
+def latency(baskets, top_n, repeats):
+    model = SuggestionModel()
+    start = time.perf_counter()
+    for timestamp, basket in generate_history(baskets, seed=2):
+        model.add_basket(basket, timestamp)
+    build = time.perf_counter() - start
+    suggest = median_ms(lambda: model.suggest(top_n, current=["Pasta", "Milk"]), repeats)
+    return build, len(model.items), suggest
+
+
+def db_latency(baskets, top_n, repeats):
+    os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='grocery_bench_'), 'bench.db')}"
+    import db
+
+    start = time.perf_counter()
+    for timestamp, basket in generate_history(baskets, seed=3):
+        db.add_history_db([{"name": n, "quantity": 1, "category": "Other"} for n in basket], "bench", timestamp)
+    ingest = time.perf_counter() - start
+    query = median_ms(lambda: db.get_smart_suggestions_db("bench", top_n, current=["Pasta", "Milk"]), repeats)
+    return ingest, query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baskets", type=int, default=5000, help="baskets replayed for hit-rate evaluation")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--latency-baskets", type=int, default=100_000)
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--db", action="store_true", help="also time add_history_db/get_smart_suggestions_db")
+    parser.add_argument("--db-baskets", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"hit rate @{args.top_n} over {args.baskets:,} replayed baskets:")
+    for label, rate in evaluate(list(generate_history(args.baskets)), args.top_n, args.warmup).items():
+        print(f"  {label:<16}{rate:>8.1%}")
+
+    build, items, suggest = latency(args.latency_baskets, args.top_n, args.repeats)
+    print(f"in-memory model, {args.latency_baskets:,} baskets / {items} distinct items:")
+    print(f"  incremental build {build:.2f}s ({args.latency_baskets / build:,.0f} baskets/s)")
+    print(f"  suggest (median)  {suggest:.3f} ms")
+
+    if args.db:
+        ingest, query = db_latency(args.db_baskets, args.top_n, args.repeats)
+        print(f"db.py, {args.db_baskets:,} baskets:")
+        print(f"  add_history_db              {args.db_baskets / ingest:,.0f} baskets/s")
+        print(f"  get_smart_suggestions_db    {query:.3f} ms (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Load test for the JSON API in app.py (Flask) and asgi_app.py (Starlette).
+
+Seeds a few users through the bulk endpoint, then hammers a mix of paged item
+reads (half of them revalidated with If-None-Match), history reads,
+suggestions and small writes from a pool of client threads. Reports
+throughput, latency percentiles and how many reads were answered 304.
+
+    python benchmarks/loadtest_api.py --spawn [--workers 4]      # start a server on a temporary DB
+    python benchmarks/loadtest_api.py --spawn --server asgi      # the same against uvicorn
+    python benchmarks/loadtest_api.py --spawn --server both      # both, one after the other
+    python benchmarks/loadtest_api.py --url http://127.0.0.1:8000 [--threads 16 --seconds 20]
+
+``--spawn`` runs the Flask app under gunicorn with ``--workers`` processes
+when it is installed and the Flask development server otherwise; the ASGI app
+runs under uvicorn with ``--workers`` processes. Each server gets a fresh
+temporary database.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Meat", "Beverages", "Snacks", "Other"]
+
+
+def call(base, method, path, body=None, headers=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base + path, data=data, method=method, headers=dict(headers or {}))
+    if data is not None:
+        req.add_header("Content-Type", "application/json")
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def spawn(port, workers, server="flask"):
+    tmp = tempfile.mkdtemp(prefix="grocery_loadtest_")
+    env = dict(os.environ, GROCERY_DB_URL=f"sqlite:///{os.path.join(tmp, 'loadtest.db')}")
+    subprocess.run([sys.executable, "-c", "import db; db.init_db()"], cwd=ROOT, env=env, check=True)
+    if server == "asgi":
+        cmd = [sys.executable, "-m", "uvicorn", "asgi_app:app", "--port", str(port), "--workers", str(workers),
+               "--log-level", "warning"]
+    elif shutil.which("gunicorn"):
+        cmd = ["gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"]
+    else:
+        cmd = [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            call(base, "GET", "/api/items")
+            return proc, base, tmp
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit(f"server did not start: {' '.join(cmd)}")
+
+
+def seed(base, users, items, baskets):
+    for user in users:
+        rows = [{"name": f"item {i}", "quantity": 1 + i % 3, "category": CATEGORIES[i % len(CATEGORIES)]}
+                for i in range(items)]
+        status, _, body = call(base, "POST", f"/api/users/{user}/items", rows)
+        if status != 201:
+            raise SystemExit(f"seeding failed: {status} {body[:200]!r}")
+        for b in range(baskets):
+            basket = [{"name": f"item {(b * 7 + k) % 40}"} for k in range(5)]
+            call(base, "POST", f"/api/users/{user}/history", {"items": basket})
+
+
+class Worker:
+    def __init__(self, base, users, deadline, seed):
+        self.base = base
+        self.users = users
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.etags = {}
+        self.latencies = []
+        self.statuses = Counter()
+        self.kinds = Counter()
+
+    def request(self, kind, method, path, body=None, revalidate=False):
+        headers = {"If-None-Match": self.etags[path]} if revalidate and path in self.etags else {}
+        start = time.perf_counter()
+        status, resp_headers, _ = call(self.base, method, path, body, headers)
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[status] += 1
+        self.kinds[kind] += 1
+        if resp_headers.get("ETag"):
+            self.etags[path] = resp_headers["ETag"]
+
+    def run(self):
+        rng = self.rng
+        while time.perf_counter() < self.deadline:
+            user = rng.choice(self.users)
+            roll = rng.random()
+            if roll < 0.5:
+                self.request("items", "GET", f"/api/users/{user}/items?limit=50", revalidate=rng.random() < 0.5)
+            elif roll < 0.7:
+                self.request("history", "GET", f"/api/users/{user}/history?limit=20", revalidate=True)
+            elif roll < 0.85:
+                self.request("suggestions", "GET", f"/api/users/{user}/suggestions?current=item+1")
+            else:
+                self.request("write", "POST", f"/api/users/{user}/items",
+                             [{"name": f"extra {rng.randrange(1000)}", "quantity": 1}])
+        return self
+
+
+def percentile(sorted_samples, fraction):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * fraction))] * 1000
+
+
+def run(base, args):
+    users = [f"load{i}" for i in range(args.users)]
+    start = time.perf_counter()
+    seed(base, users, args.items, args.baskets)
+    print(f"seeded {args.users} users x {args.items} items in {time.perf_counter() - start:.2f}s")
+
+    deadline = time.perf_counter() + args.seconds
+    with ThreadPoolExecutor(args.threads) as pool:
+        workers = list(pool.map(lambda i: Worker(base, users, deadline, i).run(), range(args.threads)))
+    latencies = sorted(s for w in workers for s in w.latencies)
+    statuses = sum((w.statuses for w in workers), Counter())
+    kinds = sum((w.kinds for w in workers), Counter())
+    if not latencies:
+        raise SystemExit("no requests completed")
+    reads = kinds["items"] + kinds["history"] + kinds["suggestions"]
+    print(f"{len(latencies):,} requests from {args.threads} threads in {args.seconds:.0f}s: "
+          f"{len(latencies) / args.seconds:,.0f} req/s")
+    print(f"  latency p50 {percentile(latencies, 0.5):.1f} ms  p95 {percentile(latencies, 0.95):.1f} ms  "
+          f"p99 {percentile(latencies, 0.99):.1f} ms")
+    print(f"  mix {dict(kinds)}")
+    print(f"  status {dict(sorted(statuses.items()))}; 304 on {statuses[304] / max(reads, 1):.0%} of reads")
+    return len(latencies) / args.seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running server")
+    target.add_argument("--spawn", action="store_true", help="start a local server on a temporary database")
+    parser.add_argument("--server", choices=["flask", "asgi", "both"], default="flask",
+                        help="which app to start with --spawn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="server processes with --spawn")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent client threads")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--items", type=int, default=500, help="items seeded per user")
+    parser.add_argument("--baskets", type=int, default=20, help="purchases seeded per user")
+    args = parser.parse_args()
+
+    if args.url:
+        run(args.url.rstrip("/"), args)
+        return
+    results = {}
+    for server in (["flask", "asgi"] if args.server == "both" else [args.server]):
+        print(f"== {server}")
+        proc, base, tmp = spawn(args.port, args.workers, server)
+        try:
+            results[server] = run(base, args)
+        finally:
+            proc.terminate()
+            proc.wait()
+            shutil.rmtree(tmp, ignore_errors=True)
+    if len(results) == 2:
+        print(f"asgi / flask throughput: {results['asgi'] / results['flask']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
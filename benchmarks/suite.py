@@ -0,0 +1,385 @@
+"""The benchmark suite: hot paths of the CLI, the database layer and the web API.
+
+Times GroceryList.add_item/remove_item, HistoryManager.save_history and
+load_history, SuggestionEngine (building the model and suggest_items), the db
+helpers (add_item_db, get_history_db, get_suggestions_db,
+get_smart_suggestions_db, get_ranked_suggestions_db), a budget plan over a
+50-store price catalog and the Flask /api/items endpoint, against
+histories generated by datagen.py at each --lines size. Everything runs
+offline in a temporary directory: a journal file for the CLI paths and a
+SQLite database for the rest. Cases whose cost does not depend on the history
+size run once, at the first size.
+
+Each case gets a warmup run, then at least --min-repeats timed runs and more
+up to --repeats while within --budget seconds; median, p95 and min are
+reported. --save keeps the results as a baseline in benchmarks/baselines/;
+--compare flags every case whose median is more than --threshold slower than
+the baseline (and slower by at least --min-delta-ms, so sub-millisecond noise
+is not flagged) and exits with status 1 if there are any. Baselines are only
+comparable on the same machine.
+
+    python benchmarks/suite.py [--lines 1000 100000] [-k db.] [--save NAME] [--compare NAME] [--list]
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, NamedTuple, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+TMP = tempfile.mkdtemp(prefix="grocery-bench-")
+os.environ["GROCERY_DB_URL"] = f"sqlite:///{os.path.join(TMP, 'empty.db')}"
+os.environ["GROCERY_JOB_THREADS"] = "0"  # No background jobs competing with the timed runs
+
+import datagen  # noqa: E402
+import db  # noqa: E402
+from smart_grocery import GroceryItem, GroceryList, HistoryManager, SuggestionEngine  # noqa: E402
+from smart_grocery.storage import JSONFileStorage  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+class Bench(NamedTuple):
+    run: Callable  # Timed; gets what setup returned
+    setup: Optional[Callable] = None  # Untimed, before every run
+    calls: int = 1  # Operations per run, for the per-call figure
+
+
+CASES = {}
+
+
+def case(name, scales=True):
+    """Register ``factory(fixtures, lines) -> Bench``; ``scales`` if its cost depends on the history size."""
+    def register(factory):
+        CASES[name] = (factory, scales)
+        return factory
+    return register
+
+
+class Fixtures:
+    """Generated data for each size, built once and only when a case needs it."""
+
+    def __init__(self, users=None, seed=1):
+        self.users = users
+        self.seed = seed
+        self.catalogue = datagen.catalogue(seed=seed)
+        self._journals = {}
+        self._databases = {}
+
+    def users_for(self, lines):
+        # About 2000 lines (a few years of shopping) per user unless --users says otherwise
+        return self.users or min(max(lines // 2000, 1), 5000)
+
+    def journal(self, lines):
+        path = self._journals.get(lines)
+        if path is None:
+            path = self._journals[lines] = os.path.join(TMP, f"history-{lines}.jsonl")
+            timed_step(f"journal of {lines} lines", datagen.write_journal, path, lines, self.seed)
+        return path
+
+    def history_manager(self, lines):
+        directory = os.path.join(TMP, f"cli-{lines}")
+        os.makedirs(directory, exist_ok=True)
+        storage = JSONFileStorage(history_file=self.journal(lines),
+                                  **{f"{kind}_file": os.path.join(directory, f"{kind}.json")
+                                     for kind in ("meals", "items", "legacy_history", "recipes")})
+        return HistoryManager(storage.history_file, storage)
+
+    def database(self, lines):
+        """Point db at the database for this size, generating it first if needed."""
+        url = self._databases.get(lines)
+        if url is None:
+            url = self._databases[lines] = f"sqlite:///{os.path.join(TMP, f'grocery-{lines}.db')}"
+            db.configure_engine(url)
+            timed_step(f"database of {lines} lines, {self.users_for(lines)} users",
+                       datagen.load_database, db, lines, self.users_for(lines), self.seed)
+        elif str(db.get_engine().url) != url:
+            db.configure_engine(url)
+
+    def basket(self, size=12):
+        grocery_list = GroceryList()
+        for name, category in self.catalogue[:size]:
+            grocery_list.add_item(GroceryItem(name, 1, category))
+        return grocery_list
+
+
+def timed_step(label, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"  [setup] {label}: {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return result
+
+
+@case("list.add_item", scales=False)
+def list_add_item(fx, lines):
+    items = [(name, category) for name, category in fx.catalogue[:1000]]
+
+    def run(_):
+        grocery_list = GroceryList()
+        for name, category in items:
+            grocery_list.add_item(GroceryItem(name, 1, category))
+    return Bench(run, calls=len(items))
+
+
+@case("list.remove_item", scales=False)
+def list_remove_item(fx, lines):
+    names = [name for name, _ in fx.catalogue[:1000]]
+
+    def setup():
+        grocery_list = GroceryList()
+        for name, category in fx.catalogue[:1000]:
+            grocery_list.add_item(GroceryItem(name, 1, category))
+        return grocery_list
+
+    def run(grocery_list):
+        for name in names:
+            grocery_list.remove_item(name)
+    return Bench(run, setup, calls=len(names))
+
+
+@case("history.save_history", scales=False)
+def history_save(fx, lines):
+    # An append costs the same whatever the journal holds, so this one writes to its own
+    storage = JSONFileStorage(**{f"{kind}_file": os.path.join(TMP, f"save-{kind}.json")
+                                 for kind in ("history", "meals", "items", "legacy_history", "recipes")})
+    history_manager = HistoryManager(storage.history_file, storage)
+    grocery_list = fx.basket()
+    return Bench(lambda _: history_manager.save_history(grocery_list))
+
+
+@case("history.load_history")
+def history_load(fx, lines):
+    history_manager = fx.history_manager(lines)
+
+    def run(_):
+        for _ in history_manager.load_history():
+            pass
+    return Bench(run)
+
+
+@case("suggestions.build_model")
+def suggestions_build(fx, lines):
+    history_manager = fx.history_manager(lines)
+    return Bench(lambda _: SuggestionEngine(history_manager).model)
+
+
+@case("suggestions.suggest_items")
+def suggestions_suggest(fx, lines):
+    engine = SuggestionEngine(fx.history_manager(lines))
+    engine.model
+    grocery_list = fx.basket(3)
+
+    def run(_):
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.suggest_items(5, grocery_list)
+    return Bench(run)
+
+
+@case("db.add_item_db")
+def db_add_item(fx, lines):
+    fx.database(lines)
+    names = itertools.cycle(fx.catalogue)
+
+    def run(_):
+        name, category = next(names)
+        db.add_item_db(name, 1, category, "bench-writer")
+    return Bench(run)
+
+
+@case("db.get_history_db")
+def db_get_history(fx, lines):
+    fx.database(lines)
+    return Bench(lambda _: db.get_history_db("shopper0"))
+
+
+@case("db.get_suggestions_db")
+def db_get_suggestions(fx, lines):
+    fx.database(lines)
+    return Bench(lambda _: db.get_suggestions_db("shopper0"))
+
+
+@case("db.get_smart_suggestions_db")
+def db_get_smart_suggestions(fx, lines):
+    fx.database(lines)
+    return Bench(lambda _: db.get_smart_suggestions_db("shopper0", current=["Milk"]))
+
+
+@case("db.get_ranked_suggestions_db")
+def db_get_ranked_suggestions(fx, lines):
+    fx.database(lines)
+    db.rank_suggestions_db("shopper0")
+    return Bench(lambda _: db.get_ranked_suggestions_db("shopper0", current=["Milk"]))
+
+
+@case("prices.plan", scales=False)
+def prices_plan(fx, lines):
+    import random
+
+    from smart_grocery.canonical import canonical_name
+    from smart_grocery.prices import PriceCatalog
+
+    rng = random.Random(fx.seed)
+    catalog = PriceCatalog((canonical_name(name), f"store {j}", round(rng.uniform(0.5, 20), 2))
+                           for name, _ in fx.catalogue for j in range(50) if rng.random() < 0.8)
+    grocery_list = GroceryList()
+    for name, category in rng.sample(fx.catalogue, 200):
+        grocery_list.add_item(GroceryItem(name, rng.randint(1, 3), category))
+    return Bench(lambda _: catalog.plan(grocery_list, budget=1000, max_stores=2, store_cost=2.0))
+
+@case("api.items")
+def api_items(fx, lines):
+    from app import app
+
+    fx.database(lines)
+    db.clear_items_db("bench-list")
+    db.add_items_db([{"name": name, "quantity": 1, "category": category}
+                     for name, category in fx.catalogue[:100]], "bench-list")
+    client = app.test_client()
+
+    def run(_):
+        response = client.get("/api/items?user=bench-list")
+        assert response.status_code == 200, response.status_code
+    return Bench(run)
+
+
+def measure(bench, min_repeats, repeats, budget):
+    times, spent = [], 0.0
+    bench.run(bench.setup() if bench.setup else None)
+    while len(times) < repeats and (len(times) < min_repeats or spent < budget):
+        state = bench.setup() if bench.setup else None
+        start = time.perf_counter()
+        bench.run(state)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed * 1000)
+        spent += elapsed
+    times.sort()
+    median = statistics.median(times)
+    return {
+        "median_ms": round(median, 4),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 4),
+        "min_ms": round(times[0], 4),
+        "repeats": len(times),
+        "calls": bench.calls,
+        "per_call_us": round(median * 1000 / bench.calls, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args):
+    fx = Fixtures(args.users, args.seed)
+    results = {}
+    print(f"{'case':<42} {'median':>11} {'p95':>11} {'min':>11} {'per call':>12}")
+    for i, lines in enumerate(args.lines):
+        for name, (factory, scales) in CASES.items():
+            if not any(k in name for k in args.k) or (not scales and i > 0):
+                continue
+            key = f"{name}@{lines}" if scales else name
+            result = measure(factory(fx, lines), args.min_repeats, args.repeats, args.budget)
+            results[key] = dict(result, lines=lines if scales else None)
+            print(f"{key:<42} {result['median_ms']:>8.3f} ms {result['p95_ms']:>8.3f} ms "
+                  f"{result['min_ms']:>8.3f} ms {result['per_call_us']:>9.1f} us")
+    return {
+        "created": datetime.now().replace(microsecond=0).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "options": {"lines": args.lines, "users": args.users, "seed": args.seed},
+        "results": results,
+    }
+
+
+def baseline_path(name):
+    return name if name.endswith(".json") or os.sep in name else os.path.join(BASELINES, f"{name}.json")
+
+
+def compare(baseline, current, threshold, min_delta_ms):
+    """Print a comparison of medians; return the keys that got slower beyond the threshold."""
+    regressions = []
+    print(f"\ncompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created')}), "
+          f"flagging > {threshold:.0%} and > {min_delta_ms} ms slower:")
+    print(f"{'case':<42} {'baseline':>11} {'now':>11} {'change':>8}")
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            print(f"{key:<42} {'-':>11} {result['median_ms']:>8.3f} ms      new")
+            continue
+        old, new = before["median_ms"], result["median_ms"]
+        change = new / old - 1 if old else 0.0
+        slower = change > threshold and new - old > min_delta_ms
+        if slower:
+            regressions.append(key)
+        print(f"{key:<42} {old:>8.3f} ms {new:>8.3f} ms {change:>+7.0%}{'  SLOWER' if slower else ''}")
+    missing = len(baseline["results"].keys() - current["results"].keys())
+    if missing:
+        print(f"({missing} baseline cases not run)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[1_000, 100_000],
+                        help="history sizes to run at, up to 10000000 (generating that takes a while)")
+    parser.add_argument("--users", type=int, help="shoppers in the database (default: one per 2000 lines)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-k", action="append", default=[],
+                        help="only cases whose name contains this (repeatable)")
+    parser.add_argument("--min-repeats", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds per case before stopping at min-repeats")
+    parser.add_argument("--save", metavar="NAME", help="write the results to benchmarks/baselines/NAME.json")
+    parser.add_argument("--output", metavar="FILE", help="write the results to FILE")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline name or JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown to flag (default 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="absolute slowdown to flag")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args()
+    args.k = args.k or [""]
+
+    if args.list:
+        for name, (_, scales) in CASES.items():
+            print(f"{name}{'' if scales else '  (size independent)'}")
+        return 0
+    baseline = None
+    if args.compare:
+        with open(baseline_path(args.compare), encoding="utf-8") as f:
+            baseline = json.load(f)
+    try:
+        current = run_suite(args)
+    finally:
+        db.get_engine().dispose()
+        shutil.rmtree(TMP, ignore_errors=True)
+    for path in filter(None, [args.output, args.save and baseline_path(args.save)]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+            f.write("\n")
+        print(f"\nresults written to {path}")
+    if baseline is not None:
+        regressions = compare(baseline, current, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,23 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func
+from sqlalchemy import create_engine, event, delete, insert, select, bindparam, literal, and_, or_, text, Column, Float, ForeignKey, Index, Integer, String, Text, DateTime, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+import argparse
 import json
 import os
-from collections import Counter
+import threading
+from collections import Counter, OrderedDict
+from itertools import groupby
+
+from smart_grocery import metrics
+from smart_grocery.canonical import AutocompleteIndex, Canonicalizer, canonical_name
+from smart_grocery.models import normalize_name
+from smart_grocery.pantry import PantryEntry, PantryProposal, remaining, runout
+from smart_grocery.recipes import CompiledIngredient, Expansion, Ingredient, Recipe, RecipeIndex, compile_ingredient, expand_meals
+from migrations import run_migrations
+from smart_grocery.suggestions import MAX_COOCCURRENCE_BASKET, RANKING_SIZE, ItemStats, RankedItem, SuggestionModel, rerank, to_days
 
 Base = declarative_base()
 
@@ -12,16 +26,120 @@ class GroceryItemDB(Base):
     id = Column(Integer, primary_key=True)
     username = Column(String)  # New: associate item with user
     name = Column(String)
+    name_normalized = Column(String)  # Canonical name (see _canonical_keys), for grouping and prefix search
+    quantity = Column(Integer)
+    category = Column(String)
+    image_path = Column(String, nullable=True)  # Content hash in the image store (legacy rows: a file path)
+    version = Column(Integer, nullable=False, default=0)  # List version of the item's last change
+    __table_args__ = (
+        Index('ix_grocery_items_username_name', 'username', 'name'),
+        Index('ix_grocery_items_username_id', 'username', 'id'),
+        Index('ix_grocery_items_username_normalized', 'username', 'name_normalized'),
+        Index('ix_grocery_items_username_version', 'username', 'version'),
+    )
+
+class ListVersionDB(Base):
+    # Per-user counter bumped by every write to grocery_items; item_changes holds what each version did
+    __tablename__ = 'list_versions'
+    username = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    pruned_version = Column(Integer, nullable=False, default=0)  # Changes up to here were removed from the log
+
+class ItemChangeDB(Base):
+    # Append-only log of grocery_items changes; 'upsert' rows hold the item as it was after the change
+    __tablename__ = 'item_changes'
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # 'upsert', 'delete' or 'clear'
+    item_id = Column(Integer)
+    name = Column(String)
     quantity = Column(Integer)
     category = Column(String)
-    image_path = Column(String, nullable=True)  # New: path to uploaded image (optional)
+    image_path = Column(String)
+    changed_at = Column(DateTime)
+    __table_args__ = (Index('ix_item_changes_username_version', 'username', 'version'),)
 
 class GroceryHistoryDB(Base):
     __tablename__ = 'grocery_history'
     id = Column(Integer, primary_key=True)
     username = Column(String)  # New: associate history with user
     timestamp = Column(DateTime, default=func.now())
-    items = Column(String)  # JSON string of items
+    items = Column(String)  # Legacy JSON string of items; lines live in grocery_history_lines
+    __table_args__ = (Index('ix_grocery_history_username_timestamp', 'username', timestamp.desc()),)
+
+class GroceryHistoryLineDB(Base):
+    __tablename__ = 'grocery_history_lines'
+    id = Column(Integer, primary_key=True)
+    history_id = Column(Integer, ForeignKey('grocery_history.id', ondelete='CASCADE'), nullable=False)
+    username = Column(String)
+    name = Column(String)  # Name as entered, for display
+    name_normalized = Column(String)  # Canonical name, used for grouping
+    quantity = Column(Integer)
+    category = Column(String)
+    __table_args__ = (
+        Index('ix_grocery_history_lines_history_id', 'history_id'),
+        Index('ix_grocery_history_lines_username_name', 'username', 'name_normalized'),
+    )
+
+class ItemFrequencyDB(Base):
+    # Per-user purchase aggregate kept in step with grocery_history_lines by add_history_db
+    __tablename__ = 'item_frequencies'
+    username = Column(String, primary_key=True)
+    name_normalized = Column(String, primary_key=True)
+    purchase_count = Column(Integer, nullable=False, default=0)  # Number of history lines
+    total_quantity = Column(Integer, nullable=False, default=0)
+    first_purchased = Column(DateTime)
+    last_purchased = Column(DateTime)
+    # Suggestion-engine state, see smart_grocery.suggestions.ItemStats; times are days since the epoch
+    basket_count = Column(Integer, nullable=False, default=0)
+    decayed_score = Column(Float)
+    decayed_at = Column(Float)
+    mean_interval_days = Column(Float)
+    __table_args__ = (
+        Index('ix_item_frequencies_username_count', 'username', purchase_count.desc(), 'name_normalized'),
+    )
+
+    def to_stats(self):
+        # Also works on a Core row of this table
+        return ItemStats(self.name_normalized, self.basket_count, self.decayed_score or 0.0, self.decayed_at,
+                         to_days(self.last_purchased) if self.last_purchased else None, self.mean_interval_days)
+
+class ItemCooccurrenceDB(Base):
+    # Number of baskets in which both items were bought; stored in both directions
+    __tablename__ = 'item_cooccurrence'
+    username = Column(String, primary_key=True)
+    name_normalized = Column(String, primary_key=True)
+    other_normalized = Column(String, primary_key=True)
+    basket_count = Column(Integer, nullable=False, default=0)
+
+class PurchaseRollupDB(Base):
+    # Purchased quantity per user, period, item and category, kept in step with history by add_history_db
+    __tablename__ = 'purchase_rollups'
+    username = Column(String, primary_key=True)
+    grain = Column(String, primary_key=True)  # 'day', 'week' (starting Monday) or 'month'
+    period_start = Column(String, primary_key=True)  # ISO date of the first day of the period
+    name_normalized = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    name = Column(String)  # Display name as first entered in the period
+    quantity = Column(Integer, nullable=False, default=0)
+    line_count = Column(Integer, nullable=False, default=0)
+    basket_count = Column(Integer, nullable=False, default=0)
+
+class ItemAliasDB(Base):
+    # Names a user's items are filed under instead of their own: synonyms they set up and typos once corrected
+    __tablename__ = 'item_aliases'
+    username = Column(String, primary_key=True)
+    alias = Column(String, primary_key=True)  # canonical_name of the alias
+    canonical = Column(String, nullable=False)
+    source = Column(String, nullable=False, default='user')  # 'user' or 'typo'
+
+class VocabularyVersionDB(Base):
+    # Bumped whenever a user's aliases or known names change, so each process can tell that its cached
+    # Canonicalizer is stale (see _canonicalizer)
+    __tablename__ = 'vocabulary_versions'
+    username = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 class MealPlanDB(Base):
     __tablename__ = 'meal_plans'
@@ -29,72 +147,2031 @@ class MealPlanDB(Base):
     username = Column(String)  # New: associate meal with user
     date = Column(String)
     items = Column(String)  # JSON string of meal items
+    __table_args__ = (Index('ix_meal_plans_username_date', 'username', 'date'),)
 
-def get_engine():
-    return create_engine('sqlite:///grocery.db', echo=False)
+class RecipeDB(Base):
+    __tablename__ = 'recipes'
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    name_normalized = Column(String, nullable=False)  # What meal-plan entries are matched against
+    servings = Column(Integer, nullable=False, default=1)
+    __table_args__ = (Index('ix_recipes_username_name', 'username', 'name_normalized', unique=True),)
+
+class RecipeIngredientDB(Base):
+    # Ingredients as entered, plus the compiled form (normalized name, base unit, amount per serving)
+    __tablename__ = 'recipe_ingredients'
+    id = Column(Integer, primary_key=True)
+    recipe_id = Column(Integer, ForeignKey('recipes.id', ondelete='CASCADE'), nullable=False)
+    name = Column(String)
+    name_normalized = Column(String)
+    category = Column(String)
+    amount = Column(Float)
+    unit = Column(String)
+    base_unit = Column(String)
+    per_serving = Column(Float)
+    __table_args__ = (Index('ix_recipe_ingredients_recipe_id', 'recipe_id'),)
 
-def create_tables():
-    engine = get_engine()
-    Base.metadata.create_all(engine)
+class PantryItemDB(Base):
+    # What a user has at home: the quantity bought (or counted) at purchased_at, used up at the forecast rate
+    __tablename__ = 'pantry_items'
+    username = Column(String, primary_key=True)
+    name_normalized = Column(String, primary_key=True)
+    name = Column(String)
+    category = Column(String)
+    quantity = Column(Float, nullable=False, default=0)
+    purchased_at = Column(DateTime)
 
-# Ensure tables are created at import time
-create_tables()
+class PantryForecastDB(Base):
+    # Consumption rates and run-out dates, rewritten by forecast_pantry_db (the nightly job)
+    __tablename__ = 'pantry_forecasts'
+    username = Column(String, primary_key=True)
+    name_normalized = Column(String, primary_key=True)
+    name = Column(String)
+    category = Column(String)
+    rate = Column(Float, nullable=False)  # Units used per day
+    typical_quantity = Column(Float)  # Mean quantity per purchase day
+    purchase_days = Column(Integer)
+    last_purchased = Column(DateTime)
+    runout_at = Column(DateTime)  # From the pantry stock if there is any, else from the last purchase
+    computed_at = Column(DateTime)
+    __table_args__ = (Index('ix_pantry_forecasts_username_runout', 'username', 'runout_at'),)
+
+class SuggestionRankingDB(Base):
+    # SuggestionModel.rank per user, rewritten by rank_suggestions_db (a background job)
+    __tablename__ = 'suggestion_rankings'
+    username = Column(String, primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    name_normalized = Column(String, nullable=False)
+    frequency = Column(Float, nullable=False)
+    due = Column(Float, nullable=False)
+    reason = Column(String)
+    due_in_days = Column(Float)
+    computed_at = Column(DateTime)
+
+class JobDB(Base):
+    # Background job queue (see jobs.py); at most one pending row per dedup_key
+    __tablename__ = 'jobs'
+    id = Column(Integer, primary_key=True)
+    job = Column(String, nullable=False)  # Task name in jobs.TASKS
+    username = Column(String)  # None: every user
+    payload = Column(Text, nullable=False, default='{}')  # JSON keyword arguments
+    dedup_key = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='pending')  # 'pending', 'running', 'done' or 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_at = Column(DateTime, nullable=False)  # Not before; retries move it back
+    enqueued_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    lease_until = Column(DateTime)  # A running job still unfinished by then is taken to have lost its worker
+    worker = Column(String)
+    result = Column(Text)
+    last_error = Column(Text)
+    __table_args__ = (
+        Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        Index('ux_jobs_pending_dedup_key', 'dedup_key', unique=True, sqlite_where=text("status = 'pending'")),
+    )
+
+class JobScheduleDB(Base):
+    # When each periodic job (jobs.SCHEDULES) is next due; shared by every worker process
+    __tablename__ = 'job_schedules'
+    job = Column(String, primary_key=True)
+    next_run_at = Column(DateTime, nullable=False)
+
+class ItemPriceDB(Base):
+    # Store price history: one row per store, item and observation (see smart_grocery/prices.py)
+    __tablename__ = 'item_prices'
+    id = Column(Integer, primary_key=True)
+    store = Column(String, nullable=False)
+    name_normalized = Column(String, nullable=False)  # canonical_name; the catalog is shared by every user
+    name = Column(String)
+    price = Column(Float, nullable=False)  # Per unit
+    observed_at = Column(DateTime, nullable=False)
+    __table_args__ = (Index('ix_item_prices_name_store_observed', 'name_normalized', 'store', 'observed_at'),)
+
+class CurrentPriceDB(Base):
+    # The newest item_prices observation per item and store, kept by add_prices_db; budget plans read this
+    __tablename__ = 'current_prices'
+    name_normalized = Column(String, primary_key=True)
+    store = Column(String, primary_key=True)
+    name = Column(String)
+    price = Column(Float, nullable=False)
+    observed_at = Column(DateTime, nullable=False)
+
+# Engine/pool settings, overridable through the environment
+DB_URL = os.environ.get('GROCERY_DB_URL', 'sqlite:///grocery.db')
+POOL_SIZE = int(os.environ.get('GROCERY_DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.environ.get('GROCERY_DB_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = float(os.environ.get('GROCERY_DB_POOL_TIMEOUT', '30'))
+BUSY_TIMEOUT_MS = int(os.environ.get('GROCERY_DB_BUSY_TIMEOUT_MS', '5000'))
+VOCABULARY_CACHE_USERS = int(os.environ.get('GROCERY_VOCABULARY_CACHE_USERS', '256'))
+
+_engine = None
+_engine_lock = threading.Lock()
+_scope = threading.local()
+# username -> Canonicalizer over the user's item vocabulary, least recently used first
+_canonicalizers = OrderedDict()
+_canonicalizers_lock = threading.Lock()
+
+# One session per thread; Streamlit runs each browser session on its own thread.
+# expire_on_commit=False keeps returned rows readable after the session closes.
+Session = scoped_session(sessionmaker(expire_on_commit=False))
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+def _build_engine(url, pool_size, max_overflow, pool_timeout):
+    options = {'echo': False}
+    # In-memory SQLite uses a single-connection pool that takes no sizing
+    if ':memory:' not in url and url != 'sqlite://':
+        options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'check_same_thread': False}
+    engine = create_engine(url, **options)
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+    metrics.watch_engine(engine)
+    return engine
+
+def configure_engine(url=None, pool_size=None, max_overflow=None, pool_timeout=None, migrate=True):
+    """Replace the process-wide engine, e.g. to point at another database file.
+
+    The schema is upgraded to the latest migration unless ``migrate`` is False.
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            Session.remove()
+            _engine.dispose()
+        _engine = _build_engine(
+            url or DB_URL,
+            POOL_SIZE if pool_size is None else pool_size,
+            MAX_OVERFLOW if max_overflow is None else max_overflow,
+            POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+        )
+        Session.configure(bind=_engine)
+        with _canonicalizers_lock:
+            _canonicalizers.clear()
+        if migrate:
+            run_migrations(_engine)
+    return _engine
+
+def get_engine():
+    if _engine is None:
+        configure_engine()
+    return _engine
+
+def init_db():
+    """Create or upgrade the schema; safe to call repeatedly."""
+    return run_migrations(get_engine())
 
 def get_session():
-    engine = get_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
+    get_engine()
+    return Session.session_factory()
+
+@contextmanager
+def session_scope():
+    """Transactional scope around the thread's session.
+
+    Nested scopes share the outer transaction, which commits (or rolls back)
+    only when the outermost scope exits.
+    """
+    get_engine()
+    depth = getattr(_scope, 'depth', 0)
+    session = Session()
+    _scope.depth = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            session.commit()
+    except Exception:
+        if depth == 0:
+            session.rollback()
+        raise
+    finally:
+        _scope.depth = depth
+        if depth == 0:
+            Session.remove()
+
+def _canonicalizer(session, username):
+    """The user's Canonicalizer, built from item_frequencies, the list and item_aliases on first use.
+
+    Cached per process and checked against the user's vocabulary version on
+    every use, so aliases and names added by other processes are picked up.
+    Writes through _canonical_keys keep this process's copy current.
+    """
+    conn = session.connection()
+    v = VocabularyVersionDB.__table__
+    version = conn.execute(select(v.c.version).where(v.c.username == username)).scalar() or 0
+    with _canonicalizers_lock:
+        cached = _canonicalizers.get(username)
+        if cached is not None and cached[0] == version:
+            _canonicalizers.move_to_end(username)
+            return cached[1]
+    f, item, alias = ItemFrequencyDB.__table__, GroceryItemDB.__table__, ItemAliasDB.__table__
+    names = list(conn.execute(select(f.c.name_normalized, f.c.purchase_count).where(f.c.username == username)))
+    names += [(name, 0) for name, in conn.execute(
+        select(item.c.name_normalized).where(item.c.username == username).distinct())]
+    aliases = dict(conn.execute(select(alias.c.alias, alias.c.canonical).where(alias.c.username == username)).all())
+    canonicalizer = Canonicalizer(AutocompleteIndex(names), aliases)
+    with _canonicalizers_lock:
+        _canonicalizers[username] = (version, canonicalizer)
+        _canonicalizers.move_to_end(username)
+        while len(_canonicalizers) > VOCABULARY_CACHE_USERS:
+            _canonicalizers.popitem(last=False)
+    return canonicalizer
+
+def _bump_vocabulary(session, username, applied=False):
+    """Record a change to the user's aliases or known names, for every process's cached Canonicalizer.
+
+    ``applied`` means this process's cached copy already has the change (as
+    _canonical_keys makes it); otherwise the copy is dropped. Purchase weights
+    alone do not bump the version: they only reorder completions.
+    """
+    v = VocabularyVersionDB.__table__
+    stmt = sqlite_insert(v).values(username=username, version=1)
+    version = session.connection().execute(
+        stmt.on_conflict_do_update(index_elements=['username'], set_={'version': v.c.version + 1})
+        .returning(v.c.version)
+    ).scalar()
+    with _canonicalizers_lock:
+        cached = _canonicalizers.get(username)
+        if cached is not None:
+            if applied and cached[0] == version - 1:
+                _canonicalizers[username] = (version, cached[1])
+            else:
+                del _canonicalizers[username]
+
+def _canonical_keys(session, username, names, weight=0):
+    """Key each name is stored under: its canonical name, or the one an alias files it under.
+
+    Typos are not corrected here. autocomplete_db offers the correction, and
+    it becomes a 'typo' alias (set_alias_db) only once the user accepts it.
+    Every key is added to the vocabulary with ``weight`` (1 per purchase).
+    Returns {name: key}.
+    """
+    canonicalizer = _canonicalizer(session, username)
+    keys, learned = {}, False
+    for name in names:
+        key = keys.get(name)
+        if key is None:
+            key, how = canonicalizer.resolve(name, typos=False)
+            keys[name] = key
+            if how == 'new':
+                canonicalizer.learn(name, weight)
+                learned = True
+                continue
+        if weight:
+            canonicalizer.learn(key, weight)
+    if learned:
+        _bump_vocabulary(session, username, applied=True)
+    return keys
+
+def _lookup_keys(session, username, names):
+    # Like _canonical_keys, for reads: nothing is recorded or learned
+    canonicalizer = _canonicalizer(session, username)
+    return {canonicalizer.canonicalize(n, typos=False) for n in names}
+
+class VersionConflict(Exception):
+    """An update or delete named a version of an item that is no longer current."""
+
+    def __init__(self, item):
+        super().__init__('the item was changed by someone else' if item is not None else 'the item was deleted')
+        self.item = item  # The item as it is now, or None if it was deleted
+
+def _conflict(session, item):
+    if item is not None:
+        # Keep its current values readable after the rollback
+        session.expunge(item)
+    return VersionConflict(item)
+
+def _bump_version(session, username):
+    # Every write to a user's grocery_items takes the next list version; the upsert also serializes writers
+    table = ListVersionDB.__table__
+    stmt = sqlite_insert(table).values(username=username, version=1, pruned_version=0)
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.username], set_={'version': table.c.version + 1})
+    return session.execute(stmt.returning(table.c.version)).scalar_one()
+
+_CHANGE_COLUMNS = ('username', 'version', 'op', 'item_id', 'name', 'quantity', 'category', 'image_path', 'changed_at')
+
+def _log_upserts(session, username, version):
+    # Copy every item written at ``version`` into the change log as it is now
+    item = GroceryItemDB.__table__
+    session.execute(insert(ItemChangeDB.__table__).from_select(_CHANGE_COLUMNS, select(
+        item.c.username, item.c.version, literal('upsert'), item.c.id, item.c.name, item.c.quantity,
+        item.c.category, item.c.image_path, literal(_utcnow(), DateTime()),
+    ).where(item.c.username == username, item.c.version == version)))
+
+def _log_removals(session, username, op, item_ids=(None,)):
+    version = _bump_version(session, username)
+    now = _utcnow()
+    session.execute(insert(ItemChangeDB), [
+        {'username': username, 'version': version, 'op': op, 'item_id': item_id, 'changed_at': now}
+        for item_id in item_ids
+    ])
+    return version
 
 def add_item_db(name, quantity, category, username, image_path=None):
-    session = get_session()
-    item = GroceryItemDB(name=name, quantity=quantity, category=category, username=username, image_path=image_path)
+    with session_scope() as session:
+        return _add_item(session, name, quantity, category, username, image_path)
+
+def _add_item(session, name, quantity, category, username, image_path=None):
+    key = _canonical_keys(session, username, [name])[name]
+    item = GroceryItemDB(name=name, name_normalized=key, quantity=quantity, category=category,
+                         username=username, image_path=image_path, version=_bump_version(session, username))
     session.add(item)
-    session.commit()
-    session.close()
+    session.flush()
+    _log_upserts(session, username, item.version)
+    return item.id
+
+def add_items_db(items, username):
+    """Insert many ``{"name", "quantity", "category"[, "image_path"]}`` dicts in one executemany."""
+    items = list(items)
+    if items:
+        with session_scope() as session:
+            _add_items(session, items, username)
+    return len(items)
+
+def _add_items(session, items, username):
+    keys = _canonical_keys(session, username, [i['name'] for i in items])
+    version = _bump_version(session, username)
+    session.execute(insert(GroceryItemDB), [
+        {'username': username, 'name': i['name'], 'name_normalized': keys[i['name']],
+         'quantity': i['quantity'], 'category': i['category'], 'image_path': i.get('image_path'),
+         'version': version}
+        for i in items
+    ])
+    _log_upserts(session, username, version)
+
+def iter_items_db(username, batch_size=1000):
+    """Stream a user's items as dicts straight from the cursor."""
+    with session_scope() as session:
+        item = GroceryItemDB
+        rows = session.execute(
+            select(item.name, item.quantity, item.category).where(item.username == username).order_by(item.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for name, quantity, category in rows:
+            yield {'name': name, 'quantity': quantity, 'category': category}
 
 def get_items_db(username):
-    session = get_session()
-    items = session.query(GroceryItemDB).filter_by(username=username).all()
-    session.close()
-    return items
+    with session_scope() as session:
+        return session.query(GroceryItemDB).filter_by(username=username).all()
+
+def get_items_page_db(username, limit=50, after_id=None):
+    """One keyset page of items in id order; returns (items, id to pass as after_id, or None)."""
+    with session_scope() as session:
+        query = session.query(GroceryItemDB).filter(GroceryItemDB.username == username)
+        if after_id is not None:
+            query = query.filter(GroceryItemDB.id > after_id)
+        items = query.order_by(GroceryItemDB.id).limit(limit + 1).all()
+    more = len(items) > limit
+    items = items[:limit]
+    return items, (items[-1].id if more else None)
+
+def _prefix_clause(prefix):
+    # Range scan on (username, name_normalized) instead of a LIKE that cannot use the index
+    prefix = canonical_name(prefix)
+    return (GroceryItemDB.name_normalized >= prefix) & (GroceryItemDB.name_normalized < prefix + '\U0010ffff')
+
+def search_items_db(username, prefix, limit=50, after=None):
+    """One keyset page of items whose canonical name starts with ``prefix``, in name order.
+
+    ``after`` is the ``(name_normalized, id)`` of the last item on the previous
+    page. Returns ``(items, next after or None)``.
+    """
+    item = GroceryItemDB
+    with session_scope() as session:
+        query = session.query(item).filter(item.username == username, _prefix_clause(prefix))
+        if after is not None:
+            name, item_id = after
+            query = query.filter((item.name_normalized > name) | ((item.name_normalized == name) & (item.id > item_id)))
+        items = query.order_by(item.name_normalized, item.id).limit(limit + 1).all()
+    more = len(items) > limit
+    items = items[:limit]
+    return items, ((items[-1].name_normalized, items[-1].id) if more else None)
+
+def count_items_db(username, prefix=None):
+    with session_scope() as session:
+        query = session.query(func.count(GroceryItemDB.id)).filter(GroceryItemDB.username == username)
+        if prefix:
+            query = query.filter(_prefix_clause(prefix))
+        return query.scalar()
+
+def get_item_names_db(username):
+    with session_scope() as session:
+        return [name for name, in session.query(GroceryItemDB.name).filter(GroceryItemDB.username == username)]
+
+def get_item_db(item_id, username):
+    with session_scope() as session:
+        return session.query(GroceryItemDB).filter_by(id=item_id, username=username).first()
+
+ITEM_FIELDS = ('name', 'quantity', 'category', 'image_path')
+
+def update_item_db(item_id, username, expected_version=None, **fields):
+    """Update name/quantity/category/image_path of one item; returns the item or None if missing.
+
+    With ``expected_version`` the item is only updated if it is still at that
+    version; otherwise VersionConflict is raised and nothing changes.
+    """
+    with session_scope() as session:
+        return _update_item(session, item_id, username, fields, expected_version)
+
+def _update_item(session, item_id, username, fields, expected_version=None):
+    item = session.query(GroceryItemDB).filter_by(id=item_id, username=username).first()
+    if item is None:
+        return None
+    if expected_version is not None and item.version != expected_version:
+        raise _conflict(session, item)
+    table = GroceryItemDB.__table__
+    values = {f: fields[f] for f in ITEM_FIELDS if f in fields}
+    if 'name' in values:
+        values['name_normalized'] = _canonical_keys(session, username, [values['name']])[values['name']]
+    values['version'] = _bump_version(session, username)
+    # Checked again in the UPDATE itself, in case another writer got in since the read above
+    stmt = update(table).where(table.c.id == item_id, table.c.username == username)
+    if expected_version is not None:
+        stmt = stmt.where(table.c.version == expected_version)
+    if not session.execute(stmt.values(values)).rowcount:
+        raise _conflict(session, session.query(GroceryItemDB).filter_by(id=item_id, username=username)
+                        .populate_existing().first())
+    _log_upserts(session, username, values['version'])
+    session.refresh(item)
+    return item
+
+def delete_item_db(item_id, username, expected_version=None):
+    """Delete one item; returns False if it does not exist.
+
+    With ``expected_version`` the item is only deleted if it is still at that
+    version; otherwise VersionConflict is raised.
+    """
+    with session_scope() as session:
+        return _delete_item(session, item_id, username, expected_version)
+
+def _delete_item(session, item_id, username, expected_version=None):
+    table = GroceryItemDB.__table__
+    stmt = delete(table).where(table.c.id == item_id, table.c.username == username)
+    if expected_version is not None:
+        stmt = stmt.where(table.c.version == expected_version)
+    if not session.execute(stmt).rowcount:
+        current = session.query(GroceryItemDB).filter_by(id=item_id, username=username).first()
+        if current is not None:
+            raise _conflict(session, current)
+        return False
+    _log_removals(session, username, 'delete', [item_id])
+    return True
+
+_IN_CHUNK = 500  # Ids per IN (...) clause, well under SQLite's bound-parameter limit
+
+def _update_items(session, changes, username):
+    table = GroceryItemDB.__table__
+    keys = _canonical_keys(session, username, [c['name'] for c in changes if 'name' in c])
+    version = None
+    groups = {}
+    for change in changes:
+        fields = tuple(f for f in ITEM_FIELDS if f in change)
+        if fields:
+            row = {'b_id': change['id'], 'b_user': username}
+            row.update((f'b_{f}', change[f]) for f in fields)
+            if 'name' in fields:
+                row['b_name_normalized'] = keys[change['name']]
+            groups.setdefault(fields, []).append(row)
+    if groups:
+        version = _bump_version(session, username)
+    for fields, rows in groups.items():
+        columns = fields + (('name_normalized',) if 'name' in fields else ())
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam('b_id'), table.c.username == bindparam('b_user'))
+            .values({**{c: bindparam(f'b_{c}') for c in columns}, 'version': version})
+        )
+        session.connection().execute(stmt, rows)
+    if version is not None:
+        _log_upserts(session, username, version)
+    return sum(len(rows) for rows in groups.values())
+
+def update_items_db(changes, username):
+    """Apply many ``{"id", <some of ITEM_FIELDS>}`` edits in one transaction; returns the number of edits.
+
+    Edits touching the same set of fields are sent as one executemany. They
+    are not version-checked: this is last-writer-wins, like a bulk import.
+    """
+    with session_scope() as session:
+        return _update_items(session, changes, username)
+
+def delete_items_db(ids, username):
+    """Delete many items by id in one transaction; returns the number deleted."""
+    with session_scope() as session:
+        return _delete_items(session, list(ids), username)
+
+def _delete_items(session, ids, username):
+    table = GroceryItemDB.__table__
+    deleted = []
+    for start in range(0, len(ids), _IN_CHUNK):
+        deleted += session.execute(
+            delete(table).where(table.c.username == username, table.c.id.in_(ids[start:start + _IN_CHUNK]))
+            .returning(table.c.id)
+        ).scalars().all()
+    if deleted:
+        _log_removals(session, username, 'delete', deleted)
+    return len(deleted)
+
+def save_list_to_history_db(username, timestamp=None, clear=True):
+    """Record the current list as a purchase (and by default clear it) atomically.
+
+    Returns the history id, or None if the list is empty.
+    """
+    with session_scope() as session:
+        item = GroceryItemDB
+        rows = session.execute(
+            select(item.name, item.quantity, item.category).where(item.username == username).order_by(item.id)
+        ).all()
+        if not rows:
+            return None
+        history_id = add_history_db([{'name': n, 'quantity': q, 'category': c} for n, q, c in rows], username, timestamp)
+        if clear:
+            _clear_items(session, username)
+        return history_id
 
 def clear_items_db(username):
-    session = get_session()
-    session.query(GroceryItemDB).filter_by(username=username).delete()
-    session.commit()
-    session.close()
-
-def add_history_db(items, username):
-    session = get_session()
-    history = GroceryHistoryDB(items=json.dumps(items), username=username)
+    with session_scope() as session:
+        _clear_items(session, username)
+
+def _clear_items(session, username):
+    # Logged as one 'clear' change rather than a delete per item
+    if session.execute(delete(GroceryItemDB).where(GroceryItemDB.username == username)).rowcount:
+        _log_removals(session, username, 'clear')
+
+CHANGE_PAGE_LIMIT = 1000
+
+def get_list_version_db(username):
+    """Current version of a user's list; it goes up with every change to their items."""
+    with session_scope() as session:
+        return _list_version(session, username)[0]
+
+def _list_version(session, username):
+    row = session.execute(
+        select(ListVersionDB.version, ListVersionDB.pruned_version).where(ListVersionDB.username == username)
+    ).first()
+    return tuple(row) if row else (0, 0)
+
+def get_changes_db(username, since=None, limit=CHANGE_PAGE_LIMIT):
+    """What happened to a user's list after version ``since``: ``(version, changes, items)``.
+
+    ``changes`` are ItemChangeDB rows in the order they were made and
+    ``version`` is the ``since`` to ask with next. Pages end between versions,
+    so a page holds up to ``limit`` changes unless a single write made more.
+    If ``since`` is None or older than the log reaches back, ``changes`` is
+    empty and ``items`` is the whole list to start from; otherwise ``items``
+    is None.
+    """
+    with session_scope() as session:
+        return _changes(session, username, since, limit)
+
+def _changes(session, username, since, limit):
+    version, pruned = _list_version(session, username)
+    if since is None or since < pruned or since > version:
+        # Read after the version, so replaying from it can repeat a change but never miss one
+        items = session.query(GroceryItemDB).filter_by(username=username).order_by(GroceryItemDB.id).all()
+        return version, [], items
+    if since == version:
+        return version, [], None
+    change = ItemChangeDB
+    query = select(change).where(change.username == username).order_by(change.id)
+    changes = session.scalars(query.where(change.version > since).limit(limit + 1)).all()
+    if len(changes) > limit:
+        cut = changes[limit].version
+        changes = [c for c in changes if c.version < cut] or \
+            session.scalars(query.where(change.version == changes[0].version)).all()
+        return changes[-1].version, changes, None
+    if changes:
+        version = max(version, changes[-1].version)
+    return version, changes, None
+
+def prune_changes_db(before, username=None):
+    """Drop change-log entries made before ``before``; returns how many were removed.
+
+    Clients still behind a pruned version are sent the whole list instead.
+    """
+    change = ItemChangeDB
+    query = select(change.username, func.max(change.version)).where(change.changed_at < before)
+    if username:
+        query = query.where(change.username == username)
+    removed = 0
+    with session_scope() as session:
+        for user, version in session.execute(query.group_by(change.username)).all():
+            removed += session.execute(
+                delete(change).where(change.username == user, change.version <= version)).rowcount
+            session.execute(update(ListVersionDB).where(
+                ListVersionDB.username == user, ListVersionDB.pruned_version < version).values(pruned_version=version))
+    return removed
+
+def _history_line(history_id, username, item, key):
+    return {
+        'history_id': history_id,
+        'username': username,
+        'name': item['name'],
+        'name_normalized': key,
+        'quantity': item['quantity'],
+        'category': item['category'],
+    }
+
+def _utcnow():
+    # Matches SQLite's CURRENT_TIMESTAMP, which older history rows were stamped with
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _update_item_frequencies(session, username, lines, timestamp):
+    counts = Counter(l['name_normalized'] for l in lines)
+    quantities = Counter()
+    for l in lines:
+        quantities[l['name_normalized']] += l['quantity']
+    table = ItemFrequencyDB.__table__
+    conn = session.connection()
+    names = list(counts)
+    existing = {}
+    for start in range(0, len(names), _IN_CHUNK):
+        rows = conn.execute(select(table).where(
+            table.c.username == username, table.c.name_normalized.in_(names[start:start + _IN_CHUNK])
+        ))
+        existing.update((row.name_normalized, row) for row in rows)
+    day = to_days(timestamp)
+    inserts, updates = [], []
+    for name, n in counts.items():
+        freq = existing.get(name)
+        if freq is None:
+            stats = ItemStats(name)
+            stats.observe(day)
+            inserts.append({
+                'username': username, 'name_normalized': name, 'purchase_count': n,
+                'total_quantity': quantities[name], 'first_purchased': timestamp, 'last_purchased': timestamp,
+                'basket_count': stats.baskets, 'decayed_score': stats.decayed, 'decayed_at': stats.decayed_at,
+                'mean_interval_days': stats.interval,
+            })
+            continue
+        stats = ItemFrequencyDB.to_stats(freq)
+        stats.observe(day)
+        updates.append({
+            'b_user': username, 'b_name': name, 'b_count': freq.purchase_count + n,
+            'b_quantity': freq.total_quantity + quantities[name],
+            'b_first': min(freq.first_purchased or timestamp, timestamp),
+            'b_last': max(freq.last_purchased or timestamp, timestamp),
+            'b_baskets': stats.baskets, 'b_decayed': stats.decayed, 'b_at': stats.decayed_at,
+            'b_interval': stats.interval,
+        })
+    if inserts:
+        conn.execute(insert(table), inserts)
+    if updates:
+        conn.execute(
+            update(table)
+            .where(table.c.username == bindparam('b_user'), table.c.name_normalized == bindparam('b_name'))
+            .values(purchase_count=bindparam('b_count'), total_quantity=bindparam('b_quantity'),
+                    first_purchased=bindparam('b_first'), last_purchased=bindparam('b_last'),
+                    basket_count=bindparam('b_baskets'), decayed_score=bindparam('b_decayed'),
+                    decayed_at=bindparam('b_at'), mean_interval_days=bindparam('b_interval')),
+            updates,
+        )
+
+    if 1 < len(counts) <= MAX_COOCCURRENCE_BASKET:
+        pairs = [
+            {'username': username, 'name_normalized': a, 'other_normalized': b, 'basket_count': 1}
+            for a in counts for b in counts if a != b
+        ]
+        stmt = sqlite_insert(ItemCooccurrenceDB.__table__)
+        session.connection().execute(stmt.on_conflict_do_update(
+            index_elements=['username', 'name_normalized', 'other_normalized'],
+            set_={'basket_count': ItemCooccurrenceDB.basket_count + 1},
+        ), pairs)
+
+ROLLUP_GRAINS = ('day', 'week', 'month')
+
+def period_start(moment, grain):
+    """First day of the ``grain`` period containing ``moment``, as an ISO date string."""
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if grain == 'week':
+        day -= timedelta(days=day.weekday())
+    elif grain == 'month':
+        day = day.replace(day=1)
+    elif grain != 'day':
+        raise ValueError(f"Unknown grain {grain!r}; expected one of {', '.join(ROLLUP_GRAINS)}")
+    return day.isoformat()
+
+def _update_rollups(session, username, lines, timestamp):
+    totals = {}
+    for l in lines:
+        key = (l['name_normalized'], l['category'] or 'Other')
+        name, quantity, count = totals.get(key, (l['name'], 0, 0))
+        totals[key] = (name, quantity + l['quantity'], count + 1)
+    rows = [
+        {'username': username, 'grain': grain, 'period_start': period,
+         'name_normalized': name_normalized, 'category': category, 'name': name,
+         'quantity': quantity, 'line_count': count, 'basket_count': 1}
+        for grain, period in ((g, period_start(timestamp, g)) for g in ROLLUP_GRAINS)
+        for (name_normalized, category), (name, quantity, count) in totals.items()
+    ]
+    stmt = sqlite_insert(PurchaseRollupDB.__table__)
+    session.connection().execute(stmt.on_conflict_do_update(
+        index_elements=['username', 'grain', 'period_start', 'name_normalized', 'category'],
+        set_={
+            'quantity': PurchaseRollupDB.quantity + stmt.excluded.quantity,
+            'line_count': PurchaseRollupDB.line_count + stmt.excluded.line_count,
+            'basket_count': PurchaseRollupDB.basket_count + 1,
+        },
+    ), rows)
+
+def _record_history(session, items, username, timestamp):
+    # Shared by add_history_db and db_async (through AsyncSession.run_sync)
+    timestamp = timestamp or _utcnow()
+    history = GroceryHistoryDB(username=username, timestamp=timestamp)
     session.add(history)
-    session.commit()
-    session.close()
+    session.flush()
+    if items:
+        keys = _canonical_keys(session, username, [i['name'] for i in items], weight=1)
+        lines = [_history_line(history.id, username, i, keys[i['name']]) for i in items]
+        session.execute(insert(GroceryHistoryLineDB), lines)
+        _update_item_frequencies(session, username, lines, timestamp)
+        _update_rollups(session, username, lines, timestamp)
+        _enqueue(session, 'rank-suggestions', username, delay_seconds=RANKING_DELAY_SECONDS)
+    return history.id
+
+def add_history_db(items, username, timestamp=None):
+    with session_scope() as session:
+        return _record_history(session, items, username, timestamp)
 
 def get_history_db(username):
-    session = get_session()
-    history = session.query(GroceryHistoryDB).filter_by(username=username).order_by(GroceryHistoryDB.timestamp.desc()).all()
-    session.close()
-    return [(h.timestamp, json.loads(h.items)) for h in history]
+    with session_scope() as session:
+        rows = (
+            session.query(GroceryHistoryDB.id, GroceryHistoryDB.timestamp, GroceryHistoryLineDB.name,
+                          GroceryHistoryLineDB.quantity, GroceryHistoryLineDB.category)
+            .outerjoin(GroceryHistoryLineDB, GroceryHistoryLineDB.history_id == GroceryHistoryDB.id)
+            .filter(GroceryHistoryDB.username == username)
+            .order_by(GroceryHistoryDB.timestamp.desc(), GroceryHistoryDB.id.desc(), GroceryHistoryLineDB.id)
+            .all()
+        )
+    history = []
+    for (_, timestamp), lines in groupby(rows, key=lambda r: (r.id, r.timestamp)):
+        items = [{'name': l.name, 'quantity': l.quantity, 'category': l.category} for l in lines if l.name is not None]
+        history.append((timestamp, items))
+    return history
+
+def _history_page(session, username, limit, before):
+    history = GroceryHistoryDB
+    query = session.query(history.id, history.timestamp).filter(history.username == username)
+    if before is not None:
+        timestamp, history_id = before
+        query = query.filter(
+            (history.timestamp < timestamp) | ((history.timestamp == timestamp) & (history.id < history_id))
+        )
+    heads = query.order_by(history.timestamp.desc(), history.id.desc()).limit(limit + 1).all()
+    more = len(heads) > limit
+    heads = heads[:limit]
+    lines = {}
+    if heads:
+        line = GroceryHistoryLineDB
+        rows = (
+            session.query(line.history_id, line.name, line.quantity, line.category)
+            .filter(line.history_id.in_([h.id for h in heads]))
+            .order_by(line.id)
+        )
+        for history_id, name, quantity, category in rows:
+            lines.setdefault(history_id, []).append({'name': name, 'quantity': quantity, 'category': category})
+    page = [(h.id, h.timestamp, lines.get(h.id, [])) for h in heads]
+    return page, ((heads[-1].timestamp, heads[-1].id) if more else None)
+
+def get_history_page_db(username, limit=20, before=None):
+    """One keyset page of purchases, newest first.
+
+    ``before`` is the ``(timestamp, id)`` of the last purchase on the previous
+    page. Returns ``([(id, timestamp, items)], next before or None)``.
+    """
+    with session_scope() as session:
+        return _history_page(session, username, limit, before)
+
+def iter_history_lines_db(username, batch_size=1000):
+    """Stream a user's purchase history as one dict per line item, oldest first."""
+    with session_scope() as session:
+        line, history = GroceryHistoryLineDB, GroceryHistoryDB
+        rows = session.execute(
+            select(history.timestamp, line.name, line.quantity, line.category)
+            .join(history, history.id == line.history_id)
+            .where(line.username == username)
+            .order_by(history.timestamp, line.history_id, line.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for timestamp, name, quantity, category in rows:
+            yield {'timestamp': timestamp, 'name': name, 'quantity': quantity, 'category': category}
 
 def add_meal_db(date, items, username):
-    session = get_session()
-    meal = MealPlanDB(date=date, items=json.dumps(items), username=username)
-    session.add(meal)
-    session.commit()
-    session.close()
+    with session_scope() as session:
+        meal = MealPlanDB(date=date, items=json.dumps(items), username=username)
+        session.add(meal)
+        session.flush()
+        return meal.id
 
 def get_meals_db(username):
-    session = get_session()
-    meals = session.query(MealPlanDB).filter_by(username=username).all()
-    session.close()
-    return [(m.date, json.loads(m.items)) for m in meals]
+    with session_scope() as session:
+        meals = session.query(MealPlanDB).filter_by(username=username).all()
+        return [(m.date, json.loads(m.items)) for m in meals]
+
+def save_recipe_db(username, name, ingredients, servings=1):
+    """Create or replace a recipe; ``ingredients`` are Ingredient tuples or dicts. Returns the recipe id."""
+    ingredients = [i if isinstance(i, Ingredient) else Ingredient(**i) for i in ingredients]
+    if not ingredients:
+        raise ValueError(f'{name}: a recipe needs at least one ingredient')
+    with session_scope() as session:
+        return _save_recipe(session, username, name, ingredients, servings)
+
+def _save_recipe(session, username, name, ingredients, servings):
+    servings = max(int(servings), 1)
+    keys = _canonical_keys(session, username, [i.name for i in ingredients])
+    compiled = [compile_ingredient(i, servings)._replace(key=keys[i.name]) for i in ingredients]
+    recipe = session.scalar(select(RecipeDB).where(
+        RecipeDB.username == username, RecipeDB.name_normalized == normalize_name(name)))
+    if recipe is None:
+        recipe = RecipeDB(username=username, name_normalized=normalize_name(name))
+        session.add(recipe)
+    recipe.name = name.strip().title()
+    recipe.servings = servings
+    session.flush()
+    session.execute(delete(RecipeIngredientDB).where(RecipeIngredientDB.recipe_id == recipe.id))
+    session.execute(insert(RecipeIngredientDB), [
+        {'recipe_id': recipe.id, 'name': c.name, 'name_normalized': c.key, 'category': c.category,
+         'amount': i.amount, 'unit': i.unit, 'base_unit': c.unit, 'per_serving': c.per_serving}
+        for i, c in zip(ingredients, compiled)
+    ])
+    return recipe.id
+
+def _recipes(session, username, name=None):
+    query = (
+        select(RecipeDB.name, RecipeDB.servings, RecipeIngredientDB.name, RecipeIngredientDB.amount,
+               RecipeIngredientDB.unit, RecipeIngredientDB.category)
+        .join(RecipeIngredientDB, RecipeIngredientDB.recipe_id == RecipeDB.id)
+        .where(RecipeDB.username == username)
+        .order_by(RecipeDB.name_normalized, RecipeIngredientDB.id)
+    )
+    if name is not None:
+        query = query.where(RecipeDB.name_normalized == normalize_name(name))
+    rows = session.execute(query).all()
+    return [Recipe(recipe_name, [Ingredient(*row[2:]) for row in group], servings)
+            for (recipe_name, servings), group in groupby(rows, key=lambda row: (row[0], row[1]))]
+
+def get_recipes_db(username, name=None):
+    """A user's recipes in name order, or only the one called ``name``."""
+    with session_scope() as session:
+        return _recipes(session, username, name)
+
+def get_recipe_db(username, name):
+    recipes = get_recipes_db(username, name)
+    return recipes[0] if recipes else None
+
+def delete_recipe_db(username, name):
+    with session_scope() as session:
+        result = session.execute(delete(RecipeDB).where(
+            RecipeDB.username == username, RecipeDB.name_normalized == normalize_name(name)))
+        return result.rowcount > 0
+
+def _by_user(session, usernames, query, user_column):
+    """Run ``query`` for usernames in chunks of _IN_CHUNK; yields its rows."""
+    usernames = list(usernames)
+    for start in range(0, len(usernames), _IN_CHUNK):
+        yield from session.connection().execute(query.where(user_column.in_(usernames[start:start + _IN_CHUNK])))
+
+def _expand_meal_plans(session, usernames, start, end, subtract_list, servings):
+    indexes = {user: RecipeIndex() for user in usernames}
+    query = (
+        select(RecipeDB.username, RecipeDB.name_normalized, RecipeDB.servings, RecipeIngredientDB.name_normalized,
+               RecipeIngredientDB.base_unit, RecipeIngredientDB.per_serving, RecipeIngredientDB.name,
+               RecipeIngredientDB.category)
+        .join(RecipeIngredientDB, RecipeIngredientDB.recipe_id == RecipeDB.id)
+        .order_by(RecipeDB.username, RecipeDB.name_normalized, RecipeIngredientDB.id)
+    )
+    for (user, recipe, recipe_servings), group in groupby(_by_user(session, usernames, query, RecipeDB.username),
+                                                          key=lambda row: row[:3]):
+        indexes[user].add_compiled(recipe, recipe_servings, [CompiledIngredient(*row[3:]) for row in group])
+
+    plans = {user: {} for user in usernames}
+    query = select(MealPlanDB.username, MealPlanDB.date, MealPlanDB.items).order_by(MealPlanDB.date, MealPlanDB.id)
+    if start is not None:
+        query = query.where(MealPlanDB.date >= start)
+    if end is not None:
+        query = query.where(MealPlanDB.date <= end)
+    for user, day, items in _by_user(session, usernames, query, MealPlanDB.username):
+        plans[user].setdefault(day, []).extend(json.loads(items))
+
+    on_list = {user: {} for user in usernames}
+    if subtract_list:
+        query = (
+            select(GroceryItemDB.username, GroceryItemDB.name_normalized, func.sum(GroceryItemDB.quantity))
+            .group_by(GroceryItemDB.username, GroceryItemDB.name_normalized)
+        )
+        for user, name, quantity in _by_user(session, usernames, query, GroceryItemDB.username):
+            on_list[user][name] = quantity or 0
+    return {user: expand_meals(plans[user], indexes[user], on_list=on_list[user], servings=servings)
+            for user in usernames}
+
+def expand_meal_plans_db(usernames, start=None, end=None, subtract_list=True, servings=None):
+    """Expand the meal plans of many users at once; returns {username: Expansion}.
+
+    Dates are inclusive ISO strings. Recipes, meals and list items are each
+    read with one query per _IN_CHUNK users.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    with session_scope() as session:
+        return _expand_meal_plans(session, usernames, start, end, subtract_list, servings)
+
+def expand_meal_plan_db(username, start=None, end=None, subtract_list=True, servings=None):
+    return expand_meal_plans_db([username], start, end, subtract_list, servings)[username]
+
+def add_meal_plan_to_list_db(username, start=None, end=None, servings=None):
+    """Put what the meals from start to end still need on the list, in one transaction.
+
+    Items already on the list have their quantity raised; the rest are added.
+    Returns the Expansion that was applied.
+    """
+    with session_scope() as session:
+        return _add_meal_plan_to_list(session, username, start, end, servings)
+
+def _add_meal_plan_to_list(session, username, start, end, servings):
+    expansion = _expand_meal_plans(session, [username], start, end, True, servings)[username]
+    existing = {}
+    for item_id, name in session.execute(
+        select(GroceryItemDB.id, GroceryItemDB.name_normalized)
+        .where(GroceryItemDB.username == username).order_by(GroceryItemDB.id)
+    ):
+        existing.setdefault(name, item_id)
+    table = GroceryItemDB.__table__
+    requirements = expansion.requirements()
+    keys = _canonical_keys(session, username, [r.name for r in requirements])
+    if not requirements:
+        return expansion
+    version = _bump_version(session, username)
+    raised, added = [], []
+    for requirement in requirements:
+        key = keys[requirement.name]
+        if key in existing:
+            raised.append({'b_id': existing[key], 'b_quantity': requirement.quantity})
+        else:
+            added.append({'username': username, 'name': requirement.name, 'name_normalized': key,
+                          'quantity': requirement.quantity, 'category': requirement.category, 'version': version})
+    if raised:
+        session.connection().execute(
+            update(table).where(table.c.id == bindparam('b_id'))
+            .values(quantity=table.c.quantity + bindparam('b_quantity'), version=version),
+            raised,
+        )
+    if added:
+        session.connection().execute(insert(table), added)
+    _log_upserts(session, username, version)
+    return expansion
 
 def get_suggestions_db(username, top_n=5):
-    history = get_history_db(username)
-    all_items = []
-    for _, purchase in history:
-        for item in purchase:
-            all_items.append(item['name'].lower())
-    counter = Counter(all_items)
-    return counter.most_common(top_n)
+    with session_scope() as session:
+        rows = (
+            session.query(ItemFrequencyDB.name_normalized, ItemFrequencyDB.purchase_count)
+            .filter(ItemFrequencyDB.username == username)
+            .order_by(ItemFrequencyDB.purchase_count.desc(), ItemFrequencyDB.name_normalized)
+            .limit(top_n)
+            .all()
+        )
+        return [(name, n) for name, n in rows]
+
+def _load_suggestion_model(session, username, current):
+    f = ItemFrequencyDB
+    rows = session.execute(
+        select(f.name_normalized, f.basket_count, f.decayed_score, f.decayed_at, f.last_purchased,
+               f.mean_interval_days).where(f.username == username)
+    )
+    stats = [
+        ItemStats(name, baskets, decayed or 0.0, decayed_at, to_days(last) if last else None, interval)
+        for name, baskets, decayed, decayed_at, last, interval in rows
+    ]
+    cooccurrence = {}
+    if current:
+        c = ItemCooccurrenceDB
+        rows = session.execute(
+            select(c.name_normalized, c.other_normalized, c.basket_count)
+            .where(c.username == username, c.name_normalized.in_(current))
+        )
+        for row in rows:
+            cooccurrence.setdefault(row.name_normalized, {})[row.other_normalized] = row.basket_count
+            cooccurrence.setdefault(row.other_normalized, {})[row.name_normalized] = row.basket_count
+    return SuggestionModel.from_aggregates(stats, cooccurrence)
+
+def get_smart_suggestions_db(username, top_n=5, current=(), now=None):
+    """Rank items with smart_grocery.SuggestionModel; ``current`` lists names already on the list."""
+    with session_scope() as session:
+        current = _lookup_keys(session, username, current)
+        model = _load_suggestion_model(session, username, current)
+    return model.suggest(top_n, now=now, current=current)
+
+RANKING_DELAY_SECONDS = 10  # Saves within this long of each other share one re-ranking job
+
+def rank_suggestions_db(username=None, now=None, limit=RANKING_SIZE):
+    """Store SuggestionModel.rank for one user, or every user with purchases; returns the users ranked.
+
+    Run by the 'rank-suggestions' background job, which saving history queues.
+    """
+    now = now or _utcnow()
+    with session_scope() as session:
+        if username is not None:
+            users = [username]
+        else:
+            users = session.scalars(select(ItemFrequencyDB.username).distinct()).all()
+            session.execute(delete(SuggestionRankingDB).where(SuggestionRankingDB.username.not_in(users)))
+    for user in users:
+        # One transaction per user, so a long run holds the write lock briefly at a time
+        with session_scope() as session:
+            ranked = _load_suggestion_model(session, user, ()).rank(limit, now=now)
+            session.execute(delete(SuggestionRankingDB).where(SuggestionRankingDB.username == user))
+            if ranked:
+                session.execute(insert(SuggestionRankingDB), [
+                    {'username': user, 'rank': i, 'name_normalized': item.name, 'frequency': item.frequency,
+                     'due': item.due, 'reason': item.reason, 'due_in_days': item.due_in_days, 'computed_at': now}
+                    for i, item in enumerate(ranked)
+                ])
+    return len(users)
+
+def get_ranked_suggestions_db(username, top_n=5, current=()):
+    """Suggestions from the stored ranking (see rank_suggestions_db), re-scored for ``current``.
+
+    Until the user's first ranking exists, the model is scored here and the
+    ranking job queued.
+    """
+    with session_scope() as session:
+        return _ranked_suggestions(session, username, top_n, current)
+
+def _ranked_suggestions(session, username, top_n, current):
+    current = _lookup_keys(session, username, current)
+    r, c, f = SuggestionRankingDB, ItemCooccurrenceDB, ItemFrequencyDB
+    if current:
+        # One row per ranked item and item on the list bought with it, with that item's basket count
+        query = (
+            select(r.name_normalized, r.frequency, r.due, r.reason, r.due_in_days,
+                   c.name_normalized, c.basket_count, f.basket_count)
+            .outerjoin(c, and_(c.username == r.username, c.other_normalized == r.name_normalized,
+                               c.name_normalized.in_(current)))
+            .outerjoin(f, and_(f.username == r.username, f.name_normalized == c.name_normalized))
+        )
+    else:
+        query = select(r.name_normalized, r.frequency, r.due, r.reason, r.due_in_days,
+                       literal(None), literal(None), literal(None))
+    rows = session.execute(query.where(r.username == username).order_by(r.rank)).all()
+    if not rows:
+        model = _load_suggestion_model(session, username, current)
+        if model.items:
+            _enqueue(session, 'rank-suggestions', username)
+        return model.suggest(top_n, current=current)
+    ranked, cooccurrence, baskets = [], {}, {}
+    for name, frequency, due, reason, due_in, anchor, together, anchor_baskets in rows:
+        if not ranked or ranked[-1].name != name:
+            ranked.append(RankedItem(name, frequency, due, reason, due_in))
+        if anchor is not None:
+            cooccurrence.setdefault(anchor, {})[name] = together
+            baskets[anchor] = anchor_baskets
+    return rerank(ranked, current, cooccurrence, baskets, top_n)
+
+def _rollup_query(session, username, grain, since, *columns):
+    rollup = PurchaseRollupDB
+    query = session.query(*columns).filter(rollup.username == username, rollup.grain == grain)
+    if since is not None:
+        query = query.filter(rollup.period_start >= period_start(since, grain))
+    return query
+
+def get_item_totals_db(username, top_n=5, since=None):
+    """Most purchased items by total quantity since ``since`` (default: ever), as (display name, quantity)."""
+    rollup = PurchaseRollupDB
+    with session_scope() as session:
+        # Monthly rows are the fewest; a bounded window needs daily ones to start on the right day
+        total = func.sum(rollup.quantity)
+        rows = (
+            _rollup_query(session, username, 'month' if since is None else 'day', since,
+                          func.min(rollup.name), total)
+            .group_by(rollup.name_normalized)
+            .order_by(total.desc())
+            .limit(top_n)
+            .all()
+        )
+        return [(name, qty) for name, qty in rows]
+
+def get_period_totals_db(username, grain='day', since=None):
+    """Purchased quantity per period, as (period start ISO date, quantity) in date order."""
+    rollup = PurchaseRollupDB
+    with session_scope() as session:
+        rows = (
+            _rollup_query(session, username, grain, since, rollup.period_start, func.sum(rollup.quantity))
+            .group_by(rollup.period_start)
+            .order_by(rollup.period_start)
+            .all()
+        )
+        return [(period, qty) for period, qty in rows]
+
+def get_daily_totals_db(username, since=None):
+    """Purchased quantity per day, as (ISO date string, quantity) in date order."""
+    return get_period_totals_db(username, 'day', since)
+
+def get_category_totals_db(username, grain='month', since=None):
+    """Quantity per period and category, as (period start, category, quantity) in date order."""
+    rollup = PurchaseRollupDB
+    with session_scope() as session:
+        rows = (
+            _rollup_query(session, username, grain, since, rollup.period_start, rollup.category,
+                          func.sum(rollup.quantity))
+            .group_by(rollup.period_start, rollup.category)
+            .order_by(rollup.period_start, rollup.category)
+            .all()
+        )
+        return [(period, category, qty) for period, category, qty in rows]
+
+def get_restock_cadence_db(username, since=None, top_n=10):
+    """Average days between purchase days for the most often bought items.
+
+    Returns (display name, days purchased, average days between) for items bought
+    on at least two days, most frequent first.
+    """
+    rollup = PurchaseRollupDB
+    with session_scope() as session:
+        days = func.count(rollup.period_start.distinct())
+        rows = (
+            _rollup_query(session, username, 'day', since, func.min(rollup.name), days,
+                          func.min(rollup.period_start), func.max(rollup.period_start))
+            .group_by(rollup.name_normalized)
+            .having(days > 1)
+            .order_by(days.desc(), rollup.name_normalized)
+            .limit(top_n)
+            .all()
+        )
+    return [
+        (name, n, (date.fromisoformat(last) - date.fromisoformat(first)).days / (n - 1))
+        for name, n, first, last in rows
+    ]
+
+PANTRY_HORIZON_DAYS = 7
+FORECAST_WINDOW_DAYS = 365
+FORECAST_BATCH_ROWS = 200_000  # Rollup rows per NumPy batch; batches end on a user boundary
+
+def _stock_pantry(session, username, items, timestamp):
+    """Add bought items to the pantry: what is left of the old stock, at the forecast rate, plus the new."""
+    keys = _canonical_keys(session, username, [i['name'] for i in items])
+    bought = {}
+    for i in items:
+        entry = bought.setdefault(keys[i['name']], {'name': i['name'], 'category': i['category'], 'quantity': 0})
+        entry['quantity'] += i['quantity']
+    pantry, forecast = PantryItemDB, PantryForecastDB
+    left = {}
+    names = list(bought)
+    for start in range(0, len(names), _IN_CHUNK):
+        rows = session.execute(
+            select(pantry.name_normalized, pantry.quantity, pantry.purchased_at, forecast.rate)
+            .outerjoin(forecast, (forecast.username == pantry.username)
+                       & (forecast.name_normalized == pantry.name_normalized))
+            .where(pantry.username == username, pantry.name_normalized.in_(names[start:start + _IN_CHUNK]))
+        )
+        left.update((key, remaining(quantity, at, rate, timestamp)) for key, quantity, at, rate in rows)
+    stmt = sqlite_insert(pantry.__table__)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=['username', 'name_normalized'],
+        set_={'name': stmt.excluded.name, 'category': stmt.excluded.category,
+              'quantity': stmt.excluded.quantity, 'purchased_at': stmt.excluded.purchased_at},
+    ), [
+        {'username': username, 'name_normalized': key, 'name': entry['name'], 'category': entry['category'],
+         'quantity': left.get(key, 0.0) + entry['quantity'], 'purchased_at': timestamp}
+        for key, entry in bought.items()
+    ])
+
+def add_to_pantry_db(items, username, timestamp=None):
+    """Record items as bought into the pantry (without touching history or the list)."""
+    if items:
+        with session_scope() as session:
+            _stock_pantry(session, username, items, timestamp or _utcnow())
+
+def check_out_items_db(ids, username, timestamp=None):
+    """Mark list items as bought: record them as a purchase, stock the pantry and take them off the list.
+
+    Returns the number of items checked out.
+    """
+    with session_scope() as session:
+        return _check_out_items(session, list(ids), username, timestamp)
+
+def _check_out_items(session, ids, username, timestamp):
+    item = GroceryItemDB
+    rows = []
+    for start in range(0, len(ids), _IN_CHUNK):
+        rows += session.execute(
+            select(item.id, item.name, item.quantity, item.category)
+            .where(item.username == username, item.id.in_(ids[start:start + _IN_CHUNK]))
+            .order_by(item.id)
+        ).all()
+    if not rows:
+        return 0
+    timestamp = timestamp or _utcnow()
+    items = [{'name': name, 'quantity': quantity, 'category': category} for _, name, quantity, category in rows]
+    _record_history(session, items, username, timestamp)
+    _stock_pantry(session, username, items, timestamp)
+    return _delete_items(session, [r.id for r in rows], username)
+
+def get_pantry_db(username, now=None):
+    """The user's pantry as PantryEntry tuples, soonest to run out first (no forecast yet: last)."""
+    with session_scope() as session:
+        return _pantry(session, username, now or _utcnow())
+
+def _pantry(session, username, now):
+    pantry, forecast = PantryItemDB, PantryForecastDB
+    rows = session.execute(
+        select(pantry.name, pantry.category, pantry.quantity, pantry.purchased_at, forecast.rate)
+        .outerjoin(forecast, (forecast.username == pantry.username)
+                   & (forecast.name_normalized == pantry.name_normalized))
+        .where(pantry.username == username)
+        .order_by(pantry.name_normalized)
+    )
+    entries = [
+        PantryEntry(name, category, quantity, remaining(quantity, at, rate, now), at, rate, runout(quantity, at, rate))
+        for name, category, quantity, at, rate in rows
+    ]
+    return sorted(entries, key=lambda e: (e.runout_at is None, e.runout_at or now))
+
+def set_pantry_item_db(username, name, quantity, category='Other', now=None):
+    """Set how much of an item is at home now; 0 removes it. Returns False if there was nothing to remove."""
+    with session_scope() as session:
+        return _set_pantry_item(session, username, name, quantity, category, now or _utcnow())
+
+def _set_pantry_item(session, username, name, quantity, category, now):
+    key = _canonical_keys(session, username, [name])[name]
+    pantry = PantryItemDB
+    if quantity <= 0:
+        return bool(session.execute(
+            delete(pantry).where(pantry.username == username, pantry.name_normalized == key)
+        ).rowcount)
+    stmt = sqlite_insert(pantry.__table__).values(
+        username=username, name_normalized=key, name=name, category=category, quantity=quantity, purchased_at=now,
+    )
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=['username', 'name_normalized'],
+        set_={'quantity': stmt.excluded.quantity, 'purchased_at': stmt.excluded.purchased_at},
+    ))
+    return True
+
+def get_pantry_proposals_db(username, horizon_days=PANTRY_HORIZON_DAYS, now=None):
+    """Items forecast to run out within ``horizon_days`` that are not on the list, as PantryProposal tuples.
+
+    Rates come from the last forecast_pantry_db run. Pantry stock, or a
+    purchase made since that run, moves the run-out date along the same rate.
+    Items overdue by more than a usual purchase's worth are left out.
+    """
+    with session_scope() as session:
+        return _pantry_proposals(session, username, horizon_days, now or _utcnow())
+
+def _pantry_proposals(session, username, horizon_days, now):
+    forecast, pantry, frequency, item = PantryForecastDB, PantryItemDB, ItemFrequencyDB, GroceryItemDB
+    listed = select(item.name_normalized).where(item.username == username, item.name_normalized.is_not(None))
+    rows = session.execute(
+        select(forecast.name, forecast.category, forecast.rate, forecast.typical_quantity, forecast.last_purchased,
+               forecast.runout_at, pantry.quantity, pantry.purchased_at,
+               frequency.last_purchased.label('bought_at'))
+        .outerjoin(pantry, (pantry.username == forecast.username)
+                   & (pantry.name_normalized == forecast.name_normalized))
+        .outerjoin(frequency, (frequency.username == forecast.username)
+                   & (frequency.name_normalized == forecast.name_normalized))
+        .where(forecast.username == username, forecast.name_normalized.not_in(listed))
+    )
+    horizon = now + timedelta(days=horizon_days)
+    proposals = []
+    for row in rows:
+        if row.purchased_at is not None:
+            at = runout(row.quantity, row.purchased_at, row.rate)
+        elif row.bought_at is not None and row.bought_at.date() > row.last_purchased.date():
+            at = runout(row.typical_quantity, row.bought_at, row.rate)
+        else:
+            at = row.runout_at
+        # More than one buying cycle overdue: probably no longer bought, not forgotten
+        if at is not None and at <= horizon and at >= now - timedelta(days=(row.typical_quantity or 1) / row.rate):
+            proposals.append(PantryProposal(row.name, row.category, max(1, round(row.typical_quantity or 1)), at,
+                                            row.purchased_at is not None))
+    return sorted(proposals, key=lambda p: p.runout_at)
+
+def add_pantry_proposals_to_list_db(username, horizon_days=PANTRY_HORIZON_DAYS, now=None):
+    """Put get_pantry_proposals_db's items on the list; returns the proposals added."""
+    with session_scope() as session:
+        return _add_pantry_proposals(session, username, horizon_days, now or _utcnow())
+
+def _add_pantry_proposals(session, username, horizon_days, now):
+    proposals = _pantry_proposals(session, username, horizon_days, now)
+    if proposals:
+        _add_items(session, [{'name': p.name, 'quantity': p.quantity, 'category': p.category} for p in proposals],
+                   username)
+    return proposals
+
+def forecast_pantry_db(username=None, now=None, window_days=FORECAST_WINDOW_DAYS):
+    """Fit consumption rates from the daily purchase rollups and store run-out forecasts; returns how many.
+
+    The nightly job (``python db.py forecast-pantry``): every (user, item)
+    series of purchase days in the last ``window_days`` goes through
+    smart_grocery.pantry in NumPy, a batch of users at a time, in one
+    transaction. Forecasts of items not bought in the window are dropped.
+    """
+    now = now or _utcnow()
+    rollup = PurchaseRollupDB
+    query = (
+        select(rollup.username, rollup.name_normalized, rollup.period_start, func.sum(rollup.quantity))
+        .where(rollup.grain == 'day', rollup.period_start >= (now - timedelta(days=window_days)).date().isoformat())
+        .group_by(rollup.username, rollup.name_normalized, rollup.period_start)
+        .order_by(rollup.username, rollup.name_normalized, rollup.period_start)
+    )
+    stale = delete(PantryForecastDB).where(PantryForecastDB.computed_at < now)
+    if username is not None:
+        query = query.where(rollup.username == username)
+        stale = stale.where(PantryForecastDB.username == username)
+    written = 0
+    with session_scope() as session:
+        batch, users = [], []
+        for user, rows in groupby(session.execute(query.execution_options(yield_per=50_000)), key=lambda r: r[0]):
+            batch.extend(rows)
+            users.append(user)
+            if len(batch) >= FORECAST_BATCH_ROWS:
+                written += _write_forecasts(session, users, batch, now)
+                batch, users = [], []
+        if batch:
+            written += _write_forecasts(session, users, batch, now)
+        session.execute(stale)
+    return written
+
+def _write_forecasts(session, users, rows, now):
+    import numpy as np
+
+    from smart_grocery import pantry as forecasting
+
+    names = np.array([r[0] for r in rows], dtype=object), np.array([r[1] for r in rows], dtype=object)
+    days = np.array([r[2] for r in rows], dtype='datetime64[D]').astype(np.int64)
+    fit = forecasting.consumption_rates(forecasting.series_starts(*names), days,
+                                        np.array([r[3] for r in rows], dtype=float))
+    series = list(zip(names[0][fit.starts], names[1][fit.starts]))
+    # Pantry stock, where there is some, is where the run-out clock starts instead of the last purchase
+    stock_day, stock = fit.last_day.astype(float), fit.last_quantity.copy()
+    position = {key: i for i, key in enumerate(series)}
+    pantry, rollup = PantryItemDB, PurchaseRollupDB
+    labels = {}
+    for start in range(0, len(users), _IN_CHUNK):
+        chunk = users[start:start + _IN_CHUNK]
+        for user, key, quantity, at in session.execute(
+            select(pantry.username, pantry.name_normalized, pantry.quantity, pantry.purchased_at)
+            .where(pantry.username.in_(chunk))
+        ):
+            i = position.get((user, key))
+            if i is not None and at is not None:
+                stock_day[i], stock[i] = forecasting.to_epoch_days(at), quantity
+        labels.update(((user, key), (name, category)) for user, key, name, category in session.execute(
+            select(rollup.username, rollup.name_normalized, func.min(rollup.name), func.min(rollup.category))
+            .where(rollup.grain == 'month', rollup.username.in_(chunk))
+            .group_by(rollup.username, rollup.name_normalized)
+        ))
+        session.execute(delete(PantryForecastDB).where(PantryForecastDB.username.in_(chunk)))
+    runout_day = forecasting.runout_days(stock_day, stock, fit.rate)
+    found = np.flatnonzero(np.isfinite(runout_day))
+    if len(found):
+        session.execute(insert(PantryForecastDB), [
+            {'username': series[i][0], 'name_normalized': series[i][1],
+             'name': labels.get(series[i], (series[i][1].title(), None))[0] or series[i][1].title(),
+             'category': labels.get(series[i], (None, 'Other'))[1] or 'Other',
+             'rate': float(fit.rate[i]), 'typical_quantity': float(fit.typical_quantity[i]),
+             'purchase_days': int(fit.purchase_days[i]),
+             'last_purchased': forecasting.from_epoch_days(fit.last_day[i]),
+             'runout_at': forecasting.from_epoch_days(runout_day[i]), 'computed_at': now}
+            for i in found
+        ])
+    return len(found)
+
+def add_prices_db(rows, now=None):
+    """Record catalog prices and bring current_prices up to date; returns how many were recorded.
+
+    ``rows`` are normalized catalog rows (smart_grocery.prices.normalize_price_row);
+    undated ones are observed ``now``. An observation older than the current
+    price of its item and store only goes into the history.
+    """
+    if not rows:
+        return 0
+    with session_scope() as session:
+        return _add_prices(session, rows, now or _utcnow())
+
+def _add_prices(session, rows, now):
+    lines = [
+        {'store': r['store'], 'name_normalized': canonical_name(r['name']), 'name': r['name'],
+         'price': r['price'], 'observed_at': r['observed_at'] or now}
+        for r in rows
+    ]
+    session.execute(insert(ItemPriceDB), lines)
+    newest = {}
+    for line in lines:
+        key = (line['name_normalized'], line['store'])
+        if key not in newest or line['observed_at'] >= newest[key]['observed_at']:
+            newest[key] = line
+    current = CurrentPriceDB.__table__
+    stmt = sqlite_insert(current)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=['name_normalized', 'store'],
+        set_={'name': stmt.excluded.name, 'price': stmt.excluded.price, 'observed_at': stmt.excluded.observed_at},
+        where=stmt.excluded.observed_at >= current.c.observed_at,
+    ), list(newest.values()))
+    return len(lines)
+
+def get_price_stores_db():
+    """Stores in the catalog, as (store, items with a current price), by store."""
+    with session_scope() as session:
+        return _price_stores(session)
+
+def _price_stores(session):
+    current = CurrentPriceDB
+    return session.execute(select(current.store, func.count()).group_by(current.store).order_by(current.store)).all()
+
+def get_price_history_db(name, store=None, since=None):
+    """Observed prices of an item, as (store, price, observed_at) by store and date."""
+    with session_scope() as session:
+        return _price_history(session, name, store, since)
+
+def _price_history(session, name, store, since):
+    price = ItemPriceDB
+    query = select(price.store, price.price, price.observed_at).where(price.name_normalized == canonical_name(name))
+    if store is not None:
+        query = query.where(price.store == store)
+    if since is not None:
+        query = query.where(price.observed_at >= since)
+    return session.execute(query.order_by(price.store, price.observed_at)).all()
+
+def plan_budget_db(username, budget=None, max_stores=1, store_cost=0.0, stores=None):
+    """Where to buy the user's list at current prices, within ``budget``: a prices.BudgetPlan.
+
+    Only ``stores`` are considered if given. Over budget, items the user
+    buys in more baskets are kept first (prices.optimize's values).
+    """
+    with session_scope() as session:
+        return _plan_budget(session, username, budget, max_stores, store_cost, stores)
+
+def _plan_budget(session, username, budget, max_stores, store_cost, stores):
+    import numpy as np
+
+    from smart_grocery.prices import optimize, price_matrix
+
+    item = GroceryItemDB
+    items = session.execute(
+        select(item.name, item.name_normalized, item.quantity).where(item.username == username).order_by(item.id)
+    ).all()
+    keys = sorted({key for _, key, _ in items})
+    current, f = CurrentPriceDB, ItemFrequencyDB
+    rows, baskets = [], {}
+    for start in range(0, len(keys), _IN_CHUNK):
+        chunk = keys[start:start + _IN_CHUNK]
+        query = select(current.name_normalized, current.store, current.price).where(current.name_normalized.in_(chunk))
+        if stores is not None:
+            query = query.where(current.store.in_(list(stores)))
+        rows += session.execute(query).all()
+        baskets.update(session.execute(
+            select(f.name_normalized, f.basket_count).where(f.username == username, f.name_normalized.in_(chunk))
+        ).all())
+    stores, matrix = price_matrix([key for _, key, _ in items], rows, sorted(stores) if stores is not None else None)
+    values = 1 + np.log1p([baskets.get(key) or 0 for _, key, _ in items])
+    return optimize([name for name, _, _ in items], [quantity or 1 for _, _, quantity in items], stores, matrix,
+                    budget, max_stores, store_cost, values)
+
+def get_spend_db(username, grain='month', since=None, store=None):
+    """Estimated spend per period from purchase history, as (period start, spend, unpriced quantity) in date order.
+
+    History has no prices, so each day's purchases are priced from the
+    catalog as it was that day: the latest observation on or before the day
+    at ``store``, or the mean over stores that had one. Quantities bought
+    with no such price are counted as unpriced.
+    """
+    with session_scope() as session:
+        return _spend(session, username, grain, since, store)
+
+def _spend(session, username, grain, since, store):
+    import numpy as np
+
+    from smart_grocery.prices import as_of_prices
+
+    rollup, price = PurchaseRollupDB, ItemPriceDB
+    bought = _rollup_query(session, username, 'day', since, rollup.period_start, rollup.name_normalized,
+                           func.sum(rollup.quantity)).group_by(rollup.period_start, rollup.name_normalized).all()
+    if not bought:
+        return []
+    history = select(price.store, price.name_normalized, price.observed_at, price.price).where(
+        price.name_normalized.in_(
+            select(rollup.name_normalized).where(rollup.username == username, rollup.grain == 'month').distinct()
+        )
+    )
+    if store is not None:
+        history = history.where(price.store == store)
+    observations = session.execute(history).all()
+    keys = [key for _, key, _ in bought]
+    days = np.array([day for day, _, _ in bought], dtype='datetime64[D]').astype(np.int64)
+    quantity = np.array([qty for _, _, qty in bought], dtype=float)
+    by_store = {}
+    for row in observations:
+        by_store.setdefault(row[0], []).append(row[1:])
+    unit = np.full((len(bought), max(len(by_store), 1)), np.nan)
+    for j, rows in enumerate(by_store.values()):
+        price_keys, observed, prices = zip(*rows)
+        unit[:, j] = as_of_prices(keys, days, price_keys,
+                                  np.array(observed, dtype='datetime64[D]').astype(np.int64), prices)
+    priced = ~np.isnan(unit).all(axis=1)
+    cost = np.where(priced, np.nanmean(np.where(priced[:, None], unit, 0.0), axis=1) * quantity, 0.0)
+    periods = {}
+    for (day, _, _), spend, qty, has_price in zip(bought, cost, quantity, priced):
+        total = periods.setdefault(period_start(date.fromisoformat(day), grain), [0.0, 0])
+        total[0] += float(spend)
+        if not has_price:
+            total[1] += int(qty)
+    return [(period, round(spend, 2), unpriced) for period, (spend, unpriced) in sorted(periods.items())]
+
+def _frequencies_from_history(username=None):
+    # Ground-truth aggregate over the raw history lines
+    line, history = GroceryHistoryLineDB, GroceryHistoryDB
+    query = (
+        select(line.username, line.name_normalized, func.count(line.id), func.sum(line.quantity),
+               func.min(history.timestamp), func.max(history.timestamp), func.count(line.history_id.distinct()))
+        .join(history, history.id == line.history_id)
+        .group_by(line.username, line.name_normalized)
+    )
+    if username is not None:
+        query = query.where(line.username == username)
+    return query
+
+def _cooccurrence_from_history(username=None):
+    a, b = GroceryHistoryLineDB.__table__.alias('a'), GroceryHistoryLineDB.__table__.alias('b')
+    line = GroceryHistoryLineDB
+    small_baskets = (
+        select(line.history_id)
+        .group_by(line.history_id)
+        .having(func.count(line.name_normalized.distinct()) <= MAX_COOCCURRENCE_BASKET)
+    )
+    query = (
+        select(a.c.username, a.c.name_normalized, b.c.name_normalized, func.count(a.c.history_id.distinct()))
+        .join(b, (b.c.history_id == a.c.history_id) & (b.c.name_normalized != a.c.name_normalized))
+        .where(a.c.history_id.in_(small_baskets))
+        .group_by(a.c.username, a.c.name_normalized, b.c.name_normalized)
+    )
+    if username is not None:
+        query = query.where(a.c.username == username)
+    return query
+
+def _rollups_from_history(grain, username=None):
+    # Ground-truth rollup for one grain; the period expressions mirror period_start()
+    line, history = GroceryHistoryLineDB, GroceryHistoryDB
+    if grain == 'day':
+        period = func.date(history.timestamp)
+    elif grain == 'week':
+        period = func.date(history.timestamp, 'weekday 0', '-6 days')
+    else:
+        period = func.date(history.timestamp, 'start of month')
+    category = func.coalesce(line.category, 'Other')
+    query = (
+        select(line.username, period, line.name_normalized, category, func.min(line.name),
+               func.sum(line.quantity), func.count(line.id), func.count(line.history_id.distinct()))
+        .join(history, history.id == line.history_id)
+        .group_by(line.username, period, line.name_normalized, category)
+    )
+    if username is not None:
+        query = query.where(line.username == username)
+    return query
+
+ROLLUP_COLUMNS = ['username', 'period_start', 'name_normalized', 'category', 'name', 'quantity', 'line_count',
+                  'basket_count']
+
+def rebuild_rollups_db(username=None):
+    """Recompute purchase_rollups from raw history, for one user or everyone."""
+    with session_scope() as session:
+        _rebuild_rollups(session, username)
+
+def _rebuild_rollups(session, username):
+    target = delete(PurchaseRollupDB)
+    if username is not None:
+        target = target.where(PurchaseRollupDB.username == username)
+    session.execute(target)
+    for grain in ROLLUP_GRAINS:
+        query = _rollups_from_history(grain, username).add_columns(literal(grain))
+        session.execute(insert(PurchaseRollupDB).from_select(ROLLUP_COLUMNS + ['grain'], query))
+
+def check_rollups_db(username=None):
+    """Compare purchase_rollups with raw history; returns mismatch descriptions."""
+    problems = []
+    with session_scope() as session:
+        for grain in ROLLUP_GRAINS:
+            expected = {tuple(r[:4]): tuple(r[5:]) for r in session.execute(_rollups_from_history(grain, username))}
+            query = session.query(PurchaseRollupDB).filter(PurchaseRollupDB.grain == grain)
+            if username is not None:
+                query = query.filter(PurchaseRollupDB.username == username)
+            actual = {
+                (r.username, r.period_start, r.name_normalized, r.category): (r.quantity, r.line_count, r.basket_count)
+                for r in query
+            }
+            for key in sorted(expected.keys() | actual.keys()):
+                label = f"{grain} " + '/'.join(key)
+                if key not in actual:
+                    problems.append(f"purchase_rollups {label}: missing")
+                elif key not in expected:
+                    problems.append(f"purchase_rollups {label}: not in history")
+                elif expected[key] != actual[key]:
+                    problems.append(f"purchase_rollups {label}: expected {expected[key]}, found {actual[key]}")
+    return problems
+
+def _replay_item_stats(session, username=None):
+    # Decay and purchase intervals depend on order, so they are replayed basket by basket
+    line, history = GroceryHistoryLineDB, GroceryHistoryDB
+    query = (
+        select(line.username, line.history_id, history.timestamp, line.name_normalized)
+        .join(history, history.id == line.history_id)
+        .order_by(line.username, history.timestamp, line.history_id)
+    )
+    if username is not None:
+        query = query.where(line.username == username)
+    rows = session.execute(query.execution_options(yield_per=10000))
+    for user, user_rows in groupby(rows, key=lambda r: r.username):
+        model = SuggestionModel()
+        for (_, timestamp), basket in groupby(user_rows, key=lambda r: (r.history_id, r.timestamp)):
+            model.add_basket([r.name_normalized for r in basket], timestamp)
+        yield user, model
+
+def rebuild_item_frequencies_db(username=None):
+    """Recompute item_frequencies and item_cooccurrence from raw history, for one user or everyone."""
+    with session_scope() as session:
+        _rebuild_item_frequencies(session, username)
+        _enqueue(session, 'rank-suggestions', username)
+
+def _rebuild_item_frequencies(session, username):
+    for table in (ItemFrequencyDB, ItemCooccurrenceDB):
+        target = delete(table)
+        if username is not None:
+            target = target.where(table.username == username)
+        session.execute(target)
+    columns = ['username', 'name_normalized', 'purchase_count', 'total_quantity', 'first_purchased',
+               'last_purchased', 'basket_count']
+    session.execute(insert(ItemFrequencyDB).from_select(columns, _frequencies_from_history(username)))
+    session.execute(insert(ItemCooccurrenceDB).from_select(
+        ['username', 'name_normalized', 'other_normalized', 'basket_count'], _cooccurrence_from_history(username)
+    ))
+    table = ItemFrequencyDB.__table__
+    set_stats = (
+        update(table)
+        .where(table.c.username == bindparam('b_user'), table.c.name_normalized == bindparam('b_name'))
+        .values(decayed_score=bindparam('b_decayed'), decayed_at=bindparam('b_at'),
+                mean_interval_days=bindparam('b_interval'))
+    )
+    for user, model in _replay_item_stats(session, username):
+        session.connection().execute(set_stats, [
+            {'b_user': user, 'b_name': s.name, 'b_decayed': s.decayed, 'b_at': s.decayed_at, 'b_interval': s.interval}
+            for s in model.items.values()
+        ])
+
+def check_item_frequencies_db(username=None):
+    """Compare item_frequencies and item_cooccurrence with raw history; returns mismatch descriptions.
+
+    Decayed scores and intervals are order-dependent floats and are left to rebuild.
+    """
+    with session_scope() as session:
+        expected = {(r[0], r[1]): tuple(r[2:]) for r in session.execute(_frequencies_from_history(username))}
+        query = session.query(ItemFrequencyDB)
+        if username is not None:
+            query = query.filter(ItemFrequencyDB.username == username)
+        actual = {
+            (f.username, f.name_normalized):
+                (f.purchase_count, f.total_quantity, f.first_purchased, f.last_purchased, f.basket_count)
+            for f in query
+        }
+        expected_pairs = {(r[0], r[1], r[2]): r[3] for r in session.execute(_cooccurrence_from_history(username))}
+        query = session.query(ItemCooccurrenceDB)
+        if username is not None:
+            query = query.filter(ItemCooccurrenceDB.username == username)
+        actual_pairs = {(c.username, c.name_normalized, c.other_normalized): c.basket_count for c in query}
+    problems = []
+    for table, want, have in (('item_frequencies', expected, actual), ('item_cooccurrence', expected_pairs, actual_pairs)):
+        for key in sorted(want.keys() | have.keys()):
+            label = '/'.join(key)
+            if key not in have:
+                problems.append(f"{table} {label}: missing")
+            elif key not in want:
+                problems.append(f"{table} {label}: not in history")
+            elif want[key] != have[key]:
+                problems.append(f"{table} {label}: expected {want[key]}, found {have[key]}")
+    return problems
+
+def get_aliases_db(username):
+    """A user's aliases as (alias, canonical name, source) in alias order."""
+    with session_scope() as session:
+        return _aliases(session, username)
+
+def _aliases(session, username):
+    a = ItemAliasDB
+    return [tuple(row) for row in session.execute(
+        select(a.alias, a.canonical, a.source).where(a.username == username).order_by(a.alias))]
+
+def set_alias_db(username, alias, canonical, source='user'):
+    """File ``alias`` under ``canonical`` from now on, and merge what was already recorded under it.
+
+    Returns the stored (alias, canonical) keys. Raises ValueError if both are the same item.
+    """
+    with session_scope() as session:
+        return _set_alias(session, username, alias, canonical, source)
+
+def _set_alias(session, username, alias, canonical, source='user'):
+    aliases = _canonicalizer(session, username).aliases
+    alias, name = canonical_name(alias), canonical_name(canonical)
+    canonical = aliases.get(name, name)
+    if not alias or not canonical:
+        raise ValueError('alias and name must not be empty')
+    if alias == canonical:
+        raise ValueError(f'{alias!r} and {name!r} are already the same item')
+    conn = session.connection()
+    table = ItemAliasDB.__table__
+    # Aliases stay one hop deep: whatever pointed at the alias now points at its target
+    conn.execute(update(table).where(table.c.username == username, table.c.canonical == alias)
+                 .values(canonical=canonical))
+    stmt = sqlite_insert(table).values(username=username, alias=alias, canonical=canonical, source=source)
+    conn.execute(stmt.on_conflict_do_update(index_elements=['username', 'alias'],
+                                            set_={'canonical': canonical, 'source': source}))
+    item, line = GroceryItemDB.__table__, GroceryHistoryLineDB.__table__
+    rekeyed = (item.c.username == username, item.c.name_normalized == alias)
+    if conn.execute(select(item.c.id).where(*rekeyed).limit(1)).first() is not None:
+        # Re-keyed items are writes like any other: a new list version and change-log rows
+        version = _bump_version(session, username)
+        conn.execute(update(item).where(*rekeyed).values(name_normalized=canonical, version=version))
+        _log_upserts(session, username, version)
+    merged = conn.execute(update(line).where(line.c.username == username, line.c.name_normalized == alias)
+                          .values(name_normalized=canonical)).rowcount
+    conn.execute(update(RecipeIngredientDB.__table__).where(
+        RecipeIngredientDB.name_normalized == alias,
+        RecipeIngredientDB.recipe_id.in_(select(RecipeDB.id).where(RecipeDB.username == username)),
+    ).values(name_normalized=canonical))
+    if merged:
+        _rebuild_item_frequencies(session, username)
+        _rebuild_rollups(session, username)
+    _bump_vocabulary(session, username)
+    return alias, canonical
+
+def delete_alias_db(username, alias):
+    """Stop filing ``alias`` under another name; what was already merged stays merged."""
+    with session_scope() as session:
+        return _delete_alias(session, username, alias)
+
+def _delete_alias(session, username, alias):
+    result = session.execute(delete(ItemAliasDB).where(
+        ItemAliasDB.username == username, ItemAliasDB.alias == canonical_name(alias)))
+    if result.rowcount:
+        _bump_vocabulary(session, username)
+    return result.rowcount > 0
+
+def autocomplete_db(username, text, limit=10):
+    """``(Resolution, [Completion])``: how ``text`` resolves and completions for it.
+
+    A 'typo' resolution is only a suggestion: ``text`` is still stored under
+    its own name unless the user accepts the correction, which
+    set_alias_db(..., source='typo') records. Completions are the user's
+    known item names starting with ``text``, heaviest (most purchased) first,
+    topped up with near misses.
+    """
+    with session_scope() as session:
+        return _autocomplete(session, username, text, limit)
+
+def _autocomplete(session, username, text, limit):
+    canonicalizer = _canonicalizer(session, username)
+    return canonicalizer.resolve(text), canonicalizer.vocabulary.suggest(text, limit)
+
+def import_legacy_images_db(store):
+    """Move items whose image_path is still a file path into the image store; returns (moved, skipped).
+
+    Missing or unreadable files are skipped and keep their old path.
+    """
+    from smart_grocery.images import is_digest
+
+    moved = skipped = 0
+    changes = {}
+    with session_scope() as session:
+        rows = session.execute(select(GroceryItemDB.id, GroceryItemDB.username, GroceryItemDB.image_path)
+                               .where(GroceryItemDB.image_path.isnot(None)))
+        for item_id, username, image_path in rows.all():
+            if is_digest(image_path):
+                continue
+            try:
+                digest = store.put_file(image_path)
+            except (OSError, ValueError):
+                skipped += 1
+            else:
+                changes.setdefault(username, []).append({'id': item_id, 'image_path': digest})
+                moved += 1
+        # Through the versioned bulk update, so clients following the change feed see the new paths
+        for username, user_changes in changes.items():
+            _update_items(session, user_changes, username)
+    store.wait()
+    return moved, skipped
+
+JOB_LEASE_SECONDS = int(os.environ.get('GROCERY_JOB_LEASE_SECONDS', '900'))
+JOB_RETRY_SECONDS = 30  # Wait before the first retry; doubles with every further attempt
+JOB_MAX_ATTEMPTS = 3
+
+def _job_key(job, username, payload):
+    return json.dumps([job, username, payload], sort_keys=True, separators=(',', ':'))
+
+def enqueue_job_db(job, username=None, payload=None, delay_seconds=0, max_attempts=JOB_MAX_ATTEMPTS, now=None):
+    """Queue ``job`` unless an identical one (same name, user and payload) is pending; returns the pending row.
+
+    A duplicate's run_at is brought forward if this request is due sooner.
+    """
+    with session_scope() as session:
+        return _enqueue(session, job, username, payload, delay_seconds, max_attempts, now)
+
+def _enqueue(session, job, username=None, payload=None, delay_seconds=0, max_attempts=JOB_MAX_ATTEMPTS, now=None):
+    # Also called inside other writes, so the job is queued only if they commit
+    now = now or _utcnow()
+    payload = payload or {}
+    key = _job_key(job, username, payload)
+    run_at = now + timedelta(seconds=delay_seconds)
+    session.execute(
+        sqlite_insert(JobDB.__table__)
+        .values(job=job, username=username, payload=json.dumps(payload, sort_keys=True), dedup_key=key,
+                status='pending', attempts=0, max_attempts=max_attempts, run_at=run_at, enqueued_at=now)
+        .on_conflict_do_nothing(index_elements=['dedup_key'], index_where=text("status = 'pending'"))
+    )
+    session.execute(
+        update(JobDB).where(JobDB.dedup_key == key, JobDB.status == 'pending', JobDB.run_at > run_at)
+        .values(run_at=run_at)
+    )
+    return session.scalars(select(JobDB).where(JobDB.dedup_key == key, JobDB.status == 'pending')).one()
+
+def claim_job_db(worker, now=None, lease_seconds=JOB_LEASE_SECONDS):
+    """Mark the next due job running under ``worker`` and return it, or None when nothing is due.
+
+    The single UPDATE is atomic under SQLite's write lock, so workers in
+    several processes never take the same job. A running job past its lease
+    (its worker died) is due again.
+    """
+    now = now or _utcnow()
+    j = JobDB
+    due = (
+        select(j.id)
+        .where(or_(and_(j.status == 'pending', j.run_at <= now), and_(j.status == 'running', j.lease_until < now)))
+        .order_by(j.run_at, j.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    with session_scope() as session:
+        return session.scalars(
+            update(j).where(j.id == due)
+            .values(status='running', worker=worker, started_at=now, attempts=j.attempts + 1,
+                    lease_until=now + timedelta(seconds=lease_seconds))
+            .returning(j)
+        ).one_or_none()
+
+def finish_job_db(job_id, worker, result=None, error=None, now=None):
+    """Record how a claimed job ended; returns its new status, or None if ``worker`` no longer holds it.
+
+    A failure is retried after JOB_RETRY_SECONDS, doubling per attempt, until
+    max_attempts; then, or if an identical job was queued meanwhile, the row
+    stays 'failed' with the error.
+    """
+    now = now or _utcnow()
+    with session_scope() as session:
+        job = session.get(JobDB, job_id)
+        if job is None or job.status != 'running' or job.worker != worker:
+            return None
+        job.finished_at, job.lease_until = now, None
+        if error is None:
+            job.status, job.result = 'done', None if result is None else json.dumps(result, default=str)
+            return job.status
+        job.last_error = error
+        pending = session.scalar(select(JobDB.id).where(JobDB.dedup_key == job.dedup_key, JobDB.status == 'pending'))
+        if job.attempts < job.max_attempts and pending is None:
+            job.status = 'pending'
+            job.run_at = now + timedelta(seconds=JOB_RETRY_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+        return job.status
+
+def get_job_db(job_id):
+    with session_scope() as session:
+        return session.get(JobDB, job_id)
+
+def get_jobs_db(status=None, limit=50):
+    """Most recently queued jobs first, optionally only those with ``status``."""
+    with session_scope() as session:
+        query = select(JobDB).order_by(JobDB.id.desc()).limit(limit)
+        if status is not None:
+            query = query.where(JobDB.status == status)
+        return session.scalars(query).all()
+
+def get_job_stats_db(now=None):
+    """Queue depth: (job, status, count, age in seconds of the oldest due pending one or None) per job and status.
+
+    Done and failed jobs count until prune_jobs_db removes them.
+    """
+    with session_scope() as session:
+        return _job_stats(session, now or _utcnow())
+
+def _job_stats(session, now):
+    j = JobDB
+    rows = session.execute(
+        select(j.job, j.status, func.count(), func.min(j.run_at)).group_by(j.job, j.status).order_by(j.job, j.status)
+    ).all()
+    return [
+        (job, status, count,
+         max(0.0, (now - oldest).total_seconds()) if status == 'pending' and oldest is not None and oldest <= now else None)
+        for job, status, count, oldest in rows
+    ]
+
+def prune_jobs_db(before):
+    """Delete done and failed jobs that finished before ``before``; returns how many."""
+    with session_scope() as session:
+        return session.execute(
+            delete(JobDB).where(JobDB.status.in_(('done', 'failed')), JobDB.finished_at < before)
+        ).rowcount
+
+def enqueue_due_schedules_db(schedules, now=None):
+    """Queue each ``(job, every, payload)`` schedule that is due and move it to its next run; returns the jobs queued.
+
+    A schedule seen for the first time is due at once. Taking a due schedule
+    is a conditional UPDATE, so with several workers only one queues it.
+    """
+    now = now or _utcnow()
+    queued = []
+    if not schedules:
+        return queued
+    with session_scope() as session:
+        session.execute(
+            sqlite_insert(JobScheduleDB.__table__).on_conflict_do_nothing(index_elements=['job']),
+            [{'job': job, 'next_run_at': now} for job, _, _ in schedules],
+        )
+        for job, every, payload in schedules:
+            taken = session.execute(
+                update(JobScheduleDB).where(JobScheduleDB.job == job, JobScheduleDB.next_run_at <= now)
+                .values(next_run_at=now + every)
+            ).rowcount
+            if taken:
+                queued.append(_enqueue(session, job, None, payload, now=now))
+    return queued
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance commands for grocery.db.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (
+        ('rebuild-frequencies', 'recompute item_frequencies and item_cooccurrence from purchase history'),
+        ('check-frequencies', 'verify item_frequencies against purchase history'),
+        ('rebuild-rollups', 'recompute the analytics rollups from purchase history'),
+        ('check-rollups', 'verify the analytics rollups against purchase history'),
+    ):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--user', help='limit to one username')
+    command = commands.add_parser('prune-changes', help='drop old entries from the item change log')
+    command.add_argument('--days', type=int, default=30, help='keep this many days of changes (default: 30)')
+    command.add_argument('--user', help='limit to one username')
+    command = commands.add_parser('forecast-pantry', help='refit consumption rates and pantry run-out dates (nightly)')
+    command.add_argument('--user', help='limit to one username')
+    command = commands.add_parser('import-images', help='move file-path item images into the content-addressed store')
+    command.add_argument('--root', help='image store directory (default: $GROCERY_IMAGE_ROOT or item_images)')
+    command = commands.add_parser('import-prices', help='add a store price catalog (CSV, JSON Lines or Parquet)')
+    command.add_argument('file', help='rows of store, name, price and optionally date')
+    args = parser.parse_args()
+
+    if args.command == 'rebuild-frequencies':
+        rebuild_item_frequencies_db(args.user)
+        print("item_frequencies rebuilt.")
+    elif args.command == 'check-frequencies':
+        problems = check_item_frequencies_db(args.user)
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} inconsistencies found.")
+        raise SystemExit(1 if problems else 0)
+    elif args.command == 'rebuild-rollups':
+        rebuild_rollups_db(args.user)
+        print("purchase_rollups rebuilt.")
+    elif args.command == 'check-rollups':
+        problems = check_rollups_db(args.user)
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} inconsistencies found.")
+        raise SystemExit(1 if problems else 0)
+    elif args.command == 'prune-changes':
+        removed = prune_changes_db(_utcnow() - timedelta(days=args.days), args.user)
+        print(f"{removed} changes older than {args.days} days removed.")
+    elif args.command == 'forecast-pantry':
+        print(f"{forecast_pantry_db(args.user)} pantry forecasts written.")
+    elif args.command == 'import-images':
+        from smart_grocery.images import ImageStore
+
+        store = ImageStore(args.root) if args.root else ImageStore()
+        moved, skipped = import_legacy_images_db(store)
+        store.close()
+        print(f"{moved} images moved into {store.root}, {skipped} missing or unreadable files skipped.")
+    elif args.command == 'import-prices':
+        from smart_grocery.prices import import_prices
+
+        report = import_prices(args.file, add_prices_db,
+                               progress=lambda done, errors: print(f"\r  {done} rows read, {errors} rejected", end=""))
+        print(f"\n{report}.")
+        for row_number, message, raw in report.errors[:10]:
+            print(f"  row {row_number}: {message} ({raw})")
+
+# Latency of every *_db helper, when metrics are enabled (see smart_grocery/metrics.py)
+metrics.instrument_module(globals())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""Asyncio counterparts of the db.py helpers, on SQLAlchemy's async engine with aiosqlite.
+
+Same models, tables and migrations as db.py, and the same helper names and
+return values, but every helper is a coroutine. Writes that maintain derived
+tables (history lines, frequencies, rollups) run db.py's own code through
+``AsyncSession.run_sync``, so both layers keep the aggregates identical.
+
+The engine keeps a bounded pool sized by the same ``GROCERY_DB_POOL_*``
+variables as db.py. Its URL is ``GROCERY_DB_ASYNC_URL``, or ``GROCERY_DB_URL``
+with the ``sqlite+aiosqlite`` driver.
+"""
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+from sqlalchemy import delete, event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import db
+from db import GroceryItemDB, JobDB, MealPlanDB, RecipeDB
+from migrations import run_migrations
+from smart_grocery import metrics
+from smart_grocery.models import normalize_name
+from smart_grocery.recipes import Ingredient
+
+ASYNC_DB_URL = os.environ.get('GROCERY_DB_ASYNC_URL') or db.DB_URL.replace('sqlite://', 'sqlite+aiosqlite://', 1)
+
+_engine = None
+Session = async_sessionmaker(expire_on_commit=False)
+
+
+def configure_engine(url=None, pool_size=None, max_overflow=None, pool_timeout=None):
+    """Create the process-wide async engine; call ``dispose()`` first to replace a running one."""
+    global _engine
+    url = url or ASYNC_DB_URL
+    options = {}
+    if ':memory:' not in url:
+        options.update(
+            pool_size=db.POOL_SIZE if pool_size is None else pool_size,
+            max_overflow=db.MAX_OVERFLOW if max_overflow is None else max_overflow,
+            pool_timeout=db.POOL_TIMEOUT if pool_timeout is None else pool_timeout,
+        )
+    _engine = create_async_engine(url, **options)
+    if _engine.dialect.name == 'sqlite':
+        event.listen(_engine.sync_engine, 'connect', db._set_sqlite_pragmas)
+    metrics.watch_engine(_engine.sync_engine)
+    Session.configure(bind=_engine)
+    return _engine
+
+
+def get_engine():
+    if _engine is None:
+        configure_engine()
+    return _engine
+
+
+async def init_db():
+    """Create or upgrade the schema, using a short-lived sync engine in a worker thread."""
+    url = get_engine().url.set(drivername=get_engine().url.get_backend_name())
+
+    def migrate():
+        engine = db._build_engine(url.render_as_string(hide_password=False), 1, 0, db.POOL_TIMEOUT)
+        try:
+            return run_migrations(engine)
+        finally:
+            engine.dispose()
+
+    return await asyncio.to_thread(migrate)
+
+
+async def dispose():
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+
+@asynccontextmanager
+async def session_scope():
+    """One session and transaction; commits on success, rolls back on error."""
+    get_engine()
+    async with Session() as session:
+        async with session.begin():
+            yield session
+
+
+async def add_item_db(name, quantity, category, username, image_path=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._add_item, name, quantity, category, username, image_path)
+
+
+async def add_items_db(items, username):
+    items = list(items)
+    if items:
+        async with session_scope() as session:
+            await session.run_sync(db._add_items, items, username)
+    return len(items)
+
+
+async def get_items_db(username):
+    async with session_scope() as session:
+        result = await session.scalars(
+            select(GroceryItemDB).where(GroceryItemDB.username == username).order_by(GroceryItemDB.id)
+        )
+        return result.all()
+
+
+async def get_items_page_db(username, limit=50, after_id=None):
+    item = GroceryItemDB
+    query = select(item).where(item.username == username)
+    if after_id is not None:
+        query = query.where(item.id > after_id)
+    async with session_scope() as session:
+        items = (await session.scalars(query.order_by(item.id).limit(limit + 1))).all()
+    more = len(items) > limit
+    items = items[:limit]
+    return items, (items[-1].id if more else None)
+
+
+async def search_items_db(username, prefix, limit=50, after=None):
+    item = GroceryItemDB
+    query = select(item).where(item.username == username, db._prefix_clause(prefix))
+    if after is not None:
+        name, item_id = after
+        query = query.where((item.name_normalized > name) | ((item.name_normalized == name) & (item.id > item_id)))
+    async with session_scope() as session:
+        items = (await session.scalars(query.order_by(item.name_normalized, item.id).limit(limit + 1))).all()
+    more = len(items) > limit
+    items = items[:limit]
+    return items, ((items[-1].name_normalized, items[-1].id) if more else None)
+
+
+async def count_items_db(username, prefix=None):
+    query = select(func.count(GroceryItemDB.id)).where(GroceryItemDB.username == username)
+    if prefix:
+        query = query.where(db._prefix_clause(prefix))
+    async with session_scope() as session:
+        return await session.scalar(query)
+
+
+async def get_item_db(item_id, username):
+    async with session_scope() as session:
+        return await session.scalar(
+            select(GroceryItemDB).where(GroceryItemDB.id == item_id, GroceryItemDB.username == username)
+        )
+
+
+async def update_item_db(item_id, username, expected_version=None, **fields):
+    async with session_scope() as session:
+        return await session.run_sync(db._update_item, item_id, username, fields, expected_version)
+
+
+async def update_items_db(changes, username):
+    async with session_scope() as session:
+        return await session.run_sync(db._update_items, changes, username)
+
+
+async def delete_item_db(item_id, username, expected_version=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._delete_item, item_id, username, expected_version)
+
+
+async def delete_items_db(ids, username):
+    async with session_scope() as session:
+        return await session.run_sync(db._delete_items, list(ids), username)
+
+
+async def clear_items_db(username):
+    async with session_scope() as session:
+        await session.run_sync(db._clear_items, username)
+
+
+async def get_list_version_db(username):
+    async with session_scope() as session:
+        return (await session.run_sync(db._list_version, username))[0]
+
+
+async def get_changes_db(username, since=None, limit=db.CHANGE_PAGE_LIMIT):
+    async with session_scope() as session:
+        return await session.run_sync(db._changes, username, since, limit)
+
+
+async def add_history_db(items, username, timestamp=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._record_history, items, username, timestamp)
+
+
+async def get_history_page_db(username, limit=20, before=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._history_page, username, limit, before)
+
+
+async def add_meal_db(date, items, username):
+    async with session_scope() as session:
+        meal = MealPlanDB(date=date, items=json.dumps(items), username=username)
+        session.add(meal)
+        await session.flush()
+        return meal.id
+
+
+async def get_meals_db(username):
+    async with session_scope() as session:
+        meals = (await session.scalars(select(MealPlanDB).where(MealPlanDB.username == username))).all()
+        return [(m.date, json.loads(m.items)) for m in meals]
+
+
+async def get_smart_suggestions_db(username, top_n=5, current=(), now=None):
+    async with session_scope() as session:
+        current = await session.run_sync(db._lookup_keys, username, current)
+        model = await session.run_sync(db._load_suggestion_model, username, current)
+    return model.suggest(top_n, now=now, current=current)
+
+
+async def get_ranked_suggestions_db(username, top_n=5, current=()):
+    async with session_scope() as session:
+        return await session.run_sync(db._ranked_suggestions, username, top_n, current)
+
+
+async def save_recipe_db(username, name, ingredients, servings=1):
+    ingredients = [i if isinstance(i, Ingredient) else Ingredient(**i) for i in ingredients]
+    if not ingredients:
+        raise ValueError(f'{name}: a recipe needs at least one ingredient')
+    async with session_scope() as session:
+        return await session.run_sync(db._save_recipe, username, name, ingredients, servings)
+
+
+async def get_recipes_db(username, name=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._recipes, username, name)
+
+
+async def get_recipe_db(username, name):
+    recipes = await get_recipes_db(username, name)
+    return recipes[0] if recipes else None
+
+
+async def delete_recipe_db(username, name):
+    async with session_scope() as session:
+        result = await session.execute(delete(RecipeDB).where(
+            RecipeDB.username == username, RecipeDB.name_normalized == normalize_name(name)))
+        return result.rowcount > 0
+
+
+async def expand_meal_plans_db(usernames, start=None, end=None, subtract_list=True, servings=None):
+    usernames = list(dict.fromkeys(usernames))
+    async with session_scope() as session:
+        return await session.run_sync(db._expand_meal_plans, usernames, start, end, subtract_list, servings)
+
+
+async def expand_meal_plan_db(username, start=None, end=None, subtract_list=True, servings=None):
+    return (await expand_meal_plans_db([username], start, end, subtract_list, servings))[username]
+
+
+async def add_meal_plan_to_list_db(username, start=None, end=None, servings=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._add_meal_plan_to_list, username, start, end, servings)
+
+
+async def add_to_pantry_db(items, username, timestamp=None):
+    if items:
+        async with session_scope() as session:
+            await session.run_sync(db._stock_pantry, username, items, timestamp or db._utcnow())
+
+
+async def check_out_items_db(ids, username, timestamp=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._check_out_items, list(ids), username, timestamp)
+
+
+async def get_pantry_db(username, now=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._pantry, username, now or db._utcnow())
+
+
+async def set_pantry_item_db(username, name, quantity, category='Other', now=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._set_pantry_item, username, name, quantity, category, now or db._utcnow())
+
+
+async def get_pantry_proposals_db(username, horizon_days=db.PANTRY_HORIZON_DAYS, now=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._pantry_proposals, username, horizon_days, now or db._utcnow())
+
+
+async def add_pantry_proposals_to_list_db(username, horizon_days=db.PANTRY_HORIZON_DAYS, now=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._add_pantry_proposals, username, horizon_days, now or db._utcnow())
+
+
+async def get_price_stores_db():
+    async with session_scope() as session:
+        return await session.run_sync(db._price_stores)
+
+
+async def get_price_history_db(name, store=None, since=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._price_history, name, store, since)
+
+
+async def plan_budget_db(username, budget=None, max_stores=1, store_cost=0.0, stores=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._plan_budget, username, budget, max_stores, store_cost, stores)
+
+
+async def get_spend_db(username, grain='month', since=None, store=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._spend, username, grain, since, store)
+
+
+async def enqueue_job_db(job, username=None, payload=None, delay_seconds=0, max_attempts=db.JOB_MAX_ATTEMPTS):
+    async with session_scope() as session:
+        return await session.run_sync(db._enqueue, job, username, payload, delay_seconds, max_attempts)
+
+
+async def get_job_db(job_id):
+    async with session_scope() as session:
+        return await session.get(JobDB, job_id)
+
+
+async def get_jobs_db(status=None, limit=50):
+    async with session_scope() as session:
+        query = select(JobDB).order_by(JobDB.id.desc()).limit(limit)
+        if status is not None:
+            query = query.where(JobDB.status == status)
+        return (await session.scalars(query)).all()
+
+
+async def get_job_stats_db(now=None):
+    async with session_scope() as session:
+        return await session.run_sync(db._job_stats, now or db._utcnow())
+
+
+async def get_aliases_db(username):
+    async with session_scope() as session:
+        return await session.run_sync(db._aliases, username)
+
+
+async def set_alias_db(username, alias, canonical, source='user'):
+    async with session_scope() as session:
+        return await session.run_sync(db._set_alias, username, alias, canonical, source)
+
+
+async def delete_alias_db(username, alias):
+    async with session_scope() as session:
+        return await session.run_sync(db._delete_alias, username, alias)
+
+
+async def autocomplete_db(username, text, limit=10):
+    async with session_scope() as session:
+        return await session.run_sync(db._autocomplete, username, text, limit)
+
+
+metrics.instrument_module(globals(), name=metrics.DB_ASYNC_HELPER, errors=None)
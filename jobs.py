@@ -0,0 +1,338 @@
+"""Background jobs: a persistent queue in grocery.db and in-process workers.
+
+Recomputation that used to run inline in requests and commands is queued
+here, and the request paths read what the jobs store:
+
+- ``rank-suggestions``: SuggestionModel rankings (db.rank_suggestions_db), read
+  by db.get_ranked_suggestions_db; saving history queues it for the user
+- ``forecast-pantry``: consumption rates and run-out dates (db.forecast_pantry_db)
+- ``repair-aggregates``: check item_frequencies and the analytics rollups
+  against history and rebuild whichever disagrees
+- ``prune-changes`` / ``prune-jobs``: compact the item change log and the queue
+- ``import-images``: move file-path item images into the image store
+- ``import-prices``: add an uploaded price catalog file (db.add_prices_db), then delete it
+
+Jobs are rows in the ``jobs`` table (see db.enqueue_job_db), so they survive
+restarts and are shared by every process on the database. Queuing a job that
+is already pending with the same user and payload returns the pending one. A
+failing job is retried with exponential backoff (db.finish_job_db). Periodic
+jobs are listed in ``SCHEDULES``; whichever worker finds one due queues it.
+
+A ``Worker`` is a dispatcher thread that claims due jobs and runs them on a
+thread pool. The web and Streamlit apps start one per process with
+``start_worker()`` (``GROCERY_JOB_THREADS=0`` turns that off, e.g. when a
+separate ``python jobs.py worker`` runs instead).
+
+    python jobs.py worker                          # run a worker in the foreground
+    python jobs.py enqueue forecast-pantry --user alice
+    python jobs.py run-pending                     # run what is due, then exit
+    python jobs.py status
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, NamedTuple, Optional
+
+import db
+from smart_grocery import metrics
+
+WORKER_THREADS = int(os.environ.get("GROCERY_JOB_THREADS", "1"))
+POLL_SECONDS = float(os.environ.get("GROCERY_JOB_POLL_SECONDS", "2"))
+CHANGE_RETENTION_DAYS = 30
+JOB_RETENTION_DAYS = 7
+# Where the web apps spool uploads for import jobs; a worker on another host needs it shared
+UPLOAD_DIR = os.environ.get("GROCERY_UPLOAD_DIR", tempfile.gettempdir())
+
+log = logging.getLogger(__name__)
+
+TASKS: Dict[str, Callable] = {}
+USER_TASKS = ("rank-suggestions", "forecast-pantry", "repair-aggregates")  # Jobs a user may queue over the API
+
+
+def task(name):
+    """Register ``fn(username, **payload)`` as the job ``name``; its return value is stored as the job's result."""
+    def register(fn):
+        TASKS[name] = fn
+        return fn
+    return register
+
+
+@task("rank-suggestions")
+def _rank_suggestions(username):
+    return {"users": db.rank_suggestions_db(username)}
+
+
+@task("forecast-pantry")
+def _forecast_pantry(username):
+    return {"forecasts": db.forecast_pantry_db(username)}
+
+
+@task("repair-aggregates")
+def _repair_aggregates(username):
+    repaired = []
+    if db.check_item_frequencies_db(username):
+        db.rebuild_item_frequencies_db(username)
+        repaired.append("item_frequencies")
+    if db.check_rollups_db(username):
+        db.rebuild_rollups_db(username)
+        repaired.append("purchase_rollups")
+    return {"repaired": repaired}
+
+
+@task("prune-changes")
+def _prune_changes(username, days=CHANGE_RETENTION_DAYS):
+    return {"removed": db.prune_changes_db(db._utcnow() - timedelta(days=days), username)}
+
+
+@task("prune-jobs")
+def _prune_jobs(username, days=JOB_RETENTION_DAYS):
+    return {"removed": db.prune_jobs_db(db._utcnow() - timedelta(days=days))}
+
+
+@task("import-images")
+def _import_images(username, root=None):
+    from smart_grocery.images import ImageStore
+
+    store = ImageStore(root) if root else ImageStore()
+    try:
+        moved, skipped = db.import_legacy_images_db(store)
+    finally:
+        store.close()
+    return {"moved": moved, "skipped": skipped}
+
+
+@task("import-prices")
+def _import_prices(username, path, fmt=None):
+    # Queued with max_attempts=1: a retry would add the rows imported before the failure again
+    from smart_grocery.prices import import_prices
+
+    try:
+        report = import_prices(path, db.add_prices_db, fmt)
+    finally:
+        os.remove(path)
+    return {"imported": report.imported, "rejected": len(report.errors),
+            "errors": [[row_number, message] for row_number, message, _ in report.errors[:20]]}
+
+
+class Schedule(NamedTuple):
+    job: str
+    every: timedelta
+    payload: Optional[dict] = None
+
+
+SCHEDULES = (
+    Schedule("forecast-pantry", timedelta(days=1)),
+    # Rankings are re-queued on every save; this keeps due dates moving for users who do not save
+    Schedule("rank-suggestions", timedelta(hours=6)),
+    Schedule("prune-changes", timedelta(days=1)),
+    Schedule("prune-jobs", timedelta(days=1)),
+)
+
+
+def enqueue(job, username=None, payload=None, delay_seconds=0, max_attempts=db.JOB_MAX_ATTEMPTS):
+    """Queue a registered job (deduplicated against pending ones) and wake this process's worker."""
+    if job not in TASKS:
+        raise ValueError(f"unknown job {job!r}; expected one of {', '.join(sorted(TASKS))}")
+    row = db.enqueue_job_db(job, username, payload, delay_seconds, max_attempts)
+    wake()
+    return row
+
+
+def wake():
+    """Have this process's worker look for due jobs now rather than at its next poll."""
+    if _worker is not None:
+        _worker.wake()
+
+
+def run_job(job):
+    """Run a claimed job row in this thread and record the outcome; returns the new status."""
+    started = time.perf_counter()
+    metrics.observe(metrics.JOB_WAIT, max(0.0, (job.started_at - job.run_at).total_seconds()), job=job.job)
+    result = error = None
+    try:
+        fn = TASKS.get(job.job)
+        if fn is None:
+            raise LookupError(f"no task registered as {job.job!r}")
+        result = fn(job.username, **json.loads(job.payload or "{}"))
+    except Exception:
+        error = traceback.format_exc()
+    status = db.finish_job_db(job.id, job.worker, result, error)
+    metrics.observe(metrics.JOB_RUN, time.perf_counter() - started, job=job.job, status=status or "lost")
+    return status
+
+
+def queue_gauges():
+    stats = db.get_job_stats_db()
+    return [({"job": job, "status": status}, count) for job, status, count, _ in stats]
+
+
+def oldest_pending_gauges():
+    stats = db.get_job_stats_db()
+    return [({"job": job}, age) for job, status, _, age in stats if age is not None]
+
+
+metrics.REGISTRY.gauge(metrics.JOB_QUEUE, queue_gauges)
+metrics.REGISTRY.gauge(metrics.JOB_OLDEST_PENDING, oldest_pending_gauges)
+
+
+class Worker:
+    """Claims due jobs from the queue and runs up to ``threads`` at once; also queues due ``schedules``."""
+
+    def __init__(self, threads: int = WORKER_THREADS, poll_seconds: float = POLL_SECONDS, schedules=SCHEDULES,
+                 name: Optional[str] = None):
+        self.threads = max(1, threads)
+        self.poll_seconds = poll_seconds
+        self.schedules = [(s.job, s.every, s.payload) for s in schedules]
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._slots = threading.Semaphore(self.threads)
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    def start(self) -> "Worker":
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="jobs")
+            self._thread = threading.Thread(target=self._dispatch, name="jobs-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, wait: bool = True):
+        """Stop claiming jobs; with ``wait``, let running ones finish."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown(wait=wait)
+            self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def run_pending(self, limit: Optional[int] = None) -> int:
+        """Run due jobs one after another in this thread until none is due (or ``limit``); returns how many ran."""
+        ran = 0
+        db.enqueue_due_schedules_db(self.schedules)
+        while limit is None or ran < limit:
+            job = db.claim_job_db(self.name)
+            if job is None:
+                break
+            run_job(job)
+            ran += 1
+        return ran
+
+    def _dispatch(self):
+        next_schedule = 0.0
+        while not self._stopping.is_set():
+            if self.schedules and time.monotonic() >= next_schedule:
+                try:
+                    db.enqueue_due_schedules_db(self.schedules)
+                except Exception:
+                    log.exception("job dispatcher: schedules not checked")
+                next_schedule = time.monotonic() + self.poll_seconds
+            if not self._slots.acquire(timeout=self.poll_seconds):
+                continue
+            try:
+                job = db.claim_job_db(self.name)
+            except Exception:
+                # Typically a locked database; the jobs stay queued
+                job = None
+                log.exception("job dispatcher: queue unavailable")
+            if job is None:
+                self._slots.release()
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            run_job(job)
+        except Exception:
+            # Recording the outcome failed; the lease expires and another worker retries the job
+            log.exception("job %s (%s): outcome not recorded", job.id, job.job)
+        finally:
+            self._slots.release()
+
+
+_worker: Optional[Worker] = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(threads: int = WORKER_THREADS) -> Optional[Worker]:
+    """This process's worker, started on first call (and again after a fork); None if ``threads`` is 0."""
+    global _worker, _worker_pid
+    if threads <= 0:
+        return None
+    if _worker is not None and _worker_pid == os.getpid():
+        return _worker
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid():
+            _worker, _worker_pid = Worker(threads).start(), os.getpid()
+            atexit.register(_worker.stop, False)
+    return _worker
+
+
+def stop_worker(wait: bool = True):
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop(wait)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background jobs for grocery.db.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("worker", help="run a worker until interrupted")
+    command.add_argument("--threads", type=int, default=max(WORKER_THREADS, 1), help="jobs run at once")
+    command.add_argument("--no-schedules", action="store_true", help="only run queued jobs")
+    command = commands.add_parser("run-pending", help="run every due job (and due schedule), then exit")
+    command = commands.add_parser("enqueue", help="queue a job")
+    command.add_argument("job", choices=sorted(TASKS))
+    command.add_argument("--user", help="limit to one username (default: every user)")
+    command.add_argument("--payload", default="{}", help="JSON keyword arguments for the job")
+    command.add_argument("--delay", type=float, default=0, help="seconds before it is due")
+    command = commands.add_parser("status", help="queue depth per job and the latest failures")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        worker = Worker(args.threads, schedules=() if args.no_schedules else SCHEDULES).start()
+        print(f"Worker {worker.name} running {worker.threads} thread(s); Ctrl-C to stop.")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print("Stopping; waiting for running jobs.")
+            worker.stop()
+    elif args.command == "run-pending":
+        print(f"{Worker(1).run_pending()} jobs run.")
+    elif args.command == "enqueue":
+        try:
+            payload = json.loads(args.payload)
+        except ValueError as e:
+            parser.error(f"--payload is not JSON: {e}")
+        row = enqueue(args.job, args.user, payload, args.delay)
+        print(f"Job {row.id} ({row.job}) pending, due {row.run_at:%Y-%m-%d %H:%M:%S} UTC.")
+    elif args.command == "status":
+        for job, status, count, age in db.get_job_stats_db():
+            waiting = f"  oldest due {age:.0f}s ago" if age is not None else ""
+            print(f"{job:<20} {status:<8} {count:>6}{waiting}")
+        for row in db.get_jobs_db("failed", limit=5):
+            error = (row.last_error or "").strip().splitlines()
+            print(f"failed #{row.id} {row.job} ({row.username or 'all users'}) after {row.attempts} attempts: "
+                  f"{error[-1] if error else ''}")
+
+
+if __name__ == "__main__":
+    main()
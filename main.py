@@ -1,202 +1,65 @@
 # main.py
 
-import json
-import os
-from collections import Counter
-from typing import List
-import datetime
-import csv
+import time
 
-class GroceryItem:
-    def __init__(self, name: str, quantity: int = 1, category: str = "Other"):
-        self.name = name.strip().title()
-        self.quantity = quantity
-        self.category = category.strip().title()
+import smart_grocery as sg
+from smart_grocery import transfer
 
-    def to_dict(self):
-        return {"name": self.name, "quantity": self.quantity, "category": self.category}
+COMMANDS = ("add", "remove", "edit", "list", "save", "history", "suggest", "clear", "mealplan", "meals", "recipe",
+            "mealshop", "optimize", "budget", "export", "import", "remind", "stats", "quit")
+_waiting = 0.0  # Seconds the current command spent at prompts
 
-    @staticmethod
-    def from_dict(data):
-        return GroceryItem(data["name"], data["quantity"], data["category"])
 
-    def __str__(self):
-        return f"{self.name} (x{self.quantity}) - {self.category}"
+def ask(prompt):
+    """input() for a command's own prompts, which keeps the wait for the user out of the command's timing."""
+    global _waiting
+    start = time.perf_counter()
+    try:
+        return input(prompt)
+    finally:
+        _waiting += time.perf_counter() - start
 
-class GroceryList:
-    def __init__(self):
-        self.items: List[GroceryItem] = []
-
-    def add_item(self, item: GroceryItem):
-        for existing in self.items:
-            if existing.name == item.name:
-                existing.quantity += item.quantity
-                return
-        self.items.append(item)
-
-    def remove_item(self, name: str):
-        self.items = [item for item in self.items if item.name.lower() != name.lower()]
-
-    def edit_item(self, name: str, quantity: int = None, category: str = None):
-        for item in self.items:
-            if item.name.lower() == name.lower():
-                if quantity is not None:
-                    item.quantity = quantity
-                if category is not None:
-                    item.category = category.strip().title()
-
-    def list_items(self):
-        if not self.items:
-            print("No items in the grocery list.")
-        for item in self.items:
-            print(item)
-
-    def clear(self):
-        self.items = []
-
-    def to_dict(self):
-        return [item.to_dict() for item in self.items]
-
-    def from_dict(self, data):
-        self.items = [GroceryItem.from_dict(item) for item in data]
-
-class HistoryManager:
-    def __init__(self, filename="history.json"):
-        self.filename = filename
-        self.history = self.load_history()
-
-    def load_history(self):
-        if os.path.exists(self.filename):
-            with open(self.filename, "r") as f:
-                return json.load(f)
-        return []
-
-    def save_history(self, grocery_list: GroceryList):
-        self.history.append(grocery_list.to_dict())
-        with open(self.filename, "w") as f:
-            json.dump(self.history, f, indent=2)
-
-    def show_history(self):
-        if not self.history:
-            print("No purchase history found.")
-            return
-        for i, purchase in enumerate(self.history, 1):
-            print(f"Purchase {i}:")
-            for item in purchase:
-                print(f"  {item['name']} (x{item['quantity']}) - {item['category']}")
-
-class SuggestionEngine:
-    def __init__(self, history_manager: HistoryManager):
-        self.history_manager = history_manager
-
-    def suggest_items(self, top_n=5):
-        all_items = []
-        for purchase in self.history_manager.history:
-            for item in purchase:
-                all_items.append(item['name'].lower())
-        if not all_items:
-            print("No suggestions available yet. Add and save some lists first.")
-            return
-        counter = Counter(all_items)
-        print(f"Top {top_n} suggested items:")
-        for item, count in counter.most_common(top_n):
-            print(f"  {item.title()} (added {count} times)")
-
-class MealPlanner:
-    def __init__(self, filename="meals.json"):
-        self.filename = filename
-        self.meals = self.load_meals()
-
-    def load_meals(self):
-        if os.path.exists(self.filename):
-            with open(self.filename, "r") as f:
-                return json.load(f)
-        return {}
-
-    def save_meals(self):
-        with open(self.filename, "w") as f:
-            json.dump(self.meals, f, indent=2)
-
-    def add_meal(self, date: str, items: List[str]):
-        self.meals[date] = items
-        self.save_meals()
-        print(f"Meal for {date} saved.")
-
-    def show_meals(self):
-        if not self.meals:
-            print("No meals planned.")
-            return
-        for date, items in self.meals.items():
-            print(f"{date}: {', '.join(items)})")
-
-class Optimizer:
-    @staticmethod
-    def optimize_list(grocery_list: GroceryList):
-        # Example: group by category and sort alphabetically
-        grouped = {}
-        for item in grocery_list.items:
-            grouped.setdefault(item.category, []).append(item)
-        for category in sorted(grouped):
-            print(f"\n{category}:")
-            for item in sorted(grouped[category], key=lambda x: x.name):
-                print(f"  {item}")
-
-class Exporter:
-    @staticmethod
-    def export_to_csv(grocery_list: GroceryList, filename: str = "grocery_list.csv"):
-        with open(filename, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["Name", "Quantity", "Category"])
-            for item in grocery_list.items:
-                writer.writerow([item.name, item.quantity, item.category])
-        print(f"Grocery list exported to {filename}.")
-
-class Importer:
-    @staticmethod
-    def import_from_csv(grocery_list: GroceryList, filename: str = "grocery_list.csv"):
-        if not os.path.exists(filename):
-            print(f"File {filename} does not exist.")
-            return
-        with open(filename, "r") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                grocery_list.add_item(GroceryItem(row["Name"], int(row["Quantity"]), row["Category"]))
-        print(f"Grocery list imported from {filename}.")
-
-class Reminder:
-    @staticmethod
-    def remind_if_empty(grocery_list: GroceryList):
-        if not grocery_list.items:
-            print("Reminder: Your grocery list is empty! Add items before shopping.")
 
 # CLI
 def main():
+    global _waiting
+    from smart_grocery import metrics  # Here rather than at the top, so importing main stays cheap
+
     print("Hello, World! This is your Smart Grocery List Generator.")
-    grocery_list = GroceryList()
-    history_manager = HistoryManager()
-    suggestion_engine = SuggestionEngine(history_manager)
-    meal_planner = MealPlanner()
+    grocery_list = sg.GroceryList()
+    history_manager = sg.HistoryManager()
+    suggestion_engine = sg.SuggestionEngine(history_manager)
+    meal_planner = sg.MealPlanner()
+    optimizer = sg.Optimizer()
+    catalog, catalog_file = None, None
     while True:
-        print("\nOptions: add, remove, edit, list, save, history, suggest, clear, mealplan, meals, optimize, export, import, remind, quit")
+        print(f"\nOptions: {', '.join(COMMANDS)}")
         cmd = input("Enter command: ").strip().lower()
+        _waiting = 0.0
+        command_start = time.perf_counter()
         if cmd == "add":
-            name = input("Item name: ")
+            name = ask("Item name: ")
+            resolution = suggestion_engine.canonicalizer.resolve(name)
+            if resolution.how == "typo":
+                answer = ask(f"Did you mean {resolution.key.title()}? [Y/n]: ").strip().lower()
+                if answer in ("", "y", "yes"):
+                    name = resolution.key.title()
             try:
-                quantity = int(input("Quantity: "))
+                quantity = int(ask("Quantity: "))
             except ValueError:
                 print("Invalid quantity. Defaulting to 1.")
                 quantity = 1
-            category = input("Category: ")
-            grocery_list.add_item(GroceryItem(name, quantity, category))
+            category = ask("Category: ")
+            grocery_list.add_item(sg.GroceryItem(name, quantity, category))
             print(f"Added {name}.")
         elif cmd == "remove":
-            name = input("Item name to remove: ")
+            name = ask("Item name to remove: ")
             grocery_list.remove_item(name)
             print(f"Removed {name}.")
         elif cmd == "edit":
-            name = input("Item name to edit: ")
-            quantity = input("New quantity (leave blank to skip): ")
-            category = input("New category (leave blank to skip): ")
+            name = ask("Item name to edit: ")
+            quantity = ask("New quantity (leave blank to skip): ")
+            category = ask("New category (leave blank to skip): ")
             grocery_list.edit_item(
                 name,
                 int(quantity) if quantity else None,
@@ -204,36 +67,132 @@ def main():
             )
             print(f"Edited {name}.")
         elif cmd == "list":
-            grocery_list.list_items()
+            if not grocery_list:
+                print("No items in the grocery list.")
+            for item in grocery_list:
+                print(item)
         elif cmd == "save":
             history_manager.save_history(grocery_list)
             print("Grocery list saved to history.")
         elif cmd == "history":
             history_manager.show_history()
         elif cmd == "suggest":
-            suggestion_engine.suggest_items()
+            suggestion_engine.suggest_items(grocery_list=grocery_list)
         elif cmd == "clear":
             grocery_list.clear()
             print("Grocery list cleared.")
         elif cmd == "mealplan":
-            date = input("Enter date (YYYY-MM-DD): ")
-            items = input("Enter meal items (comma separated): ").split(",")
+            date = ask("Enter date (YYYY-MM-DD): ")
+            items = ask("Enter meal items (comma separated): ").split(",")
             meal_planner.add_meal(date, [item.strip().title() for item in items])
         elif cmd == "meals":
             meal_planner.show_meals()
+        elif cmd == "recipe":
+            name = ask("Recipe name: ").strip()
+            try:
+                servings = int(ask("Servings [1]: ") or 1)
+            except ValueError:
+                servings = 1
+            print("Ingredients as 'amount unit name' (e.g. '200 g pasta' or '2 eggs'), blank line to finish:")
+            ingredients = []
+            while True:
+                line = ask("  ").strip()
+                if not line:
+                    break
+                parts = line.split(maxsplit=2)
+                try:
+                    amount = float(parts[0])
+                except ValueError:
+                    amount, parts = 1.0, ["1"] + parts
+                unit, ingredient = (parts[1], parts[2]) if len(parts) == 3 else ("", " ".join(parts[1:]))
+                category = ask(f"  Category for {ingredient} [Other]: ").strip() or "Other"
+                ingredients.append(sg.Ingredient(ingredient, amount, unit, category))
+            try:
+                meal_planner.add_recipe(sg.Recipe(name, ingredients, servings))
+                print(f"Recipe {name} saved.")
+            except ValueError as e:
+                print(f"Recipe not saved: {e}")
+        elif cmd == "mealshop":
+            start = ask("From date (YYYY-MM-DD, blank for all): ").strip() or None
+            end = ask("To date (YYYY-MM-DD, blank for all): ").strip() or None
+            expansion = meal_planner.expand(start, end, grocery_list)
+            for requirement in expansion.requirements():
+                grocery_list.add_item(sg.GroceryItem(requirement.name, requirement.quantity, requirement.category))
+                print(f"  {requirement.name}: {requirement.label()}")
+            print(f"Added {len(expansion.totals)} items for {expansion.meals} planned meals.")
         elif cmd == "optimize":
-            Optimizer.optimize_list(grocery_list)
+            route = optimizer.plan(grocery_list)
+            for stop in route.stops:
+                print(f"\n{stop.location.title()}:")
+                for item in stop.items:
+                    print(f"  {item}")
+            print(f"\nWalk: {' -> '.join(route.path)} ({route.distance:.0f} m)")
+        elif cmd == "budget":
+            filename = ask(f"Price file [{catalog_file or 'prices.csv'}]: ").strip() or catalog_file or "prices.csv"
+            try:
+                if filename != catalog_file:
+                    catalog, catalog_file = sg.PriceCatalog.from_file(filename), filename
+                cap = ask("Spending cap (blank for none): ").strip()
+                max_stores = int(ask("Stores to visit at most [1]: ").strip() or 1)
+                plan = catalog.plan(grocery_list, float(cap) if cap else None, max_stores)
+            except (ImportError, OSError, ValueError) as e:
+                print(f"Budget failed: {e}")
+                plan = None
+            for store in (plan.stores if plan else []):
+                print(f"\n{store}:")
+                for line in plan.lines:
+                    if line.store == store:
+                        print(f"  {line.name} x{line.quantity}: {line.cost:.2f}")
+            if plan:
+                print(f"\nTotal: {plan.total:.2f}")
+            if plan and plan.dropped:
+                print(f"Left out to stay within the cap: {', '.join(line.name for line in plan.dropped)}")
+            if plan and plan.unavailable:
+                print(f"No price at the chosen stores: {', '.join(plan.unavailable)}")
         elif cmd == "export":
-            Exporter.export_to_csv(grocery_list)
+            what = ask("Export what (list/history) [list]: ").strip().lower() or "list"
+            filename = ask("File name (.csv, .jsonl or .parquet) [grocery_list.csv]: ").strip() or "grocery_list.csv"
+            try:
+                if what == "history":
+                    count = transfer.export_rows(
+                        ({"timestamp": ts, **item} for ts, items in history_manager.load_records() for item in items),
+                        filename, columns=("timestamp",) + transfer.ITEM_COLUMNS,
+                        progress=lambda n: print(f"\r  {n} rows written", end=""),
+                    )
+                    print(f"\nHistory exported to {filename} ({count} rows).")
+                else:
+                    sg.Exporter.export(grocery_list, filename)
+            except (ImportError, ValueError) as e:
+                print(f"Export failed: {e}")
         elif cmd == "import":
-            Importer.import_from_csv(grocery_list)
+            filename = ask("File name [grocery_list.csv]: ").strip() or "grocery_list.csv"
+            try:
+                report = sg.Importer.import_file(
+                    grocery_list, filename,
+                    progress=lambda done, errors: print(f"\r  {done} rows read, {errors} rejected", end=""),
+                )
+            except (ImportError, ValueError) as e:
+                print(f"Import failed: {e}")
+                report = None
+            for row_number, message, raw in (report.errors[:10] if report else []):
+                print(f"  row {row_number}: {message} ({raw})")
+            if report and len(report.errors) > 10:
+                print(f"  ... and {len(report.errors) - 10} more rejected rows")
         elif cmd == "remind":
-            Reminder.remind_if_empty(grocery_list)
+            sg.Reminder.remind_if_empty(grocery_list)
+        elif cmd == "stats":
+            if not metrics.enabled():
+                print("Metrics are off; start with GROCERY_METRICS=1 to record command timings.")
+            for row in metrics.summary(metrics.CLI_COMMAND):
+                print(f"  {row['labels']:<20} {row['count']:>5} runs  {row['mean_ms']:>9.2f} ms mean  "
+                      f"{row['p95_ms']:>9.2f} ms p95")
         elif cmd == "quit":
             print("Goodbye!")
             break
         else:
             print("Unknown command.")
+        metrics.observe(metrics.CLI_COMMAND, time.perf_counter() - command_start - _waiting,
+                        command=cmd if cmd in COMMANDS else "unknown")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,455 @@
+"""Versioned schema migrations for grocery.db.
+
+Each migration is a function registered with ``@migration(version, description)``
+that receives an open connection inside a transaction. Applied versions are
+recorded in ``schema_migrations`` so existing databases are upgraded in place.
+
+    python migrations.py            # upgrade the configured database
+    python migrations.py --status   # list applied migrations
+"""
+import argparse
+import json
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import text
+
+from smart_grocery.models import normalize_name
+
+MIGRATIONS = {}
+
+
+def migration(version, description):
+    def register(fn):
+        if version in MIGRATIONS:
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS[version] = (description, fn)
+        return fn
+    return register
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR, applied_at DATETIME)"
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return [row[0] for row in conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))]
+
+
+def current_version(engine):
+    versions = applied_versions(engine)
+    return versions[-1] if versions else 0
+
+
+def run_migrations(engine, target=None):
+    """Apply pending migrations up to ``target`` (default: latest). Returns applied versions."""
+    applied = []
+    done = set(applied_versions(engine))
+    for version in sorted(MIGRATIONS):
+        if target is not None and version > target:
+            break
+        if version in done:
+            continue
+        description, fn = MIGRATIONS[version]
+        with engine.begin() as conn:
+            # Another process may have migrated while we waited for the lock
+            if conn.execute(text("SELECT 1 FROM schema_migrations WHERE version = :v"), {"v": version}).first():
+                continue
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.now()},
+            )
+        applied.append(version)
+    return applied
+
+
+@migration(1, "baseline tables")
+def _baseline(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS grocery_items ("
+        "id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, name VARCHAR, "
+        "quantity INTEGER, category VARCHAR, image_path VARCHAR)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS grocery_history ("
+        "id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, "
+        "timestamp DATETIME, items VARCHAR)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS meal_plans ("
+        "id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, date VARCHAR, items VARCHAR)"
+    ))
+
+
+@migration(2, "username-scoped indexes")
+def _username_indexes(conn):
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grocery_history_username_timestamp "
+        "ON grocery_history (username, timestamp DESC)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grocery_items_username_name ON grocery_items (username, name)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_meal_plans_username_date ON meal_plans (username, date)"
+    ))
+
+
+@migration(3, "normalized purchase-history lines")
+def _history_lines(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS grocery_history_lines ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "history_id INTEGER NOT NULL REFERENCES grocery_history (id) ON DELETE CASCADE, "
+        "username VARCHAR, name VARCHAR, name_normalized VARCHAR, quantity INTEGER, category VARCHAR)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grocery_history_lines_history_id ON grocery_history_lines (history_id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grocery_history_lines_username_name "
+        "ON grocery_history_lines (username, name_normalized)"
+    ))
+    # Backfill from the JSON blobs in id-ordered batches
+    insert_line = text(
+        "INSERT INTO grocery_history_lines (history_id, username, name, name_normalized, quantity, category) "
+        "VALUES (:history_id, :username, :name, :name_normalized, :quantity, :category)"
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, username, items FROM grocery_history WHERE id > :last AND items IS NOT NULL "
+            "ORDER BY id LIMIT 5000"
+        ), {"last": last_id}).fetchall()
+        if not rows:
+            break
+        lines = []
+        for history_id, username, items in rows:
+            for item in json.loads(items):
+                lines.append({
+                    "history_id": history_id,
+                    "username": username,
+                    "name": item["name"],
+                    "name_normalized": normalize_name(item["name"]),
+                    "quantity": item.get("quantity", 1),
+                    "category": item.get("category", "Other"),
+                })
+        if lines:
+            conn.execute(insert_line, lines)
+        last_id = rows[-1][0]
+
+
+@migration(4, "materialized item frequencies")
+def _item_frequencies(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS item_frequencies ("
+        "username VARCHAR NOT NULL, name_normalized VARCHAR NOT NULL, "
+        "purchase_count INTEGER NOT NULL DEFAULT 0, total_quantity INTEGER NOT NULL DEFAULT 0, "
+        "first_purchased DATETIME, last_purchased DATETIME, "
+        "PRIMARY KEY (username, name_normalized))"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_item_frequencies_username_count "
+        "ON item_frequencies (username, purchase_count DESC, name_normalized)"
+    ))
+    _fill_item_frequencies(conn)
+
+
+def _fill_item_frequencies(conn):
+    conn.execute(text(
+        "INSERT INTO item_frequencies "
+        "(username, name_normalized, purchase_count, total_quantity, first_purchased, last_purchased) "
+        "SELECT l.username, l.name_normalized, COUNT(l.id), SUM(l.quantity), MIN(h.timestamp), MAX(h.timestamp) "
+        "FROM grocery_history_lines l JOIN grocery_history h ON h.id = l.history_id "
+        "GROUP BY l.username, l.name_normalized"
+    ))
+
+
+@migration(5, "suggestion engine state")
+def _suggestion_state(conn):
+    for column in ("basket_count INTEGER NOT NULL DEFAULT 0", "decayed_score FLOAT",
+                   "decayed_at FLOAT", "mean_interval_days FLOAT"):
+        conn.execute(text(f"ALTER TABLE item_frequencies ADD COLUMN {column}"))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS item_cooccurrence ("
+        "username VARCHAR NOT NULL, name_normalized VARCHAR NOT NULL, other_normalized VARCHAR NOT NULL, "
+        "basket_count INTEGER NOT NULL DEFAULT 0, "
+        "PRIMARY KEY (username, name_normalized, other_normalized))"
+    ))
+    _fill_suggestion_state(conn)
+
+
+def _fill_suggestion_state(conn):
+    from smart_grocery.suggestions import MAX_COOCCURRENCE_BASKET, SuggestionModel
+
+    conn.execute(text(
+        "INSERT INTO item_cooccurrence (username, name_normalized, other_normalized, basket_count) "
+        "SELECT a.username, a.name_normalized, b.name_normalized, COUNT(DISTINCT a.history_id) "
+        "FROM grocery_history_lines a JOIN grocery_history_lines b "
+        "ON b.history_id = a.history_id AND b.name_normalized != a.name_normalized "
+        "WHERE a.history_id IN (SELECT history_id FROM grocery_history_lines GROUP BY history_id "
+        "HAVING COUNT(DISTINCT name_normalized) <= :max_basket) "
+        "GROUP BY a.username, a.name_normalized, b.name_normalized"
+    ), {"max_basket": MAX_COOCCURRENCE_BASKET})
+    # Replay each user's baskets in time order to seed decay and purchase intervals
+    rows = conn.execute(text(
+        "SELECT l.username, l.history_id, h.timestamp, l.name_normalized "
+        "FROM grocery_history_lines l JOIN grocery_history h ON h.id = l.history_id "
+        "ORDER BY l.username, h.timestamp, l.history_id"
+    ))
+    models = {}
+    for (username, _, timestamp), basket in groupby(rows, key=lambda r: (r[0], r[1], r[2])):
+        models.setdefault(username, SuggestionModel()).add_basket([r[3] for r in basket], _parse_timestamp(timestamp))
+    updates = [
+        {"u": user, "n": s.name, "b": s.baskets, "d": s.decayed, "a": s.decayed_at, "i": s.interval}
+        for user, model in models.items() for s in model.items.values()
+    ]
+    if updates:
+        conn.execute(text(
+            "UPDATE item_frequencies SET basket_count = :b, decayed_score = :d, decayed_at = :a, "
+            "mean_interval_days = :i WHERE username = :u AND name_normalized = :n"
+        ), updates)
+
+
+@migration(6, "analytics rollups")
+def _purchase_rollups(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS purchase_rollups ("
+        "username VARCHAR NOT NULL, grain VARCHAR NOT NULL, period_start VARCHAR NOT NULL, "
+        "name_normalized VARCHAR NOT NULL, category VARCHAR NOT NULL, name VARCHAR, "
+        "quantity INTEGER NOT NULL DEFAULT 0, line_count INTEGER NOT NULL DEFAULT 0, "
+        "basket_count INTEGER NOT NULL DEFAULT 0, "
+        "PRIMARY KEY (username, grain, period_start, name_normalized, category))"
+    ))
+    _fill_rollups(conn)
+
+
+def _fill_rollups(conn):
+    # Weeks start on Monday: step forward to Sunday, then back six days
+    periods = {
+        "day": "date(h.timestamp)",
+        "week": "date(h.timestamp, 'weekday 0', '-6 days')",
+        "month": "date(h.timestamp, 'start of month')",
+    }
+    for grain, period in periods.items():
+        conn.execute(text(
+            "INSERT INTO purchase_rollups (username, grain, period_start, name_normalized, category, name, "
+            "quantity, line_count, basket_count) "
+            f"SELECT l.username, :grain, {period}, l.name_normalized, COALESCE(l.category, 'Other'), MIN(l.name), "
+            "SUM(l.quantity), COUNT(l.id), COUNT(DISTINCT l.history_id) "
+            "FROM grocery_history_lines l JOIN grocery_history h ON h.id = l.history_id "
+            f"GROUP BY l.username, {period}, l.name_normalized, COALESCE(l.category, 'Other')"
+        ), {"grain": grain})
+
+
+@migration(7, "normalized item names for prefix search")
+def _item_search(conn):
+    conn.execute(text("ALTER TABLE grocery_items ADD COLUMN name_normalized VARCHAR"))
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, name FROM grocery_items WHERE id > :last ORDER BY id LIMIT 5000"
+        ), {"last": last_id}).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            text("UPDATE grocery_items SET name_normalized = :n WHERE id = :id"),
+            [{"id": item_id, "n": normalize_name(name or "")} for item_id, name in rows],
+        )
+        last_id = rows[-1][0]
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grocery_items_username_id ON grocery_items (username, id)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grocery_items_username_normalized "
+        "ON grocery_items (username, name_normalized)"
+    ))
+
+
+@migration(8, "recipes and compiled ingredients")
+def _recipes(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS recipes ("
+        "id INTEGER NOT NULL PRIMARY KEY, username VARCHAR NOT NULL, name VARCHAR NOT NULL, "
+        "name_normalized VARCHAR NOT NULL, servings INTEGER NOT NULL DEFAULT 1)"
+    ))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_recipes_username_name ON recipes (username, name_normalized)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS recipe_ingredients ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "recipe_id INTEGER NOT NULL REFERENCES recipes (id) ON DELETE CASCADE, "
+        "name VARCHAR, name_normalized VARCHAR, category VARCHAR, amount FLOAT, unit VARCHAR, "
+        "base_unit VARCHAR, per_serving FLOAT)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_recipe_ingredients_recipe_id ON recipe_ingredients (recipe_id)"
+    ))
+
+
+@migration(9, "canonical item names and aliases")
+def _canonical_names(conn):
+    from smart_grocery.canonical import canonical_name
+
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS item_aliases ("
+        "username VARCHAR NOT NULL, alias VARCHAR NOT NULL, canonical VARCHAR NOT NULL, "
+        "source VARCHAR NOT NULL DEFAULT 'user', PRIMARY KEY (username, alias))"
+    ))
+    # Re-key plural and singular spellings onto one name; typos are only merged from now on
+    changed = {}
+    for table in ("grocery_items", "grocery_history_lines", "recipe_ingredients"):
+        changed[table] = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(text(
+                f"SELECT id, name, name_normalized FROM {table} WHERE id > :last ORDER BY id LIMIT 5000"
+            ), {"last": last_id}).fetchall()
+            if not rows:
+                break
+            updates = [{"id": row_id, "n": canonical_name(name or "")} for row_id, name, key in rows
+                       if canonical_name(name or "") != key]
+            if updates:
+                conn.execute(text(f"UPDATE {table} SET name_normalized = :n WHERE id = :id"), updates)
+                changed[table] += len(updates)
+            last_id = rows[-1][0]
+    if changed["grocery_history_lines"]:
+        for table in ("item_frequencies", "item_cooccurrence", "purchase_rollups"):
+            conn.execute(text(f"DELETE FROM {table}"))
+        _fill_item_frequencies(conn)
+        _fill_suggestion_state(conn)
+        _fill_rollups(conn)
+
+
+@migration(10, "item versions and change log")
+def _item_changes(conn):
+    conn.execute(text("ALTER TABLE grocery_items ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_grocery_items_username_version ON grocery_items (username, version)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS list_versions ("
+        "username VARCHAR NOT NULL PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0, "
+        "pruned_version INTEGER NOT NULL DEFAULT 0)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS item_changes ("
+        "id INTEGER NOT NULL PRIMARY KEY, username VARCHAR NOT NULL, version INTEGER NOT NULL, "
+        "op VARCHAR NOT NULL, item_id INTEGER, name VARCHAR, quantity INTEGER, category VARCHAR, "
+        "image_path VARCHAR, changed_at DATETIME)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_item_changes_username_version ON item_changes (username, version)"
+    ))
+
+
+@migration(11, "pantry inventory and forecasts")
+def _pantry(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS pantry_items ("
+        "username VARCHAR NOT NULL, name_normalized VARCHAR NOT NULL, name VARCHAR, category VARCHAR, "
+        "quantity FLOAT NOT NULL DEFAULT 0, purchased_at DATETIME, PRIMARY KEY (username, name_normalized))"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS pantry_forecasts ("
+        "username VARCHAR NOT NULL, name_normalized VARCHAR NOT NULL, name VARCHAR, category VARCHAR, "
+        "rate FLOAT NOT NULL, typical_quantity FLOAT, purchase_days INTEGER, last_purchased DATETIME, "
+        "runout_at DATETIME, computed_at DATETIME, PRIMARY KEY (username, name_normalized))"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_pantry_forecasts_username_runout ON pantry_forecasts (username, runout_at)"
+    ))
+
+
+@migration(12, "background job queue and suggestion rankings")
+def _jobs(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        "id INTEGER NOT NULL PRIMARY KEY, job VARCHAR NOT NULL, username VARCHAR, payload TEXT NOT NULL DEFAULT '{}', "
+        "dedup_key VARCHAR NOT NULL, status VARCHAR NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+        "max_attempts INTEGER NOT NULL DEFAULT 3, run_at DATETIME NOT NULL, enqueued_at DATETIME NOT NULL, "
+        "started_at DATETIME, finished_at DATETIME, lease_until DATETIME, worker VARCHAR, result TEXT, last_error TEXT)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)"))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_pending_dedup_key ON jobs (dedup_key) WHERE status = 'pending'"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS job_schedules (job VARCHAR NOT NULL PRIMARY KEY, next_run_at DATETIME NOT NULL)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS suggestion_rankings ("
+        "username VARCHAR NOT NULL, rank INTEGER NOT NULL, name_normalized VARCHAR NOT NULL, frequency FLOAT NOT NULL, "
+        "due FLOAT NOT NULL, reason VARCHAR, due_in_days FLOAT, computed_at DATETIME, PRIMARY KEY (username, rank))"
+    ))
+
+
+@migration(13, "store price history and current prices")
+def _prices(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS item_prices ("
+        "id INTEGER NOT NULL PRIMARY KEY, store VARCHAR NOT NULL, name_normalized VARCHAR NOT NULL, name VARCHAR, "
+        "price FLOAT NOT NULL, observed_at DATETIME NOT NULL)"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_item_prices_name_store_observed "
+        "ON item_prices (name_normalized, store, observed_at)"
+    ))
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS current_prices ("
+        "name_normalized VARCHAR NOT NULL, store VARCHAR NOT NULL, name VARCHAR, price FLOAT NOT NULL, "
+        "observed_at DATETIME NOT NULL, PRIMARY KEY (name_normalized, store))"
+    ))
+
+
+@migration(14, "per-user vocabulary versions")
+def _vocabulary_versions(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS vocabulary_versions ("
+        "username VARCHAR NOT NULL PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+    ))
+
+
+@migration(15, "drop unconfirmed typo aliases")
+def _drop_typo_aliases(conn):
+    # Typo corrections used to be applied on every write and saved without asking.
+    # Rows already merged stay merged; new writes of those names keep their own key.
+    conn.execute(text(
+        "INSERT INTO vocabulary_versions (username, version) "
+        "SELECT DISTINCT username, 1 FROM item_aliases WHERE source = 'typo' "
+        "ON CONFLICT (username) DO UPDATE SET version = version + 1"
+    ))
+    conn.execute(text("DELETE FROM item_aliases WHERE source = 'typo'"))
+
+
+def _parse_timestamp(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the grocery database schema.")
+    parser.add_argument("--status", action="store_true", help="only list applied migrations")
+    args = parser.parse_args()
+
+    import db
+
+    engine = db.configure_engine(migrate=False)
+    applied = set(applied_versions(engine))
+    for version in sorted(MIGRATIONS):
+        state = "applied" if version in applied else "pending"
+        print(f"{version:>4}  {state:<8} {MIGRATIONS[version][0]}")
+    if not args.status and applied != set(MIGRATIONS):
+        print(f"Applied: {run_migrations(engine)}")
+
+
+if __name__ == "__main__":
+    main()
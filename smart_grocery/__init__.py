@@ -0,0 +1,53 @@
+"""Smart Grocery List domain models and services.
+
+Shared by the CLI (``main.py``), the Flask app and the Streamlit app. Names are
+imported lazily on first access so ``import smart_grocery`` stays cheap and
+optional dependencies are only loaded by the modules that need them.
+"""
+import importlib
+
+_EXPORTS = {
+    "normalize_name": "models",
+    "canonical_name": "canonical",
+    "Canonicalizer": "canonical",
+    "AutocompleteIndex": "canonical",
+    "GroceryItem": "models",
+    "GroceryList": "models",
+    "Storage": "storage",
+    "MemoryStorage": "storage",
+    "JSONFileStorage": "storage",
+    "SQLiteStorage": "storage",
+    "HistoryManager": "history",
+    "SuggestionModel": "suggestions",
+    "SuggestionEngine": "suggestions",
+    "Suggestion": "suggestions",
+    "RankedItem": "suggestions",
+    "MealPlanner": "meals",
+    "Recipe": "recipes",
+    "Ingredient": "recipes",
+    "RecipeIndex": "recipes",
+    "Optimizer": "optimizer",
+    "Exporter": "transfer",
+    "Importer": "transfer",
+    "Reminder": "reminders",
+    "ImageStore": "images",
+    "PantryEntry": "pantry",
+    "PantryProposal": "pantry",
+    "PriceCatalog": "prices",
+    "BudgetPlan": "prices",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
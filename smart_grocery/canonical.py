@@ -0,0 +1,299 @@
+# smart_grocery/canonical.py
+"""Item-name canonicalization and autocomplete.
+
+``canonical_name`` is the key items are grouped by: ``normalize_name`` plus
+singular/plural folding of the last word, so "Tomatoes" and "tomato" are one
+item. On top of that a ``Canonicalizer`` applies user-defined aliases
+("aubergine" -> "eggplant") and typo detection: a name nobody has used before
+that is one edit away from exactly one known name is probably that name. That
+is only offered as a correction ("Did you mean ...?"); writes resolve with
+``typos=False``, so distinct items that happen to be one edit apart ("paste",
+"pasta") are never merged without the user saying so.
+
+``AutocompleteIndex`` holds a vocabulary of canonical names with weights
+(e.g. purchase counts). Prefix lookups bisect a sorted key list. Typo lookups
+use a partition index: every name is cut into SEGMENTS pieces, and a name
+within ``k`` edits of the query keeps at least ``SEGMENTS - k`` of them
+unchanged, each shifted by at most ``k`` places. So it is either in one of the
+``k`` rarest segment groups or in all of the others, and only names that pass
+this count are compared in full.
+"""
+import bisect
+import heapq
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# Irregular or ambiguous plurals; anything else goes through the suffix rules
+_PLURALS = {
+    "cookies": "cookie", "brownies": "brownie", "smoothies": "smoothie", "pies": "pie", "veggies": "veggie",
+    "fries": "fries", "leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife",
+    "calves": "calf", "molasses": "molasses", "geese": "goose", "mice": "mouse", "teeth": "tooth",
+}
+# Singular words that look plural
+_KEEP = ("ss", "us", "is", "ous", "ics")
+
+FUZZY_MIN_LENGTH = 5  # Shorter names are too easily one edit from another word
+SEGMENTS = 5  # Pieces each name is cut into for the typo index
+PREFIX_SCAN_LIMIT = 256  # Prefix ranges larger than this are ranked once and cached
+_TOP_END = "\U0010ffff"
+
+
+def normalize_name(name: str) -> str:
+    # Key used to compare item names: Unicode-normalized, casefolded, single-spaced
+    return " ".join(unicodedata.normalize("NFKC", name).split()).casefold()
+
+
+def singularize(word: str) -> str:
+    if word in _PLURALS:
+        return _PLURALS[word]
+    if len(word) < 4 or not word.endswith("s") or word.endswith(_KEEP):
+        return word
+    if word.endswith("ies") and word[-4] not in "aeiou":
+        return word[:-3] + "y"
+    if word.endswith(("ches", "shes", "xes", "zes", "sses", "oes")):
+        return word[:-2]
+    return word[:-1]
+
+
+def canonical_name(name: str) -> str:
+    """normalize_name with the last word made singular: "Cherry Tomatoes" -> "cherry tomato"."""
+    key = normalize_name(name)
+    head, _, last = key.rpartition(" ")
+    last = singularize(last)
+    return f"{head} {last}" if head else last
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or ``limit + 1`` as soon as it must exceed ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Only the differing middle needs the dynamic programme
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) <= 1 or not a:
+        return len(b)
+    if limit <= 1:
+        return limit + 1
+    # Cells further than ``limit`` from the diagonal cannot be on a path within the limit
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        current = [over] * (len(b) + 1)
+        current[0] = best = i if i <= limit else over
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != b[j - 1]))
+            current[j] = cost
+            if cost < best:
+                best = cost
+        if best > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+def _char_masks(pattern: str) -> Dict[str, int]:
+    masks: Dict[str, int] = {}
+    for i, ch in enumerate(pattern):
+        masks[ch] = masks.get(ch, 0) | 1 << i
+    return masks
+
+
+def _bit_distance(masks: Dict[str, int], length: int, text: str) -> int:
+    """Levenshtein distance between a pattern (given by _char_masks) and ``text``, bit-parallel (Myers/Hyyrö)."""
+    full = (1 << length) - 1
+    high = 1 << (length - 1)
+    pv, mv, score = full, 0, length
+    for ch in text:
+        eq = masks.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = (ph << 1 | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return score
+
+
+def max_typos(key: str) -> int:
+    """Edits tolerated when correcting a name of this length."""
+    return 0 if len(key) < FUZZY_MIN_LENGTH else 1
+
+
+def _segments(length: int, parts: int) -> List[Tuple[int, int]]:
+    """(start, length) of ``parts`` near-equal segments covering ``length`` characters."""
+    short, extra = divmod(length, parts)
+    segments, start = [], 0
+    for i in range(parts):
+        size = short + (i >= parts - extra)
+        segments.append((start, size))
+        start += size
+    return segments
+
+
+class Completion(NamedTuple):
+    name: str  # Display name
+    key: str  # Canonical name
+    weight: float
+    distance: int = 0  # 0 for prefix matches, else the edit distance of a typo match
+
+
+class AutocompleteIndex:
+    def __init__(self, names: Iterable[Tuple[str, float]] = ()):
+        """``names`` are (name, weight) pairs; the same canonical name adds up its weights."""
+        self._lock = threading.Lock()
+        self._weights: Dict[str, float] = {}
+        self._display: Dict[str, str] = {}
+        self._ids: Dict[str, int] = {}
+        self._by_id: List[str] = []
+        self._segments: Dict[Tuple[int, int, str], Set[int]] = {}
+        self._lengths: Dict[int, List[int]] = {}
+        self._top: Dict[str, List[str]] = {}
+        for name, weight in names:
+            self._add(name, weight)
+        self._sorted = sorted(self._weights)
+
+    def __len__(self):
+        return len(self._weights)
+
+    def __contains__(self, name: str):
+        return canonical_name(name) in self._weights
+
+    def _add(self, name, weight):
+        key = canonical_name(name)
+        if not key:
+            return None
+        if key in self._weights:
+            self._weights[key] += weight
+            return None
+        self._weights[key] = weight
+        self._display[key] = name.strip().title()
+        self._ids[key] = len(self._by_id)
+        self._by_id.append(key)
+        self._lengths.setdefault(len(key), []).append(self._ids[key])
+        for i, (start, size) in enumerate(_segments(len(key), min(SEGMENTS, len(key)))):
+            self._segments.setdefault((len(key), i, key[start:start + size]), set()).add(self._ids[key])
+        return key
+
+    def add(self, name: str, weight: float = 1.0):
+        with self._lock:
+            key = self._add(name, weight)
+            if key is not None:
+                bisect.insort(self._sorted, key)
+            self._top.clear()
+
+    def weight(self, name: str) -> float:
+        return self._weights.get(canonical_name(name), 0.0)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Completion]:
+        """Known names starting with ``prefix``, heaviest first."""
+        key = normalize_name(prefix)
+        if not key:
+            return []
+        lo = bisect.bisect_left(self._sorted, key)
+        hi = bisect.bisect_left(self._sorted, key + _TOP_END, lo)
+        if hi - lo <= PREFIX_SCAN_LIMIT:
+            keys = heapq.nlargest(limit, self._sorted[lo:hi], key=self._weights.__getitem__)
+        else:
+            top = self._top.get(key)
+            if top is None or len(top) < limit:
+                top = self._top[key] = heapq.nlargest(max(limit, 50), self._sorted[lo:hi],
+                                                       key=self._weights.__getitem__)
+            keys = top[:limit]
+        return [Completion(self._display[k], k, self._weights[k]) for k in keys]
+
+    def fuzzy(self, name: str, limit: int = 10, max_distance: Optional[int] = None) -> List[Completion]:
+        """Known names within ``max_distance`` edits (default: ``max_typos``), closest and heaviest first."""
+        key = canonical_name(name)
+        k = max_typos(key) if max_distance is None else max_distance
+        if not key or k <= 0:
+            return []
+        candidates = []
+        segments = self._segments
+        for length in range(max(len(key) - k, 1), len(key) + k + 1):
+            # Per segment, the ids of names whose segment occurs in the query within k places
+            groups = []
+            for i, (start, size) in enumerate(_segments(length, min(SEGMENTS, length))):
+                found = [segments[s] for s in {(length, i, key[shift:shift + size])
+                                               for shift in range(max(start - k, 0), min(start + k, len(key) - size) + 1)}
+                         if s in segments]
+                groups.append(found[0] if len(found) == 1 else set().union(*found))
+            needed = len(groups) - k
+            if needed <= 0:
+                # Too short to be sure a segment survives
+                candidates.extend(self._lengths.get(length, ()))
+                continue
+            groups.sort(key=len)
+            everywhere = set.intersection(*groups[k:])
+            candidates.extend(everywhere)
+            rare = set().union(*groups[:k]) - everywhere
+            candidates.extend(i for i in rare if sum(i in group for group in groups) >= needed)
+        matches = []
+        masks = _char_masks(key)
+        for i in candidates:
+            other = self._by_id[i]
+            if other == key:
+                continue
+            distance = _bit_distance(masks, len(key), other)
+            if distance <= k:
+                matches.append(Completion(self._display[other], other, self._weights[other], distance))
+        matches.sort(key=lambda c: (c.distance, -c.weight, c.key))
+        return matches[:limit]
+
+    def suggest(self, text: str, limit: int = 10) -> List[Completion]:
+        """Prefix completions, topped up with typo matches when there are fewer than ``limit``."""
+        results = self.complete(text, limit)
+        if len(results) < limit:
+            seen = {c.key for c in results}
+            results += [c for c in self.fuzzy(text, limit) if c.key not in seen][:limit - len(results)]
+        return results
+
+
+class Resolution(NamedTuple):
+    key: str
+    how: str  # "known", "alias", "typo" or "new"
+
+
+class Canonicalizer:
+    """Maps names to canonical keys using aliases and a vocabulary of known names."""
+
+    def __init__(self, vocabulary: Optional[AutocompleteIndex] = None, aliases: Optional[Dict[str, str]] = None):
+        self.vocabulary = vocabulary if vocabulary is not None else AutocompleteIndex()
+        self.aliases = {canonical_name(a): canonical_name(c) for a, c in (aliases or {}).items()}
+
+    def add_alias(self, alias: str, canonical: str):
+        self.aliases[canonical_name(alias)] = canonical_name(canonical)
+
+    def resolve(self, name: str, typos: bool = True) -> Resolution:
+        """Where ``name`` belongs; with ``typos`` False only aliases and known names match."""
+        key = canonical_name(name)
+        if key in self.aliases:
+            return Resolution(self.aliases[key], "alias")
+        if key in self.vocabulary:
+            return Resolution(key, "known")
+        if typos:
+            matches = self.vocabulary.fuzzy(key, limit=2)
+            # Only an unambiguous typo is suggested
+            if matches and (len(matches) == 1 or matches[0].distance < matches[1].distance):
+                return Resolution(matches[0].key, "typo")
+        return Resolution(key, "new")
+
+    def canonicalize(self, name: str, typos: bool = True) -> str:
+        return self.resolve(name, typos).key
+
+    def learn(self, name: str, weight: float = 1.0):
+        """Add a name to the vocabulary once it has been used."""
+        self.vocabulary.add(name, weight)
@@ -0,0 +1,44 @@
+# smart_grocery/history.py
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional
+
+from .models import GroceryList
+from .storage import HistoryRecord, JSONFileStorage, Storage
+
+class HistoryManager:
+    def __init__(self, filename="history.jsonl", storage: Optional[Storage] = None):
+        self.filename = filename
+        self.storage = storage or JSONFileStorage(history_file=filename)
+        self._listeners: List[Callable[[datetime, List[dict]], None]] = []
+
+    def load_history(self) -> Iterator[List[dict]]:
+        """Yield saved purchases oldest first without loading the whole history."""
+        for _, items in self.storage.load_history():
+            yield items
+
+    def load_records(self) -> Iterator[HistoryRecord]:
+        return self.storage.load_history()
+
+    def subscribe(self, listener: Callable[[datetime, List[dict]], None]):
+        """Call ``listener(timestamp, items)`` after every save."""
+        self._listeners.append(listener)
+
+    def save_history(self, grocery_list: GroceryList):
+        purchase = grocery_list.to_dict()
+        timestamp = datetime.now().replace(microsecond=0)
+        self.storage.append_history(purchase, timestamp)
+        for listener in self._listeners:
+            listener(timestamp, purchase)
+
+    def compact(self):
+        self.storage.compact_history()
+
+    def show_history(self):
+        found = False
+        for i, (timestamp, purchase) in enumerate(self.load_records(), 1):
+            found = True
+            print(f"Purchase {i}:" if timestamp is None else f"Purchase {i} ({timestamp:%Y-%m-%d %H:%M}):")
+            for item in purchase:
+                print(f"  {item['name']} (x{item['quantity']}) - {item['category']}")
+        if not found:
+            print("No purchase history found.")
@@ -0,0 +1,164 @@
+# smart_grocery/images.py
+"""Content-addressed store for item images.
+
+Uploads are streamed to disk in chunks while being hashed, and are stored once
+under their SHA-256 digest, so the same picture uploaded twice (by any user, under
+any file name) costs one file. The digest is what ``GroceryItemDB.image_path``
+records. Square WebP thumbnails for every size in ``THUMBNAIL_SIZES`` are
+rendered by a background thread pool as soon as an image is stored, and
+thumbnail bytes are served from a bounded in-memory LRU cache.
+
+Layout under ``root``::
+
+    objects/ab/abcdef...            originals
+    thumbs/60/ab/abcdef....webp     thumbnails
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, Optional
+
+DEFAULT_ROOT = os.environ.get("GROCERY_IMAGE_ROOT", "item_images")
+THUMBNAIL_SIZES = (60, 120)
+CHUNK_SIZE = 64 * 1024
+CACHE_ENTRIES = 512
+WEBP_QUALITY = 80
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_digest(value) -> bool:
+    """True for image references written by the store, False for legacy file paths."""
+    return isinstance(value, str) and bool(_DIGEST.match(value))
+
+
+class ImageStore:
+    def __init__(self, root=DEFAULT_ROOT, sizes=THUMBNAIL_SIZES, workers: int = 2,
+                 cache_entries: int = CACHE_ENTRIES):
+        self.root = root
+        self.sizes = tuple(sizes)
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, object] = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+
+    def original_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest)
+
+    def thumbnail_path(self, digest: str, size: int) -> str:
+        return os.path.join(self.root, "thumbs", str(size), digest[:2], digest + ".webp")
+
+    def put(self, stream: BinaryIO) -> str:
+        """Store an image from a binary stream and return its digest.
+
+        Raises ValueError if the data is not an image Pillow can read.
+        """
+        from PIL import Image, UnidentifiedImageError
+
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+                    f.write(chunk)
+            try:
+                with Image.open(tmp_path) as image:
+                    image.verify()
+            except (UnidentifiedImageError, OSError, SyntaxError) as e:
+                raise ValueError(f"not a readable image: {e}") from e
+            digest = hasher.hexdigest()
+            path = self.original_path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._schedule(digest)
+        return digest
+
+    def put_file(self, path: str) -> str:
+        with open(path, "rb") as f:
+            return self.put(f)
+
+    def _schedule(self, digest):
+        with self._lock:
+            if digest in self._pending or self._has_thumbnails(digest):
+                return
+            future = self._executor.submit(self._render_thumbnails, digest)
+            self._pending[digest] = future
+        future.add_done_callback(lambda _: self._done(digest))
+
+    def _done(self, digest):
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def _has_thumbnails(self, digest):
+        return all(os.path.exists(self.thumbnail_path(digest, size)) for size in self.sizes)
+
+    def _render_thumbnails(self, digest):
+        from PIL import Image, ImageOps
+
+        with Image.open(self.original_path(digest)) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+            for size in self.sizes:
+                path = self.thumbnail_path(digest, size)
+                if os.path.exists(path):
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                thumb.save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+                os.replace(tmp_path, path)
+
+    def wait(self, digest: Optional[str] = None):
+        """Block until thumbnails for ``digest`` (or every pending image) are rendered."""
+        with self._lock:
+            futures = [self._pending[digest]] if digest in self._pending else (
+                [] if digest else list(self._pending.values()))
+        for future in futures:
+            future.result()
+
+    def thumbnail(self, digest: str, size: int = THUMBNAIL_SIZES[0]) -> Optional[bytes]:
+        """WebP thumbnail bytes, or None if the image is unknown."""
+        if size not in self.sizes:
+            raise ValueError(f"Unsupported thumbnail size {size}; expected one of {self.sizes}")
+        if not is_digest(digest):
+            return None
+        key = (digest, size)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                return data
+        path = self.thumbnail_path(digest, size)
+        if not os.path.exists(path):
+            if not os.path.exists(self.original_path(digest)):
+                return None
+            self._schedule(digest)
+            try:
+                self.wait(digest)
+            except OSError:
+                return None
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._lock:
+            self._cache[key] = data
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,107 @@
+# smart_grocery/journal.py
+"""Append-only JSON Lines journal for purchase history.
+
+Each saved list is one line, ``{"ts": "<ISO timestamp>", "items": [...]}``,
+appended and fsync'd, so a save costs one small write no matter how long the
+history is. A crash can at worst leave a torn final line, which readers skip
+and the next compaction drops. Compaction rewrites the journal into a
+temporary file and atomically renames it over the original.
+
+A legacy ``history.json`` (one JSON array of purchases) is converted into the
+journal the first time it is opened and kept as ``history.json.migrated``.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+COMPACT_EVERY = 1000  # Appends between automatic compactions
+
+
+def _fsync_dir(path):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class HistoryJournal:
+    def __init__(self, path="history.jsonl", legacy_path: Optional[str] = "history.json",
+                 compact_every: int = COMPACT_EVERY):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.compact_every = compact_every
+        self._appends = 0
+        self._tail_checked = False
+        self._needs_compaction = False
+        self.migrate_legacy()
+
+    def migrate_legacy(self) -> bool:
+        """Convert a legacy JSON array file into the journal; returns True if it did."""
+        if not self.legacy_path or os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            return False
+        with open(self.legacy_path, "r") as f:
+            purchases = json.load(f)
+        self._write_atomically((None, items) for items in purchases)
+        os.replace(self.legacy_path, self.legacy_path + ".migrated")
+        return True
+
+    def append(self, items: List[dict], timestamp: Optional[datetime] = None):
+        record = {"ts": timestamp.isoformat() if timestamp else None, "items": items}
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with open(self.path, "a+b") as f:
+            if not self._tail_checked:
+                # Never glue a new record onto a torn last line from a crash
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        line = "\n" + line
+                        self._needs_compaction = True
+                self._tail_checked = True
+            f.write(line.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        self._appends += 1
+        if self._needs_compaction or (self.compact_every and self._appends >= self.compact_every):
+            self.compact()
+
+    def __iter__(self) -> Iterator[Tuple[Optional[datetime], List[dict]]]:
+        """Yield ``(timestamp, items)`` oldest first, reading one line at a time."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = self._parse(line)
+                if record is not None:
+                    yield record
+
+    def _parse(self, line):
+        if not line.strip():
+            return None
+        try:
+            record = json.loads(line)
+            ts = record.get("ts")
+            return (datetime.fromisoformat(ts) if ts else None), record["items"]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._needs_compaction = True
+            return None
+
+    def compact(self):
+        """Rewrite the journal without blank or damaged lines, atomically."""
+        self._write_atomically(iter(self))
+        self._appends = 0
+        self._needs_compaction = False
+        self._tail_checked = True
+
+    def _write_atomically(self, records):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for timestamp, items in records:
+                record = {"ts": timestamp.isoformat() if timestamp else None, "items": items}
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
@@ -0,0 +1,42 @@
+# smart_grocery/meals.py
+from typing import List, Optional
+
+from .models import GroceryList
+from .recipes import Recipe, RecipeIndex, expand_meals, list_quantities
+from .storage import JSONFileStorage, Storage
+
+class MealPlanner:
+    def __init__(self, filename="meals.json", storage: Optional[Storage] = None):
+        self.filename = filename
+        self.storage = storage or JSONFileStorage(meals_file=filename)
+        self.meals = self.load_meals()
+        self.recipes = RecipeIndex(Recipe.from_dict(r) for r in self.storage.load_recipes())
+
+    def load_meals(self):
+        return self.storage.load_meals()
+
+    def add_meal(self, date: str, items: List[str]):
+        self.meals[date] = items
+        self.storage.save_meal(date, items)
+        print(f"Meal for {date} saved.")
+
+    def add_recipe(self, recipe: Recipe):
+        self.recipes.add(recipe)
+        self.storage.save_recipe(recipe.to_dict())
+
+    def expand(self, start: Optional[str] = None, end: Optional[str] = None,
+               grocery_list: Optional[GroceryList] = None, servings: Optional[int] = None):
+        """What the meals from ``start`` to ``end`` still need beyond ``grocery_list``; see recipes.expand_meals."""
+        on_list = list_quantities(grocery_list) if grocery_list is not None else None
+        return expand_meals(self.meals, self.recipes, start, end, on_list, servings)
+
+    def shopping_list(self, start: Optional[str] = None, end: Optional[str] = None,
+                      grocery_list: Optional[GroceryList] = None, servings: Optional[int] = None) -> GroceryList:
+        return self.expand(start, end, grocery_list, servings).to_grocery_list()
+
+    def show_meals(self):
+        if not self.meals:
+            print("No meals planned.")
+            return
+        for date, items in self.meals.items():
+            print(f"{date}: {', '.join(items)})")
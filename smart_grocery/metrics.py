@@ -0,0 +1,393 @@
+# smart_grocery/metrics.py
+"""Latency histograms and counters for the hot paths, in Prometheus text format.
+
+Metrics are off unless ``GROCERY_METRICS=1`` is set or ``enable()`` is called.
+While off, an instrumented function costs one flag check, ``timed`` returns a
+shared no-op context, and no SQL statement hooks are attached to engines.
+
+What is recorded:
+
+- ``grocery_db_helper_seconds{helper}``: every public ``*_db`` helper in db.py
+  (``grocery_db_async_helper_seconds`` for db_async.py)
+- ``grocery_sql_statement_seconds{statement}``: each SQL statement, labelled by
+  its verb and first table ("SELECT grocery_items")
+- ``grocery_http_request_seconds{method,route,status}``: Flask and Starlette routes
+- ``grocery_cli_command_seconds{command}``: CLI commands
+- ``grocery_streamlit_section_seconds{section}``: timed sections of a Streamlit run
+- ``grocery_job_seconds{job,status}`` and ``grocery_job_wait_seconds{job}``:
+  background jobs run by this process, and how long they waited past their due time
+- ``grocery_jobs{job,status}`` and ``grocery_job_oldest_pending_seconds{job}``:
+  gauges read from the job queue when metrics are rendered (see jobs.py), so
+  they cover every process
+
+Separately from metrics, single requests can be profiled with cProfile (see
+``Profile``): with ``GROCERY_PROFILE_REQUESTS=1`` a request asks for it with
+``?profile=1`` or an ``X-Profile: 1`` header, and ``GROCERY_PROFILE_SAMPLE``
+profiles that share of all requests at random. Each profile is written as a
+``.prof`` file (pstats; open with ``snakeviz`` or ``python -m pstats``).
+cProfile and an external sampler such as ``py-spy record --pid`` do not get in
+each other's way, so py-spy needs nothing from here.
+"""
+import bisect
+import functools
+import os
+import re
+import threading
+import time
+import weakref
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DB_HELPER = "grocery_db_helper_seconds"
+DB_HELPER_ERRORS = "grocery_db_helper_errors_total"
+DB_ASYNC_HELPER = "grocery_db_async_helper_seconds"
+SQL_STATEMENT = "grocery_sql_statement_seconds"
+HTTP_REQUEST = "grocery_http_request_seconds"
+CLI_COMMAND = "grocery_cli_command_seconds"
+STREAMLIT_SECTION = "grocery_streamlit_section_seconds"
+JOB_RUN = "grocery_job_seconds"
+JOB_WAIT = "grocery_job_wait_seconds"
+JOB_QUEUE = "grocery_jobs"
+JOB_OLDEST_PENDING = "grocery_job_oldest_pending_seconds"
+DESCRIPTIONS = {
+    DB_HELPER: "Time spent in db.py helpers.",
+    DB_HELPER_ERRORS: "db.py helper calls that raised.",
+    DB_ASYNC_HELPER: "Time spent in db_async.py helpers.",
+    SQL_STATEMENT: "Time spent executing SQL statements.",
+    HTTP_REQUEST: "Time spent handling HTTP requests.",
+    CLI_COMMAND: "Time spent running CLI commands.",
+    STREAMLIT_SECTION: "Time spent in sections of a Streamlit run.",
+    JOB_RUN: "Time spent running background jobs.",
+    JOB_WAIT: "Time background jobs waited past their due time.",
+    JOB_QUEUE: "Jobs in the queue by status.",
+    JOB_OLDEST_PENDING: "Age of the oldest due pending job.",
+}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Upper bounds in seconds; wide enough for a sub-millisecond query and a slow bulk import
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILE_REQUESTS = os.environ.get("GROCERY_PROFILE_REQUESTS", "").lower() in ("1", "true", "yes", "on")
+PROFILE_SAMPLE = float(os.environ.get("GROCERY_PROFILE_SAMPLE", "0"))
+PROFILE_DIR = os.environ.get("GROCERY_PROFILE_DIR", "profiles")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last one is +Inf
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate, interpolating linearly inside the bucket the quantile falls in."""
+        rank = q * self.count
+        seen, lower = 0, 0.0
+        for upper, count in zip(BUCKETS, self.counts):
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return BUCKETS[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[str, Callable[[], Iterable[Tuple[dict, float]]]] = {}
+
+    def gauge(self, name: str, read: Callable[[], Iterable[Tuple[dict, float]]]):
+        """Render ``name`` as a gauge from ``read()``, called at render time: ``[(labels, value), ...]``."""
+        with self._lock:
+            self._gauges[name] = read
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def _snapshot(self):
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum) for key, h in self._histograms.items()}
+            return histograms, dict(self._counters)
+
+    def render(self) -> str:
+        """The Prometheus text exposition format."""
+        histograms, counters = self._snapshot()
+        lines = ["# TYPE grocery_metrics_enabled gauge", f"grocery_metrics_enabled {int(_enabled)}"]
+        with self._lock:
+            gauges = sorted(self._gauges.items())
+        for name, read in gauges:
+            lines += [f"# HELP {name} {DESCRIPTIONS.get(name, name)}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_labels(tuple(sorted(labels.items())))} {value!r}" for labels, value in read()]
+        for name in sorted({name for name, _ in histograms}):
+            lines += [f"# HELP {name} {DESCRIPTIONS.get(name, name)}", f"# TYPE {name} histogram"]
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for upper, count in zip(BUCKETS + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if upper == float("inf") else repr(upper)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total!r}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        for name in sorted({name for name, _ in counters}):
+            lines += [f"# HELP {name} {DESCRIPTIONS.get(name, name)}", f"# TYPE {name} counter"]
+            lines += [f"{name}{_labels(labels)} {value!r}"
+                      for (metric, labels), value in sorted(counters.items()) if metric == name]
+        return "\n".join(lines) + "\n"
+
+    def summary(self, prefix: str = "") -> List[dict]:
+        """One row per histogram, slowest total first: for tables in a debug panel or the CLI."""
+        with self._lock:
+            rows = [{
+                "metric": name,
+                "labels": ", ".join(f"{k}={v}" for k, v in labels),
+                "count": h.count,
+                "total_ms": h.sum * 1000,
+                "mean_ms": h.sum * 1000 / max(h.count, 1),
+                "p50_ms": h.quantile(0.5) * 1000,
+                "p95_ms": h.quantile(0.95) * 1000,
+            } for (name, labels), h in self._histograms.items() if name.startswith(prefix)]
+        return sorted(rows, key=lambda row: -row["total_ms"])
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+REGISTRY = Registry()
+_enabled = os.environ.get("GROCERY_METRICS", "").lower() in ("1", "true", "yes", "on")
+_engines = weakref.WeakSet()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+    if on:
+        for engine in list(_engines):
+            _attach(engine)
+
+
+def observe(name: str, seconds: float, **labels):
+    if _enabled:
+        REGISTRY.observe(name, seconds, **labels)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def summary(prefix: str = "") -> List[dict]:
+    return REGISTRY.summary(prefix)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timed(name: str, **labels):
+    """``with timed(CLI_COMMAND, command="add"):`` records how long the block took."""
+    return _Timer(name, labels) if _enabled else _NO_TIMER
+
+
+def instrumented(fn, name: str = DB_HELPER, label: str = "helper", errors: Optional[str] = DB_HELPER_ERRORS):
+    """Wrap ``fn`` to record its duration under ``name{label=fn.__name__}``, and count exceptions."""
+    import inspect  # inspect, cProfile and random are imported where used: the CLI never needs them
+
+    value = fn.__name__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def coroutine_wrapper(*args, **kwargs):
+            if not _enabled:
+                return await fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except Exception:
+                if errors:
+                    REGISTRY.inc(errors, **{label: value})
+                raise
+            finally:
+                REGISTRY.observe(name, time.perf_counter() - start, **{label: value})
+        return coroutine_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            if errors:
+                REGISTRY.inc(errors, **{label: value})
+            raise
+        finally:
+            REGISTRY.observe(name, time.perf_counter() - start, **{label: value})
+    return wrapper
+
+
+def instrument_module(namespace: dict, suffix: str = "_db", **options):
+    """Replace every function in a module's ``globals()`` whose name ends in ``suffix`` with ``instrumented(fn)``.
+
+    Generator functions are left alone: timing them would only time creating the generator.
+    """
+    import inspect
+
+    module = namespace["__name__"]
+    for name, value in list(namespace.items()):
+        if (name.endswith(suffix) and inspect.isfunction(value) and value.__module__ == module
+                and not inspect.isgeneratorfunction(value) and not inspect.isasyncgenfunction(value)):
+            namespace[name] = instrumented(value, **options)
+
+
+_STATEMENT = re.compile(r"^\s*(\w+)(?:.*?\b(?:FROM|INTO|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?|ON)\s+[\"`\[]?(\w+))?",
+                        re.IGNORECASE | re.DOTALL)
+
+
+@functools.lru_cache(maxsize=2048)
+def statement_label(statement: str) -> str:
+    """"SELECT grocery_items" for a query on grocery_items: few enough distinct values for a label."""
+    match = _STATEMENT.match(statement)
+    if not match:
+        return "other"
+    verb, table = match.group(1).upper(), match.group(2)
+    words = statement.split(None, 2)
+    if verb == "UPDATE" and len(words) > 1:
+        table = words[1].strip("\"`[]")
+    return f"{verb} {table}" if table else verb
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("grocery_metrics_starts", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("grocery_metrics_starts")
+    if starts:
+        start = starts.pop()
+        if _enabled:
+            REGISTRY.observe(SQL_STATEMENT, time.perf_counter() - start, statement=statement_label(statement))
+
+
+def _execute_failed(context):
+    starts = context.connection.info.get("grocery_metrics_starts") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _attach(engine):
+    from sqlalchemy import event
+
+    if not event.contains(engine, "before_cursor_execute", _before_execute):
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+        event.listen(engine, "handle_error", _execute_failed)
+
+
+def watch_engine(engine):
+    """Time the SQL statements run on a (sync) SQLAlchemy engine, now or once metrics are enabled."""
+    _engines.add(engine)
+    if _enabled:
+        _attach(engine)
+
+
+def should_profile(requested: bool = False) -> bool:
+    """Whether to profile this request: asked for (and allowed), or picked by the sample rate."""
+    import random
+
+    return (requested and PROFILE_REQUESTS) or (PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE)
+
+
+class Profile:
+    """cProfile over one request or command, saved to ``PROFILE_DIR`` when stopped."""
+
+    def __init__(self, label: str, directory: Optional[str] = None):
+        self.label = re.sub(r"[^\w.-]+", "_", label).strip("_") or "profile"
+        self.directory = directory or PROFILE_DIR
+        self.path = None
+        import cProfile
+
+        self._profiler = cProfile.Profile()
+
+    def start(self) -> "Profile":
+        self._profiler.enable()
+        return self
+
+    def stop(self) -> str:
+        """Stop profiling and write the stats; returns the file name."""
+        self._profiler.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.path = os.path.join(self.directory, f"{stamp}-{self.label}.prof")
+        self._profiler.dump_stats(self.path)
+        return self.path
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
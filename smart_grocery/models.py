@@ -0,0 +1,108 @@
+# smart_grocery/models.py
+from typing import Dict, List, Optional
+
+from .canonical import canonical_name, normalize_name
+
+class GroceryItem:
+    __slots__ = ("name", "quantity", "category")
+
+    def __init__(self, name: str, quantity: int = 1, category: str = "Other"):
+        self.name = name.strip().title()
+        self.quantity = quantity
+        self.category = category.strip().title()
+
+    def to_dict(self):
+        return {"name": self.name, "quantity": self.quantity, "category": self.category}
+
+    @staticmethod
+    def from_dict(data):
+        return GroceryItem(data["name"], data["quantity"], data["category"])
+
+    def __str__(self):
+        return f"{self.name} (x{self.quantity}) - {self.category}"
+
+class GroceryList:
+    def __init__(self):
+        # Insertion-ordered, keyed by canonical_name(item.name)
+        self._items: Dict[str, GroceryItem] = {}
+        # normalize_name(category) -> {item key: item}
+        self._by_category: Dict[str, Dict[str, GroceryItem]] = {}
+
+    @property
+    def items(self) -> List[GroceryItem]:
+        return list(self._items.values())
+
+    @items.setter
+    def items(self, items: List[GroceryItem]):
+        self.clear()
+        for item in items:
+            self.add_item(item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __contains__(self, name: str):
+        return canonical_name(name) in self._items
+
+    def get(self, name: str) -> Optional[GroceryItem]:
+        return self._items.get(canonical_name(name))
+
+    def _index(self, key: str, item: GroceryItem):
+        self._by_category.setdefault(normalize_name(item.category), {})[key] = item
+
+    def _unindex(self, key: str, item: GroceryItem):
+        category = normalize_name(item.category)
+        bucket = self._by_category.get(category)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._by_category[category]
+
+    def add_item(self, item: GroceryItem):
+        key = canonical_name(item.name)
+        existing = self._items.get(key)
+        if existing is not None:
+            existing.quantity += item.quantity
+            return
+        self._items[key] = item
+        self._index(key, item)
+
+    def remove_item(self, name: str):
+        key = canonical_name(name)
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._unindex(key, item)
+
+    def edit_item(self, name: str, quantity: int = None, category: str = None):
+        key = canonical_name(name)
+        item = self._items.get(key)
+        if item is None:
+            return
+        if quantity is not None:
+            item.quantity = quantity
+        if category is not None:
+            self._unindex(key, item)
+            item.category = category.strip().title()
+            self._index(key, item)
+
+    def by_category(self, category: str) -> List[GroceryItem]:
+        return list(self._by_category.get(normalize_name(category), {}).values())
+
+    def categories(self) -> List[str]:
+        return [next(iter(bucket.values())).category for bucket in self._by_category.values()]
+
+    def list_items(self):
+        return [item.to_dict() for item in self._items.values()]
+
+    def clear(self):
+        self._items = {}
+        self._by_category = {}
+
+    def to_dict(self):
+        return [item.to_dict() for item in self._items.values()]
+
+    def from_dict(self, data):
+        self.items = [GroceryItem.from_dict(item) for item in data]
@@ -0,0 +1,244 @@
+# smart_grocery/optimizer.py
+"""Store-layout aware ordering of a grocery list.
+
+A ``StoreLayout`` is a weighted graph of locations (entrance, aisles,
+checkout) plus a map from categories, and optionally from individual items, to
+the location where they are shelved. ``Optimizer.plan`` groups a list by
+location and orders the stops along a short walk from the entrance to the
+checkout: shortest paths between stops come from Dijkstra over the aisle
+graph, the visiting order from a nearest-neighbour tour improved with 2-opt.
+
+Routes depend only on the store and the set of locations visited, so they are
+cached per (store, locations); lists over the same categories share one entry.
+
+Layouts are JSON files::
+
+    {"name": "Corner Store", "entrance": "entrance", "checkout": "checkout",
+     "edges": [["entrance", "produce", 4], ["produce", "dairy", 6], ...],
+     "categories": {"Produce": "produce", "Dairy": "dairy"},
+     "items": {"Ice Cream": "freezer"}, "default": "aisle 5"}
+"""
+import heapq
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .models import GroceryList, normalize_name
+
+ROUTE_CACHE_ENTRIES = 1024
+MAX_2OPT_PASSES = 50
+DEFAULT_LAYOUT_DIR = os.environ.get("GROCERY_STORE_DIR", "stores")
+
+
+class StoreLayout:
+    def __init__(self, name: str, edges: Iterable[Sequence], categories: Dict[str, str],
+                 entrance: str = "entrance", checkout: str = "checkout", default: Optional[str] = None,
+                 items: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.entrance = entrance
+        self.checkout = checkout
+        self.graph: Dict[str, Dict[str, float]] = {}
+        for a, b, weight in edges:
+            if weight < 0:
+                raise ValueError(f"{name}: negative distance between {a} and {b}")
+            # Walking is symmetric; keep the shorter of duplicate edges
+            for x, y in ((a, b), (b, a)):
+                neighbours = self.graph.setdefault(x, {})
+                neighbours[y] = min(weight, neighbours.get(y, weight))
+        self.categories = {normalize_name(c): node for c, node in categories.items()}
+        self.items = {normalize_name(i): node for i, node in (items or {}).items()}
+        self.default = default or checkout
+        self._shortest: Dict[str, Tuple[Dict[str, float], Dict[str, str]]] = {}
+        self._lock = threading.Lock()
+        reachable = self.shortest_paths(entrance)[0] if entrance in self.graph else {}
+        for node in [checkout, self.default, *self.categories.values(), *self.items.values()]:
+            if node not in reachable:
+                raise ValueError(f"{name}: location {node!r} cannot be reached from {entrance!r}")
+
+    @staticmethod
+    def from_dict(data) -> "StoreLayout":
+        return StoreLayout(data["name"], data["edges"], data.get("categories", {}), data.get("entrance", "entrance"),
+                           data.get("checkout", "checkout"), data.get("default"), data.get("items"))
+
+    @staticmethod
+    def load(path: str) -> "StoreLayout":
+        with open(path) as f:
+            return StoreLayout.from_dict(json.load(f))
+
+    def location(self, name: str, category: str) -> str:
+        """Where an item is shelved: its own entry, else its category's, else the default."""
+        return self.items.get(normalize_name(name)) or self.categories.get(normalize_name(category)) or self.default
+
+    def shortest_paths(self, source: str) -> Tuple[Dict[str, float], Dict[str, str]]:
+        """Dijkstra from ``source``: (distance, predecessor) per reachable location; cached per source."""
+        cached = self._shortest.get(source)
+        if cached is not None:
+            return cached
+        distances, previous = {source: 0.0}, {}
+        queue = [(0.0, source)]
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            for neighbour, weight in self.graph[node].items():
+                candidate = distance + weight
+                if candidate < distances.get(neighbour, float("inf")):
+                    distances[neighbour] = candidate
+                    previous[neighbour] = node
+                    heapq.heappush(queue, (candidate, neighbour))
+        with self._lock:
+            self._shortest[source] = (distances, previous)
+        return distances, previous
+
+    def path(self, source: str, target: str) -> List[str]:
+        _, previous = self.shortest_paths(source)
+        path = [target]
+        while path[-1] != source:
+            path.append(previous[path[-1]])
+        return path[::-1]
+
+
+# A small supermarket used when no layout is configured
+DEFAULT_LAYOUT = StoreLayout(
+    "Default store",
+    edges=[
+        ("entrance", "produce", 5), ("produce", "bakery", 8), ("bakery", "aisle 1", 6),
+        ("aisle 1", "aisle 2", 4), ("aisle 2", "aisle 3", 4), ("aisle 3", "aisle 4", 4),
+        ("produce", "aisle 1", 10), ("aisle 4", "meat", 6), ("meat", "dairy", 8),
+        ("dairy", "frozen", 6), ("frozen", "checkout", 10), ("aisle 4", "frozen", 12),
+        ("entrance", "checkout", 12), ("aisle 1", "checkout", 14),
+    ],
+    categories={
+        "Produce": "produce", "Fruit": "produce", "Vegetables": "produce", "Bakery": "bakery",
+        "Pantry": "aisle 1", "Dry": "aisle 1", "Snacks": "aisle 2", "Beverages": "aisle 3",
+        "Household": "aisle 4", "Meat": "meat", "Dairy": "dairy", "Frozen": "frozen",
+    },
+    default="aisle 2",
+)
+
+
+def load_layouts(directory: str = DEFAULT_LAYOUT_DIR) -> Dict[str, StoreLayout]:
+    """The default layout plus every ``*.json`` layout in ``directory``, by name."""
+    layouts = {DEFAULT_LAYOUT.name: DEFAULT_LAYOUT}
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".json"):
+                layout = StoreLayout.load(os.path.join(directory, filename))
+                layouts[layout.name] = layout
+    return layouts
+
+
+class Stop(NamedTuple):
+    location: str
+    items: list  # The list's items shelved here, by name
+
+
+class ShoppingRoute(NamedTuple):
+    store: str
+    stops: List[Stop]
+    distance: float  # Entrance to checkout, through every stop
+    path: List[str]  # Every location walked past, in order
+
+    def ordered_items(self) -> list:
+        return [item for stop in self.stops for item in stop.items]
+
+
+def _tour_length(order, dist):
+    return sum(dist[a][b] for a, b in zip(order, order[1:]))
+
+
+def _nearest_neighbour(dist, n):
+    """Open tour from 0 through 1..n-2 to n-1 (indices into ``dist``)."""
+    order, remaining = [0], set(range(1, n - 1))
+    while remaining:
+        row = dist[order[-1]]
+        nearest = min(remaining, key=row.__getitem__)
+        order.append(nearest)
+        remaining.remove(nearest)
+    order.append(n - 1)
+    return order
+
+
+def _two_opt(order, dist, max_passes=MAX_2OPT_PASSES):
+    """Reverse segments while that shortens the tour; the endpoints stay fixed."""
+    n = len(order)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 2):
+            a, b = order[i - 1], order[i]
+            row_a, row_b = dist[a], dist[b]
+            for j in range(i + 1, n - 1):
+                c, d = order[j], order[j + 1]
+                if row_a[c] + row_b[d] < row_a[b] + dist[c][d] - 1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    b = order[i]
+                    row_b = dist[b]
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+class Optimizer:
+    def __init__(self, layout: StoreLayout = DEFAULT_LAYOUT, cache_entries: int = ROUTE_CACHE_ENTRIES):
+        self.layout = layout
+        self.cache_entries = cache_entries
+        self._routes: "OrderedDict[tuple, Tuple[List[str], float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def route(self, locations: Iterable[str]) -> Tuple[List[str], float, List[str]]:
+        """(visiting order, walking distance, full path) through ``locations``; cached per location set."""
+        key = (self.layout.name, frozenset(locations))
+        with self._lock:
+            cached = self._routes.get(key)
+            if cached is not None:
+                self._routes.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        result = self._solve(sorted(key[1]))
+        with self._lock:
+            self._routes[key] = result
+            while len(self._routes) > self.cache_entries:
+                self._routes.popitem(last=False)
+        return result
+
+    def _solve(self, locations):
+        layout = self.layout
+        nodes = [layout.entrance] + [n for n in locations if n not in (layout.entrance, layout.checkout)]
+        nodes.append(layout.checkout)
+        dist = []
+        for node in nodes:
+            distances, _ = layout.shortest_paths(node)
+            dist.append([distances.get(other, float("inf")) for other in nodes])
+        order = _two_opt(_nearest_neighbour(dist, len(nodes)), dist)
+        visits = [nodes[i] for i in order]
+        path = [layout.entrance]
+        for a, b in zip(visits, visits[1:]):
+            path.extend(layout.path(a, b)[1:])
+        return visits[1:-1], _tour_length(order, dist), path
+
+    def plan(self, items: Iterable) -> ShoppingRoute:
+        """Route through the store for anything with ``name`` and ``category`` (GroceryItem, db rows)."""
+        by_location: Dict[str, list] = {}
+        for item in items:
+            by_location.setdefault(self.layout.location(item.name, item.category), []).append(item)
+        order, distance, path = self.route(by_location)
+
+        def stop(location):
+            return Stop(location, sorted(by_location[location], key=lambda i: normalize_name(i.name)))
+
+        stops = [stop(location) for location in order if location in by_location]
+        # Items shelved at the entrance or checkout are picked up there
+        if self.layout.entrance in by_location:
+            stops.insert(0, stop(self.layout.entrance))
+        if self.layout.checkout in by_location:
+            stops.append(stop(self.layout.checkout))
+        return ShoppingRoute(self.layout.name, stops, distance, path)
+
+    def optimize_list(self, grocery_list: GroceryList) -> list:
+        """The list's items in walking order."""
+        return self.plan(grocery_list).ordered_items()
@@ -0,0 +1,126 @@
+# smart_grocery/pantry.py
+"""Pantry stock and consumption forecasts.
+
+A purchase is taken to last until the next purchase of the same item, so
+between two purchase days the item was used at (quantity bought on the first
+day) / (days until the second). ``consumption_rates`` fits one rate per series
+of purchase days (one series per user and item) as a weighted average of
+those intervals, with recent ones counting more (half-life
+``HALF_LIFE_DAYS``). A stock of ``q`` bought at day ``t`` then runs out at
+``t + q / rate``.
+
+The fits run in NumPy over many series at once (see db.forecast_pantry_db,
+the nightly job); NumPy is only imported by the functions that need it.
+"""
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+HALF_LIFE_DAYS = 90.0
+MIN_PURCHASE_DAYS = 2  # A rate needs at least one interval
+EPOCH = datetime(1970, 1, 1)
+
+
+def _require_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("Pantry forecasts need the 'numpy' package (pip install numpy)") from e
+    return numpy
+
+
+class PantryEntry(NamedTuple):
+    name: str
+    category: str
+    quantity: float  # As bought (or last counted) at purchased_at
+    remaining: float  # Estimated now, at the forecast rate
+    purchased_at: datetime
+    rate: Optional[float]  # Units used per day, None until a forecast exists
+    runout_at: Optional[datetime]
+
+
+class PantryProposal(NamedTuple):
+    name: str
+    category: str
+    quantity: int  # The usual amount bought
+    runout_at: datetime
+    in_pantry: bool  # Whether the date comes from pantry stock or from the last purchase
+
+
+def remaining(quantity: float, since: datetime, rate: Optional[float], now: datetime) -> float:
+    """What is left of ``quantity`` bought at ``since``, used at ``rate`` per day."""
+    if not rate or since is None:
+        return quantity
+    return max(0.0, quantity - rate * (now - since).total_seconds() / 86400)
+
+
+def runout(quantity: float, since: datetime, rate: Optional[float]) -> Optional[datetime]:
+    if not rate or since is None:
+        return None
+    return since + timedelta(days=quantity / rate)
+
+
+class Rates(NamedTuple):
+    starts: "numpy.ndarray"  # Row index where each series starts
+    rate: "numpy.ndarray"  # Units per day; NaN with fewer than MIN_PURCHASE_DAYS purchase days
+    purchase_days: "numpy.ndarray"
+    last_day: "numpy.ndarray"
+    last_quantity: "numpy.ndarray"
+    typical_quantity: "numpy.ndarray"  # Mean quantity per purchase day
+
+
+def series_starts(*keys):
+    """Row indices where any of the key columns (sorted together) changes value, starting with 0."""
+    np = _require_numpy()
+    keys = [np.asarray(k) for k in keys]
+    if not len(keys[0]):
+        return np.zeros(0, dtype=np.int64)
+    change = np.zeros(len(keys[0]), dtype=bool)
+    change[0] = True
+    for key in keys:
+        change[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(change)
+
+
+def consumption_rates(starts, day, quantity, half_life_days: float = HALF_LIFE_DAYS) -> Rates:
+    """Fit a rate per series; rows are sorted by series and day, one row per purchase day.
+
+    ``starts`` comes from series_starts; ``day`` is in days (any origin) and
+    ``quantity`` is the amount bought that day.
+    """
+    np = _require_numpy()
+    day = np.asarray(day, dtype=float)
+    quantity = np.asarray(quantity, dtype=float)
+    starts = np.asarray(starts, dtype=np.int64)
+    if not len(starts):
+        empty = np.zeros(0)
+        return Rates(starts, empty, np.zeros(0, dtype=np.int64), empty, empty, empty)
+    ends = np.append(starts[1:], len(day)) - 1
+    counts = ends - starts + 1
+    last_day = day[ends]
+    # Each purchase but the last of its series is used up over the gap to the next one
+    gap = np.append(np.diff(day), 0.0)
+    has_next = np.ones(len(day), dtype=bool)
+    has_next[ends] = False
+    weight = np.where(has_next, 0.5 ** ((np.repeat(last_day, counts) - day) / half_life_days), 0.0)
+    used = np.add.reduceat(weight * quantity, starts)
+    elapsed = np.add.reduceat(weight * gap, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where((counts >= MIN_PURCHASE_DAYS) & (elapsed > 0), used / elapsed, np.nan)
+    typical = np.add.reduceat(quantity, starts) / counts
+    return Rates(starts, rate, counts, last_day, quantity[ends], typical)
+
+
+def runout_days(stock_day, stock, rate):
+    """Day each stock runs out at its rate; NaN where there is no positive rate."""
+    np = _require_numpy()
+    stock_day, stock, rate = (np.asarray(a, dtype=float) for a in (stock_day, stock, rate))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(rate > 0, stock_day + stock / rate, np.nan)
+
+
+def to_epoch_days(timestamp: datetime) -> float:
+    return (timestamp - EPOCH).total_seconds() / 86400
+
+
+def from_epoch_days(days: float) -> datetime:
+    return EPOCH + timedelta(days=float(days))
@@ -0,0 +1,356 @@
+# smart_grocery/prices.py
+"""Store price catalogs and budget plans.
+
+A catalog has one price per store and item (by canonical name) per date
+observed, so it keeps each price's history. ``import_prices`` streams rows of
+``store, name, price[, date]`` from CSV, JSON Lines or Parquet into a sink in
+validated chunks, as transfer.import_items does for list items.
+
+``optimize`` decides where to buy a list. Line costs form an items x stores
+matrix, NaN where a store has no price. Choosing at most ``max_stores``
+stores is a small facility-location problem: while there are at most
+``EXHAUSTIVE_LIMIT`` subsets of a size, all of them are scored in vectorized
+batches; past that, stores are added greedily and then swapped while that
+helps. Each item then goes to its cheapest chosen store. Over a spending
+cap, which lines to keep is a 0/1 knapsack (cost in cents, a value per line)
+solved by dynamic programming over the budget, one vector operation per
+line. Only the list's rows of the catalog are involved, so a plan for a few
+hundred items over 50 stores takes milliseconds whatever the catalog size.
+
+NumPy is only imported by the functions that need it.
+"""
+import math
+from datetime import date, datetime, timezone
+from itertools import combinations, islice
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .canonical import canonical_name
+from .models import GroceryList
+from .transfer import Progress, import_items, read_rows
+
+IMPORT_CHUNK_SIZE = 10_000
+EXHAUSTIVE_LIMIT = 25_000  # Store subsets of one size scored exhaustively; more and the search is greedy
+BATCH_CELLS = 4_000_000  # Matrix cells per vectorized batch of subsets
+KNAPSACK_CELLS = 4_000_000  # Lines x budget steps; the budget is counted in coarser steps past this
+
+
+def _require_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("Budget plans need the 'numpy' package (pip install numpy)") from e
+    return numpy
+
+
+def _timestamp(value) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        timestamp = value
+    elif isinstance(value, date):
+        timestamp = datetime(value.year, value.month, value.day)
+    else:
+        try:
+            timestamp = datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            raise ValueError(f"invalid date {value!r}")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def normalize_price_row(row: dict) -> dict:
+    """Validate one raw catalog row; raises ValueError with a readable message."""
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+    store = str(row.get("store") or "").strip()
+    if not store:
+        raise ValueError("missing store")
+    name = str(row.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    raw_price = row.get("price")
+    try:
+        price = float(str(raw_price).strip().lstrip("$")) if raw_price not in (None, "") else None
+    except ValueError:
+        raise ValueError(f"invalid price {raw_price!r}")
+    if price is None or not math.isfinite(price) or price <= 0:
+        raise ValueError(f"price must be a positive number, got {raw_price!r}")
+    observed_at = _timestamp(row.get("observed_at") or row.get("date"))
+    return {"store": store, "name": name.title(), "price": price, "observed_at": observed_at}
+
+
+def import_prices(source, sink, fmt: Optional[str] = None, chunk_size: int = IMPORT_CHUNK_SIZE,
+                  progress: Optional[Progress] = None):
+    """Stream catalog rows into ``sink`` in validated chunks; bad rows are reported, not raised.
+
+    Rows are ``{"store", "name", "price", "observed_at"}``; observed_at is None
+    for undated rows (the sink decides, e.g. the import time).
+    """
+    return import_items(source, sink, fmt, chunk_size, progress, normalize=normalize_price_row)
+
+
+def latest_prices(source, fmt: Optional[str] = None) -> List[Tuple[str, str, float]]:
+    """``(key, store, price)`` with the newest price per item and store of a catalog file, for price_matrix.
+
+    Undated rows count as newer than dated ones, and later rows win ties.
+    Invalid rows are skipped.
+    """
+    newest = {}
+    for row in read_rows(source, fmt):
+        try:
+            row = normalize_price_row(row)
+        except ValueError:
+            continue
+        key = (canonical_name(row["name"]), row["store"])
+        observed = row["observed_at"] or datetime.max
+        if key not in newest or observed >= newest[key][0]:
+            newest[key] = (observed, row["price"])
+    return [(name, store, price) for (name, store), (_, price) in newest.items()]
+
+
+def price_matrix(keys: Sequence[str], prices: Iterable[Tuple[str, str, float]], stores=None):
+    """``(stores, matrix)``: unit prices for items ``keys`` x stores from ``(key, store, price)`` rows.
+
+    Stores are every store in ``prices`` (sorted) unless given; NaN marks a
+    store without a price for the item.
+    """
+    np = _require_numpy()
+    rows = list(prices)
+    stores = sorted({store for _, store, _ in rows}) if stores is None else list(stores)
+    row_of = {key: i for i, key in enumerate(keys)}
+    column_of = {store: j for j, store in enumerate(stores)}
+    matrix = np.full((len(keys), len(stores)), np.nan)
+    r = np.array([row_of.get(key, -1) for key, _, _ in rows], dtype=np.intp)
+    c = np.array([column_of.get(store, -1) for _, store, _ in rows], dtype=np.intp)
+    p = np.array([price for _, _, price in rows], dtype=float)
+    known = (r >= 0) & (c >= 0)
+    matrix[r[known], c[known]] = p[known]
+    return stores, matrix
+
+
+class PlanLine(NamedTuple):
+    name: str
+    quantity: int
+    store: str
+    unit_price: float
+    cost: float
+
+
+class StoreTotal(NamedTuple):
+    store: str
+    total: float  # For the items it has a price for
+    missing: int  # Items priced somewhere else but not here
+
+
+class BudgetPlan(NamedTuple):
+    stores: List[str]  # Where to shop, biggest spend first
+    lines: List[PlanLine]
+    total: float
+    dropped: List[PlanLine]  # Left out to stay within the budget, at what they would have cost
+    unavailable: List[str]  # No price at the chosen stores
+    by_store: List[StoreTotal]  # Each store on its own: complete ones first, then cheapest
+
+
+def optimize(names: Sequence[str], quantities, stores: Sequence[str], matrix, budget: Optional[float] = None,
+             max_stores: int = 1, store_cost: float = 0.0, values=None) -> BudgetPlan:
+    """Cheapest way to buy ``names`` at up to ``max_stores`` of ``stores``, within ``budget`` if given.
+
+    ``matrix`` holds unit prices (items x stores, NaN for none). Each store
+    shopped at adds ``store_cost`` to the cost compared (not to the spend), so
+    a second store is only used when it saves more than that. Over budget,
+    the lines kept are those with the most total ``values`` (default: one
+    each) that fit.
+    """
+    np = _require_numpy()
+    stores = list(stores)
+    quantities = np.asarray(quantities, dtype=float)
+    prices = np.asarray(matrix, dtype=float).reshape(len(names), len(stores))
+    values = np.ones(len(names)) if values is None else np.asarray(values, dtype=float)
+    costs = prices * quantities[:, None]
+    priced = ~np.isnan(costs)
+    available = priced.any(axis=1)
+    by_store = sorted(
+        (StoreTotal(store, round(float(np.nansum(costs[:, j])), 2), int(available.sum() - priced[:, j].sum()))
+         for j, store in enumerate(stores)),
+        key=lambda t: (t.missing, t.total, t.store),
+    )
+    rows = np.flatnonzero(available)
+    chosen = _choose_stores(costs[rows], max(1, max_stores), store_cost) if len(rows) else []
+    unit = np.where(np.isnan(prices[np.ix_(rows, chosen)]), np.inf, prices[np.ix_(rows, chosen)])
+    pick = unit.argmin(axis=1) if chosen else np.zeros(len(rows), dtype=int)
+    unit_price = unit[np.arange(len(rows)), pick] if chosen else np.full(len(rows), np.inf)
+    covered = np.isfinite(unit_price)
+    line_cost = np.where(covered, unit_price * quantities[rows], 0.0)
+    keep = covered.copy()
+    if budget is not None and line_cost[covered].sum() > budget + 1e-9:
+        keep[covered] = _knapsack(line_cost[covered], values[rows][covered], budget)
+
+    def line(i):
+        item = rows[i]
+        return PlanLine(names[item], int(quantities[item]), stores[chosen[pick[i]]], float(unit_price[i]),
+                        round(float(line_cost[i]), 2))
+
+    lines = [line(i) for i in np.flatnonzero(keep)]
+    spend = {}
+    for plan_line in lines:
+        spend[plan_line.store] = spend.get(plan_line.store, 0.0) + plan_line.cost
+    return BudgetPlan(
+        stores=sorted(spend, key=lambda s: (-spend[s], s)),
+        lines=lines,
+        total=round(sum((l.cost for l in lines), 0.0), 2),
+        dropped=[line(i) for i in np.flatnonzero(covered & ~keep)],
+        unavailable=[names[i] for i in np.flatnonzero(~available)] + [names[rows[i]] for i in np.flatnonzero(~covered)],
+        by_store=by_store,
+    )
+
+
+def _choose_stores(costs, max_stores, store_cost):
+    """Column indices of the store subset with the lowest total (plus store_cost each), covering the most items."""
+    np = _require_numpy()
+    n_items, n_stores = costs.shape
+    # An item a subset cannot supply costs more than everything else together, so coverage comes first
+    missing = float(np.nansum(costs)) + store_cost * n_stores + 1.0
+    filled = np.where(np.isnan(costs), missing, costs)
+    best, best_total = [], math.inf
+    for k in range(1, min(max_stores, n_stores) + 1):
+        if math.comb(n_stores, k) <= EXHAUSTIVE_LIMIT:
+            subset, total = _best_subset(filled, k)
+        else:
+            subset, total = _greedy_subset(filled, k)
+        total += store_cost * k
+        if total < best_total - 1e-9:
+            best, best_total = subset, total
+    return best
+
+
+def _best_subset(filled, k):
+    np = _require_numpy()
+    n_items, n_stores = filled.shape
+    batch = max(1, BATCH_CELLS // max(n_items * k, 1))
+    subsets = combinations(range(n_stores), k)
+    best, best_total = None, math.inf
+    while True:
+        chunk = np.array(list(islice(subsets, batch)), dtype=np.intp)
+        if not len(chunk):
+            return best, best_total
+        totals = filled[:, chunk].min(axis=2).sum(axis=0)
+        i = int(totals.argmin())
+        if totals[i] < best_total:
+            best, best_total = chunk[i].tolist(), float(totals[i])
+
+
+def _greedy_subset(filled, k):
+    np = _require_numpy()
+    n_items, n_stores = filled.shape
+    chosen = []
+    cheapest = np.full(n_items, np.inf)
+    for _ in range(k):
+        totals = np.minimum(cheapest[:, None], filled).sum(axis=0)
+        totals[chosen] = np.inf
+        j = int(totals.argmin())
+        chosen.append(j)
+        cheapest = np.minimum(cheapest, filled[:, j])
+    # Swap one chosen store for another while that lowers the total
+    improved = True
+    while improved:
+        improved = False
+        for position in range(k):
+            others = chosen[:position] + chosen[position + 1:]
+            rest = filled[:, others].min(axis=1) if others else np.full(n_items, np.inf)
+            totals = np.minimum(rest[:, None], filled).sum(axis=0)
+            now = totals[chosen[position]]
+            totals[chosen] = np.inf
+            j = int(totals.argmin())
+            if totals[j] < now - 1e-9:
+                chosen[position] = j
+                improved = True
+    return chosen, float(filled[:, chosen].min(axis=1).sum())
+
+
+def _knapsack(costs, values, budget):
+    """Boolean mask of the lines to keep: most total value with total cost within ``budget`` (0/1 knapsack)."""
+    np = _require_numpy()
+    n = len(costs)
+    capacity = int(math.floor(budget * 100 + 1e-6))  # Cents
+    step = max(1, math.ceil(n * (capacity + 1) / KNAPSACK_CELLS))
+    # Costs round up and the budget down to whole steps, so a coarser plan still never goes over
+    weights = np.ceil(np.round(np.asarray(costs) * 100, 6) / step).astype(np.int64)
+    capacity //= step
+    best = np.zeros(capacity + 1)
+    take = np.zeros((n, capacity + 1), dtype=bool)
+    for i in range(n):
+        w = int(weights[i])
+        if w > capacity:
+            continue
+        candidate = best[:capacity + 1 - w] + values[i]
+        better = candidate > best[w:]
+        take[i, w:] = better
+        best[w:] = np.where(better, candidate, best[w:])
+    keep = np.zeros(n, dtype=bool)
+    c = capacity
+    for i in range(n - 1, -1, -1):
+        if take[i, c]:
+            keep[i] = True
+            c -= int(weights[i])
+    # Rounding up to coarse steps leaves budget unused; fill it at exact cost, best value per cent first
+    left = budget - float(np.sum(costs[keep]))
+    for i in sorted(np.flatnonzero(~keep), key=lambda i: -values[i] / max(costs[i], 1e-9)):
+        if costs[i] <= left + 1e-9:
+            keep[i] = True
+            left -= costs[i]
+    return keep
+
+
+class PriceCatalog:
+    """Current prices of a whole catalog as one items x stores matrix, to plan lists against in memory."""
+
+    def __init__(self, prices: Iterable[Tuple[str, str, float]], stores=None):
+        rows = list(prices)
+        keys = sorted({key for key, _, _ in rows})
+        self.stores, self.matrix = price_matrix(keys, rows, stores)
+        self._rows = {key: i for i, key in enumerate(keys)}
+
+    @classmethod
+    def from_file(cls, source, fmt: Optional[str] = None) -> "PriceCatalog":
+        return cls(latest_prices(source, fmt))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def prices(self, names: Sequence[str]):
+        """Unit prices for ``names`` (rows) at every store; NaN rows for items not in the catalog."""
+        np = _require_numpy()
+        rows = np.array([self._rows.get(canonical_name(name), -1) for name in names], dtype=np.intp)
+        prices = self.matrix[np.maximum(rows, 0)] if len(self._rows) else np.full((len(rows), len(self.stores)), np.nan)
+        prices[rows < 0] = np.nan
+        return prices
+
+    def plan(self, grocery_list: GroceryList, budget: Optional[float] = None, max_stores: int = 1,
+             store_cost: float = 0.0, values=None) -> BudgetPlan:
+        """optimize() for the items of ``grocery_list``."""
+        items = list(grocery_list)
+        names = [item.name for item in items]
+        return optimize(names, [item.quantity for item in items], self.stores, self.prices(names), budget,
+                        max_stores, store_cost, values)
+
+
+def as_of_prices(keys, days, price_keys, price_days, price_values):
+    """For each ``(keys[i], days[i])``, the last price observed for that key on or before that day (NaN if none).
+
+    ``days`` and ``price_days`` are in days on any common scale.
+    """
+    np = _require_numpy()
+    ids = {}
+    key_ids = np.array([ids.setdefault(k, len(ids)) for k in keys], dtype=float)
+    price_ids = np.array([ids.get(k, -1) for k in price_keys], dtype=float)
+    known = price_ids >= 0
+    # One sorted axis: key id, then day within the key (days stay far below the span)
+    span = 1e7
+    observed = price_ids[known] * span + np.asarray(price_days, dtype=float)[known]
+    values = np.asarray(price_values, dtype=float)[known]
+    order = np.argsort(observed, kind="stable")
+    observed, values, owner = observed[order], values[order], price_ids[known][order]
+    at = np.searchsorted(observed, key_ids * span + np.asarray(days, dtype=float), side="right") - 1
+    found = (at >= 0) & (owner[np.maximum(at, 0)] == key_ids) if len(observed) else np.zeros(len(key_ids), bool)
+    return np.where(found, values[np.maximum(at, 0)] if len(observed) else np.nan, np.nan)
@@ -0,0 +1,224 @@
+# smart_grocery/recipes.py
+"""Recipes and the meal-plan-to-shopping-list expansion engine.
+
+A meal plan maps ISO dates to entries; an entry that names a known recipe
+expands into that recipe's ingredients, any other entry is one unit of a
+plain grocery item. ``expand_meals`` sums what a date range needs, merging
+the same ingredient across recipes once amounts are in a common base unit, and
+subtracts what is already on the list.
+
+Recipes are compiled into a ``RecipeIndex`` up front: ingredient names are
+canonicalized and amounts converted to base units per serving once, so expanding
+a plan is only dictionary lookups and additions.
+"""
+import math
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple
+
+from .canonical import canonical_name
+from .models import GroceryItem, GroceryList, normalize_name
+
+COUNT_UNIT = "each"
+
+# Unit alias -> (base unit, factor to the base unit)
+UNITS: Dict[str, Tuple[str, float]] = {
+    "g": ("g", 1.0), "gram": ("g", 1.0), "grams": ("g", 1.0),
+    "kg": ("g", 1000.0), "kilogram": ("g", 1000.0), "kilograms": ("g", 1000.0),
+    "oz": ("g", 28.3495), "ounce": ("g", 28.3495), "ounces": ("g", 28.3495),
+    "lb": ("g", 453.592), "lbs": ("g", 453.592), "pound": ("g", 453.592), "pounds": ("g", 453.592),
+    "ml": ("ml", 1.0), "milliliter": ("ml", 1.0), "milliliters": ("ml", 1.0),
+    "l": ("ml", 1000.0), "liter": ("ml", 1000.0), "liters": ("ml", 1000.0),
+    "litre": ("ml", 1000.0), "litres": ("ml", 1000.0),
+    "tsp": ("ml", 4.92892), "teaspoon": ("ml", 4.92892), "teaspoons": ("ml", 4.92892),
+    "tbsp": ("ml", 14.7868), "tablespoon": ("ml", 14.7868), "tablespoons": ("ml", 14.7868),
+    "cup": ("ml", 236.588), "cups": ("ml", 236.588),
+    "": (COUNT_UNIT, 1.0), "each": (COUNT_UNIT, 1.0), "x": (COUNT_UNIT, 1.0),
+    "pc": (COUNT_UNIT, 1.0), "pcs": (COUNT_UNIT, 1.0), "piece": (COUNT_UNIT, 1.0), "pieces": (COUNT_UNIT, 1.0),
+}
+# Measured amounts are bought as one pack; counts are bought one by one
+MEASURED_UNITS = ("g", "ml")
+
+
+def normalize_unit(unit: Optional[str]) -> Tuple[str, float]:
+    """Base unit and conversion factor; unknown units (``can``, ``bunch``) are their own base."""
+    key = normalize_name(unit or "").rstrip(".")
+    return UNITS.get(key, (key, 1.0))
+
+
+def format_amount(amount: float, unit: str) -> str:
+    if unit in MEASURED_UNITS and amount >= 1000:
+        amount, unit = amount / 1000, {"g": "kg", "ml": "l"}[unit]
+    text = f"{amount:.2f}".rstrip("0").rstrip(".")
+    return text if unit == COUNT_UNIT else f"{text} {unit}"
+
+
+class Ingredient(NamedTuple):
+    name: str
+    amount: float = 1.0
+    unit: str = COUNT_UNIT
+    category: str = "Other"
+
+
+class Recipe(NamedTuple):
+    name: str
+    ingredients: List[Ingredient]
+    servings: int = 1
+
+    def to_dict(self):
+        return {"name": self.name, "servings": self.servings, "ingredients": [i._asdict() for i in self.ingredients]}
+
+    @staticmethod
+    def from_dict(data):
+        return Recipe(data["name"], [Ingredient(**i) for i in data["ingredients"]], data.get("servings", 1))
+
+
+class CompiledIngredient(NamedTuple):
+    key: str  # canonical_name(name)
+    unit: str  # Base unit
+    per_serving: float  # Amount in the base unit
+    name: str
+    category: str
+
+
+def compile_ingredient(ingredient: Ingredient, servings: int = 1) -> CompiledIngredient:
+    if ingredient.amount is None or not ingredient.amount > 0:
+        raise ValueError(f"{ingredient.name}: amount must be positive")
+    unit, factor = normalize_unit(ingredient.unit)
+    return CompiledIngredient(canonical_name(ingredient.name), unit, ingredient.amount * factor / max(servings, 1),
+                              ingredient.name.strip().title(), (ingredient.category or "Other").strip().title())
+
+
+class RecipeIndex:
+    """Recipes keyed by normalized name, with ingredients pre-converted to base units per serving."""
+
+    def __init__(self, recipes: Iterable[Recipe] = ()):
+        self.recipes: Dict[str, Recipe] = {}
+        self._compiled: Dict[str, Tuple[int, Tuple[CompiledIngredient, ...]]] = {}
+        for recipe in recipes:
+            self.add(recipe)
+
+    def add(self, recipe: Recipe):
+        if not recipe.ingredients:
+            raise ValueError(f"{recipe.name}: a recipe needs at least one ingredient")
+        key = normalize_name(recipe.name)
+        self.recipes[key] = recipe
+        self._compiled[key] = (recipe.servings, tuple(compile_ingredient(i, recipe.servings)
+                                                      for i in recipe.ingredients))
+
+    def add_compiled(self, name: str, servings: int, ingredients: Iterable[CompiledIngredient]):
+        """Register ingredients that were compiled ahead of time (e.g. stored by db.py)."""
+        self._compiled[normalize_name(name)] = (servings, tuple(ingredients))
+
+    def remove(self, name: str):
+        key = normalize_name(name)
+        self.recipes.pop(key, None)
+        self._compiled.pop(key, None)
+
+    def __contains__(self, name: str):
+        return normalize_name(name) in self._compiled
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def lookup(self, name: str) -> Optional[Tuple[int, Tuple[CompiledIngredient, ...]]]:
+        return self._compiled.get(normalize_name(name))
+
+
+class Requirement(NamedTuple):
+    name: str
+    category: str
+    amount: float  # In ``unit``, after subtracting the list
+    unit: str  # Base unit
+
+    @property
+    def quantity(self) -> int:
+        """How many to put on the list: one pack of a measured amount, otherwise the count rounded up."""
+        return 1 if self.unit in MEASURED_UNITS else math.ceil(self.amount - 1e-9)
+
+    def label(self) -> str:
+        return format_amount(self.amount, self.unit)
+
+
+class Expansion:
+    def __init__(self):
+        # (canonical name, base unit) -> [display name, category, amount]
+        self.totals: Dict[Tuple[str, str], list] = {}
+        self.meals = 0
+        self.unknown: List[str] = []  # Entries that were not recipes and became plain items
+        self.covered: List[str] = []  # Needed items already on the list in full
+
+    def add(self, key: str, unit: str, amount: float, name: str, category: str):
+        total = self.totals.get((key, unit))
+        if total is None:
+            self.totals[(key, unit)] = [name, category, amount]
+        else:
+            total[2] += amount
+
+    def requirements(self) -> List[Requirement]:
+        return [Requirement(name, category, amount, unit) for (_, unit), (name, category, amount) in self.totals.items()]
+
+    def to_grocery_list(self) -> GroceryList:
+        grocery_list = GroceryList()
+        for requirement in self.requirements():
+            grocery_list.add_item(GroceryItem(requirement.name, requirement.quantity, requirement.category))
+        return grocery_list
+
+
+def _in_range(date: str, start: Optional[str], end: Optional[str]) -> bool:
+    return (start is None or date >= start) and (end is None or date <= end)
+
+
+def expand_meals(meals: Mapping[str, Iterable[str]], index: RecipeIndex, start: Optional[str] = None,
+                 end: Optional[str] = None, on_list: Optional[Mapping[str, int]] = None,
+                 servings: Optional[int] = None) -> Expansion:
+    """Ingredients needed for the meals dated ``start``..``end`` (inclusive ISO dates).
+
+    ``on_list`` maps canonical item names to quantities already on the list.
+    Counted items are reduced by that quantity; measured ones are dropped as
+    covered. ``servings`` scales every recipe (default: as written).
+    """
+    expansion = Expansion()
+    # Count each distinct entry once, then expand it with a multiplier
+    uses: Dict[str, int] = {}
+    for date, entries in meals.items():
+        if _in_range(date, start, end):
+            for entry in entries:
+                uses[entry] = uses.get(entry, 0) + 1
+    for entry, count in uses.items():
+        expansion.meals += count
+        compiled = index.lookup(entry)
+        if compiled is None:
+            name = entry.strip().title()
+            if name:
+                if name not in expansion.unknown:
+                    expansion.unknown.append(name)
+                expansion.add(canonical_name(entry), COUNT_UNIT, float(count), name, "Other")
+            continue
+        recipe_servings, ingredients = compiled
+        scale = (servings or recipe_servings) * count
+        for i in ingredients:
+            expansion.add(i.key, i.unit, i.per_serving * scale, i.name, i.category)
+    if on_list:
+        _subtract(expansion, on_list)
+    return expansion
+
+
+def _subtract(expansion: Expansion, on_list: Mapping[str, int]):
+    matches = [(k, t) for k, t in expansion.totals.items() if k[0] in on_list]
+    for (key, unit), total in matches:
+        have = on_list[key]
+        if not have:
+            continue
+        if unit not in MEASURED_UNITS:
+            total[2] -= have
+        if unit in MEASURED_UNITS or total[2] <= 1e-9:
+            del expansion.totals[(key, unit)]
+            expansion.covered.append(total[0])
+
+
+def list_quantities(items: Iterable) -> Dict[str, int]:
+    """``on_list`` mapping for ``expand_meals`` from GroceryItems (or anything with name and quantity)."""
+    quantities: Dict[str, int] = {}
+    for item in items:
+        key = canonical_name(item.name)
+        quantities[key] = quantities.get(key, 0) + (item.quantity or 0)
+    return quantities
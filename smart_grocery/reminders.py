@@ -0,0 +1,8 @@
+# smart_grocery/reminders.py
+from .models import GroceryList
+
+class Reminder:
+    @staticmethod
+    def remind_if_empty(grocery_list: GroceryList):
+        if not grocery_list:
+            print("Reminder: Your grocery list is empty! Add items before shopping.")
@@ -0,0 +1,183 @@
+# smart_grocery/storage.py
+"""Storage backends shared by the services.
+
+Every backend stores four things: the current list (item dicts), purchase
+history (``(timestamp, items)`` records, oldest first; the timestamp may be
+None for entries migrated from the old format), meal plans
+(date -> item names) and recipes (``Recipe.to_dict()`` dicts). ``SQLiteStorage`` imports ``db`` only when first used,
+so SQLAlchemy is never loaded by the JSON or in-memory backends.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .journal import HistoryJournal
+from .models import normalize_name
+
+HistoryRecord = Tuple[Optional[datetime], List[dict]]
+
+
+class Storage:
+    def load_items(self) -> List[dict]:
+        raise NotImplementedError
+
+    def save_items(self, items: List[dict]):
+        raise NotImplementedError
+
+    def load_history(self) -> Iterator[HistoryRecord]:
+        raise NotImplementedError
+
+    def append_history(self, items: List[dict], timestamp: Optional[datetime] = None):
+        raise NotImplementedError
+
+    def compact_history(self):
+        pass
+
+    def load_meals(self) -> Dict[str, List[str]]:
+        raise NotImplementedError
+
+    def save_meal(self, date: str, items: List[str]):
+        raise NotImplementedError
+
+    def load_recipes(self) -> List[dict]:
+        return []
+
+    def save_recipe(self, recipe: dict):
+        raise NotImplementedError
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.items: List[dict] = []
+        self.history: List[HistoryRecord] = []
+        self.meals: Dict[str, List[str]] = {}
+        self.recipes: Dict[str, dict] = {}
+
+    def load_items(self):
+        return list(self.items)
+
+    def save_items(self, items):
+        self.items = list(items)
+
+    def load_history(self):
+        return iter(list(self.history))
+
+    def append_history(self, items, timestamp=None):
+        self.history.append((timestamp, list(items)))
+
+    def load_meals(self):
+        return dict(self.meals)
+
+    def save_meal(self, date, items):
+        self.meals[date] = list(items)
+
+    def load_recipes(self):
+        return list(self.recipes.values())
+
+    def save_recipe(self, recipe):
+        self.recipes[normalize_name(recipe["name"])] = recipe
+
+
+def _read_json(filename, default):
+    if os.path.exists(filename):
+        with open(filename, "r") as f:
+            return json.load(f)
+    return default
+
+
+def _write_json(filename, data):
+    with open(filename, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+class JSONFileStorage(Storage):
+    """JSON files on disk; history is an append-only journal (see journal.py)."""
+
+    def __init__(self, history_file="history.jsonl", meals_file="meals.json", items_file="grocery_list.json",
+                 legacy_history_file="history.json", recipes_file="recipes.json"):
+        self.history_file = history_file
+        self.meals_file = meals_file
+        self.recipes_file = recipes_file
+        self.items_file = items_file
+        self.journal = HistoryJournal(history_file, legacy_history_file)
+
+    def load_items(self):
+        return _read_json(self.items_file, [])
+
+    def save_items(self, items):
+        _write_json(self.items_file, list(items))
+
+    def load_history(self):
+        return iter(self.journal)
+
+    def append_history(self, items, timestamp=None):
+        self.journal.append(list(items), timestamp)
+
+    def compact_history(self):
+        self.journal.compact()
+
+    def load_meals(self):
+        return _read_json(self.meals_file, {})
+
+    def save_meal(self, date, items):
+        meals = self.load_meals()
+        meals[date] = list(items)
+        _write_json(self.meals_file, meals)
+
+    def load_recipes(self):
+        return list(_read_json(self.recipes_file, {}).values())
+
+    def save_recipe(self, recipe):
+        recipes = _read_json(self.recipes_file, {})
+        recipes[normalize_name(recipe["name"])] = recipe
+        _write_json(self.recipes_file, recipes)
+
+
+class SQLiteStorage(Storage):
+    """Per-user storage on top of the db.py helpers."""
+
+    def __init__(self, username: str):
+        self.username = username
+
+    def load_items(self):
+        import db
+
+        return [{"name": i.name, "quantity": i.quantity, "category": i.category} for i in db.get_items_db(self.username)]
+
+    def save_items(self, items):
+        import db
+
+        with db.session_scope():
+            db.clear_items_db(self.username)
+            db.add_items_db(items, self.username)
+
+    def load_history(self):
+        import db
+
+        return reversed(db.get_history_db(self.username))
+
+    def append_history(self, items, timestamp=None):
+        import db
+
+        db.add_history_db(list(items), self.username, timestamp)
+
+    def load_meals(self):
+        import db
+
+        return {date: items for date, items in db.get_meals_db(self.username)}
+
+    def save_meal(self, date, items):
+        import db
+
+        db.add_meal_db(date, list(items), self.username)
+
+    def load_recipes(self):
+        import db
+
+        return [recipe.to_dict() for recipe in db.get_recipes_db(self.username)]
+
+    def save_recipe(self, recipe):
+        import db
+
+        db.save_recipe_db(self.username, recipe["name"], recipe["ingredients"], recipe.get("servings", 1))
@@ -0,0 +1,293 @@
+# smart_grocery/suggestions.py
+"""Suggestion scoring shared by the CLI and the database-backed apps.
+
+Items are ranked by a blend of three signals:
+
+* exponentially time-decayed purchase frequency,
+* purchase-interval prediction ("you buy milk every 6 days, it's due"),
+* co-occurrence with items already on the current list.
+
+All state is kept as small per-item aggregates that are updated one basket at a
+time, so scoring never has to replay history.
+"""
+import heapq
+import math
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from .canonical import AutocompleteIndex, Canonicalizer, canonical_name
+
+HALF_LIFE_DAYS = 90.0
+INTERVAL_SMOOTHING = 0.3  # EWMA weight given to the newest purchase gap
+WEIGHTS = {"frequency": 0.3, "due": 0.5, "co_purchase": 0.2}
+# Larger baskets (bulk imports, pantry restocks) say little about what goes
+# together and would add O(n^2) pairs, so they are left out of co-occurrence
+MAX_COOCCURRENCE_BASKET = 50
+RANKING_SIZE = 100  # Items kept by SuggestionModel.rank; the co-purchase signal can reorder these
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_days(timestamp) -> float:
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.replace(tzinfo=None) - timestamp.utcoffset()
+        return (timestamp - _EPOCH).total_seconds() / 86400.0
+    return float(timestamp)
+
+
+class ItemStats:
+    __slots__ = ("name", "baskets", "decayed", "decayed_at", "last_purchased", "interval")
+
+    def __init__(self, name, baskets=0, decayed=0.0, decayed_at=None, last_purchased=None, interval=None):
+        self.name = name
+        self.baskets = baskets  # Number of baskets containing the item
+        self.decayed = decayed  # Decayed basket count as of decayed_at (days)
+        self.decayed_at = decayed_at
+        self.last_purchased = last_purchased  # Days
+        self.interval = interval  # Smoothed days between purchases
+
+    def observe(self, day: float, half_life: float = HALF_LIFE_DAYS):
+        if self.decayed_at is None:
+            self.decayed, self.decayed_at = 1.0, day
+        elif day >= self.decayed_at:
+            self.decayed = self.decayed * 0.5 ** ((day - self.decayed_at) / half_life) + 1.0
+            self.decayed_at = day
+        else:
+            # Late-arriving basket: decay its contribution instead of the total
+            self.decayed += 0.5 ** ((self.decayed_at - day) / half_life)
+        if self.last_purchased is not None and day > self.last_purchased:
+            gap = day - self.last_purchased
+            self.interval = gap if self.interval is None else (
+                INTERVAL_SMOOTHING * gap + (1 - INTERVAL_SMOOTHING) * self.interval
+            )
+        if self.last_purchased is None or day > self.last_purchased:
+            self.last_purchased = day
+        self.baskets += 1
+
+    def frequency_at(self, day: float, half_life: float = HALF_LIFE_DAYS) -> float:
+        if self.decayed_at is None:
+            return 0.0
+        return self.decayed * 0.5 ** (max(day - self.decayed_at, 0.0) / half_life)
+
+    def due_ratio(self, day: float) -> Optional[float]:
+        """Elapsed time since the last purchase as a fraction of the usual interval."""
+        if not self.interval or self.last_purchased is None:
+            return None
+        return (day - self.last_purchased) / self.interval
+
+
+class Suggestion(NamedTuple):
+    name: str
+    score: float
+    reason: str
+    due_in_days: Optional[float] = None
+
+
+class RankedItem(NamedTuple):
+    name: str
+    frequency: float  # Weighted frequency and due parts of the score
+    due: float
+    reason: str  # Why, when the co-purchase signal does not win
+    due_in_days: Optional[float] = None
+
+
+def _due_score(ratio: Optional[float]) -> float:
+    if ratio is None:
+        return 0.0
+    if ratio <= 1.0:
+        return max(ratio, 0.0)
+    # Long-overdue items fade out; the habit has probably changed
+    return max(0.0, 1.0 - (ratio - 1.0) / 3.0)
+
+
+class SuggestionModel:
+    def __init__(self, half_life_days: float = HALF_LIFE_DAYS, weights: Optional[Dict[str, float]] = None):
+        self.half_life = half_life_days
+        self.weights = dict(WEIGHTS, **(weights or {}))
+        self.items: Dict[str, ItemStats] = {}
+        # Sparse symmetric counts: cooccurrence[a][b] = baskets containing both a and b
+        self.cooccurrence: Dict[str, Dict[str, int]] = {}
+        self._clock = None
+
+    def add_basket(self, names: Iterable[str], timestamp=None):
+        """Record one purchase. Baskets without a timestamp are spaced one day apart."""
+        if timestamp is None:
+            day = 0.0 if self._clock is None else self._clock + 1.0
+        else:
+            day = to_days(timestamp)
+        self._clock = day if self._clock is None else max(self._clock, day)
+        basket = {canonical_name(n) for n in names}
+        basket.discard("")
+        for name in basket:
+            stats = self.items.get(name)
+            if stats is None:
+                stats = self.items[name] = ItemStats(name)
+            stats.observe(day, self.half_life)
+        if len(basket) > MAX_COOCCURRENCE_BASKET:
+            return
+        for name in basket:
+            row = self.cooccurrence.setdefault(name, {})
+            for other in basket:
+                if other != name:
+                    row[other] = row.get(other, 0) + 1
+
+    @classmethod
+    def from_history(cls, baskets, **kwargs) -> "SuggestionModel":
+        """Build a model from ``(timestamp, items)`` pairs or bare item lists, oldest first."""
+        model = cls(**kwargs)
+        for basket in baskets:
+            if isinstance(basket, tuple):
+                timestamp, items = basket
+            else:
+                timestamp, items = None, basket
+            model.add_basket((i["name"] if isinstance(i, dict) else i for i in items), timestamp)
+        return model
+
+    @classmethod
+    def from_aggregates(cls, items: Iterable[ItemStats], cooccurrence: Dict[str, Dict[str, int]], **kwargs):
+        """Build a model from persisted per-item stats and co-occurrence rows."""
+        model = cls(**kwargs)
+        model.items = {stats.name: stats for stats in items}
+        model.cooccurrence = cooccurrence
+        return model
+
+    def suggest(self, top_n: int = 5, now=None, current: Iterable[str] = ()) -> List[Suggestion]:
+        current = {canonical_name(n) for n in current}
+        return [Suggestion(name, total, self._reason(name, parts, stats, due_in, current), due_in)
+                for total, name, parts, stats, due_in in self._top(top_n, now, current)]
+
+    def rank(self, limit: int = RANKING_SIZE, now=None) -> List["RankedItem"]:
+        """The top ``limit`` items scored without the co-purchase signal, to be stored and finished by ``rerank``."""
+        return [RankedItem(name, parts["frequency"], parts["due"], self._reason(name, parts, stats, due_in, set()),
+                           due_in)
+                for _, name, parts, stats, due_in in self._top(limit, now, set())]
+
+    def _top(self, top_n, now, current):
+        if not self.items:
+            return []
+        if now is None:
+            day = self._clock if self._clock is not None else to_days(datetime.now(timezone.utc))
+        else:
+            day = to_days(now)
+        anchors = [(self.cooccurrence.get(c, {}), self.items[c].baskets) for c in current if c in self.items]
+        half_life = self.half_life
+        frequencies = {name: stats.frequency_at(day, half_life) for name, stats in self.items.items()}
+        peak = max(frequencies.values()) or 1.0
+        w_freq, w_due, w_co = self.weights["frequency"], self.weights["due"], self.weights["co_purchase"]
+
+        def co_share(name):
+            # Strongest P(name | anchor) over the items already on the list
+            best = 0.0
+            for row, anchor_baskets in anchors:
+                together = row.get(name)
+                if together and together / anchor_baskets > best:
+                    best = together / anchor_baskets
+            return best
+
+        # Hot loop over every known item: plain floats here, breakdowns only for the top N
+        totals = []
+        for name, stats in self.items.items():
+            if name in current:
+                continue
+            total = w_freq * frequencies[name] / peak
+            if stats.interval:
+                total += w_due * _due_score((day - stats.last_purchased) / stats.interval)
+            if anchors:
+                total += w_co * co_share(name)
+            totals.append((total, name))
+
+        top = []
+        for total, name in heapq.nlargest(top_n, totals):
+            stats = self.items[name]
+            ratio = stats.due_ratio(day)
+            due_in = None if ratio is None else stats.interval - (day - stats.last_purchased)
+            parts = {
+                "frequency": w_freq * frequencies[name] / peak,
+                "due": w_due * _due_score(ratio),
+                "co_purchase": w_co * co_share(name),
+            }
+            top.append((total, name, parts, stats, due_in))
+        return top
+
+    def _reason(self, name, parts, stats, due_in, current):
+        # Ties go to the more specific explanation
+        signal = max(("due", "co_purchase", "frequency"), key=parts.get)
+        if signal == "due" and due_in is not None:
+            every = f"you buy it every {stats.interval:.0f} days"
+            if due_in <= 0.5:
+                return f"{every}, it's due"
+            return f"{every}, due in {math.ceil(due_in)} days"
+        if signal == "co_purchase":
+            partner = max(current & self.cooccurrence.get(name, {}).keys(),
+                          key=lambda c: self.cooccurrence[name][c] / self.items[c].baskets)
+            return f"often bought with {partner.title()}"
+        return f"bought in {stats.baskets} list{'s' if stats.baskets != 1 else ''}"
+
+
+def rerank(ranked: Iterable[RankedItem], current: Iterable[str], cooccurrence: Dict[str, Dict[str, int]],
+           baskets: Dict[str, int], top_n: int = 5, weights: Optional[Dict[str, float]] = None) -> List[Suggestion]:
+    """Finish a stored ``SuggestionModel.rank`` for the items on the list, as ``suggest`` would.
+
+    ``cooccurrence[c][name]`` and ``baskets[c]`` are needed for the items ``c``
+    in ``current``. Only ranked items can be suggested, so an item outside
+    the stored ranking that only the co-purchase signal would lift is missed.
+    """
+    w_co = dict(WEIGHTS, **(weights or {}))["co_purchase"]
+    current = {canonical_name(n) for n in current}
+    scored = []
+    for item in ranked:
+        if item.name in current:
+            continue
+        partner, share = None, 0.0
+        for anchor in current:
+            together = cooccurrence.get(anchor, {}).get(item.name)
+            if together and baskets.get(anchor) and together / baskets[anchor] > share:
+                partner, share = anchor, together / baskets[anchor]
+        co = w_co * share
+        # Same tie order as SuggestionModel._reason: due, then co-purchase, then frequency
+        reason = item.reason
+        if partner is not None and co > item.due and co >= item.frequency:
+            reason = f"often bought with {partner.title()}"
+        scored.append((item.frequency + item.due + co, item.name, reason, item.due_in_days))
+    return [Suggestion(name, total, reason, due_in) for total, name, reason, due_in in heapq.nlargest(top_n, scored)]
+
+
+class SuggestionEngine:
+    def __init__(self, history_manager):
+        self.history_manager = history_manager
+        self._model = None
+        self._canonicalizer = None
+
+    @property
+    def model(self) -> SuggestionModel:
+        # Replay the journal once, then stay current through save notifications
+        if self._model is None:
+            self._model = SuggestionModel.from_history(self.history_manager.load_records())
+            self.history_manager.subscribe(
+                lambda timestamp, items: self._model.add_basket((i["name"] for i in items), timestamp)
+            )
+        return self._model
+
+    @property
+    def canonicalizer(self) -> Canonicalizer:
+        """Typo correction against every item name in the history, weighted by purchase count."""
+        if self._canonicalizer is None:
+            vocabulary = AutocompleteIndex((name, stats.baskets) for name, stats in self.model.items.items())
+            self._canonicalizer = Canonicalizer(vocabulary)
+            self.history_manager.subscribe(self._learn)
+        return self._canonicalizer
+
+    def _learn(self, timestamp, items):
+        for name in {canonical_name(i["name"]): i["name"] for i in items}.values():
+            self._canonicalizer.learn(name)
+
+    def suggest_items(self, top_n=5, grocery_list=None):
+        current = [item.name for item in grocery_list] if grocery_list else []
+        suggestions = self.model.suggest(top_n, current=current)
+        if not suggestions:
+            print("No suggestions available yet. Add and save some lists first.")
+            return
+        print(f"Top {top_n} suggested items:")
+        for suggestion in suggestions:
+            print(f"  {suggestion.name.title()} ({suggestion.reason})")
@@ -0,0 +1,250 @@
+# smart_grocery/transfer.py
+"""Streaming import/export of grocery rows as CSV, JSON Lines or Parquet.
+
+Rows are read, validated and handed to a sink in chunks, so memory stays
+bounded by ``chunk_size`` regardless of file size. A sink is any callable that
+takes a list of ``{"name", "quantity", "category"}`` dicts, e.g.
+``list_sink(grocery_list)`` or a wrapper around ``db.add_items_db``.
+Parquet needs the optional ``pyarrow`` package.
+"""
+import csv
+import io
+import json
+import os
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from .models import GroceryItem, GroceryList
+
+FORMATS = ("csv", "jsonl", "parquet")
+CHUNK_SIZE = 1000
+ITEM_COLUMNS = ("name", "quantity", "category")
+_EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl", ".parquet": "parquet"}
+
+Progress = Callable[[int, int], None]  # (rows processed, error rows so far)
+
+
+class ImportReport:
+    def __init__(self):
+        self.imported = 0
+        self.errors = []  # (row number, message, raw row)
+
+    def add_error(self, row_number, message, raw):
+        self.errors.append((row_number, message, raw))
+
+    def __str__(self):
+        return f"{self.imported} rows imported, {len(self.errors)} rejected"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet support needs the optional 'pyarrow' package (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _binary(source):
+    """Open a path, or rewind an already-open binary stream (e.g. a Streamlit upload)."""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb"), True
+    source.seek(0)
+    return source, False
+
+
+def detect_format(source, filename: Optional[str] = None) -> str:
+    """Pick a format from the file extension, falling back to sniffing the first bytes."""
+    name = filename or (source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", ""))
+    ext = os.path.splitext(str(name))[1].lower()
+    if ext in _EXTENSIONS:
+        return _EXTENSIONS[ext]
+    stream, owned = _binary(source)
+    try:
+        head = stream.read(512)
+    finally:
+        if owned:
+            stream.close()
+        else:
+            stream.seek(0)
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head.lstrip().startswith(b"{"):
+        return "jsonl"
+    return "csv"
+
+
+def read_rows(source, fmt: Optional[str] = None) -> Iterator[dict]:
+    """Yield raw rows as dicts with lower-cased keys, one at a time."""
+    fmt = fmt or detect_format(source)
+    stream, owned = _binary(source)
+    try:
+        if fmt == "parquet":
+            pyarrow = _require_pyarrow()
+            for batch in pyarrow.parquet.ParquetFile(stream).iter_batches(batch_size=CHUNK_SIZE):
+                for row in batch.to_pylist():
+                    yield {str(k).lower(): v for k, v in row.items()}
+            return
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        try:
+            if fmt == "jsonl":
+                for line in text:
+                    if line.strip():
+                        try:
+                            row = json.loads(line)
+                        except ValueError:
+                            row = {"__error__": "invalid JSON", "__raw__": line.strip()}
+                        yield {str(k).lower(): v for k, v in row.items()} if isinstance(row, dict) else {"__raw__": row}
+            elif fmt == "csv":
+                for row in csv.DictReader(text):
+                    yield {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+            else:
+                raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+        finally:
+            text.detach()
+    finally:
+        if owned:
+            stream.close()
+
+
+def normalize_row(row: dict) -> dict:
+    """Validate one raw row; raises ValueError with a readable message."""
+    if "__error__" in row:
+        raise ValueError(row["__error__"])
+    name = str(row.get("name") or "").strip()
+    if not name:
+        raise ValueError("missing name")
+    raw_quantity = row.get("quantity")
+    try:
+        quantity = int(float(raw_quantity)) if raw_quantity not in (None, "") else 1
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid quantity {raw_quantity!r}")
+    if quantity < 1:
+        raise ValueError(f"quantity must be at least 1, got {quantity}")
+    category = str(row.get("category") or "Other").strip() or "Other"
+    return {"name": name.title(), "quantity": quantity, "category": category.title()}
+
+
+def import_items(source, sink: Callable[[List[dict]], None], fmt: Optional[str] = None,
+                 chunk_size: int = CHUNK_SIZE, progress: Optional[Progress] = None,
+                 normalize: Callable[[dict], dict] = normalize_row) -> ImportReport:
+    """Stream ``source`` into ``sink`` in validated chunks; bad rows are reported, not raised.
+
+    ``normalize`` validates one raw row (raising ValueError), e.g. for other
+    row shapes such as prices.normalize_price_row.
+    """
+    report = ImportReport()
+    chunk = []
+    row_number = 0
+    for row_number, row in enumerate(read_rows(source, fmt), 1):
+        try:
+            chunk.append(normalize(row))
+        except ValueError as e:
+            report.add_error(row_number, str(e), row.get("__raw__", row))
+        if len(chunk) >= chunk_size:
+            sink(chunk)
+            report.imported += len(chunk)
+            chunk = []
+            if progress:
+                progress(row_number, len(report.errors))
+    if chunk:
+        sink(chunk)
+        report.imported += len(chunk)
+    if progress:
+        progress(row_number, len(report.errors))
+    return report
+
+
+def list_sink(grocery_list: GroceryList) -> Callable[[List[dict]], None]:
+    def add(chunk):
+        for row in chunk:
+            grocery_list.add_item(GroceryItem(row["name"], row["quantity"], row["category"]))
+    return add
+
+
+def export_rows(rows: Iterable[dict], target, fmt: Optional[str] = None, columns=ITEM_COLUMNS,
+                chunk_size: int = CHUNK_SIZE, progress: Optional[Callable[[int], None]] = None) -> int:
+    """Write dict rows to a path or binary stream as they arrive; returns the row count."""
+    fmt = fmt or _EXTENSIONS.get(os.path.splitext(str(getattr(target, "name", target)))[1].lower(), "csv")
+    owned = isinstance(target, (str, os.PathLike))
+    stream = open(target, "wb") if owned else target
+    count = 0
+    try:
+        if fmt == "parquet":
+            pyarrow = _require_pyarrow()
+            writer = None
+            for chunk in _chunks(rows, chunk_size):
+                table = pyarrow.Table.from_pylist([{c: r.get(c) for c in columns} for r in chunk])
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(stream, table.schema)
+                writer.write_table(table)
+                count += len(chunk)
+                if progress:
+                    progress(count)
+            if writer is not None:
+                writer.close()
+            return count
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        try:
+            if fmt == "csv":
+                writer = csv.writer(text)
+                writer.writerow([c.title() for c in columns])
+            elif fmt != "jsonl":
+                raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+            for row in rows:
+                if fmt == "csv":
+                    writer.writerow([row.get(c) for c in columns])
+                else:
+                    text.write(json.dumps({c: row.get(c) for c in columns}, default=str) + "\n")
+                count += 1
+                if progress and count % chunk_size == 0:
+                    progress(count)
+            text.flush()
+        finally:
+            text.detach()
+        if progress:
+            progress(count)
+        return count
+    finally:
+        if owned:
+            stream.close()
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Exporter:
+    @staticmethod
+    def export_to_csv(grocery_list: GroceryList, filename: str = "grocery_list.csv"):
+        Exporter.export(grocery_list, filename, "csv")
+
+    @staticmethod
+    def export(grocery_list: GroceryList, filename: str, fmt: Optional[str] = None,
+               progress: Optional[Callable[[int], None]] = None):
+        count = export_rows((item.to_dict() for item in grocery_list), filename, fmt, progress=progress)
+        print(f"Grocery list exported to {filename} ({count} items).")
+
+
+class Importer:
+    @staticmethod
+    def import_from_csv(grocery_list: GroceryList, filename: str = "grocery_list.csv"):
+        return Importer.import_file(grocery_list, filename, "csv")
+
+    @staticmethod
+    def import_file(grocery_list: GroceryList, filename: str, fmt: Optional[str] = None,
+                    progress: Optional[Progress] = None) -> Optional[ImportReport]:
+        if not os.path.exists(filename):
+            print(f"File {filename} does not exist.")
+            return None
+        report = import_items(filename, list_sink(grocery_list), fmt, progress=progress)
+        if progress:
+            print()
+        print(f"Grocery list imported from {filename}: {report}.")
+        return report
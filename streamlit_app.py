@@ -1,29 +1,329 @@
 import streamlit as st
-from grocery import GroceryList, GroceryItem
+from smart_grocery.models import GroceryList, GroceryItem
+from smart_grocery import metrics, transfer
+from smart_grocery.images import ImageStore, is_digest
+from smart_grocery.optimizer import Optimizer, load_layouts
+from smart_grocery.recipes import Ingredient
+import io
+import json
 import os
-from db import (add_history_db, get_history_db, add_meal_db, get_meals_db, get_suggestions_db, add_item_db, get_items_db, clear_items_db, get_session, MealPlanDB)
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from db import (add_history_db, get_history_db, add_meal_db, get_meals_db, get_suggestions_db, add_item_db, get_items_db, clear_items_db,
+                update_item_db, delete_item_db, delete_items_db, save_list_to_history_db, get_items_page_db, search_items_db, count_items_db, get_item_names_db, get_item_totals_db, get_period_totals_db, get_category_totals_db,
+                get_restock_cadence_db, get_ranked_suggestions_db, add_items_db, iter_items_db, iter_history_lines_db,
+                save_recipe_db, get_recipes_db, delete_recipe_db, expand_meal_plan_db, add_meal_plan_to_list_db,
+                get_aliases_db, set_alias_db, delete_alias_db, autocomplete_db, get_list_version_db, VersionConflict,
+                check_out_items_db, get_pantry_db, set_pantry_item_db, get_pantry_proposals_db, add_pantry_proposals_to_list_db,
+                get_job_db, get_job_stats_db, get_price_stores_db, plan_budget_db, get_spend_db)
+import jobs
 import streamlit_authenticator as stauth
 import matplotlib.pyplot as plt
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
 import streamlit.components.v1 as components
 
-hashed_passwords = stauth.Hasher(['password1', 'password2']).generate()
+# Cached reads are keyed by (username, generation); every write bumps the user's
+# generation so the next rerun misses. The generation includes the list version
+# from the database, so item changes made elsewhere (other tabs, the API) miss
+# too; the TTL bounds staleness of everything else.
+CACHE_TTL_SECONDS = 60
+LIVE_REFRESH_SECONDS = 3
+CACHE_MAX_ENTRIES = 256
+CREDENTIALS_FILE = os.environ.get("GROCERY_CREDENTIALS_FILE", "credentials.json")
+DEMO_USERS = {'user1': ('User One', 'password1'), 'user2': ('User Two', 'password2')}
+
+_run_timings = []
+
+@contextmanager
+def timed(section):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _run_timings.append((section, elapsed * 1000))
+        metrics.observe(metrics.STREAMLIT_SECTION, elapsed, section=section)
+
+# A run that ended early (st.stop, st.rerun) never reached the debug panel to stop its profiler
+if st.session_state.get("_profile") is not None:
+    st.session_state.pop("_profile").stop()
+if metrics.should_profile(st.session_state.get("profile_runs", False)):
+    st.session_state["_profile"] = metrics.Profile("streamlit-run").start()
+
+@st.cache_resource
+def load_credentials():
+    """Pre-hashed credentials, read (or for the demo users, bcrypt-hashed) once per process.
+
+    ``credentials.json`` holds ``{"usernames": {"<user>": {"name": ..., "password": "<bcrypt hash>"}}}``.
+    """
+    if os.path.exists(CREDENTIALS_FILE):
+        with open(CREDENTIALS_FILE) as f:
+            return json.load(f)
+    hashed = stauth.Hasher([password for _, password in DEMO_USERS.values()]).generate()
+    return {'usernames': {user: {'name': display, 'password': h}
+                          for (user, (display, _)), h in zip(DEMO_USERS.items(), hashed)}}
+
+@st.cache_resource
+def image_store():
+    return ImageStore()
+
+def show_item_image(image_path, width=60):
+    if is_digest(image_path):
+        thumbnail = image_store().thumbnail(image_path, width)
+        if thumbnail:
+            st.image(thumbnail, width=width)
+    elif image_path and os.path.exists(image_path):
+        # Legacy file path; `python db.py import-images` moves these into the store
+        st.image(image_path, width=width)
+
+@st.cache_resource
+def _generations():
+    return {}, threading.Lock()
+
+def data_generation(username):
+    generations, _ = _generations()
+    return generations.get(username, 0), get_list_version_db(username)
+
+def invalidate(username):
+    """Call after every write for ``username`` so cached reads are refetched."""
+    generations, lock = _generations()
+    with lock:
+        generations[username] = generations.get(username, 0) + 1
+
+def edit_item(item, username, **fields):
+    """Save an edit unless the item changed since this page was drawn; returns whether it was saved."""
+    try:
+        saved = update_item_db(item.id, username, expected_version=item.version, **fields) is not None
+    except VersionConflict:
+        saved = False
+    invalidate(username)
+    if not saved:
+        st.session_state["item_conflict"] = f"{item.name} was changed or removed elsewhere, so your edit was not saved."
+    return saved
+
+def remove_item(item, username):
+    try:
+        delete_item_db(item.id, username, expected_version=item.version)
+    except VersionConflict:
+        st.session_state["item_conflict"] = f"{item.name} was changed elsewhere, so it was not deleted."
+    invalidate(username)
+
+LIST_PAGE_SIZE = 25
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_item_page(username, generation, prefix, cursor):
+    if prefix:
+        return search_items_db(username, prefix, LIST_PAGE_SIZE, cursor)
+    return get_items_page_db(username, LIST_PAGE_SIZE, cursor)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_item_count(username, generation, prefix):
+    return count_items_db(username, prefix)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_item_names(username, generation):
+    return tuple(get_item_names_db(username))
+
+def item_pager(key, username, prefix=""):
+    """Render prev/next controls and return ``(page of items, total)`` for one list widget.
+
+    Pages are keyset cursors kept as a stack in session state, so only one page
+    of rows is ever loaded or drawn, however long the list is.
+    """
+    state = st.session_state.setdefault(f"{key}_pager", {"prefix": prefix, "cursors": [None]})
+    if state["prefix"] != prefix:
+        state.update(prefix=prefix, cursors=[None])
+    generation = data_generation(username)
+    items, next_cursor = cached_item_page(username, generation, prefix, state["cursors"][-1])
+    while not items and len(state["cursors"]) > 1:
+        # The page was emptied by deletes; step back
+        state["cursors"].pop()
+        items, next_cursor = cached_item_page(username, generation, prefix, state["cursors"][-1])
+    total = cached_item_count(username, generation, prefix)
+    page = len(state["cursors"])
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    with col_prev:
+        if st.button("◀ Prev", key=f"{key}_prev", disabled=page == 1):
+            state["cursors"].pop()
+            st.rerun()
+    with col_info:
+        st.caption(f"Page {page} of {max(1, -(-total // LIST_PAGE_SIZE))} · {total} items")
+    with col_next:
+        if st.button("Next ▶", key=f"{key}_next", disabled=next_cursor is None):
+            state["cursors"].append(next_cursor)
+            st.rerun()
+    return items, total
+
+@st.cache_resource
+def job_worker():
+    """One background job worker per server process, shared by every session."""
+    return jobs.start_worker()
+
+@st.cache_resource
+def store_optimizers():
+    """One Optimizer per store layout; each keeps its own route cache across sessions."""
+    return {name: Optimizer(layout) for name, layout in load_layouts().items()}
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_route(username, generation, store):
+    return store_optimizers()[store].plan(get_items_db(username))
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_history(username, generation):
+    return get_history_db(username)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_suggestions(username, generation, current):
+    return get_ranked_suggestions_db(username, current=list(current))
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_aliases(username, generation):
+    return get_aliases_db(username)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_meals(username, generation):
+    return sorted(get_meals_db(username))
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_recipes(username, generation):
+    return get_recipes_db(username)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_meal_expansion(username, generation, start, end, servings):
+    return expand_meal_plan_db(username, start, end, servings=servings)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_pantry(username, generation):
+    return get_pantry_db(username)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_pantry_proposals(username, generation, days):
+    return get_pantry_proposals_db(username, days)
+
+# The price catalog is shared by every user; imports by others show up within the TTL
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_price_stores(generation):
+    return get_price_stores_db()
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_budget_plan(username, generation, budget, max_stores, store_cost):
+    return plan_budget_db(username, budget, max_stores, store_cost)
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_spend(username, generation, grain, store):
+    return get_spend_db(username, grain, store=store)
+
+RECIPE_UNITS = ["", "g", "kg", "ml", "l", "tsp", "tbsp", "cup", "oz", "lb", "can", "bunch"]
+
+def meal_planner_ui(username):
+    """Plan meals, keep recipes, and turn a date range of meals into list items."""
+    generation = data_generation(username)
+    recipes = cached_recipes(username, generation)
+    tab_plan, tab_shop, tab_recipes = st.tabs(["Plan", "Shopping list", "Recipes"])
+
+    with tab_plan:
+        with st.form("meal_form", clear_on_submit=True):
+            meal_date = st.date_input("Date", value=datetime.now().date())
+            chosen = st.multiselect("Recipes", [r.name for r in recipes])
+            extra = st.text_input("Other items (comma separated)")
+            if st.form_submit_button("Plan meal"):
+                entries = chosen + [i.strip().title() for i in extra.split(",") if i.strip()]
+                if entries:
+                    add_meal_db(meal_date.isoformat(), entries, username)
+                    invalidate(username)
+                    st.success(f"Planned {len(entries)} entries for {meal_date}.")
+                else:
+                    st.warning("Pick a recipe or enter an item.")
+        meals = cached_meals(username, generation)
+        if meals:
+            st.dataframe(pd.DataFrame([{"date": d, "meal": ", ".join(items)} for d, items in meals]), hide_index=True)
+        else:
+            st.info("No meals planned yet.")
+
+    with tab_shop:
+        today = datetime.now().date()
+        col_start, col_end, col_servings = st.columns(3)
+        start = col_start.date_input("From", value=today, key="meal_shop_start")
+        end = col_end.date_input("To", value=today + timedelta(days=6), key="meal_shop_end")
+        servings = col_servings.number_input("Servings (0 = as written)", min_value=0, value=0, step=1,
+                                             key="meal_shop_servings") or None
+        expansion = cached_meal_expansion(username, generation, start.isoformat(), end.isoformat(), servings)
+        needed = expansion.requirements()
+        st.caption(f"{expansion.meals} planned entries · {len(needed)} items to buy · "
+                   f"{len(expansion.covered)} already on your list")
+        if needed:
+            st.dataframe(pd.DataFrame([{"item": r.name, "category": r.category, "need": r.label(),
+                                        "add to list": r.quantity} for r in needed]), hide_index=True)
+            if st.button("Add to grocery list", key="meal_shop_add"):
+                add_meal_plan_to_list_db(username, start.isoformat(), end.isoformat(), servings)
+                invalidate(username)
+                st.success(f"Added {len(needed)} items.")
+                st.rerun()
+        if expansion.unknown:
+            st.caption("Not recipes, added as plain items: " + ", ".join(sorted(set(expansion.unknown))))
+
+    with tab_recipes:
+        with st.form("recipe_form", clear_on_submit=True):
+            recipe_name = st.text_input("Recipe name")
+            recipe_servings = st.number_input("Servings", min_value=1, value=2, step=1)
+            rows = st.data_editor(
+                pd.DataFrame({"ingredient": [""] * 5, "amount": [1.0] * 5, "unit": [""] * 5, "category": ["Other"] * 5}),
+                column_config={"unit": st.column_config.SelectboxColumn("unit", options=RECIPE_UNITS)},
+                num_rows="dynamic", hide_index=True, key="recipe_rows",
+            )
+            if st.form_submit_button("Save recipe"):
+                ingredients = [
+                    Ingredient(row["ingredient"], float(row["amount"]) if pd.notna(row["amount"]) else 1.0,
+                               row["unit"] or "", row["category"] or "Other")
+                    for row in rows.to_dict("records") if str(row["ingredient"] or "").strip()
+                ]
+                try:
+                    if not recipe_name.strip():
+                        raise ValueError("a recipe needs a name")
+                    save_recipe_db(username, recipe_name, ingredients, recipe_servings)
+                except ValueError as e:
+                    st.error(f"Recipe not saved: {e}")
+                else:
+                    invalidate(username)
+                    st.success(f"Saved {recipe_name.strip().title()}.")
+        for recipe in recipes:
+            col_info, col_delete = st.columns([5, 1])
+            col_info.markdown(f"**{recipe.name}** (serves {recipe.servings}): " + ", ".join(
+                f"{i.name} {i.amount:g} {i.unit}".rstrip() for i in recipe.ingredients))
+            if col_delete.button("Delete", key=f"delete_recipe_{recipe.name}"):
+                delete_recipe_db(username, recipe.name)
+                invalidate(username)
+                st.rerun()
+
+# Dashboard window -> (days back or None for all time, rollup grain for trends)
+ANALYTICS_WINDOWS = {
+    "Last 30 days": (30, "day"),
+    "Last 90 days": (90, "week"),
+    "Last 12 months": (365, "week"),
+    "All time": (None, "month"),
+}
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_analytics(username, generation, window):
+    """Everything the dashboard draws for one window, read from the purchase rollups."""
+    days, grain = ANALYTICS_WINDOWS[window]
+    since = datetime.now() - timedelta(days=days) if days else None
+    return {
+        'grain': grain,
+        'top_items': get_item_totals_db(username, top_n=10, since=since),
+        'trend': get_period_totals_db(username, grain, since),
+        'categories': get_category_totals_db(username, grain, since),
+        'cadence': get_restock_cadence_db(username, since),
+    }
 
 config = {
-    'credentials': {
-        'usernames': {
-            'user1': {
-                'name': 'User One',
-                'password': hashed_passwords[0]
-            },
-            'user2': {
-                'name': 'User Two',
-                'password': hashed_passwords[1]
-            }
-        }
-    },
+    'credentials': load_credentials(),
     'cookie': {
         'expiry_days': 1,
         'key': 'some_signature_key',
@@ -42,7 +342,8 @@ authenticator = stauth.Authenticate(
     config['preauthorized']
 )
 
-name, authentication_status, username = authenticator.login('Login', 'main')
+with timed("Login"):
+    name, authentication_status, username = authenticator.login('Login', 'main')
 
 st.set_page_config(page_title="Smart Grocery List Generator", page_icon="🛒", layout="wide")
 
@@ -140,28 +441,83 @@ else:
         category = st.text_input("Category", value="Other")
         image_file = st.file_uploader("Upload item image (optional)", type=["png", "jpg", "jpeg"], key="add_image")
         submitted = st.form_submit_button("Add Item")
-        image_path = None
-        if image_file is not None:
-            img_dir = f"item_images/{username}"
-            os.makedirs(img_dir, exist_ok=True)
-            image_path = os.path.join(img_dir, image_file.name)
-            with open(image_path, "wb") as f:
-                f.write(image_file.read())
         if submitted and name_input:
-            add_item_db(name_input, quantity, category, username, image_path)
-            st.success(f"Added {name_input}")
+            image_path = None
+            try:
+                if image_file is not None:
+                    image_path = image_store().put(image_file)
+            except ValueError as e:
+                st.error(f"Image not saved: {e}")
+            else:
+                resolution, _ = autocomplete_db(username, name_input, 1)
+                if resolution.how == "typo":
+                    # Filed under the near match only if the user says so below
+                    st.session_state["pending_add"] = (name_input, quantity, category, image_path, resolution.key)
+                else:
+                    add_item_db(name_input, quantity, category, username, image_path)
+                    invalidate(username)
+                    if resolution.how == "alias":
+                        st.success(f"Added {name_input} as {resolution.key.title()}")
+                    else:
+                        st.success(f"Added {name_input}")
+    if "pending_add" in st.session_state:
+        typed, pending_quantity, pending_category, pending_image, near = st.session_state["pending_add"]
+        st.warning(f"Did you mean **{near.title()}**?")
+        col_yes, col_no = st.columns(2)
+        accepted = col_yes.button(f"Yes, add {near.title()}", key="typo_yes")
+        rejected = col_no.button(f"No, add {typed}", key="typo_no")
+        if accepted or rejected:
+            if accepted:
+                # Remembered as a typo alias, which can be deleted under Item names
+                set_alias_db(username, typed, near, source="typo")
+            add_item_db(near.title() if accepted else typed, pending_quantity, pending_category, username,
+                        pending_image)
+            del st.session_state["pending_add"]
+            invalidate(username)
+            st.rerun()
 
-    with st.expander("Grocery List (Database)", expanded=True):
-        db_items = get_items_db(username)
-        search = st.text_input("🔍 Search items", key="search_items")
-        filtered_items = [item for item in db_items if search.lower() in item.name.lower()] if db_items else []
+    with st.expander("Item names", expanded=False), timed("Item names"):
+        lookup = st.text_input("Look up an item", key="item_lookup").strip()
+        if lookup:
+            resolution, completions = autocomplete_db(username, lookup, 10)
+            if resolution.how == "typo":
+                st.info(f"Did you mean **{resolution.key.title()}**? Adding {lookup} asks before filing it there.")
+            elif resolution.how == "alias":
+                st.info(f"Adding {lookup} files it under **{resolution.key.title()}**.")
+            for completion in completions:
+                st.write(completion.name if not completion.distance else f"{completion.name} (spelling)")
+        aliases = cached_aliases(username, data_generation(username))
+        for alias, canonical, source in aliases:
+            col1, col2 = st.columns([5, 1])
+            col1.write(f"{alias.title()} → {canonical.title()}" + (" (typo fix)" if source == "typo" else ""))
+            if col2.button("🗑️", key=f"alias_{alias}", help="Stop treating these as the same item"):
+                delete_alias_db(username, alias)
+                invalidate(username)
+                st.rerun()
+        with st.form("alias_form", clear_on_submit=True):
+            alias_name = st.text_input("Also call it", placeholder="aubergine")
+            alias_target = st.text_input("Same item as", placeholder="eggplant")
+            if st.form_submit_button("Add alias") and alias_name and alias_target:
+                try:
+                    set_alias_db(username, alias_name, alias_target)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    invalidate(username)
+                    st.success(f"{alias_name.title()} is now filed under {alias_target.title()}")
+
+    with st.expander("Grocery List (Database)", expanded=True), timed("Grocery list"):
+        if "item_conflict" in st.session_state:
+            st.warning(st.session_state.pop("item_conflict") + " The list below is up to date.")
+        search = st.text_input("🔍 Search items (name starts with)", key="search_items").strip()
+        filtered_items, _ = item_pager("grocery_list", username, search)
         if filtered_items:
             for idx, item in enumerate(filtered_items):
                 with st.container():
                     col_img, col_info, col_edit, col_del = st.columns([1,4,1,1])
                     with col_img:
                         if getattr(item, 'image_path', None):
-                            st.image(item.image_path, width=60, output_format="auto", use_column_width=False)
+                            show_item_image(item.image_path)
                     with col_info:
                         badge_color = globals().get('CATEGORY_COLORS', {}).get(item.category, "#b0bec5")
                         st.markdown(f"**{item.name}**  <span class='category-badge' style='background:{badge_color};'>{item.category}</span>  ", unsafe_allow_html=True)
@@ -174,35 +530,36 @@ else:
                                 new_category = st.text_input("Category", value=item.category)
                                 submitted = st.form_submit_button("Save Changes")
                                 if submitted:
-                                    item.name = new_name
-                                    item.quantity = new_quantity
-                                    item.category = new_category
-                                    session = get_session()
-                                    session.merge(item)
-                                    session.commit()
-                                    session.close()
-                                    st.success("Item updated!")
+                                    if edit_item(item, username, name=new_name, quantity=new_quantity, category=new_category):
+                                        st.success("Item updated!")
                                     st.rerun()
                     with col_del:
                         if st.button("🗑️", "Delete item", key=f"delete_grocery_{item.id}_{idx}"):
-                            session = get_session()
-                            session.delete(item)
-                            session.commit()
-                            session.close()
-                            st.success("Item deleted!")
+                            remove_item(item, username)
                             st.rerun()
         else:
             st.info("No items in the grocery list.")
 
         if st.button("Clear List (Database)"):
             clear_items_db(username)
+            invalidate(username)
             st.success("Grocery list cleared from database.")
 
         if st.button("Save to History (DB)"):
-            add_history_db([{ 'name': i.name, 'quantity': i.quantity, 'category': i.category } for i in db_items], username)
-            st.success("Grocery list saved to database history.")
+            if save_list_to_history_db(username, clear=False):
+                invalidate(username)
+                st.success("Grocery list saved to database history.")
+            else:
+                st.info("The grocery list is empty.")
+        if st.button("Save to History & Clear (DB)"):
+            if save_list_to_history_db(username):
+                invalidate(username)
+                st.session_state["checked_items"] = set()
+                st.success("Grocery list saved to history and cleared.")
+            else:
+                st.info("The grocery list is empty.")
         if st.button("Show History (DB)"):
-            history = get_history_db(username)
+            history = cached_history(username, data_generation(username))
             if not history:
                 st.info("No purchase history found in database.")
             else:
@@ -211,11 +568,27 @@ else:
                     for item in items:
                         st.write(f"- {item['name']} (x{item['quantity']}) - {item['category']}")
 
-    with st.expander("Shopping Mode", expanded=False):
+    with st.expander("Shopping Mode", expanded=False), timed("Shopping mode"):
         st.header("Shopping Mode")
-        if db_items:
+        col_store, col_order = st.columns([2, 1])
+        store = col_store.selectbox("Store", list(store_optimizers()), key="shopping_store")
+        by_route = col_order.checkbox("Walking order", value=True, key="shopping_by_route")
+        stop_of = {}
+        if by_route:
+            route = cached_route(username, data_generation(username), store)
+            stop_of = {item.id: stop.location for stop in route.stops for item in stop.items}
+            shopping_items, total = route.ordered_items(), len(stop_of)
+            if route.stops:
+                st.caption(f"{len(route.stops)} stops · about {route.distance:.0f} m · " + " → ".join(route.path))
+        else:
+            shopping_items, total = item_pager("shopping", username)
+        if shopping_items:
             checked_items = st.session_state.get("checked_items", set())
-            for idx, item in enumerate(db_items):
+            current_stop = None
+            for idx, item in enumerate(shopping_items):
+                if stop_of.get(item.id, current_stop) != current_stop:
+                    current_stop = stop_of[item.id]
+                    st.markdown(f"**{current_stop.title()}**")
                 checked = item.id in checked_items
                 col1, col2, col3 = st.columns([2,1,1])
                 with col1:
@@ -228,22 +601,12 @@ else:
                             new_category = st.text_input("Category", value=item.category)
                             submitted = st.form_submit_button("Save Changes")
                             if submitted:
-                                item.name = new_name
-                                item.quantity = new_quantity
-                                item.category = new_category
-                                session = get_session()
-                                session.merge(item)
-                                session.commit()
-                                session.close()
-                                st.success("Item updated!")
+                                if edit_item(item, username, name=new_name, quantity=new_quantity, category=new_category):
+                                    st.success("Item updated!")
                                 st.rerun()
                 with col3:
                     if st.button(f"Delete", "Delete item", key=f"delete_shopping_{item.id}_{idx}"):
-                        session = get_session()
-                        session.delete(item)
-                        session.commit()
-                        session.close()
-                        st.success("Item deleted!")
+                        remove_item(item, username)
                         st.rerun()
                 # Update checked items in session state
                 if is_checked:
@@ -255,60 +618,247 @@ else:
             st.info("No items in the grocery list.")
 
         # Progress bar for shopping completion
-        if db_items:
-            total = len(db_items)
-            checked = len(st.session_state.get("checked_items", set()))
-            percent = int((checked / total) * 100) if total else 0
+        if total:
+            checked_ids = st.session_state.get("checked_items", set())
+            checked = len(checked_ids)
+            percent = min(100, int((checked / total) * 100))
             st.progress(percent, text=f"Shopping completion: {percent}%")
             if percent == 100 and total > 0:
                 st.balloons()
+            if checked_ids and st.button(f"Check out {checked} items to the pantry"):
+                check_out_items_db(checked_ids, username)
+                invalidate(username)
+                st.session_state["checked_items"] = set()
+                st.rerun()
+
+    with st.expander("Pantry", expanded=False), timed("Pantry"):
+        st.header("Pantry")
+        pantry = cached_pantry(username, data_generation(username))
+        if pantry:
+            st.dataframe(pd.DataFrame([{"Item": e.name, "Category": e.category, "Bought": e.quantity,
+                                        "Left (est.)": round(e.remaining, 1), "Purchased": e.purchased_at.date(),
+                                        "Runs out": e.runout_at.date() if e.runout_at else None} for e in pantry]),
+                         hide_index=True)
+            col_name, col_qty, col_set = st.columns([3, 1, 1])
+            with col_name:
+                pantry_name = st.selectbox("Item", [e.name for e in pantry], key="pantry_item")
+            with col_qty:
+                pantry_qty = st.number_input("Left now", min_value=0.0, step=1.0, key="pantry_qty")
+            with col_set:
+                if st.button("Update", key="pantry_update"):
+                    set_pantry_item_db(username, pantry_name, pantry_qty)
+                    invalidate(username)
+                    st.rerun()
+        else:
+            st.info("The pantry is empty. Check out items in Shopping Mode to stock it.")
 
-    with st.expander("Meal Planner (DB)", expanded=False):
-        meal_planner_ui = globals().get('meal_planner_ui')
-        if meal_planner_ui:
-            meal_planner_ui()
+        horizon = st.slider("Running out within (days)", 1, 30, 7, key="pantry_horizon")
+        proposals = cached_pantry_proposals(username, data_generation(username), horizon)
+        if proposals:
+            for proposal in proposals:
+                source = "pantry" if proposal.in_pantry else "last purchase"
+                st.write(f"{proposal.name} (x{proposal.quantity}) runs out {proposal.runout_at:%b %d} ({source})")
+            if st.button(f"Add {len(proposals)} items to the list", key="pantry_propose"):
+                add_pantry_proposals_to_list_db(username, horizon)
+                invalidate(username)
+                st.rerun()
         else:
-            st.info("Meal planner not available.")
+            st.caption("Nothing forecast to run out. Forecasts are refreshed nightly in the background.")
+        if st.button("Refresh my forecasts", key="pantry_forecast"):
+            jobs.enqueue("forecast-pantry", username)
+            st.toast("Forecast queued; it shows here once the job has run.")
 
-    with st.expander("Suggestions (DB)", expanded=False):
+    with st.expander("Budget", expanded=False), timed("Budget"):
+        st.header("Budget")
+        price_upload = st.file_uploader("Import store prices (store, name, price and optionally date)",
+                                        type=["csv", "jsonl", "ndjson", "json", "parquet"], key="price_file")
+        if price_upload is not None and st.button("Import prices"):
+            # The spooled copy has no extension to go by, so the job gets the upload's format
+            price_format = transfer.detect_format(price_upload)
+            os.makedirs(jobs.UPLOAD_DIR, exist_ok=True)
+            fd, path = tempfile.mkstemp(suffix=".upload", dir=jobs.UPLOAD_DIR)
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(price_upload, f)
+            # One attempt: a retry would add the rows imported before a failure again
+            job = jobs.enqueue("import-prices", payload={"path": path, "fmt": price_format}, max_attempts=1)
+            st.session_state["price_job"], st.session_state["price_job_seen"] = job.id, False
+        price_job = get_job_db(st.session_state["price_job"]) if "price_job" in st.session_state else None
+        if price_job is not None and price_job.status in ("pending", "running"):
+            st.info(f"Import {price_job.status} in the background (job {price_job.id}).")
+            if st.button("Check again", key="price_job_check"):
+                st.rerun()
+        elif price_job is not None:
+            if not st.session_state["price_job_seen"]:
+                st.session_state["price_job_seen"] = True
+                invalidate(username)
+            if price_job.status == "failed":
+                st.error(f"Import failed: {price_job.last_error.strip().splitlines()[-1]}")
+            else:
+                result = json.loads(price_job.result)
+                st.success(f"{result['imported']} prices imported, {result['rejected']} rows rejected.")
+                if result["errors"]:
+                    st.dataframe(pd.DataFrame(result["errors"], columns=["row", "error"]), hide_index=True)
+
+        price_stores = cached_price_stores(data_generation(username))
+        if price_stores:
+            col_budget, col_stores, col_trip = st.columns(3)
+            with col_budget:
+                budget = st.number_input("Spending cap (0 for none)", min_value=0.0, step=5.0, key="budget_cap")
+            with col_stores:
+                max_stores = st.number_input("Stores to visit at most", min_value=1, max_value=10, value=1, key="budget_stores")
+            with col_trip:
+                store_cost = st.number_input("Cost of each extra store", min_value=0.0, step=1.0, key="budget_trip",
+                                             help="A split only pays off if it saves more than this per store")
+            plan = cached_budget_plan(username, data_generation(username), budget or None, int(max_stores), store_cost)
+            if plan.lines:
+                st.metric("Total", f"{plan.total:.2f}", help=f"At {', '.join(plan.stores)}")
+                st.dataframe(pd.DataFrame([line._asdict() for line in plan.lines]), hide_index=True)
+            if plan.dropped:
+                st.warning(f"Left out to stay within the cap: {', '.join(line.name for line in plan.dropped)}")
+            if plan.unavailable:
+                st.caption(f"No price at the chosen stores: {', '.join(plan.unavailable)}")
+            if plan.by_store:
+                st.subheader("Whole list per store")
+                st.dataframe(pd.DataFrame([t._asdict() for t in plan.by_store]), hide_index=True)
+
+            st.subheader("Spend over time")
+            col_grain, col_store = st.columns(2)
+            with col_grain:
+                grain = st.selectbox("Per", ["month", "week", "day"], key="spend_grain")
+            with col_store:
+                spend_store = st.selectbox("Priced at", ["Average of stores"] + [store for store, _ in price_stores], key="spend_store")
+            spend = cached_spend(username, data_generation(username), grain,
+                                 None if spend_store == "Average of stores" else spend_store)
+            if spend:
+                st.line_chart(pd.Series([total for _, total, _ in spend], index=pd.to_datetime([p for p, _, _ in spend]), name="spend"))
+                unpriced = sum(n for _, _, n in spend)
+                if unpriced:
+                    st.caption(f"{unpriced} items bought had no price yet and are not counted.")
+            else:
+                st.info("No purchase history to estimate spend from.")
+        else:
+            st.info("No store prices yet. Import a price list to plan against a budget.")
+
+    with st.expander("Import / Export", expanded=False), timed("Import / export"):
+        st.header("Import / Export")
+        upload = st.file_uploader("Import items (CSV, JSON Lines or Parquet)", type=["csv", "jsonl", "ndjson", "json", "parquet"], key="import_file")
+        if upload is not None and st.button("Import into list"):
+            import_bar = st.progress(0, text="Importing...")
+            total = max(upload.size, 1)
+
+            def show_import_progress(done, errors):
+                fraction = min(upload.tell() / total, 1.0)
+                import_bar.progress(fraction, text=f"{done} rows read, {errors} rejected")
+
+            try:
+                report = transfer.import_items(upload, lambda chunk: add_items_db(chunk, username), progress=show_import_progress)
+            except (ImportError, ValueError) as e:
+                st.error(f"Import failed: {e}")
+            else:
+                invalidate(username)
+                import_bar.progress(1.0, text=str(report))
+                st.success(f"Imported {report.imported} items.")
+                if report.errors:
+                    st.warning(f"{len(report.errors)} rows were rejected.")
+                    st.dataframe(pd.DataFrame([{"row": n, "error": msg, "data": str(raw)} for n, msg, raw in report.errors[:1000]]))
+
+        export_what = st.selectbox("Export", ["Grocery list", "Purchase history"], key="export_what")
+        export_format = st.selectbox("Format", list(transfer.FORMATS), key="export_format")
+        if st.button("Prepare export"):
+            buffer = io.BytesIO()
+            try:
+                if export_what == "Purchase history":
+                    count = transfer.export_rows(iter_history_lines_db(username), buffer, export_format, columns=("timestamp",) + transfer.ITEM_COLUMNS)
+                else:
+                    count = transfer.export_rows(iter_items_db(username), buffer, export_format)
+            except (ImportError, ValueError) as e:
+                st.error(f"Export failed: {e}")
+            else:
+                stem = "history" if export_what == "Purchase history" else "grocery_list"
+                st.download_button(f"Download {count} rows", buffer.getvalue(), file_name=f"{stem}.{export_format}")
+
+    with st.expander("Meal Planner (DB)", expanded=False), timed("Meal planner"):
+        meal_planner_ui(username)
+
+    with st.expander("Suggestions (DB)", expanded=False), timed("Suggestions"):
         st.header("Suggestions (DB)")
-        suggestions = get_suggestions_db(username)
+        suggestions = cached_suggestions(username, data_generation(username), cached_item_names(username, data_generation(username)))
         if suggestions:
-            for item, count in suggestions:
-                st.write(f"{item.title()} (added {count} times)")
+            for suggestion in suggestions:
+                st.write(f"{suggestion.name.title()} ({suggestion.reason})")
         else:
             st.info("No suggestions available yet. Add and save some lists first.")
 
-    with st.expander("Analytics Dashboard", expanded=False):
+    with st.expander("Analytics Dashboard", expanded=False), timed("Analytics"):
         st.header("Analytics Dashboard")
-        history = get_history_db(username)
-        if history:
-            all_items = []
-            for ts, items in history:
-                for item in items:
-                    all_items.append({"name": item["name"], "quantity": item["quantity"], "date": ts})
-            df = pd.DataFrame(all_items)
-            if not df.empty:
-                st.subheader("Most Purchased Items")
-                top_items = df.groupby("name")["quantity"].sum().sort_values(ascending=False).head(5)
-                st.bar_chart(top_items)
-                st.subheader("Purchase Trends Over Time")
-                df["date"] = pd.to_datetime(df["date"])
-                trend = df.groupby(df["date"].dt.date)["quantity"].sum()
-                st.line_chart(trend)
-            else:
-                st.info("No data for analytics yet.")
+        window = st.selectbox("Period", list(ANALYTICS_WINDOWS), index=1, key="analytics_window")
+        analytics = cached_analytics(username, data_generation(username), window)
+        if analytics['top_items']:
+            st.subheader("Most Purchased Items")
+            st.bar_chart(pd.Series(dict(analytics['top_items']), name="quantity"))
+            st.subheader(f"Purchase Trend (per {analytics['grain']})")
+            trend = analytics['trend']
+            st.line_chart(pd.Series([qty for _, qty in trend], index=pd.to_datetime([p for p, _ in trend]), name="quantity"))
+            st.subheader("Category Mix")
+            mix = pd.DataFrame(analytics['categories'], columns=["period", "category", "quantity"])
+            mix = mix.pivot(index="period", columns="category", values="quantity").fillna(0)
+            mix.index = pd.to_datetime(mix.index)
+            st.bar_chart(mix)
+            if analytics['cadence']:
+                st.subheader("Restock Cadence")
+                st.dataframe(pd.DataFrame(analytics['cadence'], columns=["item", "days purchased", "avg days between"]).round(1), hide_index=True)
         else:
-            st.info("No purchase history for analytics.")
+            st.info("No purchase history for analytics in this period.")
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def watch_list(username, seen_version):
+    """Rerun the page as soon as the list changes in another tab, on another device or through the API."""
+    if get_list_version_db(username) != seen_version:
+        st.rerun()
 
 with st.sidebar:
     st.header("👤 User Info")
     if authentication_status:
         st.write(f"**Logged in as:** {name}")
         st.write(f"**Username:** {username}")
+        if st.toggle("Live updates", value=True, key="live_updates",
+                     help="Show changes made elsewhere without reloading"):
+            watch_list(username, data_generation(username)[1])
     st.markdown("---")
     st.write("Switch Streamlit theme in settings (⚙️) for dark/light mode.")
     st.markdown("[GitHub Repo](https://github.com/) | [Help](#)")
+    with st.expander("⏱️ Timings (this run)", expanded=False):
+        if _run_timings:
+            st.dataframe(pd.DataFrame(_run_timings, columns=["section", "ms"]).round(1), hide_index=True)
+            st.caption(f"Total {sum(ms for _, ms in _run_timings):.1f} ms")
+        if authentication_status and st.button("Clear my cached data"):
+            invalidate(username)
+            st.rerun()
+    with st.expander("⚙️ Background jobs", expanded=False):
+        queue = get_job_stats_db()
+        if queue:
+            st.dataframe(pd.DataFrame(queue, columns=["job", "status", "count", "oldest due (s)"]), hide_index=True)
+        else:
+            st.caption("No jobs queued yet.")
+        if job_worker() is None:
+            st.caption("No worker in this process (GROCERY_JOB_THREADS=0); run `python jobs.py worker`.")
+    with st.expander("🔬 Metrics (this process)", expanded=False):
+        if metrics.enabled():
+            rows = metrics.summary()
+            if rows:
+                st.dataframe(pd.DataFrame(rows).round(2), hide_index=True)
+            if st.button("Reset metrics"):
+                metrics.REGISTRY.reset()
+        else:
+            st.caption("Start with GROCERY_METRICS=1 to record database helper, SQL and section timings.")
+        if metrics.PROFILE_REQUESTS:
+            st.toggle("Profile each run", key="profile_runs")
+        profile = st.session_state.pop("_profile", None)
+        if profile is not None:
+            report = io.StringIO()
+            pstats.Stats(profile.stop(), stream=report).sort_stats("cumulative").print_stats(25)
+            st.caption(f"Saved to {profile.path}")
+            st.code(report.getvalue())
 
 CATEGORY_COLORS = {
     "Produce": "#a5d6a7",
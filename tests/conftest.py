@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# db.py reads these at import; tests point it at their own database file
+os.environ.setdefault("GROCERY_DB_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='grocery-test-'), 'grocery.db')}")
+os.environ["GROCERY_JOB_THREADS"] = "0"
+
+
+@pytest.fixture
+def database(tmp_path):
+    """db configured on a fresh, migrated SQLite file; yields its URL."""
+    import db
+
+    url = f"sqlite:///{tmp_path / 'grocery.db'}"
+    db.configure_engine(url)
+    yield url
+    db.get_engine().dispose()
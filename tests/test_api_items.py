@@ -0,0 +1,36 @@
+import pytest
+
+
+@pytest.fixture
+def client(database):
+    import app
+
+    return app.app.test_client()
+
+
+def test_patch_changes_only_the_fields_sent(client):
+    import db
+
+    item_id = db.add_item_db("BBQ sauce", 1, "condiments", "u")
+    before = db.get_item_db(item_id, "u")
+
+    response = client.patch(f"/api/users/u/items/{item_id}", json={"quantity": 3, "version": before.version})
+    assert response.status_code == 200
+    after = db.get_item_db(item_id, "u")
+    assert (after.name, after.name_normalized, after.category) == ("BBQ sauce", before.name_normalized, "condiments")
+    assert after.quantity == 3 and after.version > before.version
+
+    response = client.patch(f"/api/users/u/items/{item_id}", json={"category": "sauces"})
+    assert response.get_json()["category"] == "Sauces"
+    assert db.get_item_db(item_id, "u").name == "BBQ sauce"
+
+
+def test_patch_rejects_bad_or_missing_fields(client):
+    import db
+
+    item_id = db.add_item_db("Milk", 1, "Dairy", "u")
+    assert client.patch(f"/api/users/u/items/{item_id}", json={"quantity": 0}).status_code == 400
+    assert client.patch(f"/api/users/u/items/{item_id}", json={"name": " "}).status_code == 400
+    assert client.patch(f"/api/users/u/items/{item_id}", json={"version": 1}).status_code == 400
+    assert client.patch(f"/api/users/u/items/{item_id + 1}", json={"quantity": 2}).status_code == 404
+    assert db.get_item_db(item_id, "u").quantity == 1
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_first_sync_sends_the_whole_list(database):
+    import db
+
+    ids = [db.add_item_db(name, 1, "Other", "u") for name in ("Milk", "Bread")]
+    version, changes, items = db.get_changes_db("u")
+    assert version == db.get_list_version_db("u")
+    assert changes == []
+    assert [item.id for item in items] == ids
+    assert db.get_changes_db("u", version) == (version, [], None)
+
+
+def test_pages_end_between_versions(database):
+    import db
+
+    start = db.get_list_version_db("u")
+    for name in ("Milk", "Bread", "Eggs"):
+        db.add_item_db(name, 1, "Other", "u")
+    assert db.add_items_db([{"name": f"Extra {i}", "quantity": 1, "category": "Other"} for i in range(4)], "u") == 4
+    db.add_item_db("Rice", 1, "Other", "u")
+
+    pages, since = [], start
+    while True:
+        version, changes, items = db.get_changes_db("u", since, limit=2)
+        assert items is None
+        if not changes:
+            break
+        pages.append([c.name for c in changes])
+        assert all(c.version <= version for c in changes)
+        since = version
+    # The four-item bulk write is one version, so it comes as one oversized page
+    assert pages == [["Milk", "Bread"], ["Eggs"], [f"Extra {i}" for i in range(4)], ["Rice"]]
+    assert since == db.get_list_version_db("u")
+
+
+def test_deletes_and_clears_are_logged(database):
+    import db
+
+    item_id = db.add_item_db("Milk", 1, "Other", "u")
+    db.add_item_db("Bread", 1, "Other", "u")
+    since = db.get_list_version_db("u")
+    db.delete_item_db(item_id, "u")
+    db.clear_items_db("u")
+    _, changes, _ = db.get_changes_db("u", since)
+    assert [(c.op, c.item_id) for c in changes] == [("delete", item_id), ("clear", None)]
+
+
+def test_clients_behind_the_pruned_log_start_over(database):
+    import db
+
+    db.add_item_db("Milk", 1, "Other", "u")
+    stale = db.get_list_version_db("u")
+    db.add_item_db("Bread", 1, "Other", "u")
+    assert db.prune_changes_db(datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=1)) == 2
+
+    version, changes, items = db.get_changes_db("u", stale)
+    assert changes == []
+    assert sorted(item.name for item in items) == ["Bread", "Milk"]
+    # A version from the future (e.g. another database) also starts over
+    assert db.get_changes_db("u", version + 5)[2] is not None
+    assert db.get_changes_db("u", version) == (version, [], None)
@@ -0,0 +1,18 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def run_cli(tmp_path, commands):
+    env = {**os.environ, "PYTHONPATH": ROOT}
+    return subprocess.run([sys.executable, os.path.join(ROOT, "main.py")], input="\n".join(commands) + "\n",
+                          capture_output=True, text=True, cwd=tmp_path, env=env, timeout=60)
+
+
+def test_mealshop_does_not_break_the_command_timer(tmp_path):
+    result = run_cli(tmp_path, ["mealshop", "", "", "mealshop", "2024-01-01", "2024-01-07", "quit"])
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.count("planned meals") == 2
+    assert "Goodbye!" in result.stdout
@@ -0,0 +1,64 @@
+def test_writes_do_not_apply_typo_corrections(database):
+    import db
+
+    pasta = db.add_item_db("Pasta", 1, "Pantry", "u")
+    db.add_item_db("Bacon", 1, "Meat", "u")
+    # "Paste" and "Baron" are one edit from a known name, but are items of their own
+    assert tuple(db.autocomplete_db("u", "paste")[0]) == ("pasta", "typo")
+    paste = db.add_item_db("Paste", 1, "Pantry", "u")
+    db.add_items_db([{"name": "Baron", "quantity": 1, "category": "Other"}], "u")
+    db.add_history_db([{"name": "Bacom", "quantity": 1, "category": "Meat"}], "u")
+
+    keys = {item.name: item.name_normalized for item in db.get_items_db("u")}
+    assert keys == {"Pasta": "pasta", "Bacon": "bacon", "Paste": "paste", "Baron": "baron"}
+    assert db.get_item_db(pasta, "u").name_normalized != db.get_item_db(paste, "u").name_normalized
+    assert dict(db.get_suggestions_db("u")) == {"bacom": 1}
+    assert db.get_aliases_db("u") == []
+
+
+def test_accepted_correction_is_kept_as_a_typo_alias(database):
+    import db
+
+    db.add_item_db("Parmesan", 1, "Dairy", "u")
+    db.set_alias_db("u", "parmesaan", "parmesan", source="typo")
+    item_id = db.add_item_db("Parmesaan", 1, "Dairy", "u")
+    assert db.get_item_db(item_id, "u").name_normalized == "parmesan"
+    assert db.get_aliases_db("u") == [("parmesaan", "parmesan", "typo")]
+    assert tuple(db.autocomplete_db("u", "parmesaan")[0]) == ("parmesan", "alias")
+
+
+def test_api_autocomplete_offers_the_correction_without_applying_it(database):
+    import app
+
+    client = app.app.test_client()
+    client.post("/api/users/u/items", json={"name": "Pasta", "quantity": 1, "category": "Pantry"})
+    body = client.get("/api/users/u/autocomplete?q=Paste").get_json()
+    assert (body["key"], body["match"], body["did_you_mean"]) == ("paste", "new", "pasta")
+
+    created = client.post("/api/users/u/items", json={"name": "Paste", "quantity": 1, "category": "Pantry"})
+    assert created.status_code == 201
+    accepted = client.post("/api/users/u/aliases", json={"alias": "Pastaa", "name": "Pasta", "source": "typo"})
+    assert accepted.get_json()["aliases"] == [{"alias": "pastaa", "name": "pasta", "source": "typo"}]
+    assert client.post("/api/users/u/aliases", json={"alias": "a", "name": "b", "source": "guess"}).status_code == 400
+
+
+def test_migration_drops_typo_aliases_saved_without_asking(tmp_path):
+    from sqlalchemy import create_engine, text
+
+    import db
+    import migrations
+
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url)
+    migrations.run_migrations(engine, target=14)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO item_aliases (username, alias, canonical, source) VALUES "
+                          "('u', 'paste', 'pasta', 'typo'), ('u', 'aubergine', 'eggplant', 'user')"))
+    engine.dispose()
+    try:
+        db.configure_engine(url)
+        assert db.get_aliases_db("u") == [("aubergine", "eggplant", "user")]
+        item_id = db.add_item_db("Paste", 1, "Pantry", "u")
+        assert db.get_item_db(item_id, "u").name_normalized == "paste"
+    finally:
+        db.get_engine().dispose()
@@ -0,0 +1,88 @@
+import threading
+from datetime import datetime, timedelta
+
+T0 = datetime(2030, 1, 1, 12, 0)
+
+
+def test_identical_pending_jobs_are_queued_once(database):
+    import db
+
+    first = db.enqueue_job_db("rank-suggestions", "u", now=T0, delay_seconds=60)
+    again = db.enqueue_job_db("rank-suggestions", "u", now=T0)
+    assert again.id == first.id
+    assert again.run_at == T0  # Brought forward to the sooner request
+    assert db.enqueue_job_db("rank-suggestions", "v", now=T0).id != first.id
+    assert db.enqueue_job_db("import-prices", payload={"path": "a"}, now=T0).id != \
+        db.enqueue_job_db("import-prices", payload={"path": "b"}, now=T0).id
+
+    # Once it runs, the same request queues a new job
+    claimed = db.claim_job_db("w", now=T0)
+    assert claimed.id == first.id
+    assert db.enqueue_job_db("rank-suggestions", "u", now=T0).id != first.id
+
+
+def test_concurrent_claimers_never_share_a_job(database):
+    import db
+
+    ids = {db.enqueue_job_db("rank-suggestions", f"user{i}", now=T0).id for i in range(60)}
+    claimed = {}
+    lock = threading.Lock()
+
+    def claim(worker):
+        while True:
+            job = db.claim_job_db(worker, now=T0 + timedelta(seconds=1))
+            if job is None:
+                return
+            with lock:
+                claimed.setdefault(job.id, []).append(worker)
+
+    threads = [threading.Thread(target=claim, args=(f"w{n}",)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(claimed) == ids
+    assert all(len(workers) == 1 for workers in claimed.values())
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(database):
+    import db
+
+    job = db.enqueue_job_db("rank-suggestions", "u", now=T0)
+    assert db.claim_job_db("a", now=T0, lease_seconds=10).id == job.id
+    assert db.claim_job_db("b", now=T0 + timedelta(seconds=9)) is None
+
+    retaken = db.claim_job_db("b", now=T0 + timedelta(seconds=11))
+    assert (retaken.id, retaken.worker, retaken.attempts) == (job.id, "b", 2)
+    # The first worker lost the job, so its late result is not recorded
+    assert db.finish_job_db(job.id, "a", result={"late": True}) is None
+    assert db.finish_job_db(job.id, "b", result={"ok": True}) == "done"
+    assert db.get_job_db(job.id).result == '{"ok": true}'
+
+
+def test_failures_back_off_then_fail(database):
+    import db
+
+    job = db.enqueue_job_db("rank-suggestions", "u", now=T0, max_attempts=3)
+    now = T0
+    for attempt, wait in ((1, db.JOB_RETRY_SECONDS), (2, db.JOB_RETRY_SECONDS * 2)):
+        assert db.claim_job_db("w", now=now).attempts == attempt
+        assert db.finish_job_db(job.id, "w", error="boom", now=now) == "pending"
+        assert db.get_job_db(job.id).run_at == now + timedelta(seconds=wait)
+        assert db.claim_job_db("w", now=now + timedelta(seconds=wait - 1)) is None
+        now += timedelta(seconds=wait)
+    assert db.claim_job_db("w", now=now).attempts == 3
+    assert db.finish_job_db(job.id, "w", error="boom", now=now) == "failed"
+    assert db.get_job_db(job.id).last_error == "boom"
+    assert db.claim_job_db("w", now=now + timedelta(days=1)) is None
+
+
+def test_schedules_are_queued_once_per_period(database):
+    import db
+
+    schedules = [("prune-jobs", timedelta(days=1), None)]
+    assert [job.job for job in db.enqueue_due_schedules_db(schedules, now=T0)] == ["prune-jobs"]
+    # A second worker checking at the same time finds it taken
+    assert db.enqueue_due_schedules_db(schedules, now=T0) == []
+    assert db.enqueue_due_schedules_db(schedules, now=T0 + timedelta(hours=23)) == []
+    assert len(db.enqueue_due_schedules_db(schedules, now=T0 + timedelta(days=1))) == 1
@@ -0,0 +1,49 @@
+import json
+import os
+from datetime import datetime
+
+from smart_grocery import journal
+from smart_grocery.journal import HistoryJournal
+
+MILK = [{"name": "Milk", "quantity": 1, "category": "Dairy"}]
+EGGS = [{"name": "Eggs", "quantity": 12, "category": "Dairy"}]
+
+
+def test_appends_are_fsynced_and_replayed_by_a_new_journal(tmp_path, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(journal.os, "fsync", lambda fd: (synced.append(fd), real_fsync(fd)))
+
+    path = str(tmp_path / "history.jsonl")
+    writer = HistoryJournal(path, legacy_path=None)
+    writer.append(MILK, datetime(2030, 1, 1, 9, 30))
+    writer.append(EGGS)
+    assert len(synced) == 2  # One fsync per save, before append returns
+
+    assert list(HistoryJournal(path, legacy_path=None)) == [(datetime(2030, 1, 1, 9, 30), MILK), (None, EGGS)]
+
+
+def test_torn_last_line_is_skipped_and_compacted_away(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    HistoryJournal(path, legacy_path=None).append(MILK)
+    with open(path, "a") as f:
+        f.write('{"ts":null,"items":[{"na')  # Crash halfway through the second save
+
+    reopened = HistoryJournal(path, legacy_path=None)
+    assert list(reopened) == [(None, MILK)]
+    reopened.append(EGGS)  # Starts on a fresh line, then compacts
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)["items"] for line in lines] == [MILK, EGGS]
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_legacy_history_is_migrated_once(tmp_path):
+    legacy = tmp_path / "history.json"
+    legacy.write_text(json.dumps([MILK, EGGS]))
+    path = str(tmp_path / "history.jsonl")
+
+    assert list(HistoryJournal(path, legacy_path=str(legacy))) == [(None, MILK), (None, EGGS)]
+    assert not legacy.exists() and (tmp_path / "history.json.migrated").exists()
+    assert HistoryJournal(path, legacy_path=str(legacy)).migrate_legacy() is False
@@ -0,0 +1,41 @@
+import json
+
+from sqlalchemy import create_engine, inspect, text
+
+
+def test_baseline_database_upgrades_to_the_current_schema(tmp_path):
+    import db
+    import migrations
+
+    url = f"sqlite:///{tmp_path / 'old.db'}"
+    engine = create_engine(url)
+    assert migrations.run_migrations(engine, target=1) == [1]
+    basket = [{"name": "Bananas", "quantity": 6, "category": "Produce"}, {"name": "Milk", "quantity": 1}]
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO grocery_items (username, name, quantity, category) "
+                          "VALUES ('u', 'Bananas', 2, 'Produce'), ('u', 'Milk', 1, 'Dairy')"))
+        for day in ("2024-01-01 10:00:00", "2024-01-08 10:00:00"):
+            conn.execute(text("INSERT INTO grocery_history (username, timestamp, items) VALUES ('u', :t, :items)"),
+                         {"t": day, "items": json.dumps(basket)})
+    engine.dispose()
+
+    try:
+        db.configure_engine(url)
+        engine = db.get_engine()
+        assert migrations.applied_versions(engine) == sorted(migrations.MIGRATIONS)
+        inspector = inspect(engine)
+        for table in db.Base.metadata.sorted_tables:
+            assert {c.name for c in table.columns} <= {c["name"] for c in inspector.get_columns(table.name)}, table.name
+
+        items = db.get_items_db("u")
+        assert sorted((item.name, item.name_normalized) for item in items) == [("Bananas", "banana"), ("Milk", "milk")]
+        assert [len(lines) for _, lines in db.get_history_db("u")] == [2, 2]
+        assert dict(db.get_suggestions_db("u")) == {"banana": 2, "milk": 2}
+
+        # Writes on the upgraded file take list versions like on a new one
+        item_id = db.add_item_db("Eggs", 12, "Dairy", "u")
+        version = db.get_item_db(item_id, "u").version
+        assert db.get_changes_db("u", version - 1)[1][0].item_id == item_id
+        assert migrations.run_migrations(engine) == []
+    finally:
+        db.get_engine().dispose()
@@ -0,0 +1,57 @@
+import pytest
+
+from smart_grocery.models import GroceryItem
+from smart_grocery.optimizer import Optimizer, StoreLayout
+
+# entrance - a - b - c - checkout in a line, with a short cut from the entrance to the checkout
+LINE = StoreLayout(
+    "Line store",
+    edges=[("entrance", "a", 1), ("a", "b", 1), ("b", "c", 1), ("c", "checkout", 1), ("entrance", "checkout", 1)],
+    categories={"Fruit": "a", "Bread": "b", "Milk": "c", "Flowers": "entrance", "Sweets": "checkout"},
+    items={"Batteries": "checkout"},
+    default="b",
+)
+
+
+def test_route_starts_at_the_entrance_and_ends_at_the_checkout():
+    items = [GroceryItem("Milk", 1, "Milk"), GroceryItem("Apples", 1, "Fruit"), GroceryItem("Rolls", 1, "Bread")]
+    route = Optimizer(LINE).plan(items)
+
+    assert [stop.location for stop in route.stops] == ["a", "b", "c"]
+    assert route.path == ["entrance", "a", "b", "c", "checkout"]
+    assert route.distance == 4
+    assert [item.name for item in route.ordered_items()] == ["Apples", "Rolls", "Milk"]
+
+
+def test_items_at_the_entrance_and_checkout_are_first_and_last_stops():
+    items = [GroceryItem("Gum", 1, "Sweets"), GroceryItem("Batteries", 1, "Household"),
+             GroceryItem("Tulips", 1, "Flowers"), GroceryItem("Rolls", 1, "Bread")]
+    route = Optimizer(LINE).plan(items)
+
+    assert [stop.location for stop in route.stops] == ["entrance", "b", "checkout"]
+    assert [item.name for item in route.stops[-1].items] == ["Batteries", "Gum"]
+    assert (route.path[0], route.path[-1]) == ("entrance", "checkout")
+
+
+def test_empty_list_walks_straight_to_the_checkout():
+    route = Optimizer(LINE).plan([])
+    assert (route.stops, route.path, route.distance) == ([], ["entrance", "checkout"], 1)
+
+
+@pytest.mark.parametrize("layout", [
+    {"categories": {"Milk": "island"}},
+    {"items": {"Ice Cream": "island"}},
+    {"default": "island"},
+    {"checkout": "island"},
+    {"entrance": "island"},
+])
+def test_unreachable_locations_are_rejected(layout):
+    data = {"name": "Broken", "edges": [["entrance", "a", 1], ["a", "checkout", 1], ["island", "pier", 1]],
+            "categories": {}, **layout}
+    with pytest.raises(ValueError, match="cannot be reached"):
+        StoreLayout.from_dict(data)
+
+
+def test_negative_distances_are_rejected():
+    with pytest.raises(ValueError, match="negative distance"):
+        StoreLayout("Broken", [("entrance", "checkout", -1)], {})
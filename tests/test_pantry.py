@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from smart_grocery.pantry import HALF_LIFE_DAYS, consumption_rates, runout_days, series_starts  # noqa: E402
+
+
+def reference_rate(days, quantities, half_life=HALF_LIFE_DAYS):
+    """One series, one interval at a time, as the module docstring describes."""
+    if len(days) < 2:
+        return math.nan
+    weights = [0.5 ** ((days[-1] - d) / half_life) for d in days[:-1]]
+    used = sum(w * q for w, q in zip(weights, quantities))
+    elapsed = sum(w * (b - a) for w, a, b in zip(weights, days, days[1:]))
+    return used / elapsed
+
+
+def test_a_single_purchase_day_has_no_rate():
+    rates = consumption_rates(series_starts(["milk"]), [100.0], [3.0])
+    assert math.isnan(rates.rate[0])
+    assert (rates.purchase_days[0], rates.last_day[0], rates.last_quantity[0], rates.typical_quantity[0]) == \
+        (1, 100.0, 3.0, 3.0)
+    assert math.isnan(runout_days(rates.last_day, rates.last_quantity, rates.rate)[0])
+
+
+def test_rates_are_fitted_per_series():
+    series = {
+        ("u", "bread"): ([0.0, 4.0, 8.0, 12.0], [2.0, 2.0, 2.0, 1.0]),  # Steady: half a loaf a day
+        ("u", "eggs"): ([5.0], [12.0]),
+        ("u", "milk"): ([1.0, 3.0, 10.0, 200.0, 203.0], [1.0, 4.0, 2.0, 6.0, 1.0]),
+        ("v", "bread"): ([0.0, 10.0], [5.0, 1.0]),
+    }
+    users, names, days, quantities = [], [], [], []
+    for (user, name), (series_days, series_quantities) in series.items():
+        users += [user] * len(series_days)
+        names += [name] * len(series_days)
+        days += series_days
+        quantities += series_quantities
+
+    starts = series_starts(np.array(users), np.array(names))
+    assert starts.tolist() == [0, 4, 5, 10]
+    rates = consumption_rates(starts, days, quantities)
+
+    expected = [reference_rate(*values) for values in series.values()]
+    assert rates.rate[0] == pytest.approx(0.5)
+    assert math.isnan(rates.rate[1])
+    assert rates.rate[[0, 2, 3]] == pytest.approx([expected[0], expected[2], expected[3]])
+    assert rates.purchase_days.tolist() == [4, 1, 5, 2]
+    assert rates.last_day.tolist() == [12.0, 5.0, 203.0, 10.0]
+    assert rates.typical_quantity.tolist() == [1.75, 12.0, 2.8, 3.0]
+    assert runout_days(rates.last_day, rates.last_quantity, rates.rate)[0] == pytest.approx(14.0)
+
+
+def test_no_series():
+    rates = consumption_rates(series_starts([]), [], [])
+    assert len(rates.rate) == 0 and len(rates.starts) == 0
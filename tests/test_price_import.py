@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def client(database, tmp_path, monkeypatch):
+    import app
+    import jobs
+
+    # A configured GROCERY_UPLOAD_DIR that nobody has created yet
+    monkeypatch.setattr(jobs, "UPLOAD_DIR", str(tmp_path / "uploads" / "prices"))
+    return app.app.test_client()
+
+
+def test_upload_creates_the_spool_directory_and_queues_an_import(client, tmp_path):
+    import db
+    import jobs
+
+    body = "store,name,price\nCorner,Milk,1.20\nCorner,Bread,oops\n"
+    response = client.post("/api/prices?format=csv", data=body, content_type="text/csv")
+    assert response.status_code == 202
+    job = response.get_json()
+    assert (job["job"], job["max_attempts"]) == ("import-prices", 1)
+    assert (tmp_path / "uploads" / "prices").is_dir()
+
+    assert jobs.Worker(schedules=()).run_pending() == 1
+    finished = db.get_job_db(job["id"])
+    assert finished.status == "done"
+    assert json.loads(finished.result)["imported"] == 1
+    assert json.loads(finished.result)["rejected"] == 1
+    assert not list((tmp_path / "uploads" / "prices").iterdir())
+    assert [store for store, _ in db.get_price_stores_db()] == ["Corner"]
+
+
+def test_empty_upload_is_rejected(client, tmp_path):
+    response = client.post("/api/prices", data=b"")
+    assert response.status_code == 400
+    assert not list((tmp_path / "uploads" / "prices").iterdir())
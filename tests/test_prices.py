@@ -0,0 +1,67 @@
+import math
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from smart_grocery.prices import optimize
+
+
+def random_case(rng):
+    n_items, n_stores = int(rng.integers(1, 8)), int(rng.integers(1, 6))
+    matrix = np.round(rng.uniform(0.5, 9.99, (n_items, n_stores)), 2)
+    matrix[rng.random((n_items, n_stores)) < 0.25] = np.nan
+    quantities = rng.integers(1, 4, n_items)
+    names = [f"item {i}" for i in range(n_items)]
+    stores = [f"store {j}" for j in range(n_stores)]
+    return names, quantities, stores, matrix
+
+
+def cheapest_subset(costs, max_stores, store_cost):
+    """(items left unsupplied, cost plus store_cost per store) of the best store subset, by trying them all."""
+    best = (math.inf, math.inf)
+    for k in range(1, min(max_stores, costs.shape[1]) + 1):
+        for subset in combinations(range(costs.shape[1]), k):
+            cheapest = np.nanmin(np.where(np.isnan(costs[:, subset]), np.inf, costs[:, subset]), axis=1)
+            supplied = np.isfinite(cheapest)
+            best = min(best, (int((~supplied).sum()), float(cheapest[supplied].sum()) + store_cost * k))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_store_choice_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    names, quantities, stores, matrix = random_case(rng)
+    max_stores, store_cost = int(rng.integers(1, 4)), float(rng.choice([0.5, 2.0, 5.0]))
+
+    plan = optimize(names, quantities, stores, matrix, max_stores=max_stores, store_cost=store_cost)
+
+    unsupplied, cost = cheapest_subset(matrix * quantities[:, None], max_stores, store_cost)
+    assert len(plan.unavailable) == unsupplied
+    assert len(plan.stores) <= max_stores
+    if plan.lines:  # Otherwise no store is visited at all
+        assert plan.total + store_cost * len(plan.stores) == pytest.approx(cost)
+    for line in plan.lines:
+        row = names.index(line.name)
+        assert line.unit_price == np.nanmin([matrix[row, stores.index(s)] for s in plan.stores])
+
+
+@pytest.mark.parametrize("seed", range(150))
+def test_budget_keeps_the_most_valuable_lines_that_fit(seed):
+    rng = np.random.default_rng(seed)
+    names, quantities, stores, matrix = random_case(rng)
+    values = rng.integers(1, 6, len(names)).astype(float)
+    full = optimize(names, quantities, stores, matrix)
+    budget = round(full.total * float(rng.uniform(0.2, 1.0)), 2)
+
+    plan = optimize(names, quantities, stores, matrix, budget=budget, values=values)
+
+    assert plan.total <= budget + 1e-9
+    lines = full.lines
+    best = max(
+        sum(values[names.index(lines[i].name)] for i in kept)
+        for k in range(len(lines) + 1) for kept in combinations(range(len(lines)), k)
+        if sum(lines[i].cost for i in kept) <= budget + 1e-9
+    )
+    assert sum(values[names.index(line.name)] for line in plan.lines) == best
+    assert sorted(line.name for line in plan.lines + plan.dropped) == sorted(line.name for line in lines)
@@ -0,0 +1,59 @@
+import pytest
+
+from smart_grocery.models import GroceryItem
+from smart_grocery.recipes import Ingredient, Recipe, RecipeIndex, expand_meals, list_quantities
+
+PASTA = Recipe("Pasta", [Ingredient("Spaghetti", 200, "g", "Pantry"),
+                         Ingredient("Olive oil", 2, "tbsp", "Pantry"),
+                         Ingredient("Eggs", 2, "", "Dairy")], servings=2)
+CARBONARA = Recipe("Carbonara", [Ingredient("spaghetti", 0.5, "lb", "Pantry"),
+                                 Ingredient("Eggs", 3, "each", "Dairy"),
+                                 Ingredient("Parmesan", 1, "cup", "Dairy"),
+                                 Ingredient("Parmesan", 50, "g", "Dairy")])
+INDEX = RecipeIndex([PASTA, CARBONARA])
+
+
+def by_name(expansion):
+    return {(r.name, r.unit): r for r in expansion.requirements()}
+
+
+def test_same_ingredient_merges_across_recipes_in_base_units():
+    expansion = expand_meals({"2030-01-01": ["pasta", "Carbonara"], "2030-01-02": ["Pasta", "Apples"],
+                              "2030-01-09": ["Carbonara"]}, INDEX, end="2030-01-07")
+    needed = by_name(expansion)
+
+    assert expansion.meals == 4
+    assert needed["Spaghetti", "g"].amount == pytest.approx(400 + 226.796)
+    assert needed["Spaghetti", "g"].quantity == 1  # Measured amounts are one pack
+    assert needed["Olive Oil", "ml"].amount == pytest.approx(4 * 14.7868)
+    assert (needed["Eggs", "each"].amount, needed["Eggs", "each"].quantity) == (7, 7)
+    # Volume and weight cannot be added together, so they stay separate lines
+    assert needed["Parmesan", "ml"].label() == "236.59 ml"
+    assert needed["Parmesan", "g"].label() == "50 g"
+    assert expansion.unknown == ["Apples"]
+    assert needed["Apples", "each"].quantity == 1
+
+
+def test_servings_scale_every_recipe():
+    needed = by_name(expand_meals({"2030-01-01": ["Pasta"]}, INDEX, servings=5))
+    assert needed["Spaghetti", "g"].label() == "500 g"
+    assert needed["Eggs", "each"].quantity == 5
+
+
+def test_what_is_on_the_list_is_subtracted():
+    on_list = list_quantities([GroceryItem("eggs", 4, "Dairy"), GroceryItem("Egg", 1, "Dairy"),
+                               GroceryItem("Spaghetti", 1, "Pantry"), GroceryItem("Apples", 3, "Produce")])
+    expansion = expand_meals({"2030-01-01": ["Pasta", "Carbonara", "Apples"]}, INDEX, on_list=on_list)
+    needed = by_name(expansion)
+
+    assert ("Eggs", "each") not in needed  # "Egg" and "eggs" count toward the same item
+    assert ("Spaghetti", "g") not in needed  # Any pack on the list covers a measured amount
+    assert ("Apples", "each") not in needed
+    assert sorted(expansion.covered) == ["Apples", "Eggs", "Spaghetti"]
+    assert [item.name for item in expansion.to_grocery_list()] == ["Olive Oil", "Parmesan"]
+
+
+def test_partly_covered_counts_are_reduced():
+    on_list = list_quantities([GroceryItem("Eggs", 3, "Dairy")])
+    needed = by_name(expand_meals({"2030-01-01": ["Carbonara", "Pasta"]}, INDEX, on_list=on_list))
+    assert needed["Eggs", "each"].quantity == 2
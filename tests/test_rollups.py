@@ -0,0 +1,43 @@
+from datetime import datetime
+
+
+def add_baskets(db):
+    db.add_history_db([{"name": "Milk", "quantity": 2, "category": "Dairy"},
+                       {"name": "Bread", "quantity": 1, "category": None}], "u", datetime(2030, 1, 6, 9))
+    db.add_history_db([{"name": "milk", "quantity": 1, "category": "Dairy"},
+                       {"name": "Milk", "quantity": 3, "category": "Dairy"}], "u", datetime(2030, 1, 7, 18))
+    db.add_history_db([{"name": "Bread", "quantity": 2, "category": "Bakery"}], "u", datetime(2030, 2, 1, 8))
+    db.add_history_db([{"name": "Milk", "quantity": 5, "category": "Dairy"}], "v", datetime(2030, 1, 7, 12))
+
+
+def test_rollups_match_history_after_adds(database):
+    import db
+
+    add_baskets(db)
+    assert db.check_rollups_db() == []
+    assert db.get_item_totals_db("u") == [("Milk", 6), ("Bread", 3)]
+    # 2030-01-06 is a Sunday, so the first two baskets fall in different weeks
+    assert db.get_period_totals_db("u", "week") == [("2029-12-31", 3), ("2030-01-07", 4), ("2030-01-28", 2)]
+    assert db.get_period_totals_db("u", "month") == [("2030-01-01", 7), ("2030-02-01", 2)]
+    assert db.get_category_totals_db("u") == [("2030-01-01", "Dairy", 6), ("2030-01-01", "Other", 1),
+                                              ("2030-02-01", "Bakery", 2)]
+
+
+def test_deleted_history_is_reported_until_rollups_are_rebuilt(database):
+    import db
+
+    add_baskets(db)
+    with db.session_scope() as session:
+        basket = session.query(db.GroceryHistoryDB).filter_by(username="u", timestamp=datetime(2030, 1, 7, 18)).one()
+        session.query(db.GroceryHistoryLineDB).filter_by(history_id=basket.id).delete()
+        session.delete(basket)
+
+    problems = db.check_rollups_db("u")
+    assert "purchase_rollups day u/2030-01-07/milk/Dairy: not in history" in problems
+    assert "purchase_rollups month u/2030-01-01/milk/Dairy: expected (2, 1, 1), found (6, 3, 2)" in problems
+    assert db.check_rollups_db("v") == []
+
+    db.rebuild_rollups_db("u")
+    assert db.check_rollups_db() == []
+    assert db.get_item_totals_db("u") == [("Bread", 3), ("Milk", 2)]
+    assert db.get_item_totals_db("v") == [("Milk", 5)]
@@ -0,0 +1,56 @@
+import io
+
+from smart_grocery import transfer
+from smart_grocery.models import GroceryList
+
+
+def test_bad_rows_are_reported_and_good_rows_streamed_in_chunks():
+    body = ("Name,Quantity,Category\n"
+            "milk,2,dairy\n"
+            ",1,Produce\n"
+            "bread,lots,Bakery\n"
+            "eggs,,\n"
+            "cheese,0,Dairy\n"
+            "apples,3,produce\n")
+    chunks, progress = [], []
+    report = transfer.import_items(io.BytesIO(body.encode()), chunks.append, "csv", chunk_size=1,
+                                   progress=lambda done, errors: progress.append((done, errors)))
+
+    assert [[row["name"] for row in chunk] for chunk in chunks] == [["Milk"], ["Eggs"], ["Apples"]]
+    assert chunks[1] == [{"name": "Eggs", "quantity": 1, "category": "Other"}]
+    assert report.imported == 3
+    assert [(row_number, message) for row_number, message, _ in report.errors] == [
+        (2, "missing name"),
+        (3, "invalid quantity 'lots'"),
+        (5, "quantity must be at least 1, got 0"),
+    ]
+    assert report.errors[1][2] == {"name": "bread", "quantity": "lots", "category": "Bakery"}
+    assert progress[-1] == (6, 3)
+    assert str(report) == "3 rows imported, 3 rejected"
+
+
+def test_invalid_json_lines_keep_their_raw_text():
+    body = b'{"name": "Milk", "quantity": 1}\n{"name": "Bread"\n\n["not", "a", "row"]\n'
+    rows = []
+    report = transfer.import_items(io.BytesIO(body), rows.extend, "jsonl")
+
+    assert [row["name"] for row in rows] == ["Milk"]
+    assert [(row_number, raw) for row_number, _, raw in report.errors] == [
+        (2, '{"name": "Bread"'),
+        (3, ["not", "a", "row"]),
+    ]
+    assert report.errors[0][1] == "invalid JSON"
+
+
+def test_importer_adds_valid_rows_from_an_exported_file(tmp_path):
+    source = GroceryList()
+    transfer.list_sink(source)([{"name": "Milk", "quantity": 2, "category": "Dairy"}])
+    path = str(tmp_path / "list.jsonl")
+    transfer.Exporter.export(source, path)
+    with open(path, "a") as f:
+        f.write('{"name": "", "quantity": 1}\n')
+
+    imported = GroceryList()
+    report = transfer.Importer.import_file(imported, path)
+    assert [item.to_dict() for item in imported] == [{"name": "Milk", "quantity": 2, "category": "Dairy"}]
+    assert (report.imported, [message for _, message, _ in report.errors]) == (1, ["missing name"])
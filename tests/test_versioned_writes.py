@@ -0,0 +1,70 @@
+import pytest
+
+
+def test_stale_expected_version_raises_and_changes_nothing(database):
+    import db
+
+    item_id = db.add_item_db("Milk", 1, "Dairy", "u")
+    seen = db.get_item_db(item_id, "u").version
+    db.update_item_db(item_id, "u", quantity=2)
+
+    with pytest.raises(db.VersionConflict) as conflict:
+        db.update_item_db(item_id, "u", expected_version=seen, quantity=5)
+    assert conflict.value.item.quantity == 2
+    with pytest.raises(db.VersionConflict):
+        db.delete_item_db(item_id, "u", expected_version=seen)
+    assert db.get_item_db(item_id, "u").quantity == 2
+
+    current = db.get_item_db(item_id, "u").version
+    assert db.update_item_db(item_id, "u", expected_version=current, quantity=3).quantity == 3
+
+
+def test_deleted_item_conflicts_without_an_item(database):
+    import db
+
+    item_id = db.add_item_db("Milk", 1, "Dairy", "u")
+    version = db.get_item_db(item_id, "u").version
+    db.delete_item_db(item_id, "u")
+    assert db.update_item_db(item_id, "u", expected_version=version, quantity=5) is None
+    assert db.delete_item_db(item_id, "u", expected_version=version) is False
+
+
+def test_alias_rekeying_is_a_versioned_write(database):
+    import db
+
+    item_id = db.add_item_db("Zucchini", 1, "Produce", "u")
+    before = db.get_list_version_db("u")
+    db.set_alias_db("u", "zucchini", "courgette")
+
+    assert db.get_item_db(item_id, "u").name_normalized == "courgette"
+    version, changes, _ = db.get_changes_db("u", before)
+    assert version > before
+    assert [(c.op, c.item_id) for c in changes] == [("upsert", item_id)]
+    assert db.get_item_db(item_id, "u").version == version
+
+    # Nothing on the list to re-key: the list version stays put
+    db.set_alias_db("u", "aubergine", "eggplant")
+    assert db.get_list_version_db("u") == version
+
+
+def test_legacy_image_import_is_logged_per_user(database, tmp_path):
+    from PIL import Image
+
+    import db
+    from smart_grocery.images import ImageStore, is_digest
+
+    photo = tmp_path / "milk.png"
+    Image.new("RGB", (4, 4), "white").save(photo)
+    moved_id = db.add_item_db("Milk", 1, "Dairy", "a", image_path=str(photo))
+    missing_id = db.add_item_db("Bread", 1, "Bakery", "b", image_path=str(tmp_path / "gone.png"))
+    before = {user: db.get_list_version_db(user) for user in ("a", "b")}
+
+    assert db.import_legacy_images_db(ImageStore(str(tmp_path / "images"))) == (1, 1)
+
+    moved = db.get_item_db(moved_id, "a")
+    assert is_digest(moved.image_path)
+    version, changes, _ = db.get_changes_db("a", before["a"])
+    assert moved.version == version > before["a"]
+    assert [(c.item_id, c.image_path) for c in changes] == [(moved_id, moved.image_path)]
+    assert db.get_item_db(missing_id, "b").image_path == str(tmp_path / "gone.png")
+    assert db.get_list_version_db("b") == before["b"]
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def in_other_process(url, code):
+    env = {**os.environ, "PYTHONPATH": ROOT, "GROCERY_DB_URL": url, "GROCERY_JOB_THREADS": "0"}
+    subprocess.run([sys.executable, "-c", "import db\n" + code], check=True, env=env, cwd=ROOT, timeout=60)
+
+
+def test_alias_set_in_another_process_is_used(database):
+    import db
+
+    db.add_item_db("Eggplant", 1, "Produce", "u")
+    assert db.autocomplete_db("u", "aubergine")[0].how == "new"  # Cached here before the alias exists
+    in_other_process(database, "db.set_alias_db('u', 'aubergine', 'eggplant')")
+
+    item_id = db.add_item_db("Aubergine", 1, "Produce", "u")
+    assert db.get_item_db(item_id, "u").name_normalized == "eggplant"
+    assert db.autocomplete_db("u", "aubergine")[0].how == "alias"
+
+    in_other_process(database, "db.delete_alias_db('u', 'aubergine')")
+    assert db.autocomplete_db("u", "aubergine")[0].how == "new"
+
+
+def test_names_learned_in_another_process_are_known(database):
+    import db
+
+    db.add_item_db("Milk", 1, "Dairy", "u")
+    in_other_process(database, "db.add_item_db('Parmesan', 1, 'Dairy', 'u')")
+    assert db.autocomplete_db("u", "parmesan")[0].how == "known"
+    # A typo of a name only the other process has seen is suggested here
+    assert tuple(db.autocomplete_db("u", "parmesaan")[0]) == ("parmesan", "typo")